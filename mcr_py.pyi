@@ -1,4 +1,7 @@
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
 
 
 PyBags = dict[int, list[PyLabel]]
@@ -24,6 +27,29 @@ class GraphCache:
         ...
 
 
+class TimetableCache:
+    def __init__(self) -> None:
+        ...
+
+    def set_timetable(
+        self,
+        route_stop_offsets: npt.NDArray[np.int64],
+        route_stops: npt.NDArray[np.int32],
+        route_trip_offsets: npt.NDArray[np.int64],
+        route_trips: npt.NDArray[np.int32],
+        route_time_offsets: npt.NDArray[np.int64],
+        arrival_times: npt.NDArray[np.int32],
+        departure_times: npt.NDArray[np.int32],
+        stop_route_offsets: npt.NDArray[np.int64],
+        stop_routes: npt.NDArray[np.int32],
+        stop_route_positions: npt.NDArray[np.int32],
+    ) -> None:
+        ...
+
+    def summary(self) -> None:
+        ...
+
+
 class PyLabel:
     values: List[int]
     hidden_values: List[int]
@@ -31,6 +57,14 @@ class PyLabel:
     node_id: int
 
 
+class PyMcRaptorLabel:
+    arrival_time: int
+    cost: int
+    n_stops: int
+    origin: Tuple[int, int]
+    path: List[Tuple[str, int]]
+
+
 def run_mlc(graph_cache: GraphCache, start_node_id: int) -> PyBags:
     ...
 
@@ -54,3 +88,12 @@ def run_mlc_with_bags(
     enable_limit: Optional[bool] = None,
 ) -> PyBags:
     ...
+
+
+def run_mcraptor_with_bags(
+    timetable_cache: TimetableCache,
+    bags: Dict[int, List[Tuple[int, int, int]]],
+    default_transfer_time: int,
+    disable_paths: Optional[bool] = None,
+) -> Dict[int, List[PyMcRaptorLabel]]:
+    ...
@@ -1,20 +1,54 @@
 import os
-from typing import Annotated
+from datetime import date, datetime
+from typing import Annotated, Optional
+import pandas as pd
 import typer
-from package import storage
+from package import key, storage
 
 from package.key import (
     TRIPS_KEY,
     STOP_TIMES_KEY,
+    CALENDAR_KEY,
+    CALENDAR_DATES_KEY,
 )
-from package.structs.build import build_structures as build_structures_direct
-from package.logger import Timed
+from package.gtfs import service
+from package.structs.incremental import build_structures_interned
+from package.logger import Timed, rlog
+from package.raptor.timetable import Timetable, timetable_path_for_structs
 
 
 def build_structures(
     clean_gtfs_dir: Annotated[str, typer.Argument(help="Path to clean GTFS directory")],
     output_file: Annotated[str, typer.Argument(help="Path to output file")],
+    timetable: Annotated[
+        bool,
+        typer.Option(
+            help=f"Also write the compiled timetable as memory-mappable arrays to a directory next to the output file, named like it with the suffix {key.TIMETABLE_DIR_SUFFIX}."
+        ),
+    ] = True,
+    previous: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Structures of a previous build. Only routes that changed since are built again."
+        ),
+    ] = None,
+    service_date: Annotated[
+        Optional[str],
+        typer.Option(
+            help=f"Only build the structures for the trips that run on this date, in the format {key.DATE_FORMAT_HUMAN_READABLE}. Uses the calendar and calendar dates of the clean GTFS directory. Trips of the previous date that run past midnight are kept from their first stop after midnight on."
+        ),
+    ] = None,
 ):
+    """
+    Builds the structures used by the routing engines from a clean GTFS
+    directory.
+    """
+    if previous is not None and not os.path.exists(previous):
+        raise typer.BadParameter(f"Previous structs file {previous} does not exist.")
+    parsed_service_date = (
+        parse_service_date(service_date) if service_date is not None else None
+    )
+
     trips_df = storage.read_df(
         os.path.join(clean_gtfs_dir, storage.get_df_filename_for_name(TRIPS_KEY))
     )
@@ -22,7 +56,63 @@ def build_structures(
         os.path.join(clean_gtfs_dir, storage.get_df_filename_for_name(STOP_TIMES_KEY))
     )
 
+    if parsed_service_date is not None:
+        with Timed.info("Cropping to service date"):
+            trips_df, stop_times_df = crop_to_service_date(
+                clean_gtfs_dir, trips_df, stop_times_df, parsed_service_date
+            )
+
+    previous_data = None
+    if previous is not None:
+        with Timed.info("Reading previous structures"):
+            previous_data = storage.read_any_dict(previous)
+
     with Timed.info("Building structures"):
-        data = build_structures_direct(trips_df, stop_times_df)
+        data = build_structures_interned(trips_df, stop_times_df, previous_data)
 
     storage.write_any_dict(data, output_file)
+
+    if timetable:
+        with Timed.info("Compiling timetable"):
+            compiled = Timetable.from_structs(data)
+        with Timed.info("Writing timetable"):
+            compiled.save(timetable_path_for_structs(output_file), output_file)
+
+
+def parse_service_date(service_date: str) -> date:
+    try:
+        return datetime.strptime(service_date, key.DATE_FORMAT).date()
+    except ValueError:
+        raise typer.BadParameter(
+            f"Service date {service_date} is not in the format {key.DATE_FORMAT_HUMAN_READABLE}."
+        )
+
+
+def crop_to_service_date(
+    clean_gtfs_dir: str,
+    trips_df: pd.DataFrame,
+    stop_times_df: pd.DataFrame,
+    service_date: date,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    calendar_dfs: dict[str, pd.DataFrame] = {}
+    for name in [CALENDAR_KEY, CALENDAR_DATES_KEY]:
+        path = os.path.join(clean_gtfs_dir, storage.get_df_filename_for_name(name))
+        if os.path.exists(path):
+            calendar_dfs[name] = storage.read_df(path)
+    if len(calendar_dfs) == 0:
+        raise typer.BadParameter(
+            f"Clean GTFS directory {clean_gtfs_dir} has neither a calendar nor calendar dates."
+        )
+
+    n_trips = len(trips_df)
+    trips_df, stop_times_df = service.crop_to_service_date(
+        trips_df,
+        stop_times_df,
+        calendar_dfs.get(CALENDAR_KEY),
+        calendar_dfs.get(CALENDAR_DATES_KEY),
+        service_date,
+    )
+    rlog.info(f"{len(trips_df)} of {n_trips} trips run on {service_date}")
+    if len(trips_df) == 0:
+        raise typer.BadParameter(f"No trips run on {service_date}.")
+    return trips_df, stop_times_df
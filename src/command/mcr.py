@@ -91,6 +91,12 @@ def run(
             help=f"Step config preconfiguration id. Possible values: {', '.join(ALL_CONFIGS)}.",
         ),
     ] = ALL_CONFIGS[0],
+    native_public_transport: Annotated[
+        bool,
+        typer.Option(
+            help="Run the public transport step with the native McRAPTOR engine of mcr_py instead of the python implementation.",
+        ),
+    ] = False,
 ):
     validate_flags(
         stops,
@@ -108,6 +114,7 @@ def run(
                 bicycle_location_path,
                 structs,
                 stops,
+                native_public_transport,
             )
         elif step_config == CAR_CONFIG:
             initial_steps, repeating_steps = get_car_only_config(
@@ -127,6 +134,7 @@ def run(
                 city_id=city_id,
                 structs_path=structs,
                 stops_path=stops,
+                native_public_transport=native_public_transport,
             )
         elif step_config == WALKING_CONFIG:
             initial_steps, repeating_steps = get_walking_only_config(
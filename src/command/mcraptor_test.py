@@ -4,6 +4,7 @@ from package.raptor.example_labels import ArrivalTimeLabel
 
 from package.raptor.mcraptor import McRaptor
 from package import storage, strtime
+from package.structs.intern import IdMaps, ensure_interned
 from package.tracer.tracer import (
     TraceFootpath,
     TraceStart,
@@ -26,16 +27,25 @@ def test_mcraptor(testdata_path: str):
     footpaths_dict = storage.read_any_dict(os.path.join(testdata_path, "footpaths.pkl"))
     footpaths_dict = footpaths_dict["footpaths"]
 
-    structs_dict = storage.read_any_dict(os.path.join(testdata_path, "structs.pkl"))
+    structs_dict = ensure_interned(
+        storage.read_any_dict(os.path.join(testdata_path, "structs.pkl"))
+    )
+    id_maps = IdMaps.from_structs(structs_dict)
+    footpaths_dict = id_maps.intern_footpaths(footpaths_dict)
 
     mc_raptor = McRaptor(
         structs_dict, footpaths_dict, 10, 180, {}, {}, ArrivalTimeLabel
     )
-    bags: dict[str, dict] = mc_raptor.run(NESSELRODE_STR_STOP_ID, "", "15:00:00")
+    bags: dict[int, dict] = mc_raptor.run(
+        id_maps.intern_stop(NESSELRODE_STR_STOP_ID), None, "15:00:00"
+    )
 
     assert any(len(b) == 1 for b in bags.values())
 
-    tracers = bags[EHRENFELD_BF_STOP_ID][0]["traces"]
+    tracers = [
+        id_maps.gtfs_trace(trace)
+        for trace in bags[id_maps.intern_stop(EHRENFELD_BF_STOP_ID)][0]["traces"]
+    ]
     assert len(tracers) == 4
     start_trace = tracers[0]
     t16_trace = tracers[1]
@@ -1,4 +1,5 @@
-from typing import Optional
+from enum import Enum
+from typing import Any, Optional
 from typing_extensions import Annotated
 from geopandas import pd
 
@@ -8,8 +9,17 @@ import typer
 from package import storage
 from package import key
 from package.raptor.raptor import Raptor
-from package.structs import build
-from package.key import BUILD_STRUCTURES_COMMAND_NAME, FOOTPATHS_COMMAND_NAME
+from package.raptor.timetable import Timetable, open_timetable_for_structs
+from package.structs import build, intern
+from package.structs.intern import IdMaps
+from package.csa.csa import ConnectionScan
+from package.trip_based.transfers import Transfers
+from package.trip_based.trip_based import TripBased
+from package.key import (
+    BUILD_STRUCTURES_COMMAND_NAME,
+    FOOTPATHS_COMMAND_NAME,
+    TRANSFERS_COMMAND_NAME,
+)
 from package.logger import Timed
 
 FOOTPATHS_HELP = f"""
@@ -22,6 +32,30 @@ A path that should point to a pickle file containing structures, as generated \
 by the {BUILD_STRUCTURES_COMMAND_NAME} command.
 """
 
+TRANSFERS_HELP = f"""
+A path that should point to a pickle file containing trip transfers, as \
+generated by the {TRANSFERS_COMMAND_NAME} command. Used by the TRIP_BASED \
+engine, defaults to {key.TRANSFERS_FILE_NAME} next to the structures. If the \
+file does not exist, the transfers are computed before the query. Transfers \
+computed from other structures or footpaths are rejected.
+"""
+
+
+class Engine(Enum):
+    RAPTOR = "raptor"
+    TRIP_BASED = "trip_based"
+    CSA = "csa"
+
+    @classmethod
+    def from_str(cls, engine: str) -> "Engine":
+        if engine.upper() not in cls.all():
+            raise typer.BadParameter(f"Unknown engine: {engine}")
+        return cls[engine.upper()]
+
+    @classmethod
+    def all(cls) -> list[str]:
+        return [engine.name for engine in cls]
+
 
 def raptor(
     footpaths: Annotated[str, typer.Option(help=FOOTPATHS_HELP)],
@@ -34,6 +68,25 @@ def raptor(
     default_transfer_time: Annotated[
         int, typer.Option(help="Transfer time used when tranfering at the same stop")
     ] = 180,
+    compile_timetable: Annotated[
+        bool,
+        typer.Option(
+            help=f"Run RAPTOR on the array-backed timetable (uses less memory). It is memory-mapped from the timetable build-structures wrote next to the structures if it was compiled from them, and compiled from the structures otherwise."
+        ),
+    ] = False,
+    n_workers: Annotated[
+        int,
+        typer.Option(
+            help="Number of processes used to scan the routes of a round in parallel."
+        ),
+    ] = 1,
+    engine: Annotated[
+        str,
+        typer.Option(
+            help=f"Routing engine to answer the query with ({', '.join(Engine.all())}). CSA does not limit the number of transfers."
+        ),
+    ] = Engine.RAPTOR.name,
+    transfers: Annotated[Optional[str], typer.Option(help=TRANSFERS_HELP)] = None,
 ):
     validate_flags(
         footpaths,
@@ -44,28 +97,51 @@ def raptor(
         end_stop_id,
         start_time,
         output_dir,
+        n_workers,
+        transfers,
     )
 
-    footpaths_dict = storage.read_any_dict(footpaths)
-    if not "footpaths" in footpaths_dict:
-        raise typer.BadParameter(f"Footpaths file {footpaths} has unexpected format.")
-    footpaths_dict = footpaths_dict["footpaths"]
+    parsed_engine = Engine.from_str(engine)
+    if compile_timetable or parsed_engine != Engine.RAPTOR:
+        structs_dict, footpaths_dict = read_timetable_and_footpaths(structs, footpaths)
+        id_maps = structs_dict.id_maps
+    else:
+        structs_dict, footpaths_dict = read_structs_and_footpaths(structs, footpaths)
+        id_maps = IdMaps.from_structs(structs_dict)
+    start_stop, end_stop = intern_stop_flags(id_maps, start_stop_id, end_stop_id)
 
-    structs_dict = storage.read_any_dict(structs)
-    build.validate_structs_dict(structs_dict)
-
-    with Timed.info("Running RAPTOR"):
+    if parsed_engine == Engine.TRIP_BASED:
+        r = TripBased(
+            structs_dict,
+            footpaths_dict,
+            max_transfers,
+            default_transfer_time,
+            read_transfers(
+                transfers or default_transfers_path(structs), structs, footpaths
+            ),
+        )
+    elif parsed_engine == Engine.CSA:
+        r = ConnectionScan(structs_dict, footpaths_dict, default_transfer_time)
+    else:
         r = Raptor(
             structs_dict,
             footpaths_dict,
             max_transfers,
             default_transfer_time,
+            n_workers,
         )
+
+    with Timed.info(f"Running {parsed_engine.name}"):
         arrival_times, tracer_map = r.run(
-            start_stop_id,
-            end_stop_id,
+            start_stop,
+            end_stop,
             start_time,
         )
+    if isinstance(r, Raptor):
+        r.close()
+
+    arrival_times = id_maps.gtfs_stop_dict(arrival_times)
+    tracer_map = id_maps.gtfs_tracer_map(tracer_map)
 
     arrival_times_df = pd.DataFrame.from_dict(
         arrival_times, orient="index", columns=["arrival_time"]
@@ -79,6 +155,63 @@ def raptor(
     )
 
 
+def default_transfers_path(structs: str) -> str:
+    return os.path.join(os.path.dirname(structs), key.TRANSFERS_FILE_NAME)
+
+
+def read_transfers(
+    transfers: str, structs: str, footpaths: str
+) -> Optional[Transfers]:
+    if not os.path.exists(transfers):
+        return None
+
+    transfers_dict = storage.read_any_dict(transfers)
+    if not key.TRANSFERS_KEY in transfers_dict:
+        raise typer.BadParameter(f"Transfers file {transfers} has unexpected format.")
+    loaded: Transfers = transfers_dict[key.TRANSFERS_KEY]
+    try:
+        loaded.validate_source(structs, footpaths)
+    except Exception as e:
+        raise typer.BadParameter(f"Transfers file {transfers}: {e}.")
+    return loaded
+
+
+def read_structs_and_footpaths(structs: str, footpaths: str) -> tuple[dict, Any]:
+    """
+    Reads the interned structs dict and the footpaths, translated to the
+    integer stop ids of the structs.
+    """
+    structs_dict = storage.read_any_dict(structs)
+    build.validate_structs_dict(structs_dict)
+    structs_dict = intern.ensure_interned(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    return structs_dict, id_maps.intern_footpaths(read_footpaths(footpaths))
+
+
+def read_timetable_and_footpaths(structs: str, footpaths: str) -> tuple[Timetable, Any]:
+    """
+    Like `read_structs_and_footpaths`, but returns the compiled timetable.
+    The timetable written by the build-structures command next to the
+    structs is memory-mapped if it was compiled from the given structs file,
+    otherwise the structs are read and compiled.
+    """
+    with Timed.info("Opening timetable"):
+        timetable = open_timetable_for_structs(structs)
+    if timetable is None:
+        structs_dict, footpaths_dict = read_structs_and_footpaths(structs, footpaths)
+        with Timed.info("Compiling timetable"):
+            return Timetable.from_structs(structs_dict), footpaths_dict
+
+    return timetable, timetable.id_maps.intern_footpaths(read_footpaths(footpaths))
+
+
+def read_footpaths(footpaths: str) -> dict:
+    footpaths_dict = storage.read_any_dict(footpaths)
+    if not "footpaths" in footpaths_dict:
+        raise typer.BadParameter(f"Footpaths file {footpaths} has unexpected format.")
+    return footpaths_dict["footpaths"]
+
+
 def validate_flags(
     footpaths: str,
     structs: str,
@@ -88,6 +221,8 @@ def validate_flags(
     end_stop_id: Optional[str],
     start_time: str,
     output: str,
+    n_workers: int,
+    transfers: Optional[str],
 ):
     if not os.path.exists(footpaths):
         raise typer.BadParameter(f"Footpaths file {footpaths} does not exist.")
@@ -95,8 +230,27 @@ def validate_flags(
     if not os.path.exists(structs):
         raise typer.BadParameter(f"Structs file {structs} does not exist.")
 
+    if transfers is not None and not os.path.exists(transfers):
+        raise typer.BadParameter(f"Transfers file {transfers} does not exist.")
+
     if max_transfers < 0:
         raise typer.BadParameter(f"Max transfers must be non-negative.")
 
     if default_transfer_time < 0:
         raise typer.BadParameter(f"Default transfer time must be non-negative.")
+
+    if n_workers < 1:
+        raise typer.BadParameter(f"Number of workers must be positive.")
+
+
+def intern_stop_flags(
+    id_maps: IdMaps, start_stop_id: str, end_stop_id: Optional[str]
+) -> tuple[int, Optional[int]]:
+    for stop_id in [start_stop_id, end_stop_id]:
+        if stop_id is not None and stop_id not in id_maps.stop_id_by_gtfs_id:
+            raise typer.BadParameter(f"Stop {stop_id} is not served by any trip.")
+
+    return (
+        id_maps.intern_stop(start_stop_id),
+        id_maps.intern_stop(end_stop_id) if end_stop_id is not None else None,
+    )
@@ -0,0 +1,121 @@
+import os
+from typing import Optional
+from typing_extensions import Annotated
+
+import typer
+
+from command.raptor import FOOTPATHS_HELP, STRUCTS_HELP, read_timetable_and_footpaths
+from package.logger import rlog
+from package.raptor.data import create_footpaths
+from package.raptor.server import QueryHTTPServer, QueryServer, UnixQueryHTTPServer
+
+
+def serve(
+    structs: Annotated[str, typer.Option(help=STRUCTS_HELP)],
+    footpaths: Annotated[str, typer.Option(help=FOOTPATHS_HELP)],
+    max_transfers: Annotated[int, typer.Option(help="Maximum number of transfers")] = 3,
+    default_transfer_time: Annotated[
+        int, typer.Option(help="Transfer time used when tranfering at the same stop")
+    ] = 180,
+    host: Annotated[str, typer.Option(help="Host to listen on.")] = "127.0.0.1",
+    port: Annotated[int, typer.Option(help="Port to listen on.")] = 8000,
+    socket: Annotated[
+        Optional[str],
+        typer.Option(help="Listen on this unix socket instead of host and port."),
+    ] = None,
+    n_workers: Annotated[
+        int,
+        typer.Option(help="Number of processes queries are answered in."),
+    ] = 1,
+    cache_size: Annotated[
+        int,
+        typer.Option(help="Number of query results that are kept in memory."),
+    ] = 1024,
+    batch_window: Annotated[
+        float,
+        typer.Option(
+            help="Milliseconds a query waits for queries of concurrent requests to be answered in one batch with. 0 answers every request on its own."
+        ),
+    ] = 5,
+):
+    """
+    Loads the timetable once and answers RAPTOR and McRAPTOR queries over
+    HTTP. POST a query, or a list of queries, as JSON to /query, e.g.
+    {"algorithm": "raptor", "start_stop_id": "1", "end_stop_id": "2",
+    "start_time": "08:00:00"}.
+    """
+    validate_flags(
+        structs,
+        footpaths,
+        max_transfers,
+        default_transfer_time,
+        socket,
+        n_workers,
+        cache_size,
+        batch_window,
+    )
+
+    timetable, footpaths_dict = read_timetable_and_footpaths(structs, footpaths)
+
+    query_server = QueryServer(
+        timetable,
+        create_footpaths(footpaths_dict, timetable.n_stops),  # type: ignore
+        max_transfers,
+        default_transfer_time,
+        n_workers=n_workers,
+        cache_size=cache_size,
+        batch_window=batch_window / 1000,
+    )
+    query_server.start_workers()
+
+    if socket is not None:
+        http_server = UnixQueryHTTPServer(socket, query_server)
+        rlog.info(f"Listening on {socket}")
+    else:
+        http_server = QueryHTTPServer((host, port), query_server)
+        rlog.info(f"Listening on http://{host}:{port}")
+
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        query_server.shutdown()
+        if socket is not None and os.path.exists(socket):
+            os.remove(socket)
+
+
+def validate_flags(
+    structs: str,
+    footpaths: str,
+    max_transfers: int,
+    default_transfer_time: int,
+    socket: Optional[str],
+    n_workers: int,
+    cache_size: int,
+    batch_window: float,
+):
+    if not os.path.exists(structs):
+        raise typer.BadParameter(f"Structs file {structs} does not exist.")
+
+    if not os.path.exists(footpaths):
+        raise typer.BadParameter(f"Footpaths file {footpaths} does not exist.")
+
+    if max_transfers < 0:
+        raise typer.BadParameter(f"Max transfers must be non-negative.")
+
+    if default_transfer_time < 0:
+        raise typer.BadParameter(f"Default transfer time must be non-negative.")
+
+    if socket is not None and os.path.exists(socket):
+        raise typer.BadParameter(f"Socket {socket} already exists.")
+
+    if n_workers < 1:
+        raise typer.BadParameter(f"Number of workers must be positive.")
+
+    if cache_size < 0:
+        raise typer.BadParameter(f"Cache size must be non-negative.")
+
+    if batch_window < 0:
+        raise typer.BadParameter(f"Batch window must be non-negative.")
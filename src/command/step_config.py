@@ -47,6 +47,7 @@ def get_bicycle_public_transport_config_with_data(
     bicycle_location_path: str,
     structs_path: str,
     stops_path: str,
+    native_public_transport: bool = False,
 ):
     with Timed.info("Fetching POI for runtime optimization"):
         pois = minute_city.fetch_pois_for_area(geo_meta.boundary, geo_data.osm_nodes)  # type: ignore
@@ -67,6 +68,7 @@ def get_bicycle_public_transport_config_with_data(
         structs_path,
         stops_path,
         geo_data.nxgraph,
+        native=native_public_transport,
     )
 
     walking_step = WalkingStepBuilder(
@@ -141,6 +143,7 @@ def get_public_transport_only_config_with_data(
     geo_data,
     structs_path: str,
     stops_path: str,
+    native_public_transport: bool = False,
 ):
     with Timed.info("Fetching POI for runtime optimization"):
         pois = minute_city.fetch_pois_for_area(geo_meta.boundary, geo_data.osm_nodes)  # type: ignore
@@ -154,6 +157,7 @@ def get_public_transport_only_config_with_data(
         structs_path,
         stops_path,
         geo_data.nxgraph,
+        native=native_public_transport,
     )
 
     initial_steps = [[walking_step]]
@@ -174,11 +178,12 @@ def get_bicycle_public_transport_config(
     bicycle_location_path: str,
     structs_path: str,
     stops_path: str,
+    native_public_transport: bool = False,
 ):
     geo_meta = GeoMeta.load(geo_meta_path)
     geo_data = OSMData(geo_meta, city_id, additional_network_types=[NetworkType.CYCLING])
     return get_bicycle_public_transport_config_with_data(
-        geo_meta, geo_data, bicycle_price_function, bicycle_location_path, structs_path, stops_path)
+        geo_meta, geo_data, bicycle_price_function, bicycle_location_path, structs_path, stops_path, native_public_transport)
 
 
 def get_bicycle_only_config(
@@ -203,7 +208,8 @@ def get_public_transport_only_config(
     city_id: str,
     structs_path: str,
     stops_path: str,
+    native_public_transport: bool = False,
 ):
     geo_meta = GeoMeta.load(geo_meta_path)
     geo_data = OSMData(geo_meta, city_id)
-    return get_public_transport_only_config_with_data(geo_meta, geo_data, structs_path, stops_path)
+    return get_public_transport_only_config_with_data(geo_meta, geo_data, structs_path, stops_path, native_public_transport)
@@ -0,0 +1,60 @@
+import os
+from typing import Optional
+from typing_extensions import Annotated
+
+import typer
+
+from command.raptor import (
+    FOOTPATHS_HELP,
+    STRUCTS_HELP,
+    default_transfers_path,
+    read_timetable_and_footpaths,
+)
+from package import key, storage
+from package.logger import Timed
+from package.raptor.data import create_footpaths
+from package.trip_based.transfers import compute_transfers, source_fingerprint
+
+
+def build_transfers(
+    structs: Annotated[str, typer.Option(help=STRUCTS_HELP)],
+    footpaths: Annotated[str, typer.Option(help=FOOTPATHS_HELP)],
+    default_transfer_time: Annotated[
+        int, typer.Option(help="Transfer time used when tranfering at the same stop")
+    ] = 180,
+    output: Annotated[
+        Optional[str],
+        typer.Option(
+            help=f"Output file in pickle format. Defaults to {key.TRANSFERS_FILE_NAME} next to the structures."
+        ),
+    ] = None,
+):
+    """
+    Precomputes the trip transfers used by the Trip-Based engine.
+    """
+    validate_flags(structs, footpaths, default_transfer_time)
+    if output is None:
+        output = default_transfers_path(structs)
+
+    timetable, footpaths_dict = read_timetable_and_footpaths(structs, footpaths)
+
+    with Timed.info("Computing transfers"):
+        transfers = compute_transfers(
+            timetable,
+            create_footpaths(footpaths_dict, timetable.n_stops),  # type: ignore
+            default_transfer_time,
+        )
+    transfers.source_fingerprint = source_fingerprint(structs, footpaths)
+
+    storage.write_any_dict({key.TRANSFERS_KEY: transfers}, output)
+
+
+def validate_flags(structs: str, footpaths: str, default_transfer_time: int):
+    if not os.path.exists(structs):
+        raise typer.BadParameter(f"Structs file {structs} does not exist.")
+
+    if not os.path.exists(footpaths):
+        raise typer.BadParameter(f"Footpaths file {footpaths} does not exist.")
+
+    if default_transfer_time < 0:
+        raise typer.BadParameter(f"Default transfer time must be non-negative.")
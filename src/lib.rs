@@ -2,6 +2,7 @@ use log::info;
 use pyo3::prelude::*;
 use pyo3_log::{Caching, Logger};
 use rs::graph_cache::GraphCache;
+use rs::mcraptor::{run_mcraptor_with_bags, PyMcRaptorLabel, TimetableCache};
 use rs::mlc_adapter::{run_mlc, run_mlc_with_bags, run_mlc_with_node_and_time, PyLabel};
 
 mod rs;
@@ -20,8 +21,11 @@ fn mcr_py(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(log_something, m)?)?;
     m.add_function(wrap_pyfunction!(run_mlc_with_bags, m)?)?;
     m.add_function(wrap_pyfunction!(run_mlc_with_node_and_time, m)?)?;
+    m.add_function(wrap_pyfunction!(run_mcraptor_with_bags, m)?)?;
 
     m.add_class::<GraphCache>()?;
     m.add_class::<PyLabel>()?;
+    m.add_class::<TimetableCache>()?;
+    m.add_class::<PyMcRaptorLabel>()?;
     Ok(())
 }
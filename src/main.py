@@ -2,7 +2,7 @@ from typing_extensions import Annotated
 
 import typer
 
-from command import build, footpaths, mcr, raptor, osm
+from command import build, footpaths, mcr, raptor, osm, serve, transfers
 from command.gtfs import gtfs
 from package import logger, key
 
@@ -10,7 +10,9 @@ from package import logger, key
 app = typer.Typer(pretty_exceptions_show_locals=False)
 app.command(key.BUILD_STRUCTURES_COMMAND_NAME)(build.build_structures)
 app.command(key.FOOTPATHS_COMMAND_NAME)(footpaths.generate)
+app.command(key.TRANSFERS_COMMAND_NAME)(transfers.build_transfers)
 app.command(key.RAPTOR_COMMAND_NAME)(raptor.raptor)
+app.command(key.SERVE_COMMAND_NAME)(serve.serve)
 app.command(key.MCR_COMMAND_NAME)(mcr.run)
 app.add_typer(gtfs.app, name=key.GTFS_UPPER_COMMAND_NAME)
 app.add_typer(osm.app, name=key.OSM_UPPER_COMMAND_NAME)
@@ -0,0 +1,297 @@
+import sys
+from bisect import bisect_left
+from typing import Optional
+from typing_extensions import Self
+
+import numpy as np
+
+from package import strtime
+from package.logger import rlog
+from package.raptor.data import create_footpaths
+from package.raptor.raptor import (
+    seconds_dict_to_times_dict,
+    seconds_profile_to_times_profile,
+)
+from package.raptor.timetable import NO_TIME, Timetable
+from package.structs.footpaths import Footpaths
+from package.tracer.tracer import (
+    Trace,
+    TraceFootpath,
+    TraceStart,
+    TraceTrip,
+    TracerMap,
+)
+
+INFINITY = sys.maxsize
+
+# last connection of the trip the stop is reached with and the walking time
+# of a footpath afterwards (None if the stop is reached by the trip)
+Arrival = tuple[int, Optional[int]]
+
+
+class Connections:
+    """
+    All elementary connections of the timetable, i.e. a trip going from one
+    stop to the next, sorted by departure time. Connections with the same
+    departure time are sorted by arrival time, so that the connections of a
+    trip stay in order, even if it spends no time between stops.
+    """
+
+    def __init__(
+        self: Self,
+        departure_stops: np.ndarray,
+        arrival_stops: np.ndarray,
+        departure_times: np.ndarray,
+        arrival_times: np.ndarray,
+        trips: np.ndarray,
+    ):
+        self.departure_stops = departure_stops
+        self.arrival_stops = arrival_stops
+        self.departure_times = departure_times
+        self.arrival_times = arrival_times
+        self.trips = trips
+
+    def __len__(self: Self) -> int:
+        return len(self.trips)
+
+    @staticmethod
+    def from_timetable(timetable: Timetable) -> "Connections":
+        columns: list[list[np.ndarray]] = [[], [], [], [], []]
+        for route_id in range(timetable.n_routes):
+            stops = np.array(timetable.iterate_stops_in_route_from_idx(route_id, 0))
+            if len(stops) < 2:
+                continue
+            trips = timetable.route_trips[
+                timetable.route_trip_offsets[route_id] : timetable.route_trip_offsets[
+                    route_id + 1
+                ]
+            ]
+            departures = timetable.departure_times_by_route[route_id][:, :-1]
+            arrivals = timetable.arrival_times_by_route[route_id][:, 1:]
+            valid = (departures != NO_TIME) & (arrivals != NO_TIME)
+
+            trip_idxs, stop_pos = np.nonzero(valid)
+            columns[0].append(stops[:-1][stop_pos])
+            columns[1].append(stops[1:][stop_pos])
+            columns[2].append(departures[valid])
+            columns[3].append(arrivals[valid])
+            columns[4].append(trips[trip_idxs])
+
+        departure_stops, arrival_stops, departure_times, arrival_times, trips = [
+            (
+                np.concatenate(column).astype(np.int64)
+                if len(column) > 0
+                else np.empty(0, dtype=np.int64)
+            )
+            for column in columns
+        ]
+        order = np.lexsort((arrival_times, departure_times))
+        return Connections(
+            departure_stops[order],
+            arrival_stops[order],
+            departure_times[order],
+            arrival_times[order],
+            trips[order],
+        )
+
+
+class ConnectionScan:
+    """
+    Connection Scan Algorithm (Dibbelt et al., 2013).
+
+    Scans the connections of the timetable once, in departure order, starting
+    at the first connection that departs after the start time. Trips are
+    boarded and footpaths walked with the same rules as in `Raptor`, so the
+    results are the same, except that the number of transfers is not limited.
+
+    Works on the compiled `Timetable` and the interned stop ids.
+    """
+
+    def __init__(
+        self: Self,
+        structs_dict: dict | Timetable,
+        footpaths: dict | Footpaths,
+        default_transfer_time: int,
+    ):
+        if not isinstance(structs_dict, Timetable):
+            structs_dict = Timetable.from_structs(structs_dict)
+        self.timetable = structs_dict
+
+        footpaths = create_footpaths(footpaths, self.timetable.n_stops)
+        assert footpaths is not None
+        self.footpaths = footpaths
+
+        self.default_transfer_time = default_transfer_time
+
+        self.connections = Connections.from_timetable(self.timetable)
+        # plain lists for the hot loop
+        self.departure_stops: list[int] = self.connections.departure_stops.tolist()
+        self.arrival_stops: list[int] = self.connections.arrival_stops.tolist()
+        self.departure_times: list[int] = self.connections.departure_times.tolist()
+        self.arrival_times: list[int] = self.connections.arrival_times.tolist()
+        self.trips: list[int] = self.connections.trips.tolist()
+
+    def run(
+        self: Self, start_stop_id: int, end_stop_id: Optional[int], start_time_str: str
+    ) -> tuple[dict[int, str], TracerMap]:
+        """
+        Returns the earliest arrival times at all stops and the journeys
+        leading to them, like `Raptor.run`. If an end stop is given, the scan
+        stops once no connection can improve the arrival time at it.
+        """
+        start_time = strtime.str_time_to_seconds(start_time_str)
+        arrival_times, arrivals, entries = self.scan(
+            start_stop_id, end_stop_id, start_time
+        )
+
+        tracers_map = TracerMap(self.timetable.stop_id_set)
+        tracers_map.tracers[start_stop_id] = [TraceStart(start_stop_id, start_time)]
+        for stop_id in arrivals:
+            tracers_map.tracers[stop_id] = self.trace(
+                arrivals, entries, stop_id, start_stop_id, start_time
+            )
+
+        return (
+            seconds_dict_to_times_dict(dict(enumerate(arrival_times))),
+            tracers_map,
+        )
+
+    def run_one_to_all(self: Self, start_stop_id: int, start_time: int) -> list[int]:
+        """
+        Returns the earliest arrival time in seconds at every stop, INFINITY
+        if the stop is not reached.
+        """
+        arrival_times, _, _ = self.scan(start_stop_id, None, start_time)
+        return arrival_times
+
+    def run_range(
+        self: Self,
+        start_stop_id: int,
+        window_start_str: str,
+        window_end_str: str,
+    ) -> dict[int, list[tuple[str, str]]]:
+        """
+        Computes the earliest arrival times for every departure from the start
+        stop within the window, in the format of `Raptor.run_range`: for every
+        stop the Pareto profile of (departure time, arrival time) tuples,
+        sorted by departure time.
+        """
+        window_start = strtime.str_time_to_seconds(window_start_str)
+        window_end = strtime.str_time_to_seconds(window_end_str)
+
+        departure_times = sorted(
+            {
+                departure_time - self.default_transfer_time
+                for departure_time in self.timetable.get_departure_times_at_stop(
+                    start_stop_id
+                )
+            }
+        )
+        departure_times = [
+            departure_time
+            for departure_time in departure_times
+            if window_start <= departure_time <= window_end
+        ]
+
+        profiles: dict[int, list[tuple[int, int]]] = {
+            stop_id: [] for stop_id in range(self.timetable.n_stops)
+        }
+        # departures are processed in decreasing order, so an entry is only
+        # Pareto optimal if it arrives earlier than the previous one
+        for departure_time in reversed(departure_times):
+            arrival_times = self.run_one_to_all(start_stop_id, departure_time)
+            for stop_id, arrival_time in enumerate(arrival_times):
+                profile = profiles[stop_id]
+                if arrival_time == INFINITY:
+                    continue
+                if len(profile) == 0 or arrival_time < profile[-1][1]:
+                    profile.append((departure_time, arrival_time))
+
+        rlog.info(f"CSA finished after {len(departure_times)} departures")
+        return {
+            stop_id: seconds_profile_to_times_profile(profile[::-1])
+            for stop_id, profile in profiles.items()
+        }
+
+    def scan(
+        self: Self, start_stop_id: int, end_stop_id: Optional[int], start_time: int
+    ) -> tuple[list[int], dict[int, Arrival], dict[int, int]]:
+        """
+        Runs the connection scan. Returns the earliest arrival time at every
+        stop, how the reached stops (except the start stop) are reached and
+        the connection every boarded trip is entered with.
+        """
+        departure_stops = self.departure_stops
+        arrival_stops = self.arrival_stops
+        departure_times = self.departure_times
+        connection_arrival_times = self.arrival_times
+        trips = self.trips
+        footpaths = self.footpaths
+        transfer_time = self.default_transfer_time
+
+        arrival_times = [INFINITY] * self.timetable.n_stops
+        arrival_times[start_stop_id] = start_time
+        arrivals: dict[int, Arrival] = {}
+        # connection with which a trip is entered
+        entries: dict[int, int] = {}
+
+        first = bisect_left(departure_times, start_time + transfer_time)
+        for c in range(first, len(trips)):
+            departure_time = departure_times[c]
+            if end_stop_id is not None and departure_time >= arrival_times[end_stop_id]:
+                break
+
+            trip_id = trips[c]
+            if trip_id not in entries:
+                if arrival_times[departure_stops[c]] + transfer_time > departure_time:
+                    continue
+                entries[trip_id] = c
+
+            arrival_stop_id = arrival_stops[c]
+            arrival_time = connection_arrival_times[c]
+            if arrival_time >= arrival_times[arrival_stop_id]:
+                continue
+            arrival_times[arrival_stop_id] = arrival_time
+            arrivals[arrival_stop_id] = (c, None)
+
+            for nearby_stop_id, walking_time in footpaths.items(arrival_stop_id):
+                if arrival_time + walking_time < arrival_times[nearby_stop_id]:
+                    arrival_times[nearby_stop_id] = arrival_time + walking_time
+                    arrivals[nearby_stop_id] = (c, walking_time)
+
+        return arrival_times, arrivals, entries
+
+    def trace(
+        self: Self,
+        arrivals: dict[int, Arrival],
+        entries: dict[int, int],
+        stop_id: int,
+        start_stop_id: int,
+        start_time: int,
+    ) -> list[Trace]:
+        """
+        Reconstructs the journey to the stop. The stop a trip is boarded at
+        may have been reached earlier afterwards, which still allows to board.
+        """
+        traces: list[Trace] = []
+        while stop_id != start_stop_id:
+            c, walking_time = arrivals[stop_id]
+            if walking_time is not None:
+                traces.append(
+                    TraceFootpath(self.arrival_stops[c], stop_id, walking_time)
+                )
+
+            entry = entries[self.trips[c]]
+            traces.append(
+                TraceTrip(
+                    start_stop_id=self.departure_stops[entry],
+                    departure_time=self.departure_times[entry],
+                    end_stop_id=self.arrival_stops[c],
+                    arrival_time=self.arrival_times[c],
+                    trip_id=self.trips[c],
+                )
+            )
+            stop_id = self.departure_stops[entry]
+
+        traces.append(TraceStart(start_stop_id, start_time))
+        return traces[::-1]
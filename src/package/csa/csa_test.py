@@ -0,0 +1,66 @@
+from typing import Any
+
+from package.csa.csa import ConnectionScan, Connections
+from package.raptor.raptor import Raptor
+from package.raptor.timetable import Timetable
+from package.structs.intern import IdMaps, intern_structs
+
+
+def test_connections_are_sorted(structs_dict: dict[str, Any]):
+    connections = Connections.from_timetable(
+        Timetable.from_structs(intern_structs(structs_dict))
+    )
+
+    # three trips with three stops each
+    assert len(connections) == 6
+    assert connections.departure_times.tolist() == [0, 600, 3600, 4200, 7200, 7800]
+
+
+def test_connection_scan_matches_raptor(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    footpaths = id_maps.intern_footpaths(footpaths_dict)
+    timetable = Timetable.from_structs(structs_dict)
+
+    for transfer_time in [0, 60]:
+        csa = ConnectionScan(timetable, footpaths, transfer_time)
+        raptor = Raptor(timetable, footpaths, 10, transfer_time)
+
+        for start_stop_id in id_maps.stop_ids:
+            for start_time in ["00:00:00", "00:30:00", "01:00:00", "02:00:00"]:
+                args = (id_maps.intern_stop(start_stop_id), None, start_time)
+                expected, expected_tracers = raptor.run(*args)
+                arrival_times, tracers = csa.run(*args)
+
+                assert arrival_times == expected
+                # journeys with the same arrival time may differ in the number
+                # of trips, so only check that they end at the right stop
+                for stop_id, traces in expected_tracers.tracers.items():
+                    assert len(tracers[stop_id]) > 0 or len(traces) == 0
+                    if len(tracers[stop_id]) > 1:
+                        assert tracers[stop_id][-1].end_stop_id == stop_id
+
+        start_stop = id_maps.intern_stop("stop1")
+        assert csa.run_range(start_stop, "00:00:00", "03:00:00") == raptor.run_range(
+            start_stop, "00:00:00", "03:00:00"
+        )
+
+
+def test_connection_scan_target_pruning(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    csa = ConnectionScan(structs_dict, id_maps.intern_footpaths(footpaths_dict), 0)
+
+    arrival_times, _ = csa.run(
+        id_maps.intern_stop("stop1"), id_maps.intern_stop("stop2"), "00:00:00"
+    )
+    arrival_times = id_maps.gtfs_stop_dict(arrival_times)
+
+    assert arrival_times["stop2"] == "00:10:00"
+    assert arrival_times["stop4"] == "00:12:00"
+    # the scan stops before trip1 leaves stop2
+    assert arrival_times["stop3"] == "--:--:--"
@@ -1,13 +1,16 @@
 from enum import Enum
 import os
+from typing import Any
 
 import geopandas as gpd
+import numpy as np
 from package.geometa import GeoMeta
 
 from package.osm import osm
 from package.logger import Timed, rlog
 from package.osm import igraph, graph
 from package import storage
+from package.structs.footpaths import create_csr_dict_from_edges
 
 
 class GenerationMethod(Enum):
@@ -33,7 +36,11 @@ def generate(
     avg_walking_speed: float,
     max_walking_duration: int,
     method: GenerationMethod = GenerationMethod.IGRAPH,
-) -> dict[str, dict[str, int]]:
+) -> dict[str, Any]:
+    """
+    Generates the footpaths between nearby stops, in the CSR format of
+    `create_csr_dict`.
+    """
     osm_path = osm_path if osm_path else osm.get_osm_path_from_city_id(city_id)
 
     with Timed.info("Reading stops and geo meta"):
@@ -65,9 +72,10 @@ def generate(
     stop_to_node_map: dict[str, int] = stops_df.set_index("stop_id")[
         "nearest_node"
     ].to_dict()
-    node_to_stop_map: dict[int, str] = stops_df.set_index("nearest_node")[
-        "stop_id"
-    ].to_dict()
+    # of the stops that share a node, the last one is used for the node
+    stop_id_by_node = stops_df.drop_duplicates("nearest_node", keep="last").set_index(
+        "nearest_node"
+    )["stop_id"]
 
     # this map contains the one-to-many queries that have to be solved on the graph
     source_targets_map: dict[int, list[int]] = {
@@ -79,21 +87,17 @@ def generate(
 
     with Timed.info(f"Calculating distances between nearby stops using {method.name}"):
         if method == GenerationMethod.IGRAPH:
-            source_targets_distance_map = igraph.query_multiple_one_to_many(
+            source_nodes, target_nodes, distances = igraph.query_multiple_one_to_many(
                 source_targets_map, osm_reader, nodes, edges
             )
         elif method == GenerationMethod.FAST_PATH:
             raise NotImplementedError()
 
-    footpaths: dict[str, dict[str, int]] = {}
-    for source_node, targets_distance_map in source_targets_distance_map.items():
-        stop_id = node_to_stop_map[source_node]
-        footpaths[stop_id] = {  # type: ignore
-            node_to_stop_map[target_node]: int(distance / avg_walking_speed)
-            for target_node, distance in targets_distance_map.items()
-        }
-
-    return footpaths
+    return create_csr_dict_from_edges(
+        stop_id_by_node.loc[source_nodes].to_numpy(),
+        stop_id_by_node.loc[target_nodes].to_numpy(),
+        (distances / avg_walking_speed).astype(np.int64),
+    )
 
 
 def create_nearby_stops_map(
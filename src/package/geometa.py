@@ -1,11 +1,18 @@
-from shapely.geometry import MultiPolygon, Point, Polygon
+from shapely.geometry import MultiPolygon, Polygon
+from shapely.geometry.base import BaseGeometry
 import pickle
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import folium
+import shapely
 
 from package import cache
 
+# pyrosm pins shapely below 2, whose array functions the cropping uses if
+# they are available
+SHAPELY_2 = int(shapely.__version__.split(".")[0]) >= 2
+
 
 class GeoMeta:
     """
@@ -40,30 +47,69 @@ class GeoMeta:
     def crop_gdf(
         self, locations: gpd.GeoDataFrame, buffer: float = 0
     ) -> gpd.GeoDataFrame:
-        boundary = self.boundary
-        if buffer > 0:
-            boundary = boundary.buffer(buffer)
-
-        locations = locations.loc[locations.geometry.within(boundary), :]
+        geometry = locations.geometry
+        if len(geometry) > 0 and (geometry.geom_type == "Point").all():
+            # points only, which can be tested by their coordinates
+            is_within = self.contains_xy(
+                geometry.x.to_numpy(), geometry.y.to_numpy(), buffer
+            )
+        else:
+            is_within = self.contains(np.asarray(geometry.array), buffer)
 
-        return locations
+        return locations.loc[is_within, :]
 
     def crop_df(
         self, locations: pd.DataFrame, lat_col: str, lon_col: str, buffer: float = 0
     ) -> pd.DataFrame:
-        boundary = self.boundary
-        if buffer > 0:
-            boundary = boundary.buffer(buffer)
+        is_within = self.contains_xy(
+            locations[lon_col].to_numpy(dtype=float),
+            locations[lat_col].to_numpy(dtype=float),
+            buffer,
+        )
 
-        locations = locations.loc[
-            locations.apply(
-                lambda x: boundary.contains(Point(x[lon_col], x[lat_col])),
-                axis=1,
-            ),
-            :,
-        ]
+        return locations.loc[is_within, :]
 
-        return locations
+    def get_buffered_boundary(self, buffer: float = 0) -> BaseGeometry:
+        if buffer > 0:
+            return self.boundary.buffer(buffer)
+        return self.boundary
+
+    def contains_xy(
+        self, x: np.ndarray, y: np.ndarray, buffer: float = 0
+    ) -> np.ndarray:
+        """
+        Returns whether the boundary contains the points with the given
+        coordinates. Points outside of the bounding box of the boundary are
+        rejected without testing them against the boundary.
+        """
+        boundary = self.get_buffered_boundary(buffer)
+        min_x, min_y, max_x, max_y = boundary.bounds
+        in_bounds = (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+
+        is_within = np.zeros(len(x), dtype=bool)
+        is_within[in_bounds] = contains_xy(boundary, x[in_bounds], y[in_bounds])
+        return is_within
+
+    def contains(self, geometries: np.ndarray, buffer: float = 0) -> np.ndarray:
+        """
+        Returns whether the boundary contains the given geometries, like
+        `geometry.within(boundary)`. Geometries whose bounding box is not
+        within the bounding box of the boundary are rejected without testing
+        them against the boundary.
+        """
+        boundary = self.get_buffered_boundary(buffer)
+        min_x, min_y, max_x, max_y = boundary.bounds
+        bounds = get_bounds(geometries)
+        in_bounds = (
+            (bounds[:, 0] >= min_x)
+            & (bounds[:, 1] >= min_y)
+            & (bounds[:, 2] <= max_x)
+            & (bounds[:, 3] <= max_y)
+        )
+
+        is_within = np.zeros(len(geometries), dtype=bool)
+        is_within[in_bounds] = contains(boundary, geometries[in_bounds])
+        return is_within
 
     def get_center_lat_lon(self) -> tuple[float, float]:
         lon, lat = self.boundary.centroid.coords[0]
@@ -76,3 +122,60 @@ class GeoMeta:
         if self.residential_area is not None:
             folium.GeoJson(self.residential_area).add_to(m)
         return m
+
+
+def contains_xy(boundary: BaseGeometry, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Returns whether the boundary contains the points with the given
+    coordinates, testing them against the prepared boundary.
+    """
+    if SHAPELY_2:
+        shapely.prepare(boundary)
+        return shapely.contains_xy(boundary, x, y)
+
+    from shapely import vectorized
+
+    return vectorized.contains(boundary, x, y)
+
+
+def contains(boundary: BaseGeometry, geometries: np.ndarray) -> np.ndarray:
+    """
+    Returns whether the boundary contains the given geometries, testing them
+    against the prepared boundary. Missing geometries are not contained.
+    """
+    if SHAPELY_2:
+        shapely.prepare(boundary)
+        return shapely.contains(boundary, geometries)
+
+    from shapely.prepared import prep
+
+    prepared_boundary = prep(boundary)
+    return np.array(
+        [
+            geometry is not None and prepared_boundary.contains(geometry)
+            for geometry in geometries
+        ],
+        dtype=bool,
+    )
+
+
+def get_bounds(geometries: np.ndarray) -> np.ndarray:
+    """
+    Returns the bounds (min x, min y, max x, max y) of the geometries as an
+    array with one row per geometry, with NaNs for missing and empty
+    geometries.
+    """
+    if SHAPELY_2:
+        return shapely.bounds(geometries)
+
+    return np.array(
+        [
+            (
+                geometry.bounds
+                if geometry is not None and not geometry.is_empty
+                else (np.nan,) * 4
+            )
+            for geometry in geometries
+        ],
+        dtype=float,
+    ).reshape(-1, 4)
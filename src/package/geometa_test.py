@@ -0,0 +1,76 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import LineString, Point, Polygon
+
+from package import geometa
+from package.geometa import GeoMeta
+
+pytestmark = pytest.mark.filterwarnings(
+    "ignore:The 'shapely.vectorized.contains' function is deprecated"
+)
+
+
+@pytest.fixture(autouse=True, params=[True, False], ids=["shapely2", "shapely1"])
+def shapely_2(request, monkeypatch):
+    # the shapely 1 functions are still available in shapely 2
+    monkeypatch.setattr(geometa, "SHAPELY_2", request.param)
+
+
+def geo_meta() -> GeoMeta:
+    # an L-shaped boundary, so that its bounding box contains points outside
+    return GeoMeta(Polygon([(0, 0), (2, 0), (2, 1), (1, 1), (1, 2), (0, 2)]))
+
+
+def random_points(n: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {"lat": rng.uniform(-1, 3, n), "lon": rng.uniform(-1, 3, n)},
+        index=pd.RangeIndex(n) * 2,
+    )
+
+
+def test_crop_df():
+    locations = random_points(1000)
+    boundary = geo_meta().boundary
+
+    cropped = geo_meta().crop_df(locations, "lat", "lon")
+
+    expected = [
+        boundary.contains(Point(lon, lat))
+        for lat, lon in zip(locations["lat"], locations["lon"])
+    ]
+    pd.testing.assert_frame_equal(cropped, locations.loc[expected, :])
+    assert 0 < len(cropped) < len(locations)
+
+
+def test_crop_df_with_buffer():
+    locations = pd.DataFrame({"lat": [1.5, 1.5], "lon": [0.9, 1.1]})
+
+    assert len(geo_meta().crop_df(locations, "lat", "lon")) == 1
+    assert len(geo_meta().crop_df(locations, "lat", "lon", buffer=0.2)) == 2
+
+
+def test_crop_gdf():
+    locations = random_points(1000)
+    points = gpd.GeoDataFrame(
+        locations, geometry=gpd.points_from_xy(locations["lon"], locations["lat"])
+    )
+    lines = gpd.GeoDataFrame(
+        geometry=[
+            LineString([(0.1, 0.1), (0.5, 1.5)]),
+            # both ends are within the boundary, but not the line
+            LineString([(0.5, 1.5), (1.5, 0.8)]),
+            LineString([(0.1, 0.1), (3, 3)]),
+            None,
+        ]
+    )
+    boundary = geo_meta().boundary
+
+    for gdf in [points, lines]:
+        cropped = geo_meta().crop_gdf(gdf)
+        pd.testing.assert_frame_equal(cropped, gdf.loc[gdf.geometry.within(boundary)])
+
+    assert len(geo_meta().crop_gdf(lines)) == 1
+    assert len(geo_meta().crop_gdf(points.iloc[:0])) == 0
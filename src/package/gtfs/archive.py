@@ -1,6 +1,10 @@
 import zipfile
+from typing import Collection, Optional
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
 from package.gtfs import dtypes
 
 
@@ -8,6 +12,7 @@ from package.key import (
     STOP_TIMES_KEY,
     TRIPS_KEY,
     STOPS_KEY,
+    CALENDAR_DATES_KEY,
 )
 from package.logger import rlog
 
@@ -21,6 +26,7 @@ TRIPS_FILE = get_gtfs_filename(TRIPS_KEY)
 STOP_TIMES_FILE = get_gtfs_filename(STOP_TIMES_KEY)
 CALENDAR_FILE = get_gtfs_filename("calendar")
 ROUTES_FILE = get_gtfs_filename("routes")
+CALENDAR_DATES_FILE = get_gtfs_filename(CALENDAR_DATES_KEY)
 
 
 EXPECTED_FILES = [
@@ -31,10 +37,20 @@ EXPECTED_FILES = [
     ROUTES_FILE,
 ]
 
+# read if contained in the zip file
+OPTIONAL_FILES = [
+    CALENDAR_DATES_FILE,
+]
+
 
-def read_dfs(gtfs_zip_path: str) -> dict[str, pd.DataFrame]:
+def read_dfs(
+    gtfs_zip_path: str, exclude: Optional[list[str]] = None
+) -> dict[str, pd.DataFrame]:
     """
-    Reads GTFS zip file and returns a dictionary of dataframes.
+    Reads GTFS zip file and returns a dictionary of dataframes. Optional
+    files are only contained in the dictionary if they are in the zip file.
+    Files named in `exclude`, e.g. the stop times, are not read, so that they
+    can be read filtered with `read_filtered_df`.
     """
     dfs = {}
 
@@ -45,7 +61,12 @@ def read_dfs(gtfs_zip_path: str) -> dict[str, pd.DataFrame]:
             if expected_file not in contained:
                 raise Exception(f"Expected file {expected_file} not in zip file")
 
-        for file in EXPECTED_FILES:
+        excluded_files = [get_gtfs_filename(name) for name in exclude or []]
+        for file in EXPECTED_FILES + [
+            file for file in OPTIONAL_FILES if file in contained
+        ]:
+            if file in excluded_files:
+                continue
             df = read_file(zip_ref, file)
             name = file.split(".")[0]
             dfs[name] = df
@@ -60,6 +81,80 @@ def read_file(zip_ref: zipfile.ZipFile, file: str) -> pd.DataFrame:
         return df
 
 
+# size of the blocks the filtered files are read in, small blocks keep the
+# memory used for reading low compared to the memory of the result
+FILTERED_READ_BLOCK_SIZE = 1024 * 1024
+
+
+def read_filtered_df(
+    gtfs_zip_path: str,
+    name: str,
+    filters: dict[str, Collection[str]],
+    columns: Optional[list[str]] = None,
+) -> pd.DataFrame:
+    """
+    Reads a file of the GTFS zip file, keeping only the rows whose value in
+    each column of `filters` is one of the given values, and only `columns`
+    if given.
+
+    The file is streamed block by block and every block is filtered before
+    the next one is read, so memory is bounded by the size of the result
+    rather than by the size of the file.
+    """
+    if columns is not None and not set(filters).issubset(columns):
+        raise ValueError("The filtered columns must be read")
+
+    file = get_gtfs_filename(name)
+    value_sets = {
+        column: pa.array(list(values), type=pa.string())
+        for column, values in filters.items()
+    }
+
+    with zipfile.ZipFile(gtfs_zip_path, "r") as zip_ref:
+        if file not in zip_ref.namelist():
+            raise Exception(f"Expected file {file} not in zip file")
+
+        with zip_ref.open(file) as f:
+            rlog.debug(f"Reading {file} filtered by {', '.join(filters)}")
+            reader = pa_csv.open_csv(
+                f,
+                read_options=pa_csv.ReadOptions(block_size=FILTERED_READ_BLOCK_SIZE),
+                convert_options=pa_csv.ConvertOptions(
+                    include_columns=columns,
+                    column_types={
+                        column: ARROW_TYPES[dtype]
+                        for column, dtype in dtypes.GTFS_DTYPES.items()
+                    },
+                    # like pandas, which reads empty fields as missing values
+                    strings_can_be_null=True,
+                ),
+            )
+
+            n_rows = 0
+            batches = []
+            for batch in reader:
+                n_rows += batch.num_rows
+                mask = None
+                for column, value_set in value_sets.items():
+                    is_kept = pc.is_in(batch.column(column), value_set=value_set)
+                    mask = is_kept if mask is None else pc.and_(mask, is_kept)
+                batches.append(batch if mask is None else batch.filter(mask))
+
+            table = pa.Table.from_batches(batches, schema=reader.schema)
+
+    rlog.debug(f"Kept {table.num_rows} of {n_rows} rows of {file}")
+    return table.to_pandas(types_mapper=PANDAS_TYPES.get)
+
+
+ARROW_TYPES = {
+    "string": pa.string(),
+    "int64": pa.int64(),
+    "float64": pa.float64(),
+}
+# types that are converted to the same dtypes as `read_file` returns
+PANDAS_TYPES = {pa.string(): pd.StringDtype()}
+
+
 def write_dfs(dfs: dict[str, pd.DataFrame], output: str):
     """
     Writes a dictionary of dataframes to a GTFS zip file.
@@ -0,0 +1,70 @@
+import os
+
+import pandas as pd
+import pytest
+
+from package import key
+from package.gtfs import archive
+
+
+@pytest.fixture
+def gtfs_zip_path(tmp_path, stop_times_df: pd.DataFrame) -> str:
+    path = os.path.join(tmp_path, "gtfs.zip")
+    stop_times_df = stop_times_df.assign(stop_headsign="")
+    archive.write_dfs(
+        {
+            key.STOPS_KEY: pd.DataFrame({"stop_id": ["stop1", "stop2"]}),
+            key.TRIPS_KEY: pd.DataFrame({"trip_id": ["trip1"]}),
+            key.STOP_TIMES_KEY: stop_times_df,
+            key.CALENDAR_KEY: pd.DataFrame({"service_id": ["service1"]}),
+            key.ROUTES_KEY: pd.DataFrame({"route_id": ["route1"]}),
+        },
+        path,
+    )
+    return path
+
+
+def test_read_dfs_excludes_files(gtfs_zip_path: str):
+    dfs = archive.read_dfs(gtfs_zip_path, exclude=[key.STOP_TIMES_KEY])
+
+    assert key.STOP_TIMES_KEY not in dfs
+    assert key.CALENDAR_DATES_KEY not in dfs
+    assert dfs[key.STOPS_KEY]["stop_id"].tolist() == ["stop1", "stop2"]
+
+
+def test_read_filtered_df_matches_read_dfs(monkeypatch, gtfs_zip_path: str):
+    # read in many small blocks, so that every block is filtered on its own
+    monkeypatch.setattr(archive, "FILTERED_READ_BLOCK_SIZE", 128)
+    stop_times_df = archive.read_dfs(gtfs_zip_path)[key.STOP_TIMES_KEY]
+    filters = {
+        key.STOP_ID_KEY: ["stop1", "stop3", "stop4"],
+        key.TRIP_ID_KEY: ["trip2", "trip3"],
+    }
+
+    filtered_df = archive.read_filtered_df(gtfs_zip_path, key.STOP_TIMES_KEY, filters)
+
+    expected_df = stop_times_df[
+        stop_times_df[key.STOP_ID_KEY].isin(filters[key.STOP_ID_KEY])
+        & stop_times_df[key.TRIP_ID_KEY].isin(filters[key.TRIP_ID_KEY])
+    ].reset_index(drop=True)
+    pd.testing.assert_frame_equal(filtered_df, expected_df)
+    assert filtered_df["stop_headsign"].isna().all()
+
+
+def test_read_filtered_df_prunes_columns(gtfs_zip_path: str):
+    columns = [key.TRIP_ID_KEY, key.STOP_SEQUENCE_KEY]
+
+    stop_times_df = archive.read_filtered_df(
+        gtfs_zip_path, key.STOP_TIMES_KEY, {key.TRIP_ID_KEY: ["trip1"]}, columns
+    )
+
+    assert stop_times_df.columns.tolist() == columns
+    assert stop_times_df[key.STOP_SEQUENCE_KEY].tolist() == [1, 2, 3]
+
+    with pytest.raises(ValueError):
+        archive.read_filtered_df(
+            gtfs_zip_path,
+            key.STOP_TIMES_KEY,
+            {key.STOP_ID_KEY: ["stop1"]},
+            columns,
+        )
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 
@@ -5,18 +6,31 @@ from package import key
 from package.logger import Timed
 from package.gtfs import archive
 
+STOP_TIMES_COLUMNS = [
+    key.TRIP_ID_KEY,
+    key.STOP_TIME_ARRIVAL_TIME_KEY,
+    key.STOP_TIME_DEPARTURE_TIME_KEY,
+    key.STOP_ID_KEY,
+    key.STOP_SEQUENCE_KEY,
+]
+
 
 def clean(gtfs_zip_path: str) -> dict[str, pd.DataFrame]:
     """
     Cleans the GTFS data and writes the cleaned data to the output path.
     The resulting files are `trips.csv` and `stop_times.csv`, other files are
-    not needed for our algorithms.
+    not needed for our algorithms. The calendar and, if present, the
+    calendar dates are passed through, so that the structures can be built
+    for a single service date.
     """
     with Timed.info("Reading GTFS data"):
-        dfs = archive.read_dfs(gtfs_zip_path)
-    trips_df, stop_times_df, stops_df, routes_df = (
+        dfs = archive.read_dfs(gtfs_zip_path, exclude=[key.STOP_TIMES_KEY])
+        # only the columns the structures are built from
+        stop_times_df = archive.read_filtered_df(
+            gtfs_zip_path, key.STOP_TIMES_KEY, {}, STOP_TIMES_COLUMNS
+        )
+    trips_df, stops_df, routes_df = (
         dfs[key.TRIPS_KEY],
-        dfs[key.STOP_TIMES_KEY],
         dfs[key.STOPS_KEY],
         dfs[key.ROUTES_KEY],
     )
@@ -36,6 +50,8 @@ def clean(gtfs_zip_path: str) -> dict[str, pd.DataFrame]:
         key.STOP_TIMES_KEY: stop_times_df,
         key.STOPS_KEY: stops_df,
         key.ROUTES_KEY: routes_df,
+        key.CALENDAR_KEY: dfs[key.CALENDAR_KEY],
+        **{name: dfs[name] for name in [key.CALENDAR_DATES_KEY] if name in dfs},
     }
 
 
@@ -44,12 +60,14 @@ def remove_circular_trips(
     stop_times_df: pd.DataFrame,
 ) -> tuple[pd.DataFrame, pd.DataFrame]:
     """
-    Removes trips that have circular paths.
+    Removes trips that have circular paths, i.e. that visit a stop twice.
 
     Circular paths are not supported by our algorithms.
     """
-    circular_trips = stop_times_df.groupby("trip_id").apply(is_circular_trip)
-    circular_trips = circular_trips[circular_trips].index
+    stop_visits_df = stop_times_df[["trip_id", "stop_id"]]
+    # a missing stop id can not be told apart from any other stop
+    is_revisit = stop_visits_df.duplicated() | stop_visits_df["stop_id"].isna()
+    circular_trips = stop_visits_df.loc[is_revisit, "trip_id"].unique()
 
     trips_df = trips_df[~trips_df["trip_id"].isin(circular_trips)].copy()
     stop_times_df = stop_times_df[~stop_times_df["trip_id"].isin(circular_trips)].copy()
@@ -57,10 +75,6 @@ def remove_circular_trips(
     return trips_df, stop_times_df
 
 
-def is_circular_trip(stop_times_df: pd.DataFrame) -> bool:
-    return stop_times_df["stop_id"].nunique() != len(stop_times_df)
-
-
 def split_routes(
     trips_df: pd.DataFrame, stop_times_df: pd.DataFrame, routes_df: pd.DataFrame
 ) -> tuple[pd.DataFrame, pd.DataFrame]:
@@ -94,54 +108,73 @@ def create_paths_df(
     trips_df: pd.DataFrame, stop_times_df: pd.DataFrame
 ) -> pd.DataFrame:
     """
-    Creates a dataframe route_id, trip_id, and path, where path is a string
-    representation of the stops on the route in order.
+    Creates a dataframe route_id, trip_id, and path, where path is an integer
+    that identifies the stops of the trip in order. Trips have the same path
+    if and only if they visit the same stops in the same order.
+
+    The stop sequence of a trip is hashed by summing the hashes of its stops
+    and their positions. Two independent hashes are used, so that different
+    stop sequences of a feed get the same path with negligible probability.
     """
-    trips_stop_times_df = pd.merge(trips_df, stop_times_df, on="trip_id")
+    trips_stop_times_df = pd.merge(
+        trips_df[["route_id", "trip_id"]],
+        stop_times_df[["trip_id", "stop_id", "stop_sequence"]],
+        on="trip_id",
+    ).sort_values(["route_id", "trip_id", "stop_sequence"])
+
+    trip_ids = trips_stop_times_df["trip_id"].to_numpy()
+    if len(trip_ids) == 0:
+        return pd.DataFrame(columns=["route_id", "trip_id", "path"])
+    starts = np.concatenate([[0], np.flatnonzero(trip_ids[1:] != trip_ids[:-1]) + 1])
+
+    stop_positions_df = pd.DataFrame(
+        {
+            "stop_id": trips_stop_times_df["stop_id"].to_numpy(),
+            "position": np.arange(len(trip_ids))
+            - np.repeat(starts, np.diff(np.append(starts, len(trip_ids)))),
+        }
+    )
+    path_hashes_df = pd.DataFrame(
+        {
+            # overflowing sums wrap around, which keeps them well distributed
+            f"hash_{i}": np.add.reduceat(
+                pd.util.hash_pandas_object(
+                    stop_positions_df, index=False, hash_key=hash_key
+                ).to_numpy(),
+                starts,
+            )
+            for i, hash_key in enumerate(PATH_HASH_KEYS)
+        }
+    )
+
     paths_df = (
-        trips_stop_times_df.sort_values(["route_id", "trip_id", "stop_sequence"])
-        .groupby(["route_id", "trip_id"])["stop_id"]
-        .apply(list)
-        .apply(str)
-        .reset_index()
+        trips_stop_times_df[["route_id", "trip_id"]].iloc[starts].reset_index(drop=True)
     )
-    paths_df = paths_df.rename(columns={"stop_id": "path"})
+    paths_df["path"] = path_hashes_df.groupby(
+        list(path_hashes_df.columns), sort=False
+    ).ngroup()
     return paths_df
 
 
+# keys of the two hashes of a stop sequence, must be 16 characters long
+PATH_HASH_KEYS = ["0123456789123456", "mcr-py-path-hash"]
+
+
 def add_unique_route_ids(paths_df: pd.DataFrame) -> pd.DataFrame:
     """
     Adds a new column `new_route_id` to the dataframe, which is a unique route_id
-    for each path.
+    for each path. The paths of a route are lettered A, B, ... in the order in
+    which they first appear.
     """
-    known_route_paths = {}
-    path_counter_per_route = {}
-    path_id_by_path = {}
-
-    paths_df["new_route_id"] = paths_df["route_id"]
-
-    for i, row in paths_df.iterrows():
-        path_counter = path_counter_per_route.get(row["route_id"], 0)
-        known_paths = known_route_paths.get(row["route_id"], set())
-
-        path_id = None
-
-        path = row["path"]
-        if path in known_paths:
-            path_id = path_id_by_path[path]
-        else:
-            path_id = chr(ord("A") + path_counter)
-            paths_df.at[i, "new_route_id"] = row["route_id"] + "_" + path_id
-
-            known_paths.add(path)
-            known_route_paths[row["route_id"]] = known_paths
-
-            path_counter_per_route[row["route_id"]] = path_counter + 1
-
-            path_id_by_path[path] = path_id
-
-        paths_df.at[i, "new_route_id"] = row["route_id"] + "_" + path_id
+    route_paths_df = paths_df[["route_id", "path"]].drop_duplicates()
+    path_letters = (
+        (ord("A") + route_paths_df.groupby("route_id").cumcount().to_numpy())
+        .astype(np.uint32)
+        .view("U1")
+    )
+    route_paths_df["new_route_id"] = route_paths_df["route_id"] + "_" + path_letters
 
+    paths_df = paths_df.merge(route_paths_df, on=["route_id", "path"], how="left")
     return paths_df.drop(columns=["path"])  # we don't need the path column anymore
 
 
@@ -157,21 +190,13 @@ def insert_new_routes(routes_df: pd.DataFrame, trips_df: pd.DataFrame) -> pd.Dat
     Reads the old and new route names of each trip and inserts the new routes into
     the routes_df by copying the old routes.
     """
-    new_rows = []
-
-    route_id_map = trips_df.set_index("route_id")["old_route_id"].to_dict()
-    # Iterate over each row in the trips_df
-    for route_id, old_route_id in route_id_map.items():
-        # Find the corresponding row in the routes_df based on old_route_id
-        old_route_row = routes_df[routes_df["route_id"] == old_route_id].iloc[0]
-
-        # Create a new row by copying the old route row and update the route_id
-        new_route_row = old_route_row.copy()
-        new_route_row["route_id"] = route_id
-
-        new_rows.append(new_route_row)
+    route_id_map_df = trips_df[["route_id", "old_route_id"]].drop_duplicates("route_id")
+    old_routes_df = routes_df.drop_duplicates("route_id").rename(
+        columns={"route_id": "old_route_id"}
+    )
 
-    return pd.DataFrame(new_rows)
+    new_routes_df = route_id_map_df.merge(old_routes_df, on="old_route_id")
+    return new_routes_df[list(routes_df.columns)]
 
 
 def add_first_stop_info(
@@ -3,7 +3,9 @@ from package.gtfs.clean import (
     add_first_stop_info,
     add_unique_route_ids,
     create_paths_df,
+    remove_circular_trips,
     remove_unused_stops,
+    split_routes,
     split_routes_by_direction,
 )
 
@@ -19,15 +21,33 @@ def test_split_routes_by_direction(trips_df: pd.DataFrame):
 
 def test_create_paths_df(trips_df: pd.DataFrame, stop_times_df: pd.DataFrame):
     paths_df = create_paths_df(trips_df, stop_times_df)
-    expected_paths = pd.Series(
-        [
-            "['stop1', 'stop2', 'stop3']",
-            "['stop1', 'stop4', 'stop3']",
-            "['stop3', 'stop2', 'stop1']",
-        ],
-        name="path",
+    assert paths_df["trip_id"].tolist() == ["trip1", "trip2", "trip3"]
+    assert paths_df["path"].nunique() == 3
+
+    # trip4 stops at the same stops as trip1, but has other stop sequences
+    trip4_stop_times_df = stop_times_df[stop_times_df["trip_id"] == "trip1"].assign(
+        trip_id="trip4", stop_sequence=lambda df: df["stop_sequence"] * 10
+    )
+    # trip5 stops at the stops of trip1 in reverse order, like trip3
+    trip5_stop_times_df = trip4_stop_times_df.assign(
+        trip_id="trip5", stop_sequence=lambda df: -df["stop_sequence"]
     )
-    pd.testing.assert_series_equal(paths_df["path"], expected_paths)
+    paths_df = create_paths_df(
+        pd.concat(
+            [
+                trips_df,
+                pd.DataFrame(
+                    [["route1", "trip4", 0], ["route1", "trip5", 0]],
+                    columns=["route_id", "trip_id", "direction_id"],
+                ),
+            ]
+        ),
+        pd.concat([stop_times_df, trip4_stop_times_df, trip5_stop_times_df]),
+    )
+    path_by_trip = paths_df.set_index("trip_id")["path"]
+    assert path_by_trip["trip4"] == path_by_trip["trip1"]
+    assert path_by_trip["trip5"] == path_by_trip["trip3"]
+    assert path_by_trip["trip5"] != path_by_trip["trip1"]
 
 
 def test_add_unique_route_ids(paths_df: pd.DataFrame):
@@ -56,3 +76,79 @@ def test_remove_unused_stops(stop_times_df: pd.DataFrame, stops_df: pd.DataFrame
     stops_df = remove_unused_stops(stop_times_df, stops_df)
     expected_stops = pd.Series(["stop1", "stop2", "stop3", "stop4"], name="stop_id")
     pd.testing.assert_series_equal(stops_df["stop_id"], expected_stops)
+
+
+def test_remove_circular_trips(trips_df: pd.DataFrame, stop_times_df: pd.DataFrame):
+    circular_stop_time = stop_times_df[stop_times_df["trip_id"] == "trip2"].iloc[[0]]
+    stop_times_df = pd.concat(
+        [stop_times_df, circular_stop_time.assign(stop_sequence=4)]
+    )
+
+    trips_df, stop_times_df = remove_circular_trips(trips_df, stop_times_df)
+
+    assert trips_df["trip_id"].tolist() == ["trip1", "trip3"]
+    assert set(stop_times_df["trip_id"]) == {"trip1", "trip3"}
+
+
+def test_add_unique_route_ids_letters_paths_per_route():
+    # path 1 is the second path of route a and the first of route b, and the
+    # rows of the routes are interleaved
+    paths_df = pd.DataFrame(
+        [["a", "t1", 0], ["a", "t2", 1], ["b", "t3", 1], ["a", "t4", 1]],
+        columns=["route_id", "trip_id", "path"],
+    )
+
+    paths_df = add_unique_route_ids(paths_df)
+
+    # paths are lettered per route, even if another route has the same path
+    assert paths_df["new_route_id"].tolist() == ["a_A", "a_B", "b_A", "a_B"]
+
+
+def test_split_routes(
+    trips_df: pd.DataFrame, stop_times_df: pd.DataFrame, routes_df: pd.DataFrame
+):
+    routes_df = routes_df.assign(route_short_name="1")
+
+    trips_df, routes_df = split_routes(trips_df, stop_times_df, routes_df)
+
+    assert trips_df["route_id"].tolist() == ["route1_0_A", "route1_0_B", "route1_1_A"]
+    assert routes_df.to_dict("records") == [
+        {"route_id": "route1_0_A", "route_short_name": "1"},
+        {"route_id": "route1_0_B", "route_short_name": "1"},
+        {"route_id": "route1_1_A", "route_short_name": "1"},
+    ]
+
+
+def test_split_routes_with_path_shared_across_routes():
+    # route a rides path P and then Q, route b rides only Q
+    stops_by_trip = {
+        "a1": ("a", ["stop1", "stop2", "stop3"]),
+        "a2": ("a", ["stop1", "stop4", "stop3"]),
+        "b1": ("b", ["stop1", "stop4", "stop3"]),
+        "a3": ("a", ["stop1", "stop4", "stop3"]),
+    }
+    trips_df = pd.DataFrame(
+        [[route_id, trip_id, 0] for trip_id, (route_id, _) in stops_by_trip.items()],
+        columns=["route_id", "trip_id", "direction_id"],
+    )
+    stop_times_df = pd.DataFrame(
+        [
+            [trip_id, stop_id, sequence + 1]
+            for trip_id, (_, stop_ids) in stops_by_trip.items()
+            for sequence, stop_id in enumerate(stop_ids)
+        ],
+        columns=["trip_id", "stop_id", "stop_sequence"],
+    )
+    routes_df = pd.DataFrame([["a"], ["b"]], columns=["route_id"])
+
+    trips_df, _ = split_routes(trips_df, stop_times_df, routes_df)
+
+    # Q is the second path of route a, but the first of route b. Trip a3 must
+    # not take the letter of Q in route b, which would merge it with path P
+    route_id_by_trip = dict(zip(trips_df["trip_id"], trips_df["route_id"]))
+    assert route_id_by_trip == {
+        "a1": "a_0_A",
+        "a2": "a_0_B",
+        "b1": "b_0_A",
+        "a3": "a_0_B",
+    }
@@ -1,11 +1,11 @@
 from datetime import datetime
-from typing import Tuple
+from typing import Optional, Tuple
 
 from geopandas import pd
 from package import key
 from package.geometa import GeoMeta
 
-from package.gtfs import archive
+from package.gtfs import archive, service
 from package.logger import Timed, rlog
 
 
@@ -17,63 +17,66 @@ def crop(
     time_end: datetime,
 ):
     with Timed.info("Reading GTFS data"):
-        dfs = archive.read_dfs(path)
+        # the stop times are by far the largest file, they are only read
+        # once the stops and trips to keep are known
+        dfs = archive.read_dfs(path, exclude=[key.STOP_TIMES_KEY])
 
-    trips_df, stop_times_df, stops_df, calendar_df, routes_df = (
+    trips_df, stops_df, calendar_df, routes_df = (
         dfs[key.TRIPS_KEY],
-        dfs[key.STOP_TIMES_KEY],
         dfs[key.STOPS_KEY],
         dfs[key.CALENDAR_KEY],
         dfs[key.ROUTES_KEY],
     )
 
-    n_trips, n_stop_times, n_stops = (
-        len(trips_df),
-        len(stop_times_df),
-        len(stops_df),
-    )
+    n_trips, n_stops = len(trips_df), len(stops_df)
     rlog.debug(
         f"""
     # of trips: {n_trips}
-    # of stop times: {n_stop_times}
     # of stops: {n_stops}
     """
     )
 
     stops_df = geo_meta.crop_df(stops_df, key.STOP_LAT_KEY, key.STOP_LON_KEY)
-    trips_df, stop_times_df = reconcile_trips_and_stop_times_with_stops(
-        trips_df, stop_times_df, stops_df
-    )
     rlog.debug(
         f"""
         Bounding Box stops remaining: {len(stops_df)}/{n_stops} ({len(stops_df) / n_stops:.2%})
-        Bounding Box trips remaining: {len(trips_df)}/{n_trips} ({len(trips_df) / n_trips:.2%})
         """
     )
+    if len(stops_df) == 0:
+        raise ValueError("Bounding box is too small, no stops remain")
 
-    n_trips_after_bbox, n_stops_after_bbox = len(trips_df), len(stops_df)
-    if n_trips_after_bbox == 0 or n_stops_after_bbox == 0:
-        raise ValueError(
-            f"Bounding box is too small, no trips or stops remain: {n_trips_after_bbox} trips, {n_stops_after_bbox} stops"
-        )
-
-    trips_df, calendar_df = crop_trips(trips_df, calendar_df, time_start, time_end)
-    stop_times_df = reconcile_stop_times_with_trips(stop_times_df, trips_df)
-    stops_df = reconcile_stops_with_stop_times(stops_df, stop_times_df)
-
+    calendar_dates_df = dfs.get(key.CALENDAR_DATES_KEY)
+    trips_df, calendar_df = crop_trips(
+        trips_df, calendar_df, time_start, time_end, calendar_dates_df
+    )
     rlog.debug(
         f"""
-        Time range trips remaining: {len(trips_df)}/{n_trips_after_bbox} ({len(trips_df) / n_trips_after_bbox:.2%})
-        Time range stops remaining: {len(stops_df)}/{n_stops_after_bbox} ({len(stops_df) / n_stops_after_bbox:.2%})
-        Time range stop times remaining: {len(stop_times_df)}/{n_stop_times} ({len(stop_times_df) / n_stop_times:.2%})
+        Time range trips remaining: {len(trips_df)}/{n_trips} ({len(trips_df) / n_trips:.2%})
         """
     )
 
+    with Timed.info("Reading stop times"):
+        stop_times_df = archive.read_filtered_df(
+            path,
+            key.STOP_TIMES_KEY,
+            {
+                key.STOP_ID_KEY: stops_df[key.STOP_ID_KEY].unique(),
+                key.TRIP_ID_KEY: trips_df[key.TRIP_ID_KEY].unique(),
+            },
+        )
+
+    trips_df, stop_times_df = reconcile_trips_and_stop_times_with_stops(
+        trips_df, stop_times_df, stops_df
+    )
+    stops_df = reconcile_stops_with_stop_times(stops_df, stop_times_df)
+    if len(trips_df) == 0:
+        raise ValueError("Bounding box or time range is too small, no trips remain")
+
     rlog.info(
         f"""\
         Crop results:
         # of trips: {len(trips_df)} ({len(trips_df) / n_trips:.2%})
-        # of stop times: {len(stop_times_df)} ({len(stop_times_df) / n_stop_times:.2%})
+        # of stop times: {len(stop_times_df)}
         # of stops: {len(stops_df)} ({len(stops_df) / n_stops:.2%})"""
     )
 
@@ -84,6 +87,15 @@ def crop(
             key.STOPS_KEY: stops_df,
             key.CALENDAR_KEY: calendar_df,
             key.ROUTES_KEY: routes_df,  # todo this is not being cropped, but is small anyways
+            **(
+                {
+                    key.CALENDAR_DATES_KEY: reconcile_calendar_dates_with_trips(
+                        calendar_dates_df, trips_df
+                    )
+                }
+                if calendar_dates_df is not None
+                else {}
+            ),
         },
         output,
     )
@@ -111,9 +123,12 @@ def crop_trips(
     calendar_df: pd.DataFrame,
     time_start: datetime,
     time_end: datetime,
+    calendar_dates_df: Optional[pd.DataFrame] = None,
 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
-    Crop trips to those that occur within the given time range.
+    Crop trips to those that occur within the given time range. Services that
+    are only added for single dates by the calendar dates are kept if one of
+    those dates is within the time range.
     """
     parsed_calendar_df = calendar_df.copy()
     parsed_calendar_df[key.CALENDAR_START_DATE_KEY] = pd.to_datetime(
@@ -131,23 +146,34 @@ def crop_trips(
 
     calendar_df = calendar_df[time_ranges_touch]  # type: ignore
 
-    service_ids = calendar_df[key.SERVICE_ID_KEY].unique()
+    service_ids = set(calendar_df[key.SERVICE_ID_KEY].unique())
+    if calendar_dates_df is not None:
+        dates = service.parse_dates(calendar_dates_df[key.CALENDAR_DATE_KEY])
+        added_in_range = (
+            (
+                calendar_dates_df[key.CALENDAR_EXCEPTION_TYPE_KEY].astype(int)
+                == service.SERVICE_ADDED
+            )
+            & (dates <= time_end)
+            & (dates >= time_start.replace(hour=0, minute=0, second=0))
+        )
+        service_ids.update(calendar_dates_df.loc[added_in_range, key.SERVICE_ID_KEY])
     trips_df = trips_df[trips_df[key.SERVICE_ID_KEY].isin(service_ids)]  # type: ignore
 
     return trips_df, calendar_df
 
 
-def reconcile_stop_times_with_trips(
-    stop_times_df: pd.DataFrame,
+def reconcile_calendar_dates_with_trips(
+    calendar_dates_df: pd.DataFrame,
     trips_df: pd.DataFrame,
 ) -> pd.DataFrame:
     """
-    Crop stop times to those that occur within the given trips.
+    Crop calendar dates to the services of the given trips.
     """
-    trip_ids = trips_df[key.TRIP_ID_KEY].unique()
-    stop_times_df = stop_times_df[stop_times_df[key.TRIP_ID_KEY].isin(trip_ids)]  # type: ignore
+    service_ids = trips_df[key.SERVICE_ID_KEY].unique()
+    calendar_dates_df = calendar_dates_df[calendar_dates_df[key.SERVICE_ID_KEY].isin(service_ids)]  # type: ignore
 
-    return stop_times_df
+    return calendar_dates_df
 
 
 def reconcile_stops_with_stop_times(
@@ -0,0 +1,173 @@
+from datetime import date, timedelta
+from typing import Optional
+
+import pandas as pd
+
+from package import key
+from package.gtfs.clean import add_first_stop_info
+from package.strtime import seconds_to_str_times, str_times_to_seconds
+
+# columns of calendar.txt, in the order of `date.weekday()`
+WEEKDAY_KEYS = [
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+]
+
+# exception types of calendar_dates.txt
+SERVICE_ADDED = 1
+SERVICE_REMOVED = 2
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+def get_active_service_ids(
+    calendar_df: Optional[pd.DataFrame],
+    calendar_dates_df: Optional[pd.DataFrame],
+    service_date: date,
+) -> set[str]:
+    """
+    Returns the ids of the services that run on the given date.
+
+    A service runs if the date is within its calendar range and the flag of
+    the weekday is set. Exceptions in calendar dates add or remove services
+    for single dates, which is also how feeds without a calendar define their
+    services.
+    """
+    service_ids: set[str] = set()
+
+    if calendar_df is not None:
+        day = pd.Timestamp(service_date)
+        runs = (
+            (parse_dates(calendar_df[key.CALENDAR_START_DATE_KEY]) <= day)
+            & (parse_dates(calendar_df[key.CALENDAR_END_DATE_KEY]) >= day)
+            & (calendar_df[WEEKDAY_KEYS[service_date.weekday()]].astype(int) == 1)
+        )
+        service_ids.update(calendar_df.loc[runs, key.SERVICE_ID_KEY])
+
+    if calendar_dates_df is not None:
+        on_date = calendar_dates_df[
+            parse_dates(calendar_dates_df[key.CALENDAR_DATE_KEY])
+            == pd.Timestamp(service_date)
+        ]
+        exception_types = on_date[key.CALENDAR_EXCEPTION_TYPE_KEY].astype(int)
+        service_ids.update(
+            on_date.loc[exception_types == SERVICE_ADDED, key.SERVICE_ID_KEY]
+        )
+        service_ids.difference_update(
+            on_date.loc[exception_types == SERVICE_REMOVED, key.SERVICE_ID_KEY]
+        )
+
+    return service_ids
+
+
+def crop_to_service_date(
+    trips_df: pd.DataFrame,
+    stop_times_df: pd.DataFrame,
+    calendar_df: Optional[pd.DataFrame],
+    calendar_dates_df: Optional[pd.DataFrame],
+    service_date: date,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Crops trips and stop times to the trips that run on the given date.
+
+    Trips of the previous date that run past midnight are kept as well, see
+    `get_previous_day_trips`.
+    """
+    service_ids = get_active_service_ids(calendar_df, calendar_dates_df, service_date)
+    previous_trips_df, previous_stop_times_df = get_previous_day_trips(
+        trips_df,
+        stop_times_df,
+        get_active_service_ids(
+            calendar_df, calendar_dates_df, service_date - timedelta(days=1)
+        ),
+    )
+
+    trips_df = trips_df[trips_df[key.SERVICE_ID_KEY].isin(service_ids)]  # type: ignore
+    stop_times_df = stop_times_df[
+        stop_times_df[key.TRIP_ID_KEY].isin(trips_df[key.TRIP_ID_KEY])
+    ]  # type: ignore
+
+    if len(previous_trips_df) == 0:
+        return trips_df, stop_times_df
+    return (
+        pd.concat([trips_df, previous_trips_df], ignore_index=True),
+        pd.concat([stop_times_df, previous_stop_times_df], ignore_index=True),
+    )
+
+
+def get_previous_day_trips(
+    trips_df: pd.DataFrame,
+    stop_times_df: pd.DataFrame,
+    previous_service_ids: set[str],
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Returns the trips of the previous date that still run after midnight,
+    i.e. that depart from at least two stops at 24:00:00 or later.
+
+    Only the stop times after midnight are kept and they are moved back by a
+    day. The trip ids get the suffix `key.PREVIOUS_DAY_ID_SUFFIX`, so that
+    they do not collide with the trips of the service date. As the trips
+    skip the first stops of their routes, the route ids get the suffix and
+    the number of skipped stops, which keeps one stop sequence per route.
+    Trips that run past 48:00:00 are not continued on a third day.
+    """
+    trips_df = trips_df[trips_df[key.SERVICE_ID_KEY].isin(previous_service_ids)]
+    stop_times_df = stop_times_df[
+        stop_times_df[key.TRIP_ID_KEY].isin(trips_df[key.TRIP_ID_KEY])
+    ]
+    departures = str_times_to_seconds(stop_times_df[key.STOP_TIME_DEPARTURE_TIME_KEY])
+    after_midnight = departures >= SECONDS_PER_DAY
+
+    trip_ids = stop_times_df[key.TRIP_ID_KEY]
+    n_after_midnight = pd.Series(after_midnight).groupby(trip_ids.to_numpy()).sum()
+    n_stops = trip_ids.value_counts()
+    continued_trip_ids = n_after_midnight.index[n_after_midnight >= 2]
+    if len(continued_trip_ids) == 0:
+        return trips_df.iloc[:0], stop_times_df.iloc[:0]
+    n_skipped = (n_stops - n_after_midnight)[continued_trip_ids]
+
+    keep = after_midnight & trip_ids.isin(continued_trip_ids).to_numpy()
+    arrivals = str_times_to_seconds(
+        stop_times_df.loc[keep, key.STOP_TIME_ARRIVAL_TIME_KEY]
+    )
+    stop_times_df = stop_times_df[keep].assign(
+        **{
+            key.TRIP_ID_KEY: lambda df: df[key.TRIP_ID_KEY].astype(str)
+            + key.PREVIOUS_DAY_ID_SUFFIX,
+            # a stop arrived at before midnight is departed from at midnight
+            key.STOP_TIME_ARRIVAL_TIME_KEY: seconds_to_str_times(
+                (arrivals - SECONDS_PER_DAY).clip(min=0)
+            ),
+            key.STOP_TIME_DEPARTURE_TIME_KEY: seconds_to_str_times(
+                departures[keep] - SECONDS_PER_DAY
+            ),
+        }
+    )
+
+    trips_df = trips_df[trips_df[key.TRIP_ID_KEY].isin(continued_trip_ids)]
+    trips_df = trips_df.assign(
+        **{
+            key.ROUTE_ID_KEY: trips_df[key.ROUTE_ID_KEY].astype(str)
+            + key.PREVIOUS_DAY_ID_SUFFIX
+            + trips_df[key.TRIP_ID_KEY].map(n_skipped).astype(str),
+            key.TRIP_ID_KEY: trips_df[key.TRIP_ID_KEY].astype(str)
+            + key.PREVIOUS_DAY_ID_SUFFIX,
+        }
+    )
+    # the first stop of the trips changed
+    first_stop_columns = ["first_stop_id", "trip_departure_time"]
+    if set(first_stop_columns).issubset(trips_df.columns):
+        trips_df = add_first_stop_info(
+            trips_df.drop(columns=first_stop_columns), stop_times_df
+        )
+
+    return trips_df, stop_times_df
+
+
+def parse_dates(dates: pd.Series) -> pd.Series:
+    return pd.to_datetime(dates.astype(str), format=key.CALENDAR_DATE_TIME_FORMAT)
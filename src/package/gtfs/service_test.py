@@ -0,0 +1,196 @@
+from datetime import date, datetime
+
+import pandas as pd
+
+from package.gtfs.crop import crop_trips
+from package.gtfs.service import crop_to_service_date, get_active_service_ids
+
+
+def calendar_df() -> pd.DataFrame:
+    # service_id, monday, ..., sunday, start_date, end_date
+    return pd.DataFrame(
+        [
+            ["weekdays", 1, 1, 1, 1, 1, 0, 0, 20240101, 20241231],
+            ["weekends", 0, 0, 0, 0, 0, 1, 1, 20240101, 20241231],
+            ["expired", 1, 1, 1, 1, 1, 1, 1, 20230101, 20231231],
+        ],
+        columns=[
+            "service_id",
+            "monday",
+            "tuesday",
+            "wednesday",
+            "thursday",
+            "friday",
+            "saturday",
+            "sunday",
+            "start_date",
+            "end_date",
+        ],
+    )
+
+
+def calendar_dates_df() -> pd.DataFrame:
+    # service_id, date, exception_type
+    return pd.DataFrame(
+        [
+            # holiday on a wednesday
+            ["weekdays", "20240501", 2],
+            ["weekends", "20240501", 1],
+            # only defined by calendar dates
+            ["special", "20240502", 1],
+        ],
+        columns=["service_id", "date", "exception_type"],
+    )
+
+
+def test_get_active_service_ids():
+    wednesday, thursday, saturday = date(2024, 5, 8), date(2024, 5, 2), date(2024, 5, 4)
+
+    assert get_active_service_ids(calendar_df(), None, wednesday) == {"weekdays"}
+    assert get_active_service_ids(calendar_df(), None, saturday) == {"weekends"}
+    assert get_active_service_ids(calendar_df(), None, date(2023, 5, 3)) == {"expired"}
+
+    holiday = date(2024, 5, 1)
+    assert get_active_service_ids(calendar_df(), calendar_dates_df(), holiday) == {
+        "weekends"
+    }
+    assert get_active_service_ids(calendar_df(), calendar_dates_df(), thursday) == {
+        "weekdays",
+        "special",
+    }
+    assert get_active_service_ids(None, calendar_dates_df(), thursday) == {"special"}
+
+
+def test_crop_to_service_date():
+    trips_df = pd.DataFrame(
+        [["trip1", "weekdays"], ["trip2", "weekends"], ["trip3", "special"]],
+        columns=["trip_id", "service_id"],
+    )
+    stop_times_df = pd.DataFrame(
+        [
+            ["trip1", "stop1", "08:00:00", "08:00:00", 1],
+            ["trip1", "stop2", "08:05:00", "08:05:00", 2],
+            ["trip2", "stop1", "09:00:00", "09:00:00", 1],
+        ],
+        columns=[
+            "trip_id",
+            "stop_id",
+            "arrival_time",
+            "departure_time",
+            "stop_sequence",
+        ],
+    )
+
+    trips_df, stop_times_df = crop_to_service_date(
+        trips_df, stop_times_df, calendar_df(), calendar_dates_df(), date(2024, 5, 4)
+    )
+
+    assert trips_df["trip_id"].tolist() == ["trip2"]
+    assert stop_times_df["trip_id"].tolist() == ["trip2"]
+
+
+def test_crop_to_service_date_keeps_trips_of_previous_day_after_midnight():
+    trips_df = pd.DataFrame(
+        [
+            ["night1", "route1", "weekdays", "stop1", "23:50:00"],
+            ["night2", "route1", "weekdays", "stop1", "23:58:00"],
+            ["late", "route1", "weekdays", "stop1", "23:00:00"],
+        ],
+        columns=[
+            "trip_id",
+            "route_id",
+            "service_id",
+            "first_stop_id",
+            "trip_departure_time",
+        ],
+    )
+    stop_times_df = pd.DataFrame(
+        [
+            ["night1", "stop1", "23:50:00", "23:50:00", 1],
+            ["night1", "stop2", "23:59:00", "24:01:00", 2],
+            ["night1", "stop3", "24:10:00", "24:10:00", 3],
+            ["night2", "stop1", "23:58:00", "23:58:00", 1],
+            ["night2", "stop2", "24:07:00", "24:07:00", 2],
+            ["night2", "stop3", "24:18:00", "24:18:00", 3],
+            # only arrives after midnight
+            ["late", "stop1", "23:00:00", "23:00:00", 1],
+            ["late", "stop2", "23:30:00", "23:30:00", 2],
+            ["late", "stop3", "24:05:00", "24:05:00", 3],
+        ],
+        columns=[
+            "trip_id",
+            "stop_id",
+            "arrival_time",
+            "departure_time",
+            "stop_sequence",
+        ],
+    )
+
+    # the weekday trips run on friday and continue on saturday morning
+    trips_df, stop_times_df = crop_to_service_date(
+        trips_df, stop_times_df, calendar_df(), None, date(2024, 5, 4)
+    )
+
+    assert trips_df.to_dict("records") == [
+        {
+            "trip_id": "night1@previous_day",
+            "route_id": "route1@previous_day1",
+            "service_id": "weekdays",
+            "first_stop_id": "stop2",
+            "trip_departure_time": "00:01:00",
+        },
+        {
+            "trip_id": "night2@previous_day",
+            "route_id": "route1@previous_day1",
+            "service_id": "weekdays",
+            "first_stop_id": "stop2",
+            "trip_departure_time": "00:07:00",
+        },
+    ]
+    assert stop_times_df.to_dict("records") == [
+        {
+            "trip_id": "night1@previous_day",
+            "stop_id": "stop2",
+            "arrival_time": "00:00:00",
+            "departure_time": "00:01:00",
+            "stop_sequence": 2,
+        },
+        {
+            "trip_id": "night1@previous_day",
+            "stop_id": "stop3",
+            "arrival_time": "00:10:00",
+            "departure_time": "00:10:00",
+            "stop_sequence": 3,
+        },
+        {
+            "trip_id": "night2@previous_day",
+            "stop_id": "stop2",
+            "arrival_time": "00:07:00",
+            "departure_time": "00:07:00",
+            "stop_sequence": 2,
+        },
+        {
+            "trip_id": "night2@previous_day",
+            "stop_id": "stop3",
+            "arrival_time": "00:18:00",
+            "departure_time": "00:18:00",
+            "stop_sequence": 3,
+        },
+    ]
+
+
+def test_crop_trips_keeps_services_added_by_calendar_dates():
+    trips_df = pd.DataFrame(
+        [["trip1", "weekdays"], ["trip2", "expired"], ["trip3", "special"]],
+        columns=["trip_id", "service_id"],
+    )
+
+    cropped_trips_df, _ = crop_trips(
+        trips_df,
+        calendar_df(),
+        datetime(2024, 5, 2, 8),
+        datetime(2024, 5, 2, 20),
+        calendar_dates_df(),
+    )
+
+    assert cropped_trips_df["trip_id"].tolist() == ["trip1", "trip3"]
@@ -8,6 +8,7 @@ TRIPS_KEY = "trips"
 STOP_TIMES_KEY = "stop_times"
 STOPS_KEY = "stops"
 CALENDAR_KEY = "calendar"
+CALENDAR_DATES_KEY = "calendar_dates"
 ROUTES_KEY = "routes"
 
 
@@ -22,6 +23,8 @@ SERVICE_ID_KEY = "service_id"
 STOP_NAME_KEY = "stop_name"
 CALENDAR_START_DATE_KEY = "start_date"
 CALENDAR_END_DATE_KEY = "end_date"
+CALENDAR_DATE_KEY = "date"
+CALENDAR_EXCEPTION_TYPE_KEY = "exception_type"
 STOP_TIME_ARRIVAL_TIME_KEY = "arrival_time"
 STOP_TIME_DEPARTURE_TIME_KEY = "departure_time"
 STOP_SEQUENCE_KEY = "stop_sequence"
@@ -30,6 +33,9 @@ ROUTE_SHORT_NAME_KEY = "route_short_name"
 TRIP_HEADSIGN_KEY = "trip_headsign"
 
 CALENDAR_DATE_TIME_FORMAT = "%Y%m%d"
+# suffix of the ids of trips (and their routes) that were taken from the
+# previous service date, because they run past midnight
+PREVIOUS_DAY_ID_SUFFIX = "@previous_day"
 
 
 # algorithm data
@@ -42,13 +48,18 @@ TIMES_BY_STOP_BY_TRIP_KEY = "times_by_stop_by_trip"
 STOP_ID_SET_KEY = "stop_id_set"
 ROUTE_ID_SET_KEY = "route_id_set"
 TRIP_ID_SET_KEY = "trip_id_set"
+ID_MAPS_KEY = "id_maps"
+ROUTE_HASHES_KEY = "route_hashes"
 FOOTPATHS_KEY = "footpaths"
+TRANSFERS_KEY = "transfers"
 
 
 # command names
 BUILD_STRUCTURES_COMMAND_NAME = "build-structures"
 FOOTPATHS_COMMAND_NAME = "generate-footpaths"
+TRANSFERS_COMMAND_NAME = "build-transfers"
 RAPTOR_COMMAND_NAME = "raptor"
+SERVE_COMMAND_NAME = "serve"
 MCR_COMMAND_NAME = "mcr"
 
 GTFS_UPPER_COMMAND_NAME = "gtfs"
@@ -79,6 +90,9 @@ TMP_GTFS_CATALOG_FILE_NAME = "catalog.csv"
 ## output
 RAPTOR_ARRIVAL_TIMES_FILE_NAME = "arrival_times.csv"
 RAPTOR_TRACE_FILE_NAME = "tracer_map.pkl"
+TRANSFERS_FILE_NAME = "transfers.pkl"
+# suffix of the timetable directory written next to a structs file
+TIMETABLE_DIR_SUFFIX = ".timetable"
 
 
 # urls
@@ -87,6 +101,8 @@ GTFS_CATALOG_URL = "https://bit.ly/catalogs-csv"  # https://database.mobilitydat
 
 DATE_TIME_FORMAT = "%d.%m.%Y-%H:%M:%S"
 DATE_TIME_FORMAT_HUMAN_READABLE = "DD.MM.YYYY-HH:MM:SS"
+DATE_FORMAT = "%d.%m.%Y"
+DATE_FORMAT_HUMAN_READABLE = "DD.MM.YYYY"
 
 # pkl data keys
 TRACER_MAP_KEY = "tracer_map"
@@ -1,7 +1,10 @@
-from typing import Callable
-from mcr_py import PyLabel
+from typing import TYPE_CHECKING, Callable, Optional
 from package.mcr.label import IntermediateLabel, McRAPTORLabel, McRAPTORLabelWithPath
 from package.raptor.bag import Bag
+from package.structs.intern import IdMaps
+
+if TYPE_CHECKING:
+    from mcr_py import PyLabel
 
 
 # key is osm_node_id, value is list of labels
@@ -9,7 +12,7 @@ IntermediateBags = dict[int, list[IntermediateLabel]]
 
 
 def convert_mlc_bags_to_intermediate_bags(
-    bags: dict[int, list[PyLabel]],
+    bags: dict[int, list["PyLabel"]],
     translate_node_id: Callable[[int], int],
 ) -> IntermediateBags:
     intermediate_bags = {
@@ -30,6 +33,7 @@ def convert_mlc_bags_to_intermediate_bags(
 def convert_mc_raptor_bags_to_intermediate_bags(
     bags: dict[int, Bag],
     min_path_length: int,
+    id_maps: Optional[IdMaps] = None,
 ) -> IntermediateBags:
     intermediate_bags: dict[int, list[IntermediateLabel]] = {}
     for node_id, bag in bags.items():
@@ -43,12 +47,12 @@ def convert_mc_raptor_bags_to_intermediate_bags(
             label: McRAPTORLabel = label
             if (
                 isinstance(label, McRAPTORLabelWithPath)
-                and len(label.path) < min_path_length
+                and len(label.shared_path) < min_path_length
             ):
                 continue
 
             intermediate_bags[int(node_id)].append(
-                label.to_intermediate_label(int(node_id))
+                label.to_intermediate_label(int(node_id), id_maps)
             )
 
     # remove empty bags
@@ -1,6 +1,9 @@
 from __future__ import annotations
+from bisect import bisect_right
+from typing import Optional
 
-from package.raptor.bag import BaseLabel as McRAPTORBaseLabel
+from package.raptor.bag import BaseLabel as McRAPTORBaseLabel, SharedPath
+from package.structs.intern import IdMaps
 
 COST_SHORT_DISTANCE_TICKET_INCR = 220
 COST_LONG_DISTANCE_TICKET_INCR = 320
@@ -9,6 +12,8 @@ LENGTH_SHORT_DISTANCE_TICKET = 4
 
 
 class IntermediateLabel:
+    __slots__ = ("values", "hidden_values", "path", "node_id")
+
     def __init__(
         self,
         values: list[int],
@@ -47,7 +52,7 @@ class IntermediateLabel:
             osm_node_id=new_node_id,
         )
 
-    def to_mc_raptor_label(self, stop_id: str) -> McRAPTORLabel:
+    def to_mc_raptor_label(self, stop_id: int) -> McRAPTORLabel:
         n_stops = self.hidden_values[1] if len(self.hidden_values) > 1 else 0
         if len(self.path) > 0:
             return McRAPTORLabelWithPath(
@@ -69,24 +74,62 @@ def merge_intermediate_bags(
     bag: list[IntermediateLabel],
     other_bag: list[IntermediateLabel],
 ) -> list[IntermediateLabel]:
-    merged_bag = []
-    for label in bag:
-        if not any(
-            [other_label.strictly_dominates(label) for other_label in other_bag]
-        ):
-            merged_bag.append(label)
-    for label in other_bag:
-        if not any([other_label.strictly_dominates(label) for other_label in bag]):
-            merged_bag.append(label)
-    return merged_bag
+    """
+    Keeps the labels of each bag that are not dominated by a label of the
+    other bag.
+    """
+    if any(len(label.values) != 2 for label in bag + other_bag):
+        merged_bag = []
+        for label in bag:
+            if not any(
+                [other_label.strictly_dominates(label) for other_label in other_bag]
+            ):
+                merged_bag.append(label)
+        for label in other_bag:
+            if not any([other_label.strictly_dominates(label) for other_label in bag]):
+                merged_bag.append(label)
+        return merged_bag
+
+    skyline = create_skyline(bag)
+    other_skyline = create_skyline(other_bag)
+    return [
+        label for label in bag if not is_dominated_by_skyline(label, other_skyline)
+    ] + [label for label in other_bag if not is_dominated_by_skyline(label, skyline)]
+
+
+def create_skyline(
+    bag: list[IntermediateLabel],
+) -> tuple[list[int], list[int]]:
+    """
+    Returns the times of the two-criteria labels in ascending order, together
+    with the minimal cost of all labels up to each time.
+    """
+    times: list[int] = []
+    min_costs: list[int] = []
+    for time, cost in sorted(label.values for label in bag):
+        if min_costs and min_costs[-1] <= cost:
+            continue
+        times.append(time)
+        min_costs.append(cost)
+    return times, min_costs
+
+
+def is_dominated_by_skyline(
+    label: IntermediateLabel, skyline: tuple[list[int], list[int]]
+) -> bool:
+    times, min_costs = skyline
+    i = bisect_right(times, label.values[0]) - 1
+    return i >= 0 and min_costs[i] <= label.values[1]
 
 
 class McRAPTORLabel(McRAPTORBaseLabel):
+    __slots__ = ("cost", "n_stops")
+
     def __init__(
         self,
         time: int,
         cost: int,
-        stop: str,
+        stop: int,
         n_stops: int,
     ):
         super().__init__(time, stop)
@@ -96,7 +139,7 @@ class McRAPTORLabel(McRAPTORBaseLabel):
     def strictly_dominates(self, other: McRAPTORLabel) -> bool:
         return self.arrival_time <= other.arrival_time and self.cost <= other.cost
 
-    def update_along_trip(self, arrival_time: int, stop_id: str, trip_id: str):
+    def update_along_trip(self, arrival_time: int, stop_id: int, trip_id: int):
         super().update_along_trip(arrival_time, stop_id, trip_id)
         if self.n_stops == 0:
             self.cost += COST_SHORT_DISTANCE_TICKET_INCR
@@ -105,17 +148,19 @@ class McRAPTORLabel(McRAPTORBaseLabel):
             self.cost += COST_LONG_DISTANCE_TICKET_INCR
         self.n_stops += 1
 
-    def update_along_footpath(self, walking_time: int, stop_id: str):
+    def update_along_footpath(self, walking_time: int, stop_id: int):
         raise NotImplementedError("This label should not be updated along a footpath")
 
-    def update_before_route_bag_merge(self, departure_time: int, stop_id: str):
+    def update_before_route_bag_merge(self, departure_time: int, stop_id: int):
         super().update_before_route_bag_merge(departure_time, stop_id)
 
-    def update_before_stop_bag_merge(self, stop_id: str):
+    def update_before_stop_bag_merge(self, stop_id: int):
         pass
         # self.n_stops = 4  # artifically set to 4, so that if another public transport trip is taken, long distance ticket is used
 
-    def to_intermediate_label(self, node_id: int) -> IntermediateLabel:
+    def to_intermediate_label(
+        self, node_id: int, id_maps: Optional[IdMaps] = None
+    ) -> IntermediateLabel:
         return IntermediateLabel(
             values=[self.arrival_time, self.cost],
             hidden_values=[0, self.n_stops],
@@ -125,12 +170,33 @@ class McRAPTORLabel(McRAPTORBaseLabel):
 
 
 class McRAPTORLabelWithPath(McRAPTORLabel):
-    STOP_PREFIX = "STOP_"
-    TRIP_PREFIX = "TRIP_"
+    # stops and trips are stored as (marker, id) tuples, so that they can be
+    # told apart from the path ids of previous steps
+    STOP_MARKER = "STOP"
+    TRIP_MARKER = "TRIP"
+
+    __slots__ = ("_path",)
 
-    def __init__(self, time: int, cost: int, stop: str, n_stops, path: list[int | str]):
+    def __init__(
+        self,
+        time: int,
+        cost: int,
+        stop: int,
+        n_stops,
+        path: list[int | str | tuple[str, int]] | SharedPath,
+    ):
         super().__init__(time, cost, stop, n_stops=n_stops)
-        self.path = path
+        self._path = (
+            path if isinstance(path, SharedPath) else SharedPath.from_list(path)
+        )
+
+    @property
+    def path(self) -> list[int | str | tuple[str, int]]:
+        return self._path.to_list()
+
+    @property
+    def shared_path(self) -> SharedPath:
+        return self._path
 
     def __str__(self):
         return f"McRAPTORLabelWithPath(time={self.arrival_time}, cost={self.cost}, n_stops={self.n_stops}, path={self.path})"
@@ -138,34 +204,44 @@ class McRAPTORLabelWithPath(McRAPTORLabel):
     def __repr__(self):
         return str(self)
 
-    def update_along_trip(self, arrival_time: int, stop_id: str, trip_id: str):
+    def update_along_trip(self, arrival_time: int, stop_id: int, trip_id: int):
         super().update_along_trip(arrival_time, stop_id, trip_id)
-        trip_id = self.TRIP_PREFIX + trip_id
-        if self.path[-1] != trip_id:
-            self.path.append(trip_id)
+        trip = (self.TRIP_MARKER, trip_id)
+        if self._path.last() != trip:
+            self._path = self._path.append(trip)
 
-    def update_before_route_bag_merge(self, departure_time: int, stop_id: str):
+    def update_before_route_bag_merge(self, departure_time: int, stop_id: int):
         super().update_before_route_bag_merge(departure_time, stop_id)
-        self.path.append(self.STOP_PREFIX + stop_id)
+        self._path = self._path.append((self.STOP_MARKER, stop_id))
 
-    def update_before_stop_bag_merge(self, stop_id: str):
+    def update_before_stop_bag_merge(self, stop_id: int):
         super().update_before_stop_bag_merge(stop_id)
-        self.path.append(self.STOP_PREFIX + stop_id)
+        self._path = self._path.append((self.STOP_MARKER, stop_id))
 
-    def to_intermediate_label(self, node_id: int) -> IntermediateLabel:
-        intermediate_label = super().to_intermediate_label(node_id)
+    def to_intermediate_label(
+        self, node_id: int, id_maps: Optional[IdMaps] = None
+    ) -> IntermediateLabel:
+        intermediate_label = super().to_intermediate_label(node_id, id_maps)
         intermediate_label.path = [
-            convert_mc_raptor_path_element(path_element) for path_element in self.path
+            convert_mc_raptor_path_element(path_element, id_maps)
+            for path_element in self.path
         ]
         return intermediate_label
 
 
-def convert_mc_raptor_path_element(path_element: int | str) -> int | str:
-    if isinstance(path_element, int):
+def convert_mc_raptor_path_element(
+    path_element: int | str | tuple[str, int], id_maps: Optional[IdMaps] = None
+) -> int | str:
+    """
+    Converts a stop or trip of a McRAPTOR path to its GTFS id, if `id_maps`
+    is given. Path ids of previous steps are returned as is.
+    """
+    if not isinstance(path_element, tuple):
         return path_element
-    if path_element.startswith(McRAPTORLabelWithPath.STOP_PREFIX):
-        return int(path_element[len(McRAPTORLabelWithPath.STOP_PREFIX) :])
-    elif path_element.startswith(McRAPTORLabelWithPath.TRIP_PREFIX):
-        return path_element[len(McRAPTORLabelWithPath.TRIP_PREFIX) :]
+    marker, element_id = path_element
+    if marker == McRAPTORLabelWithPath.STOP_MARKER:
+        return id_maps.gtfs_stop(element_id) if id_maps else element_id
+    elif marker == McRAPTORLabelWithPath.TRIP_MARKER:
+        return id_maps.gtfs_trip(element_id) if id_maps else element_id
     else:
         raise ValueError(f"Unknown path element {path_element}")
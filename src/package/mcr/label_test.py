@@ -17,3 +17,15 @@ def test_merge_intermediate_bags():
     assert il1 in merged_bag
     assert il3 not in merged_bag
     assert il2 not in merged_bag
+
+
+def test_merge_intermediate_bags_keeps_undominated_labels():
+    il1 = IntermediateLabel([1, 3], [], [], 1)
+    il2 = IntermediateLabel([3, 1], [], [], 2)
+    il3 = IntermediateLabel([2, 2], [], [], 3)
+    il4 = IntermediateLabel([3, 3], [], [], 4)
+    il5 = IntermediateLabel([1, 3], [], [], 5)
+
+    merged_bag = merge_intermediate_bags([il1, il2], [il3, il4, il5])
+
+    assert merged_bag == [il2, il3]
@@ -143,8 +143,8 @@ class MCR:
             columns=["osm_node_id", "time", "cost", "n_transfers"],
         )
 
-        labels["human_readable_time"] = labels["time"].apply(
-            strtime.seconds_to_str_time
+        labels["human_readable_time"] = strtime.seconds_to_str_times(
+            labels["time"].to_numpy()
         )
 
         labels.to_feather(output_path)
@@ -1,5 +1,5 @@
 from logging import Logger
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from package import storage
 from package.logger import Timed, Timer
 from package.mcr.bag import IntermediateBags
@@ -7,15 +7,25 @@ from package.mcr.label import IntermediateLabel, McRAPTORLabel, McRAPTORLabelWit
 from package.mcr.path import PathManager, PathType
 from package.mcr.steps.interface import Step, StepBuilder
 from package.osm import graph
-from package.raptor.bag import Bag
+from package.raptor.bag import Bag, SharedPath, SkylineBag, SkylineRouteBag
 from package.mcr.bag import (
     IntermediateBags,
     convert_mc_raptor_bags_to_intermediate_bags,
 )
 from package.raptor.mcraptor_single import McRaptorSingle
+from package.raptor.timetable import Timetable, open_timetable_for_structs
+from package.structs import intern
+from package.structs.intern import IdMaps
 import networkx as nx
 
-McRAPTORInputBags = dict[str, list[IntermediateLabel]]
+if TYPE_CHECKING:
+    # the native McRAPTOR engine is only imported when it is used, so that a
+    # missing or stale extension does not break the python implementation
+    from mcr_py import PyMcRaptorLabel, TimetableCache
+
+McRAPTORInputBags = dict[int, Bag]
+
+DEFAULT_TRANSFER_TIME = 60
 
 
 class PublicTransportStep(Step):
@@ -26,9 +36,11 @@ class PublicTransportStep(Step):
         path_manager: Optional[PathManager],
         enable_limit: bool,
         disable_paths: bool,
-        structs_dict: dict,
+        structs_dict: dict | Timetable,
+        id_maps: IdMaps,
         osm_node_to_stop_map: dict[int, int],
         stop_to_osm_node_map: dict[int, int],
+        timetable_cache: Optional["TimetableCache"] = None,
     ):
         self.logger = logger
         self.timer = timer
@@ -36,8 +48,10 @@ class PublicTransportStep(Step):
         self.enable_limit = enable_limit
         self.disable_paths = disable_paths
         self.structs_dict = structs_dict
+        self.id_maps = id_maps
         self.osm_node_to_stop_map = osm_node_to_stop_map
         self.stop_to_osm_node_map = stop_to_osm_node_map
+        self.timetable_cache = timetable_cache
 
     def run(self, input_bags: IntermediateBags, offset: int) -> IntermediateBags:
         with self.timer.info("Preparing input for MCRAPTOR step"):
@@ -49,14 +63,21 @@ class PublicTransportStep(Step):
                 return {}
 
         with self.timer.info("Running MCRAPTOR step"):
-            mc_raptor = McRaptorSingle(
-                self.structs_dict,
-                default_transfer_time=60,
-                label_class=(
-                    McRAPTORLabel if self.disable_paths else McRAPTORLabelWithPath
-                ),
-            )
-            raw_public_transport_result_bags = mc_raptor.run(prepared_input_bags)  # type: ignore
+            if self.timetable_cache is not None:
+                raw_public_transport_result_bags = self.run_native_mc_raptor(
+                    prepared_input_bags
+                )
+            else:
+                mc_raptor = McRaptorSingle(
+                    self.structs_dict,
+                    default_transfer_time=DEFAULT_TRANSFER_TIME,
+                    label_class=(
+                        McRAPTORLabel if self.disable_paths else McRAPTORLabelWithPath
+                    ),
+                    bag_class=SkylineBag,
+                    route_bag_class=SkylineRouteBag,
+                )
+                raw_public_transport_result_bags = mc_raptor.run(prepared_input_bags)  # type: ignore
 
         with self.timer.info("Extracting MCRAPTOR step bags"):
             raw_public_transport_result_bags = self.convert_public_transport_bags(
@@ -70,56 +91,103 @@ class PublicTransportStep(Step):
 
         return raw_public_transport_result_bags
 
-    # converts bags with node ids to bags with stop ids
+    # converts bags with node ids to bags with (interned) stop ids
     def prepare_public_transport_step_input(
         self, bags: IntermediateBags
     ) -> McRAPTORInputBags:
-        def translate_osm_node_id_to_stop_id(
-            walking_node_id: int,
-        ) -> str | None:
-            if walking_node_id in self.osm_node_to_stop_map:
-                stop_id = str(self.osm_node_to_stop_map[walking_node_id])
-                return stop_id
-            return None
-
-        mc_raptor_bags = {
-            node_id: bag
-            for node_id, bag in bags.items()
-            if translate_osm_node_id_to_stop_id(node_id) is not None
+        mc_raptor_bags: McRAPTORInputBags = {}
+        for node_id, labels in bags.items():
+            stop_id = self.osm_node_to_stop_map.get(node_id)
+            if stop_id is None:
+                continue
+            mc_raptor_bags[stop_id] = SkylineBag.from_labels(
+                [label.to_mc_raptor_label(stop_id) for label in labels]
+            )
+
+        return mc_raptor_bags
+
+    def run_native_mc_raptor(self, bags: McRAPTORInputBags) -> dict[int, Bag]:
+        """
+        Runs the McRAPTOR step with the rust implementation, which returns
+        labels that reference the input label they were created from.
+        """
+        import mcr_py
+
+        input_labels: dict[int, list[McRAPTORLabel]] = {
+            stop_id: list(bag) for stop_id, bag in bags.items()  # type: ignore
         }
-        mc_raptor_bags_string: McRAPTORInputBags = {
-            translate_osm_node_id_to_stop_id(node_id): Bag.from_labels(
+        raw_bags = mcr_py.run_mcraptor_with_bags(
+            self.timetable_cache,  # type: ignore
+            {
+                stop_id: [
+                    (label.arrival_time, label.cost, label.n_stops) for label in labels
+                ]
+                for stop_id, labels in input_labels.items()
+            },
+            default_transfer_time=DEFAULT_TRANSFER_TIME,
+            disable_paths=self.disable_paths,
+        )
+        return {
+            stop_id: SkylineBag.from_labels(
                 [
-                    label.to_mc_raptor_label(
-                        translate_osm_node_id_to_stop_id(node_id),  # type: ignore
-                    )
+                    self.from_native_label(label, stop_id, input_labels)
                     for label in labels
                 ]
             )
-            for node_id, labels in mc_raptor_bags.items()
+            for stop_id, labels in raw_bags.items()
         }
 
-        return mc_raptor_bags_string
+    def from_native_label(
+        self,
+        label: "PyMcRaptorLabel",
+        stop_id: int,
+        input_labels: dict[int, list[McRAPTORLabel]],
+    ) -> McRAPTORLabel:
+        if self.disable_paths:
+            return McRAPTORLabel(
+                time=label.arrival_time,
+                cost=label.cost,
+                stop=stop_id,
+                n_stops=label.n_stops,
+            )
+
+        origin_stop_id, origin_idx = label.origin
+        origin = input_labels[origin_stop_id][origin_idx]
+        path = (
+            origin.shared_path
+            if isinstance(origin, McRAPTORLabelWithPath)
+            else SharedPath()
+        )
+        for path_element in label.path:
+            path = path.append(path_element)
+        return McRAPTORLabelWithPath(
+            time=label.arrival_time,
+            cost=label.cost,
+            stop=stop_id,
+            n_stops=label.n_stops,
+            path=path,
+        )
 
     def convert_public_transport_bags(
-        self, bags: dict[str, Bag], path_index_offset: int
+        self, bags: dict[int, Bag], path_index_offset: int
     ) -> IntermediateBags:
         """
         Converts the bags from the McRAPTOR step to the intermediate bags
         format.
-        The stop ids will be translated to the nearest osm node ids.
+        The stop ids will be translated to the nearest osm node ids and the
+        stops and trips of the paths to their GTFS ids.
 
         :param bags: The bags resulting from MLC on a multi modal graph.
         :param path_index_offset: Used to properly build the path and should
             be set to the length of the path before the step.
         """
         mc_raptor_result_bags = {
-            self.stop_to_osm_node_map[int(stop_id)]: bag
-            for stop_id, bag in bags.items()
+            self.stop_to_osm_node_map[stop_id]: bag for stop_id, bag in bags.items()
         }
         mc_raptor_result_bags = convert_mc_raptor_bags_to_intermediate_bags(
             mc_raptor_result_bags,
             min_path_length=path_index_offset + 1,
+            id_maps=self.id_maps,
         )
         if self.path_manager:
             self.path_manager.extract_all_paths_from_bags(
@@ -139,22 +207,73 @@ class PublicTransportStepBuilder(StepBuilder):
         structs_path: str,
         stops_path: str,
         nxgraph: nx.Graph,
+        compile_timetable: bool = False,
+        native: bool = False,
     ):
-        structs_dict = storage.read_any_dict(structs_path)
+        # memory-mapped, so all processes share one copy of the timetable
+        with Timed.info("Opening timetable"):
+            timetable = open_timetable_for_structs(structs_path)
+        if timetable is not None:
+            structs_dict: dict | Timetable = timetable
+            id_maps = timetable.id_maps
+        else:
+            structs_dict = intern.ensure_interned(storage.read_any_dict(structs_path))
+            id_maps = IdMaps.from_structs(structs_dict)
+            if compile_timetable:
+                with Timed.info("Compiling timetable"):
+                    structs_dict = Timetable.from_structs(structs_dict)
         with Timed.info("Reading stops"):
             self.stops_df = storage.read_gdf(stops_path)
 
         stops_df = graph.add_nearest_node_to_stops(self.stops_df, nxgraph)
 
-        stops_df["stop_id"] = stops_df["stop_id"].astype(int)
-        stop_to_osm_node_map: dict[int, int] = stops_df.set_index("stop_id")[
-            "nearest_node"
-        ].to_dict()
+        # the stops file may be parsed with numeric stop ids, while the
+        # structs always contain them as strings
+        stop_to_osm_node_map: dict[int, int] = {
+            id_maps.intern_stop(str(stop_id)): nearest_node
+            for stop_id, nearest_node in zip(
+                stops_df["stop_id"], stops_df["nearest_node"]
+            )
+            if str(stop_id) in id_maps.stop_id_by_gtfs_id
+        }
         osm_node_to_stop_map: dict[int, int] = {
             v: k for k, v in stop_to_osm_node_map.items()
         }
+
+        timetable_cache: Optional["TimetableCache"] = None
+        if native:
+            with Timed.info("Loading timetable into native cache"):
+                timetable_cache = create_timetable_cache(
+                    structs_dict
+                    if isinstance(structs_dict, Timetable)
+                    else Timetable.from_structs(structs_dict)
+                )
+
         self.kwargs = {
             "structs_dict": structs_dict,
+            "id_maps": id_maps,
             "osm_node_to_stop_map": osm_node_to_stop_map,
             "stop_to_osm_node_map": stop_to_osm_node_map,
+            "timetable_cache": timetable_cache,
         }
+
+
+def create_timetable_cache(timetable: Timetable) -> "TimetableCache":
+    # the arrays are passed as they are and copied through the buffer
+    # protocol, memory-mapped timetables are read from the mapping directly
+    from mcr_py import TimetableCache
+
+    timetable_cache = TimetableCache()
+    timetable_cache.set_timetable(
+        timetable.route_stop_offsets,
+        timetable.route_stops,
+        timetable.route_trip_offsets,
+        timetable.route_trips,
+        timetable.route_time_offsets,
+        timetable.arrival_times,
+        timetable.departure_times,
+        timetable.stop_route_offsets,
+        timetable.stop_routes,
+        timetable.stop_route_positions,
+    )
+    return timetable_cache
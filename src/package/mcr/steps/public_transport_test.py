@@ -0,0 +1,185 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from package.gtfs.clean import add_first_stop_info, split_routes
+from package.logger import Timer, rlog
+from package.mcr.label import McRAPTORLabelWithPath
+from package.mcr.steps.public_transport import (
+    DEFAULT_TRANSFER_TIME,
+    PublicTransportStep,
+    create_timetable_cache,
+)
+from package.raptor.bag import Bag, SkylineBag, SkylineRouteBag
+from package.raptor.mcraptor_single import McRaptorSingle
+from package.raptor.timetable import NO_TIME, Timetable
+from package.strtime import seconds_to_str_time
+from package.structs.build import build_structures
+from package.structs.intern import IdMaps, intern_structs
+from package.key import TIMES_BY_STOP_BY_TRIP_KEY
+
+
+def line_timetable() -> Timetable:
+    # the line rides from stop1 to stop7, long enough for the long distance
+    # ticket, but the first trip does not serve stop4. The cross route rides
+    # from stop8 over stop3 to stop9
+    trips = [
+        ("line", "line1", 120, [f"stop{i}" for i in range(1, 8)]),
+        ("line", "line2", 900, [f"stop{i}" for i in range(1, 8)]),
+        ("cross", "cross1", 300, ["stop8", "stop3", "stop9"]),
+    ]
+    trips_df = pd.DataFrame(
+        [[route_id, trip_id, 0] for route_id, trip_id, _, _ in trips],
+        columns=["route_id", "trip_id", "direction_id"],
+    )
+    stop_times_df = pd.DataFrame(
+        [
+            [trip_id, time, time, stop_id, sequence + 1]
+            for _, trip_id, start, stop_ids in trips
+            for sequence, stop_id in enumerate(stop_ids)
+            for time in [seconds_to_str_time(start + sequence * 120)]
+        ],
+        columns=[
+            "trip_id",
+            "departure_time",
+            "arrival_time",
+            "stop_id",
+            "stop_sequence",
+        ],
+    )
+    routes_df = pd.DataFrame([["line"], ["cross"]], columns=["route_id"])
+
+    trips_df, _ = split_routes(trips_df, stop_times_df, routes_df)
+    trips_df = add_first_stop_info(trips_df, stop_times_df)
+    structs_dict = build_structures(trips_df, stop_times_df)
+    del structs_dict[TIMES_BY_STOP_BY_TRIP_KEY]["line1"]["stop4"]
+    return Timetable.from_structs(intern_structs(structs_dict))
+
+
+def comparable_bags(bags: dict[int, Bag], with_paths: bool) -> dict[int, list]:
+    return {
+        stop_id: sorted(
+            (label.arrival_time, label.cost, label.n_stops)
+            + ((tuple(label.path),) if with_paths else ())
+            for label in bag
+        )
+        for stop_id, bag in bags.items()
+        if len(bag) > 0
+    }
+
+
+def create_step(timetable: Timetable, disable_paths: bool) -> PublicTransportStep:
+    return PublicTransportStep(
+        logger=rlog,
+        timer=Timer(),
+        path_manager=None,
+        enable_limit=False,
+        disable_paths=disable_paths,
+        structs_dict=timetable,
+        id_maps=timetable.id_maps,
+        osm_node_to_stop_map={},
+        stop_to_osm_node_map={},
+        timetable_cache=None,
+    )
+
+
+def input_bags(id_maps: IdMaps) -> dict[int, Bag]:
+    stop1 = id_maps.intern_stop("stop1")
+    stop8 = id_maps.intern_stop("stop8")
+    return {
+        stop1: SkylineBag.from_labels(
+            [
+                McRAPTORLabelWithPath(0, 100, stop1, n_stops=0, path=[42]),
+                McRAPTORLabelWithPath(600, 0, stop1, n_stops=0, path=[43]),
+            ]
+        ),
+        stop8: SkylineBag.from_labels(
+            [McRAPTORLabelWithPath(0, 0, stop8, n_stops=0, path=[44])]
+        ),
+    }
+
+
+def run_mc_raptor_single(timetable: Timetable, bags: dict[int, Bag]):
+    return McRaptorSingle(
+        timetable,
+        default_transfer_time=DEFAULT_TRANSFER_TIME,
+        label_class=McRAPTORLabelWithPath,
+        bag_class=SkylineBag,
+        route_bag_class=SkylineRouteBag,
+    ).run(bags)
+
+
+def test_mc_raptor_single_skips_stops_not_served_by_the_trip():
+    timetable = line_timetable()
+    id_maps: IdMaps = timetable.id_maps
+    stop4 = id_maps.intern_stop("stop4")
+    stop5 = id_maps.intern_stop("stop5")
+
+    bags = run_mc_raptor_single(timetable, input_bags(id_maps))
+
+    # only the second trip of the line serves stop4
+    assert [label.arrival_time for label in bags[stop4]] == [1260]
+    assert all(label.arrival_time < NO_TIME for bag in bags.values() for label in bag)
+    # the first trip is still ridden past stop4
+    assert sorted(label.arrival_time for label in bags[stop5]) == [600, 1380]
+
+
+@pytest.mark.parametrize("disable_paths", [False, True])
+def test_native_mc_raptor_matches_mc_raptor_single(disable_paths: bool):
+    pytest.importorskip("mcr_py")
+
+    timetable = line_timetable()
+    id_maps: IdMaps = timetable.id_maps
+    bags = input_bags(id_maps)
+    step = create_step(timetable, disable_paths)
+    step.timetable_cache = create_timetable_cache(timetable)
+
+    native_bags = step.run_native_mc_raptor(bags)
+    python_bags = run_mc_raptor_single(timetable, bags)
+
+    with_paths = not disable_paths
+    assert comparable_bags(native_bags, with_paths) == comparable_bags(
+        python_bags, with_paths
+    )
+
+    # the long distance ticket is used from the fifth stop of a ride on
+    stop5 = id_maps.intern_stop("stop5")
+    stop6 = id_maps.intern_stop("stop6")
+    assert sorted(label.cost for label in native_bags[stop5]) == [220, 320]
+    assert sorted(label.cost for label in native_bags[stop6]) == [320, 420]
+    if disable_paths:
+        return
+    # paths continue the paths of the input labels they were created from
+    stop9 = id_maps.intern_stop("stop9")
+    assert [label.path[0] for label in native_bags[stop9]] == [44]
+
+
+@pytest.mark.parametrize("disable_paths", [False, True])
+def test_from_native_label(disable_paths: bool):
+    timetable = line_timetable()
+    id_maps: IdMaps = timetable.id_maps
+    bags = input_bags(id_maps)
+    stop1 = id_maps.intern_stop("stop1")
+    stop3 = id_maps.intern_stop("stop3")
+    input_labels = {stop_id: list(bag) for stop_id, bag in bags.items()}
+    # a label as returned by the native engine, created from the second input
+    # label of stop1
+    native_label = SimpleNamespace(
+        arrival_time=1020,
+        cost=320,
+        n_stops=2,
+        origin=(stop1, 1),
+        path=[("STOP", stop1), ("TRIP", 5), ("STOP", stop3)],
+    )
+
+    label = create_step(timetable, disable_paths).from_native_label(
+        native_label, stop3, input_labels  # type: ignore
+    )
+
+    assert (label.arrival_time, label.cost, label.n_stops) == (1020, 320, 2)
+    if disable_paths:
+        assert not isinstance(label, McRAPTORLabelWithPath)
+        return
+    assert isinstance(label, McRAPTORLabelWithPath)
+    assert label.path == input_labels[stop1][1].path + native_label.path
@@ -1,5 +1,6 @@
 import multiprocessing
 
+import numpy as np
 import pyrosm
 import geopandas as gpd
 import igraph as ig
@@ -10,13 +11,13 @@ from package.logger import Timed
 
 
 # retrieves a dictionary, where the keys are source and the values are a list of targets
-# returns a dictionary, where the keys are source and the values are a dictionary of targets and distances
+# returns the source nodes, target nodes and distances as edge arrays
 def query_multiple_one_to_many(
     source_target_nodes_map: dict[int, list[int]],
     osm_reader: pyrosm.OSM,
     nodes: gpd.GeoDataFrame,
     edges: gpd.GeoDataFrame,
-) -> dict[int, dict[int, float]]:
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
     global i_graph  # will be used during multiprocessing
     # TODO: we could probably use a class to avoid this global variable
     with Timed.info("Creating igraph graph"):
@@ -45,17 +46,23 @@ def query_multiple_one_to_many(
         max_workers=key.DEFAULT_N_PROCESSES,
     )
 
-    source_target_nodes_distance_map: dict[int, dict[int, float]] = {}
-    for source_node, nearby_nodes_with_distance in zip(source_nodes, res):
-        source_node = igraph_node_id_to_node_id_map[source_node]  # type: ignore
-        source_target_nodes_distance_map[source_node] = {
-            igraph_node_id_to_node_id_map[target_node]: distance
-            for target_node, distance in nearby_nodes_with_distance.items()
-        }
+    # igraph node ids are vertex indices, so they are converted by a lookup
+    node_id_by_igraph_node_id = np.zeros(
+        max(igraph_node_id_to_node_id_map) + 1, np.int64
+    )
+    node_id_by_igraph_node_id[list(igraph_node_id_to_node_id_map.keys())] = list(
+        igraph_node_id_to_node_id_map.values()
+    )
+    n_targets = [len(target_nodes) for target_nodes in target_nodes_matrix]
+    source_nodes_array = node_id_by_igraph_node_id[np.repeat(source_nodes, n_targets)]
+    target_nodes_array = node_id_by_igraph_node_id[
+        np.concatenate(target_nodes_matrix).astype(np.int64)
+    ]
+    distances = np.concatenate(res).astype(np.float64)
 
     del i_graph
 
-    return source_target_nodes_distance_map
+    return source_nodes_array, target_nodes_array, distances
 
 
 def get_conversion_maps(
@@ -92,11 +99,6 @@ def get_shortest_path(source_node: int, target_node: int) -> int:
 def get_shortest_path_one_to_many(
     source_node: int,
     target_nodes: list[int],
-):
-    return {
-        target_stop: get_shortest_path(
-            source_node,
-            target_stop,
-        )
-        for target_stop in target_nodes
-    }
+) -> list[int]:
+    # distances in the order of the target nodes
+    return [get_shortest_path(source_node, target_node) for target_node in target_nodes]
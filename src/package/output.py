@@ -50,6 +50,9 @@ class TraceEnricher:
     def enrich_trace_trip(self, trace: TraceTrip) -> EnrichedTraceTrip:
         start_stop_id, end_stop_id = trace.start_stop_id, trace.end_stop_id
         trip_id = trace.trip_id
+        if isinstance(trip_id, str):
+            # trips continued from the previous day are trips of the GTFS data
+            trip_id = trip_id.removesuffix(key.PREVIOUS_DAY_ID_SUFFIX)
 
         start_stop = self.stops_df.loc[start_stop_id]
         end_stop = self.stops_df.loc[end_stop_id]
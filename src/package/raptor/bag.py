@@ -1,5 +1,6 @@
-from copy import deepcopy
-from typing import Generic, Optional, TypeVar
+from bisect import bisect_left, bisect_right
+from functools import cache
+from typing import Any, Generic, Iterator, Optional, TypeVar
 from typing_extensions import Self
 
 from package.key import S, T
@@ -7,8 +8,72 @@ from package.raptor.data import DataQuerier, ExpandedDataQuerier
 from package.tracer.tracer import TraceFootpath, TraceStart, TraceTrip
 
 
+class SharedPath:
+    """
+    Immutable list of path elements. Appending returns a new path that shares
+    all previous elements with this one, so copying a label never copies its
+    path and labels branching off the same label share the common prefix.
+    """
+
+    __slots__ = ("parent", "element", "length")
+
+    def __init__(self, parent: Optional["SharedPath"] = None, element: Any = None):
+        self.parent = parent
+        self.element = element
+        self.length = parent.length + 1 if parent is not None else 0
+
+    @staticmethod
+    def from_list(elements: list) -> "SharedPath":
+        path = SharedPath()
+        for element in elements:
+            path = path.append(element)
+        return path
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator:
+        return iter(self.to_list())
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+    def append(self, element: Any) -> "SharedPath":
+        return SharedPath(self, element)
+
+    def replace_last(self, element: Any) -> "SharedPath":
+        assert self.parent is not None, "Path is empty"
+        return SharedPath(self.parent, element)
+
+    def last(self) -> Any:
+        return self.element if self.parent is not None else None
+
+    def to_list(self) -> list:
+        elements = []
+        path = self
+        while path.parent is not None:
+            elements.append(path.element)
+            path = path.parent
+        elements.reverse()
+        return elements
+
+
+@cache
+def get_slot_names(label_class: type) -> tuple[str, ...]:
+    names: list[str] = []
+    for cls in label_class.__mro__:
+        slots = cls.__dict__.get("__slots__", ())
+        names.extend([slots] if isinstance(slots, str) else slots)
+    return tuple(names)
+
+
 class BaseLabel:
-    def __init__(self, time: int, stop_id: Optional[str] = None):
+    # labels are created and copied for every step along a route, so they
+    # only use slots and are copied shallowly. Mutable attributes therefore
+    # have to be replaced instead of modified in place, e.g. with `SharedPath`
+    __slots__ = ("arrival_time",)
+
+    def __init__(self, time: int, stop_id: Optional[int] = None):
         self.arrival_time = time
 
     def __repr__(self):
@@ -17,35 +82,51 @@ class BaseLabel:
     def strictly_dominates(self, other: Self) -> bool:
         return True
 
-    def update_along_trip(self, arrival_time: int, stop_id: str, trip_id: str):
+    def update_along_trip(self, arrival_time: int, stop_id: int, trip_id: int):
         self.arrival_time = arrival_time
 
-    def update_along_footpath(self, walking_time: int, stop_id: str):
+    def update_along_footpath(self, walking_time: int, stop_id: int):
         self.arrival_time = self.arrival_time + walking_time
 
-    def update_before_route_bag_merge(self, departure_time: int, stop_id: str):
+    def update_before_route_bag_merge(self, departure_time: int, stop_id: int):
         self.arrival_time = departure_time
 
-    def update_before_stop_bag_merge(self, stop_id: str):
+    def update_before_stop_bag_merge(self, stop_id: int):
         pass
 
     def to_human_readable(self):
         pass
 
     def copy(self: Self) -> Self:
-        return deepcopy(self)
+        label = object.__new__(self.__class__)
+        for name in get_slot_names(self.__class__):
+            setattr(label, name, getattr(self, name))
+        if hasattr(self, "__dict__"):
+            label.__dict__.update(self.__dict__)
+        return label
 
 
 L = TypeVar("L", bound=BaseLabel)  # custom label
 
 
 class Bag:
+    """
+    Pareto set of labels.
+
+    A bag takes ownership of the labels added to it and labels in a bag are
+    never modified in place, so bags can share labels and copying a bag only
+    copies the container.
+    """
+
     def __init__(self):
         self._bag: set[BaseLabel] = set()
 
     def __iter__(self):
         return iter(self._bag)
 
+    def __len__(self):
+        return len(self._bag)
+
     def __str__(self):
         return str(self._bag)
 
@@ -66,7 +147,7 @@ class Bag:
         return False
 
     def add(self, label: BaseLabel):
-        self._bag.add(label.copy())
+        self._bag.add(label)
 
     def content_dominates(self, label: BaseLabel):
         return any(other.strictly_dominates(label) for other in self._bag)
@@ -85,25 +166,27 @@ class Bag:
         return is_any_added
 
     def create_bag_with_timeoffset(self: Self, time: int) -> Self:
-        bag = self.copy()
+        bag = self.copy_with_labels()
         bag.add_arrival_time_to_all(time)
         return bag
 
     def create_footpath_bag(
         self: Self,
         walk_time: int,
-        stop_id: str,
+        stop_id: int,
     ):
-        bag = self.copy()
+        bag = self.copy_with_labels()
         for label in bag._bag:
             label.update_along_footpath(walk_time, stop_id)
         return bag
 
+    # only for bags that own their labels exclusively, see `copy_with_labels`
     def add_arrival_time_to_all(self, time: int):
         for label in self._bag:
             label.arrival_time += time
 
-    def update_before_stop_bag_merge(self, stop_id: str) -> Self:
+    # only for bags that own their labels exclusively, see `copy_with_labels`
+    def update_before_stop_bag_merge(self, stop_id: int) -> Self:
         for label in self._bag:
             label.update_before_stop_bag_merge(stop_id)
         return self
@@ -112,12 +195,20 @@ class Bag:
         return list((label.to_human_readable()) for label in self._bag)
 
     def copy(self):
+        new_bag = Bag()
+        new_bag._bag = self._bag.copy()
+        return new_bag
+
+    def copy_with_labels(self):
+        """
+        Returns a copy with copied labels, which can be modified in place.
+        """
         new_bag = Bag()
         new_bag._bag = set(label.copy() for label in self._bag)
         return new_bag
 
 
-ArrivalTimePerTrip = dict[str, int]
+ArrivalTimePerTrip = dict[int, int]
 
 
 class RouteBag(Generic[L, S, T]):
@@ -125,23 +216,27 @@ class RouteBag(Generic[L, S, T]):
         self,
         dq: ExpandedDataQuerier[S, T] | DataQuerier,
     ):
-        self._bag: set[tuple[L, str]] = set()
+        self._bag: set[tuple[L, int]] = set()
         self._dq = dq
 
+    def __len__(self):
+        return len(self._bag)
+
     def __str__(self):
         return str(self._bag)
 
     def __repr__(self):
         return repr(self._bag)
 
-    def add_if_necessary(self, label: L, trip: str) -> Self:
+    def add_if_necessary(self, label: L, trip: int) -> Self:
         if not self.content_dominates(label):
             self.remove_dominated_by(label)
             self.add(label, trip)
         return self
 
-    def add(self, label: L, trip: str) -> Self:
-        self._bag.add((label.copy(), trip))
+    # takes ownership of the label, which is updated in place along the trip
+    def add(self, label: L, trip: int) -> Self:
+        self._bag.add((label, trip))
         return self
 
     def content_dominates(self, label: L) -> bool:
@@ -155,41 +250,53 @@ class RouteBag(Generic[L, S, T]):
         }
         return self
 
-    def update_along_trip(self, stop_id: str) -> Self:
+    def update_along_trip(self, stop_id: int) -> Self:
         for label, trip in self._bag:
             arrival_time = self._dq.get_arrival_time(trip, stop_id)
             label.update_along_trip(arrival_time, stop_id, trip)
         return self
 
-    def get_trips(self) -> set[str]:
+    def get_trips(self) -> set[int]:
         return set(trip for _, trip in self._bag)
 
     def to_bag(self) -> Bag:
-        bag = Bag()
-        for label, _ in self._bag:
-            bag.add(label)
-        return bag
+        # the labels of the route bag are still updated along the trip
+        return Bag.from_labels([label.copy() for label, _ in self._bag])
 
 
 class TraceLabel(BaseLabel):
-    def __init__(self, time: int, stop: Optional[str] = None):
+    __slots__ = ("_stops", "_trips", "_traces", "last_update")
+
+    def __init__(self, time: int, stop: Optional[int] = None):
         super().__init__(time, stop)
-        self.stops = []
-        self.trips = []
-        self.traces = []
+        self._stops = SharedPath()
+        self._trips = SharedPath()
+        self._traces = SharedPath()
         if stop is not None and time is not None:
-            self.stops.append(stop)
-            self.traces.append(TraceStart(stop, time))
+            self._stops = self._stops.append(stop)
+            self._traces = self._traces.append(TraceStart(stop, time))
 
         self.last_update = "start"
 
-    def update_along_trip(self, arrival_time: int, stop_id: str, trip_id: str):
+    @property
+    def stops(self) -> list[int]:
+        return self._stops.to_list()
+
+    @property
+    def trips(self) -> list[int]:
+        return self._trips.to_list()
+
+    @property
+    def traces(self) -> list:
+        return self._traces.to_list()
+
+    def update_along_trip(self, arrival_time: int, stop_id: int, trip_id: int):
         old_arrival_time = self.arrival_time
         super().update_along_trip(arrival_time, stop_id, trip_id)
         if self.last_update == "trip":
-            prev_trace = self.traces.pop()
+            prev_trace = self._traces.last()
             assert trip_id == prev_trace.trip_id
-            self.traces.append(
+            self._traces = self._traces.replace_last(
                 TraceTrip(
                     prev_trace.start_stop_id,
                     prev_trace.departure_time,
@@ -199,23 +306,298 @@ class TraceLabel(BaseLabel):
                 )
             )
         else:
-            self.traces.append(
+            self._traces = self._traces.append(
                 TraceTrip(
-                    self.stops[-1], old_arrival_time, stop_id, arrival_time, trip_id
+                    self._stops.last(), old_arrival_time, stop_id, arrival_time, trip_id
                 )
             )
 
         self.last_update = "trip"
-        self.stops.append(stop_id)
-        self.trips.append(trip_id)
+        self._stops = self._stops.append(stop_id)
+        self._trips = self._trips.append(trip_id)
 
-    def update_along_footpath(self, walking_time: int, stop_id: str):
+    def update_along_footpath(self, walking_time: int, stop_id: int):
         super().update_along_footpath(walking_time, stop_id)
         self.last_update = "footpath"
-        self.traces.append(TraceFootpath(self.stops[-1], stop_id, walking_time))
-        self.stops.append(stop_id)
+        self._traces = self._traces.append(
+            TraceFootpath(self._stops.last(), stop_id, walking_time)
+        )
+        self._stops = self._stops.append(stop_id)
 
-    def update_before_route_bag_merge(self, departure_time: int, stop_id: str):
+    def update_before_route_bag_merge(self, departure_time: int, stop_id: int):
         super().update_before_route_bag_merge(departure_time, stop_id)
         self.last_update = "waiting"
-        self.stops.append(stop_id)
+        self._stops = self._stops.append(stop_id)
+
+
+class Skyline:
+    """
+    Pareto set of labels with the two criteria `arrival_time` and `cost`,
+    each stored together with a payload (e.g. the trip of a route bag label).
+
+    Labels are kept sorted by arrival time. As no label dominates another, the
+    costs are then strictly decreasing, so a label is dominated iff the latest
+    label that arrives no later than it is not more expensive. Dominance checks
+    are binary searches and merging sorted skylines is a linear sweep, but
+    inserting and removing labels shifts the lists and takes linear time.
+    """
+
+    def __init__(self):
+        self._labels: list = []
+        self._payloads: list = []
+        self._times: list[int] = []
+        # negated costs, so that they are increasing and can be bisected
+        self._neg_costs: list[int] = []
+
+    def __len__(self):
+        return len(self._labels)
+
+    def _is_dominated(self, label) -> bool:
+        i = bisect_right(self._times, label.arrival_time) - 1
+        return i >= 0 and -self._neg_costs[i] <= label.cost
+
+    def _remove_dominated_by(self, label):
+        # labels arriving no earlier are dominated as long as they cost no less
+        start = bisect_left(self._times, label.arrival_time)
+        end = bisect_right(self._neg_costs, -label.cost, lo=start)
+        if start < end:
+            del self._labels[start:end]
+            del self._payloads[start:end]
+            del self._times[start:end]
+            del self._neg_costs[start:end]
+
+    def _insert(self, label, payload) -> bool:
+        if self._is_dominated(label):
+            return False
+        self._remove_dominated_by(label)
+        i = bisect_left(self._times, label.arrival_time)
+        self._labels.insert(i, label)
+        self._payloads.insert(i, payload)
+        self._times.insert(i, label.arrival_time)
+        self._neg_costs.insert(i, -label.cost)
+        return True
+
+    def _set(self, labels: list, payloads: list) -> list[int]:
+        """
+        Replaces the content with the non-dominated labels of `labels`. The
+        labels are not copied. Returns the indices of the dominated labels.
+        """
+        order = sorted(
+            range(len(labels)),
+            key=lambda i: (labels[i].arrival_time, labels[i].cost),
+        )
+        self._labels, self._payloads, self._times, self._neg_costs = [], [], [], []
+        dominated: list[int] = []
+        for i in order:
+            label = labels[i]
+            if self._neg_costs and -self._neg_costs[-1] <= label.cost:
+                dominated.append(i)
+                continue
+            self._labels.append(label)
+            self._payloads.append(payloads[i])
+            self._times.append(label.arrival_time)
+            self._neg_costs.append(-label.cost)
+        return dominated
+
+    def _sync(self):
+        # the labels were updated in place, so their order may have changed
+        self._set(self._labels, self._payloads)
+
+
+class SkylineBag(Skyline, Bag):
+    """
+    A `Bag` for labels that are compared by `arrival_time` and `cost` only,
+    like `McRAPTORLabel`.
+    """
+
+    def __init__(self):
+        Skyline.__init__(self)
+
+    def __iter__(self):
+        return iter(self._labels)
+
+    def __str__(self):
+        return str(self._labels)
+
+    def __repr__(self):
+        return repr(self._labels)
+
+    @staticmethod
+    def from_labels(labels: list[BaseLabel]):
+        bag = SkylineBag()
+        bag._set(list(labels), [None] * len(labels))
+        return bag
+
+    def add_if_necessary(self, label: BaseLabel) -> bool:
+        return self._insert(label, None)
+
+    def add(self, label: BaseLabel):
+        # the bag is always a pareto set, so dominated labels are not added
+        self._insert(label, None)
+
+    def content_dominates(self, label: BaseLabel):
+        return self._is_dominated(label)
+
+    def remove_dominated_by(self, label: BaseLabel):
+        self._remove_dominated_by(label)
+
+    def merge(self: Self, other: Bag) -> bool:
+        if not isinstance(other, SkylineBag):
+            return super().merge(other)
+
+        labels: list[BaseLabel] = []
+        is_any_added = False
+        i, j = 0, 0
+        while i < len(self) or j < len(other):
+            # on equal labels our own label wins, as it dominates the other one
+            is_own = j == len(other) or (
+                i < len(self)
+                and (self._times[i], -self._neg_costs[i])
+                <= (other._times[j], -other._neg_costs[j])
+            )
+            if is_own:
+                label = self._labels[i]
+                i += 1
+            else:
+                label = other._labels[j]
+                j += 1
+
+            if labels and labels[-1].cost <= label.cost:
+                continue
+            if not is_own:
+                is_any_added = True
+            labels.append(label)
+
+        self._labels = labels
+        self._payloads = [None] * len(labels)
+        self._times = [label.arrival_time for label in labels]
+        self._neg_costs = [-label.cost for label in labels]
+        return is_any_added
+
+    def create_footpath_bag(
+        self: Self,
+        walk_time: int,
+        stop_id: int,
+    ):
+        bag = self.copy_with_labels()
+        for label in bag._labels:
+            label.update_along_footpath(walk_time, stop_id)
+        bag._sync()
+        return bag
+
+    def add_arrival_time_to_all(self, time: int):
+        for label in self._labels:
+            label.arrival_time += time
+        self._times = [t + time for t in self._times]
+
+    def update_before_stop_bag_merge(self, stop_id: int) -> Self:
+        for label in self._labels:
+            label.update_before_stop_bag_merge(stop_id)
+        self._sync()
+        return self
+
+    def to_human_readable(self):
+        return list((label.to_human_readable()) for label in self._labels)
+
+    def copy(self):
+        new_bag = SkylineBag()
+        new_bag._labels = self._labels.copy()
+        new_bag._payloads = self._payloads.copy()
+        new_bag._times = self._times.copy()
+        new_bag._neg_costs = self._neg_costs.copy()
+        return new_bag
+
+    def copy_with_labels(self):
+        new_bag = self.copy()
+        new_bag._labels = [label.copy() for label in self._labels]
+        return new_bag
+
+
+class SkylineRouteBag(Skyline, RouteBag[L, S, T]):
+    """
+    The `RouteBag` counterpart of `SkylineBag`, the trips are stored as
+    payloads.
+
+    Updating the labels along a trip changes their arrival times and costs
+    independently, and the cost is not monotone in the number of stops (see
+    `McRAPTORLabel`). A label that is dominated at one stop may therefore not
+    be dominated at a later one, so, like in `RouteBag`, labels are only
+    removed when a label that dominates them is added. The skyline holds the
+    non-dominated labels, the dominated ones ride along beside it. Checking
+    new labels against the skyline suffices, as whatever a dominated label
+    dominates is dominated by the skyline as well.
+    """
+
+    def __init__(
+        self,
+        dq: ExpandedDataQuerier[S, T] | DataQuerier,
+    ):
+        Skyline.__init__(self)
+        self._dq = dq
+        self._dominated_labels: list = []
+        self._dominated_payloads: list = []
+
+    def __len__(self):
+        return len(self._labels) + len(self._dominated_labels)
+
+    def __str__(self):
+        return str(list(zip(*self._all())))
+
+    def __repr__(self):
+        return str(self)
+
+    def _all(self) -> tuple[list, list]:
+        return (
+            self._labels + self._dominated_labels,
+            self._payloads + self._dominated_payloads,
+        )
+
+    def add_if_necessary(self, label: L, trip: int) -> Self:
+        if self._insert(label, trip):
+            self._remove_dominated_labels_dominated_by(label)
+        return self
+
+    def add(self, label: L, trip: int) -> Self:
+        return self.add_if_necessary(label, trip)
+
+    def content_dominates(self, label: L) -> bool:
+        return self._is_dominated(label)
+
+    def remove_dominated_by(self, label: L) -> Self:
+        self._remove_dominated_by(label)
+        self._remove_dominated_labels_dominated_by(label)
+        return self
+
+    def _remove_dominated_labels_dominated_by(self, label: L):
+        if len(self._dominated_labels) == 0:
+            return
+        kept = [
+            i
+            for i, other in enumerate(self._dominated_labels)
+            if not label.strictly_dominates(other)
+        ]
+        self._dominated_labels = [self._dominated_labels[i] for i in kept]
+        self._dominated_payloads = [self._dominated_payloads[i] for i in kept]
+
+    def update_along_trip(self, stop_id: int) -> Self:
+        labels, payloads = self._all()
+        for label, trip in zip(labels, payloads):
+            arrival_time = self._dq.get_arrival_time(trip, stop_id)
+            label.update_along_trip(arrival_time, stop_id, trip)
+        # the order changed, labels are resorted but none is discarded
+        dominated = self._set(labels, payloads)
+        self._dominated_labels = [labels[i] for i in dominated]
+        self._dominated_payloads = [payloads[i] for i in dominated]
+        return self
+
+    def get_trips(self) -> set[int]:
+        return set(self._payloads) | set(self._dominated_payloads)
+
+    def to_bag(self) -> SkylineBag:
+        # dominated labels would not be added to a bag anyway
+        bag = SkylineBag()
+        bag._labels = [label.copy() for label in self._labels]
+        bag._payloads = [None] * len(self._labels)
+        bag._times = self._times.copy()
+        bag._neg_costs = self._neg_costs.copy()
+        return bag
@@ -1,3 +1,8 @@
+import random
+
+from package.mcr.label import McRAPTORLabel
+from package.raptor.bag import Bag, SkylineBag
+
 # import pytest
 # from package.raptor.bag import Bag, Label, RouteBag
 #
@@ -118,3 +123,41 @@
 #     for label, trip in copied_bag._bag:
 #         assert isinstance(label, Label)
 #         assert isinstance(trip, str)
+
+
+def create_random_labels(n: int, seed: int) -> list[McRAPTORLabel]:
+    rng = random.Random(seed)
+    return [
+        McRAPTORLabel(rng.randint(0, 50), rng.randint(0, 50), stop=0, n_stops=0)
+        for _ in range(n)
+    ]
+
+
+def to_values(bag: Bag) -> list[tuple[int, int]]:
+    return sorted((label.arrival_time, label.cost) for label in bag)
+
+
+def test_skyline_bag_add_if_necessary():
+    bag = Bag()
+    skyline_bag = SkylineBag()
+    for label in create_random_labels(200, seed=0):
+        assert bag.add_if_necessary(label) == skyline_bag.add_if_necessary(label)
+        assert to_values(bag) == to_values(skyline_bag)
+
+
+def test_skyline_bag_merge():
+    for seed in range(20):
+        bag = Bag.from_labels([])
+        other_bag = Bag()
+        skyline_bag = SkylineBag()
+        other_skyline_bag = SkylineBag()
+        labels = create_random_labels(40, seed)
+        for label in labels[:20]:
+            bag.add_if_necessary(label)
+            skyline_bag.add_if_necessary(label)
+        for label in labels[20:]:
+            other_bag.add_if_necessary(label)
+            other_skyline_bag.add_if_necessary(label)
+
+        assert bag.merge(other_bag) == skyline_bag.merge(other_skyline_bag)
+        assert to_values(bag) == to_values(skyline_bag)
@@ -0,0 +1,222 @@
+from typing_extensions import Self
+
+import numpy as np
+
+from package import strtime
+from package.logger import rlog
+from package.raptor.data import create_footpaths
+from package.raptor.timetable import NO_TIME, Timetable
+from package.structs.footpaths import Footpaths
+
+# arrival time of stops that are not reached
+UNREACHED = NO_TIME
+
+
+class BatchRaptor:
+    """
+    Runs one-to-all RAPTOR queries for many sources at once.
+
+    The arrival times of all sources are kept in a sources x stops matrix.
+    Every round, each route that serves a marked stop is scanned once for all
+    sources that marked one of its stops, using NumPy operations over the
+    sources instead of a Python loop per query.
+
+    Works on the compiled `Timetable` and the interned stop ids. The results
+    are the same as running `Raptor.run` for every source without an end stop.
+    """
+
+    def __init__(
+        self: Self,
+        structs_dict: dict | Timetable,
+        footpaths: dict[int, dict[int, int]] | Footpaths,
+        max_transfers: int,
+        default_transfer_time: int,
+    ):
+        if not isinstance(structs_dict, Timetable):
+            structs_dict = Timetable.from_structs(structs_dict)
+        self.timetable = structs_dict
+
+        self.max_transfers = max_transfers
+        self.default_transfer_time = default_transfer_time
+
+        footpaths = create_footpaths(footpaths, self.timetable.n_stops)
+        assert footpaths is not None
+        self.footpath_sources = footpaths.sources()
+        self.footpath_targets = footpaths.neighbors
+        self.footpath_walking_times = footpaths.walking_times
+
+    def run(
+        self: Self, start_stop_ids: list[int], start_times: list[str]
+    ) -> np.ndarray:
+        """
+        Returns a (sources x stops) matrix with the earliest arrival time at
+        every stop for every pair of start stop and start time (in HH:MM:SS).
+        Stops that are not reached have an arrival time of `UNREACHED`.
+        """
+        if len(start_stop_ids) != len(start_times):
+            raise ValueError("start_stop_ids and start_times must have equal length")
+
+        n_sources = len(start_stop_ids)
+        shape = (n_sources, self.timetable.n_stops)
+
+        tau_previous = np.full(shape, UNREACHED, dtype=np.int64)
+        tau_best = np.full(shape, UNREACHED, dtype=np.int64)
+        marked = np.zeros(shape, dtype=bool)
+
+        sources = np.arange(n_sources)
+        start_stops = np.array(start_stop_ids, dtype=np.int64)
+        tau_previous[sources, start_stops] = strtime.str_times_to_seconds(start_times)
+        tau_best[sources, start_stops] = tau_previous[sources, start_stops]
+        marked[sources, start_stops] = True
+
+        tau_current = tau_previous.copy()
+
+        k = 0
+        for k in range(1, self.max_transfers + 1):
+            rlog.debug(f"iteration {k}")
+
+            new_marked = np.zeros(shape, dtype=bool)
+            for route_id in self.collect_routes(marked):
+                self.process_route(
+                    route_id, tau_previous, tau_current, tau_best, marked, new_marked
+                )
+            self.process_footpaths(tau_current, tau_best, new_marked)
+
+            # the previous round only differs from the current one at the
+            # stops marked in this round
+            changed_stops = np.flatnonzero(new_marked.any(axis=0))
+            tau_previous[:, changed_stops] = tau_current[:, changed_stops]
+
+            marked = new_marked
+            rlog.debug(f"marked stops: {len(changed_stops)}")
+
+            if len(changed_stops) == 0:
+                break
+
+        rlog.info(f"Batched RAPTOR finished after {k} iterations")
+        return tau_best
+
+    def collect_routes(self: Self, marked: np.ndarray) -> list[int]:
+        timetable = self.timetable
+        routes: set[int] = set()
+        for stop_id in np.flatnonzero(marked.any(axis=0)):
+            start = timetable.stop_route_offsets[stop_id]
+            end = timetable.stop_route_offsets[stop_id + 1]
+            routes.update(timetable.stop_routes[start:end].tolist())
+        return sorted(routes)
+
+    def process_route(
+        self: Self,
+        route_id: int,
+        tau_previous: np.ndarray,
+        tau_current: np.ndarray,
+        tau_best: np.ndarray,
+        marked: np.ndarray,
+        new_marked: np.ndarray,
+    ):
+        timetable = self.timetable
+        stops = timetable.route_stops[
+            timetable.route_stop_offsets[route_id] : timetable.route_stop_offsets[
+                route_id + 1
+            ]
+        ]
+        # only sources that marked a stop of the route can improve anything
+        rows = np.flatnonzero(marked[:, stops].any(axis=1))
+        if len(rows) == 0:
+            return
+
+        departures = timetable.departure_times_by_route[route_id]
+        arrivals = timetable.arrival_times_by_route[route_id]
+        sorted_departures = timetable.sorted_departures_by_route[route_id]
+        n_trips, n_stops = departures.shape
+
+        ready_to_depart = tau_previous[np.ix_(rows, stops)] + self.default_transfer_time
+
+        # position of the earliest trip that can be boarded at every stop
+        boarded_trips = np.empty((len(rows), n_stops), dtype=np.int64)
+        for stop_pos in range(n_stops):
+            boarded_trips[:, stop_pos] = earliest_trip_positions(
+                departures[:, stop_pos],
+                ready_to_depart[:, stop_pos],
+                sorted_departures[stop_pos],
+            )
+
+        # a stop is reached with the earliest trip boarded at any stop before it
+        trips = np.minimum.accumulate(boarded_trips, axis=1)
+        trips = np.concatenate(
+            [np.full((len(rows), 1), n_trips, dtype=np.int64), trips[:, :-1]], axis=1
+        )
+        is_on_trip = trips < n_trips
+        arrival_times = np.where(
+            is_on_trip,
+            arrivals[np.minimum(trips, n_trips - 1), np.arange(n_stops)],
+            UNREACHED,
+        ).astype(np.int64)
+
+        improved = arrival_times < tau_best[np.ix_(rows, stops)]
+        row_idxs, stop_positions = np.nonzero(improved)
+        if len(row_idxs) == 0:
+            return
+
+        sources = rows[row_idxs]
+        stop_ids = stops[stop_positions]
+        tau_current[sources, stop_ids] = arrival_times[row_idxs, stop_positions]
+        tau_best[sources, stop_ids] = arrival_times[row_idxs, stop_positions]
+        new_marked[sources, stop_ids] = True
+
+    def process_footpaths(
+        self: Self,
+        tau_current: np.ndarray,
+        tau_best: np.ndarray,
+        new_marked: np.ndarray,
+    ):
+        is_marked_stop = new_marked.any(axis=0)
+        edges = np.flatnonzero(is_marked_stop[self.footpath_sources])
+        if len(edges) == 0:
+            return
+
+        edge_sources = self.footpath_sources[edges]
+        edge_targets = self.footpath_targets[edges]
+        walking_times = self.footpath_walking_times[edges]
+
+        # only walk from the stops that were marked by the respective source
+        arrival_times = np.where(
+            new_marked[:, edge_sources],
+            tau_current[:, edge_sources] + walking_times,
+            UNREACHED,
+        )
+
+        targets, edge_target_idxs = np.unique(edge_targets, return_inverse=True)
+        target_arrival_times = np.full(
+            (len(tau_current), len(targets)), UNREACHED, dtype=np.int64
+        )
+        np.minimum.at(target_arrival_times.T, edge_target_idxs, arrival_times.T)
+
+        improved = target_arrival_times < tau_best[:, targets]
+        sources, target_idxs = np.nonzero(improved)
+        stop_ids = targets[target_idxs]
+        tau_current[sources, stop_ids] = target_arrival_times[sources, target_idxs]
+        tau_best[sources, stop_ids] = target_arrival_times[sources, target_idxs]
+        new_marked[sources, stop_ids] = True
+
+
+def earliest_trip_positions(
+    departures: np.ndarray, ready_to_depart: np.ndarray, is_sorted: bool
+) -> np.ndarray:
+    """
+    Returns for every ready time the position of the first trip that departs
+    no earlier than it, or the number of trips if there is none.
+    """
+    n_trips = len(departures)
+
+    if is_sorted:
+        positions = np.searchsorted(departures, ready_to_depart, side="left")
+        catchable = positions < n_trips
+        catchable[catchable] = departures[positions[catchable]] != NO_TIME
+        return np.where(catchable, positions, n_trips)
+
+    # trips overtake each other at this stop, fall back to a linear scan
+    catchable = (departures[None, :] >= ready_to_depart[:, None]) & (
+        departures[None, :] != NO_TIME
+    )
+    return np.where(catchable.any(axis=1), catchable.argmax(axis=1), n_trips)
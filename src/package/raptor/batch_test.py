@@ -0,0 +1,45 @@
+from typing import Any
+
+from package import strtime
+from package.raptor.batch import UNREACHED, BatchRaptor
+from package.raptor.raptor import Raptor
+from package.raptor.timetable import Timetable
+from package.structs.intern import IdMaps, intern_structs
+
+
+def test_batch_raptor_matches_single_runs(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    footpaths = id_maps.intern_footpaths(footpaths_dict)
+
+    start_stop_ids = [
+        id_maps.intern_stop(stop_id)
+        for stop_id in ["stop1", "stop1", "stop2", "stop3", "stop4"]
+    ]
+    start_times = ["00:00:00", "00:30:00", "00:00:00", "01:00:00", "00:05:00"]
+
+    for transfer_time in [0, 60]:
+        arrival_matrix = BatchRaptor(
+            Timetable.from_structs(structs_dict), footpaths, 3, transfer_time
+        ).run(start_stop_ids, start_times)
+
+        assert arrival_matrix.shape == (len(start_stop_ids), len(id_maps.stop_ids))
+
+        for source, (start_stop_id, start_time) in enumerate(
+            zip(start_stop_ids, start_times)
+        ):
+            arrival_times, _ = Raptor(structs_dict, footpaths, 3, transfer_time).run(
+                start_stop_id, None, start_time
+            )
+
+            for stop_id, arrival_time in arrival_times.items():
+                batch_arrival_time = arrival_matrix[source, stop_id]
+                if batch_arrival_time == UNREACHED:
+                    assert arrival_time == "--:--:--"
+                else:
+                    assert (
+                        strtime.seconds_to_str_time(int(batch_arrival_time))
+                        == arrival_time
+                    )
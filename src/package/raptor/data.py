@@ -1,15 +1,33 @@
 import sys
+from bisect import bisect_left
 from typing import Generic, Optional
 from typing_extensions import Self
 
 from package.key import S, T
-from package.structs import build
+from package.raptor.timetable import Timetable
+from package.structs import build, intern
+from package.structs.footpaths import Footpaths
+from package.structs.intern import IdMaps
 
 
 class DataQuerier:
-    def __init__(self: Self, structs_dict: dict, footpaths: dict | None):
-        self.footpaths = footpaths
-
+    def __init__(
+        self: Self,
+        structs_dict: dict | Timetable | str,
+        footpaths: dict | Footpaths | None,
+    ):
+        if isinstance(structs_dict, str):
+            # path of a timetable written by `Timetable.save`, the arrays are
+            # memory-mapped and only read once they are queried
+            structs_dict = Timetable.open(structs_dict)
+
+        if isinstance(structs_dict, Timetable):
+            self.use_timetable(structs_dict)
+            self.footpaths = create_footpaths(footpaths, structs_dict.n_stops)
+            return
+
+        # the engines work on the dense integer ids of the interned structs
+        structs_dict = intern.ensure_interned(structs_dict)
         (
             # stop_times_by_trip,
             self.trip_ids_by_route,
@@ -21,20 +39,44 @@ class DataQuerier:
             # route_id_set,
             # trip_id_set,
         ) = build.unpack_structs(structs_dict)
-
-    def get_stop_ids(self) -> set[str]:
+        self.id_maps = IdMaps.from_structs(structs_dict)
+        self.departure_columns_by_route: dict[int, dict[int, Optional[list[int]]]] = {}
+        self.footpaths = create_footpaths(footpaths, len(self.stop_id_set))
+
+    def use_timetable(self: Self, timetable: Timetable):
+        """
+        Answers all timetable queries from the compiled `Timetable` instead of
+        the structs dicts. The methods are bound directly, so that the hot
+        loops of the engines do not pay for an additional indirection.
+        """
+        self.timetable = timetable
+        self.id_maps = timetable.id_maps
+        self.stop_id_set = timetable.stop_id_set
+
+        self.get_stop_ids = timetable.get_stop_ids  # type: ignore
+        self.get_routes_by_stop = timetable.get_routes_by_stop  # type: ignore
+        self.get_routes_serving_stop = timetable.get_routes_serving_stop  # type: ignore
+        self.get_idx_of_stop_in_route = timetable.get_idx_of_stop_in_route  # type: ignore
+        self.get_arrival_time = timetable.get_arrival_time  # type: ignore
+        self.get_departure_time = timetable.get_departure_time  # type: ignore
+        self.get_departure_times_at_stop = timetable.get_departure_times_at_stop  # type: ignore
+        self.earliest_trip = timetable.earliest_trip  # type: ignore
+        self.earliest_trip_with_pointer = timetable.earliest_trip_with_pointer  # type: ignore
+        self.iterate_stops_in_route_from_idx = timetable.iterate_stops_in_route_from_idx  # type: ignore
+
+    def get_stop_ids(self) -> set[int]:
         return self.stop_id_set
 
-    def get_routes_by_stop(self, stop_id: str) -> set[str]:
+    def get_routes_by_stop(self, stop_id: int) -> set[int]:
         return self.routes_by_stop[stop_id]
 
-    def get_routes_serving_stop(self, stop_id: str) -> set[str]:
+    def get_routes_serving_stop(self, stop_id: int) -> set[int]:
         return self.routes_by_stop[stop_id]
 
-    def get_idx_of_stop_in_route(self, stop_id: str, route_id: str) -> int:
+    def get_idx_of_stop_in_route(self, stop_id: int, route_id: int) -> int:
         return self.idx_by_stop_by_route[route_id][stop_id]
 
-    def get_arrival_time(self, trip_id: str, stop_id: str) -> int:
+    def get_arrival_time(self, trip_id: int, stop_id: int) -> int:
         assert trip_id is not None
         assert stop_id is not None
 
@@ -42,7 +84,7 @@ class DataQuerier:
         assert type(arrival_time) == int
         return arrival_time
 
-    def get_departure_time(self, trip_id: Optional[str], stop_id: str) -> int:
+    def get_departure_time(self, trip_id: Optional[int], stop_id: int) -> int:
         assert stop_id is not None
 
         if trip_id is None:
@@ -52,42 +94,130 @@ class DataQuerier:
         assert type(departure_time) == int
         return departure_time
 
+    def get_departure_times_at_stop(self, stop_id: int) -> list[int]:
+        """
+        Returns the departure times of all trips serving the stop.
+        """
+        return [
+            self.times_by_stop_by_trip[trip_id][stop_id][1]
+            for route_id in self.routes_by_stop[stop_id]
+            for trip_id in self.trip_ids_by_route[route_id]
+            if stop_id in self.times_by_stop_by_trip[trip_id]
+        ]
+
     def earliest_trip(
-        self, route_id: str, stop_id: str, arrival_time: int
-    ) -> Optional[tuple[str, int]]:
+        self,
+        route_id: int,
+        stop_id: int,
+        arrival_time: int,
+        trip_pointer: Optional[int] = None,
+    ) -> Optional[tuple[int, int]]:
+        result = self.earliest_trip_with_pointer(
+            route_id, stop_id, arrival_time, trip_pointer
+        )
+        if result is None:
+            return None
+        trip_id, departure_time, _ = result
+        return trip_id, departure_time
+
+    def earliest_trip_with_pointer(
+        self,
+        route_id: int,
+        stop_id: int,
+        arrival_time: int,
+        trip_pointer: Optional[int] = None,
+    ) -> Optional[tuple[int, int, int]]:
+        """
+        Returns the first trip of the route that departs at the stop no earlier
+        than `arrival_time`, its departure time and its position within the
+        route (the trip pointer).
+
+        If `trip_pointer` is given, only trips before that position are
+        considered. During a route scan the earliest catchable trip can only
+        move backwards, so passing the pointer of the current trip narrows the
+        search.
+        """
         trip_ids = self.trip_ids_by_route[route_id]  # sorted by departure time
-        for trip_id in trip_ids:
+        end = len(trip_ids) if trip_pointer is None else trip_pointer
+
+        departures = self.get_departure_column(route_id, stop_id)
+        if departures is not None:
+            trip_pos = bisect_left(departures, arrival_time, 0, end)
+            if trip_pos == end:
+                return None
+            return trip_ids[trip_pos], departures[trip_pos], trip_pos
+
+        # trips overtake each other at this stop, fall back to a linear scan
+        for trip_pos in range(end):
+            trip_id = trip_ids[trip_pos]
             departure_time = self.get_departure_time(trip_id, stop_id)
             if departure_time >= arrival_time:
-                return trip_id, departure_time
-
-    def iterate_footpaths_from_stop(self, stop_id: str):
-        if self.footpaths == None:
+                return trip_id, departure_time, trip_pos
+
+    def get_departure_column(self, route_id: int, stop_id: int) -> Optional[list[int]]:
+        """
+        Returns the departure times at the stop of all trips of the route, in
+        the order of `trip_ids_by_route`, or None if the departure times are
+        not sorted in that order. Columns are built per route on first use.
+        """
+        columns = self.departure_columns_by_route.get(route_id)
+        if columns is None:
+            columns = self.create_departure_columns(route_id)
+            self.departure_columns_by_route[route_id] = columns
+        return columns[stop_id]
+
+    def create_departure_columns(self, route_id: int) -> dict[int, Optional[list[int]]]:
+        trip_ids = self.trip_ids_by_route[route_id]
+        columns: dict[int, Optional[list[int]]] = {}
+        for stop_id in self.stops_by_route[route_id]:
+            column = [
+                self.times_by_stop_by_trip[trip_id][stop_id][1] for trip_id in trip_ids
+            ]
+            # trips are sorted by their first departure, which only implies
+            # sorted departures at later stops if no trip overtakes another
+            is_sorted = all(a <= b for a, b in zip(column, column[1:]))
+            columns[stop_id] = column if is_sorted else None
+        return columns
+
+    def iterate_footpaths_from_stop(self, stop_id: int):
+        if self.footpaths is None:
             raise Exception(
                 "footpaths has to be defined when calling iterate_footpaths_from_stop"
             )
-        return self.footpaths[stop_id].items()
+        return self.footpaths.items(stop_id)
 
     def iterate_stops_in_route_from_idx(
-        self: Self, route_id: str, idx: int
-    ) -> list[str]:
+        self: Self, route_id: int, idx: int
+    ) -> list[int]:
         return self.stops_by_route[route_id][idx:]
 
 
 class ExpandedDataQuerier(Generic[S, T], DataQuerier):
     def __init__(
         self: Self,
-        structs_dict: dict,
-        footpaths: dict | None,
-        additional_stop_information: dict[str, S],
-        additional_trip_information: dict[str, T],
+        structs_dict: dict | Timetable,
+        footpaths: dict | Footpaths | None,
+        additional_stop_information: dict[int, S],
+        additional_trip_information: dict[int, T],
     ):
         self.additional_stop_information = additional_stop_information
         self.additional_trip_information = additional_trip_information
         super().__init__(structs_dict, footpaths)
 
-    def get_stop(self, stop_id: str) -> S:
+    def get_stop(self, stop_id: int) -> S:
         return self.additional_stop_information[stop_id]
 
-    def get_trip(self, trip_id: str) -> T:
+    def get_trip(self, trip_id: int) -> T:
         return self.additional_trip_information[trip_id]
+
+
+def create_footpaths(
+    footpaths: dict[int, dict[int, int]] | Footpaths | None, n_stops: int
+) -> Optional[Footpaths]:
+    """
+    Converts footpaths in the dict format (keyed by interned stop ids) to
+    `Footpaths`, which is what the engines work on.
+    """
+    if footpaths is None or isinstance(footpaths, Footpaths):
+        return footpaths
+    return Footpaths.from_dict(footpaths, n_stops)
@@ -11,19 +11,21 @@ class ArrivalTimeLabel(bag.TraceLabel):
     behaves like the original RAPTOR algorithm.
     """
 
-    def __init__(self, time: int, stop: Optional[str] = None):
+    __slots__ = ()
+
+    def __init__(self, time: int, stop: Optional[int] = None):
         super().__init__(time, stop)
 
     def strictly_dominates(self, other: Self) -> bool:
         return self.arrival_time <= other.arrival_time
 
-    def update_along_trip(self, arrival_time: int, stop_id: str, trip_id: str):
+    def update_along_trip(self, arrival_time: int, stop_id: int, trip_id: int):
         super().update_along_trip(arrival_time, stop_id, trip_id)
 
-    def update_along_footpath(self, walking_time: int, stop_id: str):
+    def update_along_footpath(self, walking_time: int, stop_id: int):
         super().update_along_footpath(walking_time, stop_id)
 
-    def update_before_route_bag_merge(self, departure_time: int, stop_id: str):
+    def update_before_route_bag_merge(self, departure_time: int, stop_id: int):
         super().update_before_route_bag_merge(departure_time, stop_id)
 
     def to_human_readable(self):
@@ -36,7 +38,9 @@ class ArrivalTimeLabel(bag.TraceLabel):
 
 
 class ActivityDurationLabel(bag.TraceLabel):
-    def __init__(self, time: int, stop: Optional[str] = None):
+    __slots__ = ("travel_time", "walking_time", "waiting_time")
+
+    def __init__(self, time: int, stop: Optional[int] = None):
         super().__init__(time, stop)
         self.travel_time = 0
         self.walking_time = 0
@@ -53,18 +57,18 @@ class ActivityDurationLabel(bag.TraceLabel):
             and self.waiting_time <= other.waiting_time
         )
 
-    def update_along_trip(self, arrival_time: int, stop_id: str, trip_id: str):
+    def update_along_trip(self, arrival_time: int, stop_id: int, trip_id: int):
         old_arrival_time = self.arrival_time
         super().update_along_trip(arrival_time, stop_id, trip_id)
         interval = arrival_time - old_arrival_time
         assert interval >= 0
         self.travel_time += interval
 
-    def update_along_footpath(self, walking_time: int, stop_id: str):
+    def update_along_footpath(self, walking_time: int, stop_id: int):
         super().update_along_footpath(walking_time, stop_id)
         self.walking_time += walking_time
 
-    def update_before_route_bag_merge(self, departure_time: int, stop_id: str):
+    def update_before_route_bag_merge(self, departure_time: int, stop_id: int):
         old_arrival_time = self.arrival_time
         super().update_before_route_bag_merge(departure_time, stop_id)
         interval = departure_time - old_arrival_time
@@ -0,0 +1,122 @@
+import heapq
+import sys
+from typing import Iterable
+
+import numpy as np
+
+from package.raptor.bag import BaseLabel, Bag
+from package.raptor.timetable import NO_TIME, Timetable
+from package.structs.footpaths import Footpaths
+
+INFINITY = sys.maxsize
+
+
+# for every stop the edges of the lower bound graph that end at it, as
+# (stop the edge starts at, travel time)
+ReverseEdges = list[list[tuple[int, int]]]
+
+
+def compute_lower_bounds(
+    structs_dict: dict | Timetable,
+    footpaths: Footpaths | None,
+    target_stop_ids: Iterable[int],
+) -> list[int]:
+    """
+    Returns for every stop a lower bound on the time needed to get from the
+    stop to the nearest target stop, INFINITY if no target can be reached.
+
+    Builds the graph of `create_reverse_edges` for a single set of targets.
+    Engines that answer many queries build it once and call
+    `compute_lower_bounds_with_edges` instead.
+    """
+    return compute_lower_bounds_with_edges(
+        create_reverse_edges(structs_dict, footpaths), target_stop_ids
+    )
+
+
+def create_reverse_edges(
+    structs_dict: dict | Timetable,
+    footpaths: Footpaths | None,
+) -> ReverseEdges:
+    """
+    Creates the graph the lower bounds are computed on, with an edge between
+    consecutive stops of every route, weighted by the shortest ride of any of
+    its trips, and an edge for every footpath. The graph does not depend on
+    the targets.
+    """
+    timetable = (
+        structs_dict
+        if isinstance(structs_dict, Timetable)
+        else Timetable.from_structs(structs_dict)
+    )
+    reverse_edges: ReverseEdges = [[] for _ in range(timetable.n_stops)]
+
+    for route_id in range(timetable.n_routes):
+        stops = timetable.iterate_stops_in_route_from_idx(route_id, 0)
+        if len(stops) < 2:
+            continue
+        departures = timetable.departure_times_by_route[route_id][:, :-1]
+        arrivals = timetable.arrival_times_by_route[route_id][:, 1:]
+        valid = (departures != NO_TIME) & (arrivals != NO_TIME)
+        ride_times = np.where(
+            valid, arrivals.astype(np.int64) - departures, INFINITY
+        ).min(axis=0)
+        for stop_pos, ride_time in enumerate(ride_times.tolist()):
+            if ride_time != INFINITY:
+                reverse_edges[stops[stop_pos + 1]].append(
+                    (stops[stop_pos], max(ride_time, 0))
+                )
+
+    if footpaths is not None:
+        for stop_id in range(timetable.n_stops):
+            for nearby_stop_id, walking_time in footpaths.items(stop_id):
+                reverse_edges[nearby_stop_id].append((stop_id, walking_time))
+
+    return reverse_edges
+
+
+def compute_lower_bounds_with_edges(
+    reverse_edges: ReverseEdges, target_stop_ids: Iterable[int]
+) -> list[int]:
+    """
+    Runs a Dijkstra search backwards from the targets over the graph of
+    `create_reverse_edges`. Waiting and transfer times are ignored, so the
+    bounds are never too large.
+    """
+    lower_bounds = [INFINITY] * len(reverse_edges)
+    queue: list[tuple[int, int]] = []
+    for stop_id in target_stop_ids:
+        lower_bounds[stop_id] = 0
+        queue.append((0, stop_id))
+    heapq.heapify(queue)
+
+    while len(queue) > 0:
+        distance, stop_id = heapq.heappop(queue)
+        if distance > lower_bounds[stop_id]:
+            continue
+        for previous_stop_id, weight in reverse_edges[stop_id]:
+            if distance + weight < lower_bounds[previous_stop_id]:
+                lower_bounds[previous_stop_id] = distance + weight
+                heapq.heappush(queue, (distance + weight, previous_stop_id))
+
+    return lower_bounds
+
+
+def is_dominated_with_lower_bound(
+    target_bags: list[Bag], label: BaseLabel, lower_bound: int
+) -> bool:
+    """
+    Returns whether a label in one of the target bags dominates the label
+    with its arrival time shifted by the lower bound. Such a label can not
+    lead to a better label at a target, as criteria only get worse.
+    """
+    if lower_bound == INFINITY:
+        return True
+
+    # shifting the arrival time in place avoids a copy for every check
+    arrival_time = label.arrival_time
+    label.arrival_time = arrival_time + lower_bound
+    try:
+        return any(bag.content_dominates(label) for bag in target_bags)
+    finally:
+        label.arrival_time = arrival_time
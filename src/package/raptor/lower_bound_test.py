@@ -0,0 +1,52 @@
+from typing import Any
+
+from package.mcr.label import McRAPTORLabel
+from package.raptor.bag import Bag
+from package.raptor.lower_bound import (
+    INFINITY,
+    compute_lower_bounds,
+    is_dominated_with_lower_bound,
+)
+from package.raptor.timetable import Timetable
+from package.structs.footpaths import Footpaths
+
+
+def test_compute_lower_bounds(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    timetable = Timetable.from_structs(structs_dict)
+    id_maps = timetable.id_maps
+    footpaths = Footpaths.from_dict(
+        id_maps.intern_footpaths(footpaths_dict), timetable.n_stops
+    )
+    stop1, stop2, stop3, stop4 = [
+        id_maps.intern_stop(stop) for stop in ["stop1", "stop2", "stop3", "stop4"]
+    ]
+
+    lower_bounds = compute_lower_bounds(timetable, footpaths, [stop3])
+    assert lower_bounds[stop3] == 0
+    assert lower_bounds[stop2] == 600
+    assert lower_bounds[stop4] == 600
+    assert lower_bounds[stop1] == 1200
+
+    # stop4 is only left by walking to stop2
+    lower_bounds = compute_lower_bounds(timetable, footpaths, [stop1])
+    assert lower_bounds[stop2] == 600
+    assert lower_bounds[stop4] == 720
+    assert lower_bounds[stop3] == 1200
+
+    # without footpaths, stop4 is left towards stop3
+    lower_bounds = compute_lower_bounds(structs_dict, None, [stop1])
+    assert lower_bounds[stop4] == 1800
+    assert compute_lower_bounds(structs_dict, None, [stop1, stop3])[stop2] == 600
+
+
+def test_is_dominated_with_lower_bound():
+    target_bag = Bag.from_labels([McRAPTORLabel(1200, 100, 0, n_stops=0)])
+    label = McRAPTORLabel(600, 100, 1, n_stops=0)
+
+    assert not is_dominated_with_lower_bound([target_bag], label, 599)
+    assert is_dominated_with_lower_bound([target_bag], label, 700)
+    assert is_dominated_with_lower_bound([target_bag], label, INFINITY)
+    # the arrival time of the label is restored
+    assert label.arrival_time == 600
@@ -1,11 +1,21 @@
-from typing import Generic, Optional
+from typing import Generic, Iterable, Optional
 from typing_extensions import Any, Self
 
 from package import strtime
 from package.key import S, T
 from package.logger import rlog
+from package.raptor import parallel
 from package.raptor.bag import L, Bag, RouteBag
 from package.raptor.data import ExpandedDataQuerier
+from package.raptor.lower_bound import (
+    ReverseEdges,
+    compute_lower_bounds_with_edges,
+    create_reverse_edges,
+    is_dominated_with_lower_bound,
+)
+from package.raptor.state import BagRoundState
+from package.raptor.timetable import Timetable
+from package.structs.footpaths import Footpaths
 from package.tracer.tracer import (
     TraceStart,
     TracerMap,
@@ -15,14 +25,19 @@ from package.tracer.tracer import (
 class McRaptor(Generic[L, S, T]):
     def __init__(
         self,
-        structs_dict: dict,
-        footpaths: dict,
+        structs_dict: dict | Timetable,
+        footpaths: dict | Footpaths,
         max_transfers: int,
         default_transfer_time: int,
-        additional_stop_information: dict[str, S],
-        additional_trip_information: dict[str, T],
+        additional_stop_information: dict[int, S],
+        additional_trip_information: dict[int, T],
         label_class: type[L],
+        bag_class: type[Bag] = Bag,
+        route_bag_class: type[RouteBag] = RouteBag,
+        n_workers: int = 1,
+        lower_bound_pruning: bool = False,
     ):
+        self.structs_dict = structs_dict
         self.dq = ExpandedDataQuerier(
             structs_dict,
             footpaths,
@@ -34,71 +49,131 @@ class McRaptor(Generic[L, S, T]):
         self.default_transfer_time = default_transfer_time
 
         self.label_class = label_class
+        self.bag_class = bag_class
+        self.route_bag_class = route_bag_class
+        # number of processes the routes of a round are scanned with
+        self.n_workers = n_workers
+        self.worker_pool = parallel.WorkerPool(self, n_workers)
+        # whether labels are pruned with lower bounds on the remaining travel
+        # time to the end stop, which are computed once per end stop on a
+        # graph that is built once, when the first bounds are needed
+        self.lower_bound_pruning = lower_bound_pruning
+        self.lower_bounds_by_end_stop: dict[int, list[int]] = {}
+        self.lower_bound_edges: Optional[ReverseEdges] = None
+
+    def close(self: Self):
+        """
+        Shuts down the worker processes of parallel route scans, if any were
+        started.
+        """
+        self.worker_pool.close()
 
-    # TODO: prune by end_stop_id
     def run(
-        self, start_stop_id: str, end_stop_id: Optional[str], start_time_str: str
-    ) -> dict[str, Any]:
+        self, start_stop_id: int, end_stop_id: Optional[int], start_time_str: str
+    ) -> dict[int, Any]:
         start_time = strtime.str_time_to_seconds(start_time_str)
 
-        b_i, b_best, marked_stops, tracers_map = self.init_vars(
-            start_stop_id, start_time
+        state, marked_stops, tracers_map = self.init_vars(start_stop_id, start_time)
+        # labels that are dominated by the bag of the target stop can not lead
+        # to a better journey to the target, as criteria only get worse
+        target_bag = state.best[end_stop_id] if end_stop_id is not None else None
+        lower_bounds = (
+            self.get_lower_bounds(end_stop_id)
+            if end_stop_id is not None and self.lower_bound_pruning
+            else None
         )
 
         k = 0
         for k in range(1, self.max_transfers + 1):
             rlog.debug(f"iteration {k}")
-            b_i[k] = b_i[k - 1].copy()
+            state.next_round()
 
             Q = self.collect_Q(marked_stops)
 
-            b_i, marked_stops = self.process_routes(Q, k, b_i)
-            b_i, additional_marked_stops = self.process_footpaths(marked_stops, k, b_i)
+            marked_stops = self.process_routes(Q, state, target_bag, lower_bounds)
+            additional_marked_stops = self.process_footpaths(
+                marked_stops, state, target_bag, lower_bounds
+            )
 
             marked_stops.update(additional_marked_stops)
 
-            # copy current bags into b_best
-            b_best = {stop_id: bag.copy() for stop_id, bag in b_i[k].items()}
-
             rlog.debug(f"marked_stops: {len(marked_stops)}")
 
             if len(marked_stops) == 0:
                 break
 
         rlog.info(f"RAPTOR finished after {k} iterations")
-        return bags_to_human_readable(b_best)
+        return bags_to_human_readable(state.best)
+
+    def get_lower_bounds(self: Self, end_stop_id: int) -> list[int]:
+        lower_bounds = self.lower_bounds_by_end_stop.get(end_stop_id)
+        if lower_bounds is None:
+            if self.lower_bound_edges is None:
+                self.lower_bound_edges = create_reverse_edges(
+                    self.structs_dict, self.dq.footpaths
+                )
+            lower_bounds = compute_lower_bounds_with_edges(
+                self.lower_bound_edges, [end_stop_id]
+            )
+            self.lower_bounds_by_end_stop[end_stop_id] = lower_bounds
+        return lower_bounds
 
     def init_vars(
-        self, start_stop_id: str, start_time: int
-    ) -> tuple[dict[int, dict[str, Bag]], dict[str, Bag], set[str], TracerMap]:
-        tau_i: dict[int, dict[str, Bag]] = {
-            0: {},
-        }
+        self, start_stop_id: int, start_time: int
+    ) -> tuple[BagRoundState, set[int], TracerMap]:
         tracer = TracerMap(self.dq.stop_id_set)
-        tau_best: dict[str, Bag] = {}
+        state = BagRoundState(self.dq.stop_id_set, bag_class=self.bag_class)
         marked_stops = set()
 
-        for stop_id in self.dq.stop_id_set:
-            tau_i[0][stop_id] = Bag()
-            tau_best[stop_id] = Bag()
-
-        start_bag = Bag()
-        start_bag.add_if_necessary(self.label_class(start_time, start_stop_id))
-        tau_i[0][start_stop_id] = start_bag
-        tau_best[start_stop_id] = start_bag.copy()
+        start_label = self.label_class(start_time, start_stop_id)
+        state.get_current_bag(start_stop_id).add_if_necessary(start_label)
+        state.best[start_stop_id].add_if_necessary(start_label)
         tracer.add(
             tracer=TraceStart(start_stop_id, start_time),
         )
 
         marked_stops.add(start_stop_id)
 
-        return tau_i, tau_best, marked_stops, tracer
+        return state, marked_stops, tracer
+
+    def merge_into_stop_bag(
+        self: Self,
+        bag: Iterable[L],
+        stop_id: int,
+        state: BagRoundState,
+        target_bag: Optional[Bag],
+        lower_bounds: Optional[list[int]] = None,
+    ) -> bool:
+        """
+        Merges the labels of `bag` into the bag of the stop in the current
+        round. A label is discarded if the target bag dominates it (target
+        pruning), if lower bounds are given even after adding the lower bound
+        of the stop to its arrival time, or if the best bag of the stop over
+        all rounds dominates it (local pruning). Returns whether any label was
+        added.
+        """
+        is_any_added = False
+        best_bag = state.best[stop_id]
+        for label in bag:
+            if target_bag is not None:
+                if lower_bounds is not None:
+                    if is_dominated_with_lower_bound(
+                        [target_bag], label, lower_bounds[stop_id]
+                    ):
+                        continue
+                elif target_bag.content_dominates(label):
+                    continue
+            if not best_bag.add_if_necessary(label):
+                continue
+            state.get_current_bag(stop_id).add_if_necessary(label)
+            is_any_added = True
+        return is_any_added
 
     def collect_Q(
         self: Self,
-        marked_stops: set[str],
-    ) -> dict[str, tuple[str, int]]:
-        Q: dict[str, tuple[str, int]] = {}
+        marked_stops: set[int],
+    ) -> dict[int, tuple[int, int]]:
+        Q: dict[int, tuple[int, int]] = {}
         for stop_id in marked_stops:
             for route_id in self.dq.get_routes_serving_stop(stop_id):
                 idx = self.dq.get_idx_of_stop_in_route(stop_id, route_id)
@@ -114,98 +189,211 @@ class McRaptor(Generic[L, S, T]):
 
     def process_routes(
         self: Self,
-        Q: dict[str, tuple[str, int]],
-        k: int,
-        b_i: dict[int, dict[str, Bag]],
-    ) -> tuple[dict[int, dict[str, Bag]], set[str]]:
+        Q: dict[int, tuple[int, int]],
+        state: BagRoundState,
+        target_bag: Optional[Bag],
+        lower_bounds: Optional[list[int]] = None,
+    ) -> set[int]:
         marked_stops = set()
+
+        if parallel.should_scan_in_parallel(self.n_workers, len(Q)):
+            candidates = self.worker_pool.map_partitioned(
+                scan_routes,
+                [(route_id, idx) for route_id, (_, idx) in Q.items()],
+                lambda routes: (*self.chunk_round_state(routes, state), target_bag),
+            )
+            # merging in the order of Q keeps the result deterministic
+            for stop_id, labels in candidates:
+                if self.merge_into_stop_bag(
+                    labels, stop_id, state, target_bag, lower_bounds
+                ):
+                    marked_stops.add(stop_id)
+            return marked_stops
+
         for route_id, (stop_id, idx) in Q.items():
-            route_bag = RouteBag[L, S, T](
+            route_bag = self.route_bag_class(
                 self.dq,
             )
 
             for stop_id in self.dq.iterate_stops_in_route_from_idx(route_id, idx):
-                b_i, marked_stops, route_bag = self.process_route(
+                marked_stops, route_bag = self.process_route(
                     route_id,
                     stop_id,
-                    k,
-                    b_i,
+                    state,
+                    target_bag,
                     route_bag,
                     marked_stops,
+                    lower_bounds,
                 )
-        return b_i, marked_stops
+        return marked_stops
 
     def process_route(
         self,
-        route_id: str,
-        stop_id: str,
-        k: int,
-        b_i: dict[int, dict[str, Bag]],
+        route_id: int,
+        stop_id: int,
+        state: BagRoundState,
+        target_bag: Optional[Bag],
         route_bag: RouteBag,
-        marked_stops: set[str],
-    ) -> tuple[dict[int, dict[str, Bag]], set[str], RouteBag]:
+        marked_stops: set[int],
+        lower_bounds: Optional[list[int]] = None,
+    ) -> tuple[set[int], RouteBag]:
         # first step - update arrival times in route bag
         route_bag.update_along_trip(stop_id)
+        if target_bag is not None:
+            for target_label in target_bag:
+                route_bag.remove_dominated_by(target_label)
 
         # second step - merge route_bag into stop_bag
-        stop_bag = b_i[k][stop_id]
-        is_any_added = stop_bag.merge(route_bag.to_bag())
+        is_any_added = self.merge_into_stop_bag(
+            route_bag.to_bag(), stop_id, state, target_bag, lower_bounds
+        )
         if is_any_added:
             marked_stops.add(stop_id)
 
-        # third step - merge stop_bag into route_bag
-        self.merge_bag_into_route_bag(
-            route_bag,
-            stop_bag,
-            route_id,
-            stop_id,
+        # third step - merge the bag of the previous round into route_bag
+        previous_stop_bag = state.previous.get(stop_id)
+        if previous_stop_bag is not None:
+            self.merge_bag_into_route_bag(
+                route_bag,
+                previous_stop_bag,
+                route_id,
+                stop_id,
+            )
+        return marked_stops, route_bag
+
+    def chunk_round_state(
+        self: Self, routes: list[tuple[int, int]], state: BagRoundState
+    ) -> tuple[dict[int, Bag], dict[int, Bag]]:
+        """
+        Returns the part of the state that `scan_route` reads for the routes:
+        the bags of the previous round and the non-empty best bags at the
+        stops that are scanned.
+        """
+        previous: dict[int, Bag] = {}
+        best: dict[int, Bag] = {}
+        for route_id, idx in routes:
+            for stop_id in self.dq.iterate_stops_in_route_from_idx(route_id, idx):
+                previous_bag = state.previous.get(stop_id)
+                if previous_bag is not None:
+                    previous[stop_id] = previous_bag
+                if len(state.best[stop_id]) > 0:
+                    best[stop_id] = state.best[stop_id]
+        return previous, best
+
+    def scan_route(
+        self: Self,
+        route_id: int,
+        idx: int,
+        previous: dict[int, Bag],
+        best: dict[int, Bag],
+        target_bag: Optional[Bag],
+    ) -> list[tuple[int, list[L]]]:
+        """
+        Scans the route like `process_route`, but only reads the bags of the
+        previous round and the best bags, of which empty ones may be left out.
+        Returns for every stop the labels of the route bag that are not
+        dominated by the best bag of the stop at the start of the scan, to be
+        merged by `merge_into_stop_bag`.
+        """
+        candidates: list[tuple[int, list[L]]] = []
+        route_bag = self.route_bag_class(
+            self.dq,
         )
-        return b_i, marked_stops, route_bag
+        for stop_id in self.dq.iterate_stops_in_route_from_idx(route_id, idx):
+            route_bag.update_along_trip(stop_id)
+            if target_bag is not None:
+                for target_label in target_bag:
+                    route_bag.remove_dominated_by(target_label)
+
+            if len(route_bag) > 0:
+                best_bag = best.get(stop_id)
+                labels = [
+                    label
+                    for label in route_bag.to_bag()
+                    if best_bag is None or not best_bag.content_dominates(label)
+                ]
+                if len(labels) > 0:
+                    candidates.append((stop_id, labels))
+
+            previous_stop_bag = previous.get(stop_id)
+            if previous_stop_bag is not None:
+                self.merge_bag_into_route_bag(
+                    route_bag,
+                    previous_stop_bag,
+                    route_id,
+                    stop_id,
+                )
+        return candidates
 
     # TODO: should this be moved into RouteBag?
     def merge_bag_into_route_bag(
         self,
         route_bag: RouteBag,
         bag: Bag,
-        route_id: str,
-        stop_id: str,
+        route_id: int,
+        stop_id: int,
     ):
-        for label in bag:
-            res = self.dq.earliest_trip(
+        # labels are processed from latest to earliest arrival, so the earliest
+        # trip of a label can only be the trip of the previous label or one
+        # before it
+        trip_pointer: Optional[int] = None
+        for label in sorted(bag, key=lambda label: label.arrival_time, reverse=True):
+            res = self.dq.earliest_trip_with_pointer(
                 route_id,
                 stop_id,
                 label.arrival_time + self.default_transfer_time,
+                trip_pointer,
             )
             if res is None:
                 continue
-            trip, departure_time = res
+            trip, departure_time, trip_pos = res
+            trip_pointer = trip_pos + 1
             label = label.copy()
             label.update_before_route_bag_merge(departure_time, stop_id)
             route_bag.add_if_necessary(label, trip)
 
     def process_footpaths(
         self: Self,
-        marked_stops: set[str],
-        k: int,
-        b_i: dict[int, dict[str, Bag]],
-    ) -> tuple[dict[int, dict[str, Bag]], set[str]]:
+        marked_stops: set[int],
+        state: BagRoundState,
+        target_bag: Optional[Bag],
+        lower_bounds: Optional[list[int]] = None,
+    ) -> set[int]:
         additional_marked_stops = set()
         for stop_id in marked_stops:
-            for nearby_stop_id, walking_time in self.dq.footpaths[stop_id].items():
-                start_bag = b_i[k][stop_id]
-                footpath_bag = start_bag.create_footpath_bag(
-                    walking_time,
-                    nearby_stop_id,
+            start_labels = list(state.current[stop_id])
+            for nearby_stop_id, walking_time in self.dq.iterate_footpaths_from_stop(
+                stop_id
+            ):
+                # the labels are merged one by one, so there is no need to
+                # collect them in an intermediate bag first
+                footpath_labels = []
+                for label in start_labels:
+                    label = label.copy()
+                    label.update_along_footpath(walking_time, nearby_stop_id)
+                    footpath_labels.append(label)
+
+                is_any_added = self.merge_into_stop_bag(
+                    footpath_labels, nearby_stop_id, state, target_bag, lower_bounds
                 )
 
-                end_bag = b_i[k][nearby_stop_id]
-
-                is_any_added = end_bag.merge(footpath_bag)
-
                 if is_any_added:
                     additional_marked_stops.add(nearby_stop_id)
-        return b_i, additional_marked_stops
+        return additional_marked_stops
+
+
+def scan_routes(
+    mc_raptor: McRaptor,
+    round_state: tuple[dict[int, Bag], dict[int, Bag], Optional[Bag]],
+    routes: list[tuple[int, int]],
+) -> list[tuple[int, list]]:
+    previous, best, target_bag = round_state
+    return [
+        candidate
+        for route_id, idx in routes
+        for candidate in mc_raptor.scan_route(route_id, idx, previous, best, target_bag)
+    ]
 
 
-def bags_to_human_readable(bags: dict[str, Bag]) -> dict[str, Any]:
+def bags_to_human_readable(bags: dict[int, Bag]) -> dict[int, Any]:
     return {stop_id: bag.to_human_readable() for stop_id, bag in bags.items()}
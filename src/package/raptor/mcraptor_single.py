@@ -1,20 +1,30 @@
-from copy import deepcopy
-from typing import Generic, Tuple
+from typing import Generic, Iterable, Optional, Tuple
 from typing_extensions import Any, Self
 
 from package.key import S, T
 from package.logger import rlog
 from package.raptor.bag import L, Bag, RouteBag
 from package.raptor.data import DataQuerier
+from package.raptor.lower_bound import (
+    ReverseEdges,
+    compute_lower_bounds_with_edges,
+    create_reverse_edges,
+    is_dominated_with_lower_bound,
+)
+from package.raptor.timetable import NO_TIME, Timetable
 
 
 class McRaptorSingle(Generic[L, S, T]):
     def __init__(
         self,
-        structs_dict: dict,
+        structs_dict: dict | Timetable,
         default_transfer_time: int,
         label_class: type[L],
+        bag_class: type[Bag] = Bag,
+        route_bag_class: type[RouteBag] = RouteBag,
+        lower_bound_pruning: bool = False,
     ):
+        self.structs_dict = structs_dict
         self.dq = DataQuerier(
             structs_dict,
             footpaths=None,
@@ -23,36 +33,83 @@ class McRaptorSingle(Generic[L, S, T]):
         self.default_transfer_time = default_transfer_time
 
         self.label_class = label_class
+        self.bag_class = bag_class
+        self.route_bag_class = route_bag_class
+        # whether labels are pruned with lower bounds on the remaining travel
+        # time to the target stops, which are computed once per set of targets
+        # on a graph that is built once, when the first bounds are needed
+        self.lower_bound_pruning = lower_bound_pruning
+        self.lower_bounds_by_targets: dict[frozenset[int], list[int]] = {}
+        self.lower_bound_edges: Optional[ReverseEdges] = None
 
     def run(
         self,
-        bags: dict[str, Bag],
-    ) -> dict[str, Bag]:
+        bags: dict[int, Bag],
+        target_stop_ids: Optional[Iterable[int]] = None,
+    ) -> dict[int, Bag]:
+        """
+        Scans all routes serving the stops of the input bags once. If target
+        stops are given and lower bound pruning is enabled, labels that can
+        not improve the bag of any target stop are not added, so the bags of
+        the other stops may be incomplete.
+        """
         output_bags, marked_stops = self.init_vars(bags)
 
+        lower_bounds: Optional[list[int]] = None
+        target_bags: Optional[list[Bag]] = None
+        if target_stop_ids is not None and self.lower_bound_pruning:
+            target_stop_ids = frozenset(target_stop_ids)
+            lower_bounds = self.get_lower_bounds(target_stop_ids)
+            target_bags = self.get_target_bags(output_bags, target_stop_ids)
+
         Q = self.collect_Q(marked_stops)
 
-        output_bags, marked_stops = self.process_routes(Q, bags, output_bags)
+        output_bags, marked_stops = self.process_routes(
+            Q, bags, output_bags, lower_bounds, target_bags
+        )
 
         if len(marked_stops) == 0:
             rlog.info("No updates")
         return output_bags
 
-    def init_vars(
-        self,
-        bags: dict[str, Bag],
-    ) -> Tuple[dict[str, Bag], set[str]]:
-        n_missing_stops = 0
-        for stop_id in self.dq.stop_id_set:
-            if stop_id not in bags:
-                bags[stop_id] = Bag()
-                n_missing_stops += 1
-        if n_missing_stops > 0:
-            rlog.debug(
-                f"Added {n_missing_stops} missing stops to bags ({n_missing_stops / len(self.dq.stop_id_set) * 100:.2f}%)"
+    def get_lower_bounds(self: Self, target_stop_ids: frozenset[int]) -> list[int]:
+        lower_bounds = self.lower_bounds_by_targets.get(target_stop_ids)
+        if lower_bounds is None:
+            if self.lower_bound_edges is None:
+                # only routes are scanned, so footpaths do not lower the bounds
+                self.lower_bound_edges = create_reverse_edges(self.structs_dict, None)
+            lower_bounds = compute_lower_bounds_with_edges(
+                self.lower_bound_edges, target_stop_ids
             )
+            self.lower_bounds_by_targets[target_stop_ids] = lower_bounds
+        return lower_bounds
+
+    def get_target_bags(
+        self: Self, output_bags: dict[int, Bag], target_stop_ids: Iterable[int]
+    ) -> list[Bag]:
+        """
+        Returns the output bags of the target stops, which are created here if
+        the input has no labels at a target, so that labels added later are
+        seen by the pruning.
+        """
+        target_bags = []
+        for stop_id in target_stop_ids:
+            target_bag = output_bags.get(stop_id)
+            if target_bag is None:
+                target_bag = output_bags[stop_id] = self.bag_class()
+            target_bags.append(target_bag)
+        return target_bags
 
-        output_bags = deepcopy(bags)
+    def init_vars(
+        self,
+        bags: dict[int, Bag],
+    ) -> Tuple[dict[int, Bag], set[int]]:
+        # bags share their labels, so only the containers have to be copied.
+        # Bags of stops that are not in the input are created when reached
+        output_bags = {stop_id: bag.copy() for stop_id, bag in bags.items()}
+        rlog.debug(
+            f"Starting from {len(bags)} stops ({len(bags) / len(self.dq.stop_id_set) * 100:.2f}%)"
+        )
 
         marked_stops = set(bags.keys())
 
@@ -60,9 +117,9 @@ class McRaptorSingle(Generic[L, S, T]):
 
     def collect_Q(
         self: Self,
-        marked_stops: set[str],
-    ) -> dict[str, tuple[str, int]]:
-        Q: dict[str, tuple[str, int]] = {}
+        marked_stops: set[int],
+    ) -> dict[int, tuple[int, int]]:
+        Q: dict[int, tuple[int, int]] = {}
         for stop_id in marked_stops:
             for route_id in self.dq.get_routes_serving_stop(stop_id):
                 idx = self.dq.get_idx_of_stop_in_route(stop_id, route_id)
@@ -78,13 +135,15 @@ class McRaptorSingle(Generic[L, S, T]):
 
     def process_routes(
         self: Self,
-        Q: dict[str, tuple[str, int]],
-        bags: dict[str, Bag],
-        output_bags: dict[str, Bag],
-    ) -> tuple[dict[str, Bag], set[str]]:
+        Q: dict[int, tuple[int, int]],
+        bags: dict[int, Bag],
+        output_bags: dict[int, Bag],
+        lower_bounds: Optional[list[int]] = None,
+        target_bags: Optional[list[Bag]] = None,
+    ) -> tuple[dict[int, Bag], set[int]]:
         marked_stops = set()
         for route_id, (stop_id, idx) in Q.items():
-            route_bag = RouteBag[L, S, T](
+            route_bag = self.route_bag_class(
                 self.dq,
             )
 
@@ -96,37 +155,62 @@ class McRaptorSingle(Generic[L, S, T]):
                     output_bags,
                     route_bag,
                     marked_stops,
+                    lower_bounds,
+                    target_bags,
                 )
         return output_bags, marked_stops
 
     def process_route(
         self,
-        route_id: str,
-        stop_id: str,
-        bags: dict[str, Bag],
-        output_bags: dict[str, Bag],
+        route_id: int,
+        stop_id: int,
+        bags: dict[int, Bag],
+        output_bags: dict[int, Bag],
         route_bag: RouteBag,
-        marked_stops: set[str],
-    ) -> tuple[dict[str, Bag], set[str], RouteBag]:
+        marked_stops: set[int],
+        lower_bounds: Optional[list[int]] = None,
+        target_bags: Optional[list[Bag]] = None,
+    ) -> tuple[dict[int, Bag], set[int], RouteBag]:
         # first step - update arrival times in route bag
         route_bag.update_along_trip(stop_id)
 
         # second step - merge route_bag into stop_bag
-        output_stop_bag = output_bags[stop_id]
-        is_any_added = output_stop_bag.merge(
-            route_bag.to_bag().update_before_stop_bag_merge(stop_id),
-        )
-        if is_any_added:
-            marked_stops.add(stop_id)
+        if len(route_bag) > 0:
+            stop_bag_update = route_bag.to_bag().update_before_stop_bag_merge(stop_id)
+            if lower_bounds is not None and target_bags is not None:
+                stop_bag_update = self.bag_class.from_labels(
+                    [
+                        label
+                        for label in stop_bag_update
+                        if not is_dominated_with_lower_bound(
+                            target_bags, label, lower_bounds[stop_id]
+                        )
+                    ]
+                )
+
+            if any(label.arrival_time >= NO_TIME for label in stop_bag_update):
+                # labels on trips that do not serve the stop are not merged
+                stop_bag_update = self.bag_class.from_labels(
+                    [label for label in stop_bag_update if label.arrival_time < NO_TIME]
+                )
+
+            if len(stop_bag_update) > 0:
+                output_stop_bag = output_bags.get(stop_id)
+                if output_stop_bag is None:
+                    output_stop_bag = output_bags[stop_id] = self.bag_class()
+                is_any_added = output_stop_bag.merge(stop_bag_update)
+                if is_any_added:
+                    marked_stops.add(stop_id)
 
-        stop_bag = bags[stop_id]
+        stop_bag = bags.get(stop_id)
         # third step - merge stop_bag into route_bag
-        self.merge_bag_into_route_bag(
-            route_bag,
-            stop_bag,
-            route_id,
-            stop_id,
-        )
+        if stop_bag is not None:
+            self.merge_bag_into_route_bag(
+                route_bag,
+                stop_bag,
+                route_id,
+                stop_id,
+            )
         return output_bags, marked_stops, route_bag
 
     # TODO: should this be moved into RouteBag?
@@ -134,22 +218,28 @@ class McRaptorSingle(Generic[L, S, T]):
         self,
         route_bag: RouteBag,
         bag: Bag,
-        route_id: str,
-        stop_id: str,
+        route_id: int,
+        stop_id: int,
     ):
-        for label in bag:
-            res = self.dq.earliest_trip(
+        # labels are processed from latest to earliest arrival, so the earliest
+        # trip of a label can only be the trip of the previous label or one
+        # before it
+        trip_pointer: Optional[int] = None
+        for label in sorted(bag, key=lambda label: label.arrival_time, reverse=True):
+            res = self.dq.earliest_trip_with_pointer(
                 route_id,
                 stop_id,
                 label.arrival_time + self.default_transfer_time,
+                trip_pointer,
             )
             if res is None:
                 continue
-            trip, departure_time = res
+            trip, departure_time, trip_pos = res
+            trip_pointer = trip_pos + 1
             label = label.copy()
             label.update_before_route_bag_merge(departure_time, stop_id)
             route_bag.add_if_necessary(label, trip)
 
 
-def bags_to_human_readable(bags: dict[str, Bag]) -> dict[str, Any]:
+def bags_to_human_readable(bags: dict[int, Bag]) -> dict[int, Any]:
     return {stop_id: bag.to_human_readable() for stop_id, bag in bags.items()}
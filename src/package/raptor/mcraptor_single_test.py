@@ -0,0 +1,138 @@
+from typing import Any
+
+import pandas as pd
+
+from package.gtfs.clean import add_first_stop_info
+from package.mcr.label import McRAPTORLabel, McRAPTORLabelWithPath
+from package.raptor.bag import Bag, RouteBag, SkylineBag, SkylineRouteBag
+from package.raptor.mcraptor_single import McRaptorSingle
+from package.strtime import seconds_to_str_time
+from package.structs.build import build_structures
+from package.structs.intern import IdMaps, intern_structs
+
+
+def test_mcraptor_single(structs_dict: dict[str, Any]):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    stop1 = id_maps.intern_stop("stop1")
+    stop3 = id_maps.intern_stop("stop3")
+    trip1 = id_maps.intern_trip("trip1")
+
+    for bag_class, route_bag_class in [(Bag, RouteBag), (SkylineBag, SkylineRouteBag)]:
+        start_label = McRAPTORLabelWithPath(0, 0, stop1, n_stops=0, path=[42])
+        input_bags = {stop1: bag_class.from_labels([start_label])}
+        bags = McRaptorSingle(
+            structs_dict,
+            default_transfer_time=0,
+            label_class=McRAPTORLabelWithPath,
+            bag_class=bag_class,
+            route_bag_class=route_bag_class,
+        ).run(input_bags)
+
+        labels = list(bags[stop3])
+        assert [(label.arrival_time, label.cost) for label in labels] == [(1200, 220)]
+        assert labels[0].path == [
+            42,
+            (McRAPTORLabelWithPath.STOP_MARKER, stop1),
+            (McRAPTORLabelWithPath.TRIP_MARKER, trip1),
+            (McRAPTORLabelWithPath.STOP_MARKER, stop3),
+        ]
+        # labels are copied shallowly, the input label must not be modified
+        assert start_label.path == [42]
+        assert list(bags[stop1]) == [start_label]
+        # the input bags are not filled up with empty bags of unreached stops
+        assert list(input_bags) == [stop1]
+
+
+def test_mcraptor_single_lower_bound_pruning(structs_dict: dict[str, Any]):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    stop1 = id_maps.intern_stop("stop1")
+    stop2 = id_maps.intern_stop("stop2")
+    stop3 = id_maps.intern_stop("stop3")
+
+    for bag_class, route_bag_class in [(Bag, RouteBag), (SkylineBag, SkylineRouteBag)]:
+        mc_raptor = McRaptorSingle(
+            structs_dict,
+            default_transfer_time=0,
+            label_class=McRAPTORLabelWithPath,
+            bag_class=bag_class,
+            route_bag_class=route_bag_class,
+            lower_bound_pruning=True,
+        )
+        # the target is already reached, so riding towards it can not help
+        input_bags = {
+            stop1: bag_class.from_labels(
+                [McRAPTORLabelWithPath(0, 0, stop1, n_stops=0, path=[])]
+            ),
+            stop3: bag_class.from_labels(
+                [McRAPTORLabelWithPath(900, 0, stop3, n_stops=0, path=[])]
+            ),
+        }
+        bags = mc_raptor.run(input_bags, target_stop_ids=[stop3])
+
+        assert [label.arrival_time for label in bags[stop3]] == [900]
+        assert stop2 not in bags
+
+        bags = mc_raptor.run(input_bags)
+        assert [label.arrival_time for label in bags[stop2]] == [600]
+
+
+def test_skyline_bags_keep_labels_that_are_dominated_for_some_stops():
+    # one trip from stop1 to stop7, longer than the short distance ticket,
+    # which stops for 10 seconds at every stop
+    stop_ids = [f"stop{i}" for i in range(1, 8)]
+    trips_df = pd.DataFrame([["route1", "trip1"]], columns=["route_id", "trip_id"])
+    stop_times_df = pd.DataFrame(
+        [
+            [
+                "trip1",
+                seconds_to_str_time(120 * (sequence + 1)),
+                seconds_to_str_time(120 * (sequence + 1) - 10),
+                stop_id,
+                sequence + 1,
+            ]
+            for sequence, stop_id in enumerate(stop_ids)
+        ],
+        columns=[
+            "trip_id",
+            "departure_time",
+            "arrival_time",
+            "stop_id",
+            "stop_sequence",
+        ],
+    )
+    trips_df = add_first_stop_info(trips_df, stop_times_df)
+    structs_dict = intern_structs(build_structures(trips_df, stop_times_df))
+    id_maps = IdMaps.from_structs(structs_dict)
+    stop1, stop2 = id_maps.intern_stop("stop1"), id_maps.intern_stop("stop2")
+
+    comparable_bags = []
+    for bag_class, route_bag_class in [(Bag, RouteBag), (SkylineBag, SkylineRouteBag)]:
+        # the label from stop1 already rides on a long distance ticket. The
+        # label boarding at stop2 dominates it from stop3 on, until its short
+        # distance ticket turns into a long distance ticket at stop7
+        input_bags = {
+            stop1: bag_class.from_labels([McRAPTORLabel(0, 300, stop1, n_stops=5)]),
+            stop2: bag_class.from_labels([McRAPTORLabel(0, 0, stop2, n_stops=0)]),
+        }
+        bags = McRaptorSingle(
+            structs_dict,
+            default_transfer_time=0,
+            label_class=McRAPTORLabel,
+            bag_class=bag_class,
+            route_bag_class=route_bag_class,
+        ).run(input_bags)
+        comparable_bags.append(
+            {
+                id_maps.gtfs_stop(stop_id): sorted(
+                    (label.arrival_time, label.cost, label.n_stops) for label in bag
+                )
+                for stop_id, bag in bags.items()
+            }
+        )
+
+    bags, skyline_bags = comparable_bags
+    assert skyline_bags == bags
+    assert bags["stop6"] == [(710, 220, 4)]
+    assert bags["stop7"] == [(830, 300, 11)]
@@ -0,0 +1,163 @@
+from typing import Any
+
+from package.raptor import parallel
+from package.raptor.example_labels import ArrivalTimeLabel
+from package.raptor.mcraptor import McRaptor
+from package.raptor.state import BagRoundState
+from package.raptor.timetable import Timetable
+from package.structs.intern import IdMaps, intern_structs
+
+
+def run_mcraptor(
+    structs_dict: dict[str, Any],
+    footpaths_dict: dict[str, dict[str, int]],
+    end_stop: str | None,
+    n_workers: int = 1,
+    lower_bound_pruning: bool = False,
+) -> dict[str, Any]:
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    mc_raptor = McRaptor(
+        structs_dict,
+        id_maps.intern_footpaths(footpaths_dict),
+        3,
+        0,
+        {},
+        {},
+        ArrivalTimeLabel,
+        n_workers=n_workers,
+        lower_bound_pruning=lower_bound_pruning,
+    )
+    bags = mc_raptor.run(
+        id_maps.intern_stop("stop1"),
+        id_maps.intern_stop(end_stop) if end_stop is not None else None,
+        "00:00:00",
+    )
+    mc_raptor.close()
+    return id_maps.gtfs_stop_dict(bags)
+
+
+def test_mcraptor(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    bags = run_mcraptor(structs_dict, footpaths_dict, None)
+
+    assert [label["arrival_time"] for label in bags["stop2"]] == ["00:10:00"]
+    assert [label["arrival_time"] for label in bags["stop3"]] == ["00:20:00"]
+    assert [label["arrival_time"] for label in bags["stop4"]] == ["00:12:00"]
+
+
+def test_mcraptor_target_pruning(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    bags = run_mcraptor(structs_dict, footpaths_dict, "stop2")
+
+    assert [label["arrival_time"] for label in bags["stop2"]] == ["00:10:00"]
+    # stop3 and stop4 are reached after the target, so their labels are pruned
+    assert bags["stop3"] == []
+    assert bags["stop4"] == []
+
+
+def test_mcraptor_lower_bound_pruning(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    bags = run_mcraptor(structs_dict, footpaths_dict, "stop3")
+    pruned_bags = run_mcraptor(
+        structs_dict, footpaths_dict, "stop3", lower_bound_pruning=True
+    )
+
+    assert [
+        (label["arrival_time"], label["stops"], label["trips"])
+        for label in pruned_bags["stop3"]
+    ] == [
+        (label["arrival_time"], label["stops"], label["trips"])
+        for label in bags["stop3"]
+    ]
+    assert [label["arrival_time"] for label in bags["stop4"]] == ["00:12:00"]
+    # stop4 is reached 12 minutes in and at least 10 minutes away from stop3,
+    # which is already reached after 20 minutes
+    assert pruned_bags["stop4"] == []
+
+
+def test_mcraptor_parallel_route_scanning(
+    monkeypatch,
+    structs_dict: dict[str, Any],
+    footpaths_dict: dict[str, dict[str, int]],
+):
+    monkeypatch.setattr(parallel, "MIN_ROUTES_PER_WORKER", 1)
+
+    for end_stop in [None, "stop2"]:
+        expected = run_mcraptor(structs_dict, footpaths_dict, end_stop)
+        bags = run_mcraptor(structs_dict, footpaths_dict, end_stop, n_workers=2)
+
+        assert bags.keys() == expected.keys()
+        for stop_id, labels in expected.items():
+            assert [
+                (label["arrival_time"], label["stops"], label["trips"])
+                for label in bags[stop_id]
+            ] == [
+                (label["arrival_time"], label["stops"], label["trips"])
+                for label in labels
+            ]
+
+
+def test_mcraptor_builds_lower_bound_graph_once(
+    monkeypatch,
+    structs_dict: dict[str, Any],
+    footpaths_dict: dict[str, dict[str, int]],
+):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    mc_raptor = McRaptor(
+        structs_dict,
+        id_maps.intern_footpaths(footpaths_dict),
+        3,
+        0,
+        {},
+        {},
+        ArrivalTimeLabel,
+        lower_bound_pruning=True,
+    )
+    from_structs = Timetable.from_structs
+    compiled = []
+    monkeypatch.setattr(
+        Timetable,
+        "from_structs",
+        lambda structs_dict: compiled.append(structs_dict)
+        or from_structs(structs_dict),
+    )
+
+    for end_stop in ["stop2", "stop3", "stop4"]:
+        mc_raptor.run(
+            id_maps.intern_stop("stop1"), id_maps.intern_stop(end_stop), "00:00:00"
+        )
+
+    assert len(compiled) == 1
+    assert len(mc_raptor.lower_bounds_by_end_stop) == 3
+
+
+def test_mcraptor_parallel_route_scanning_sends_the_bags_of_the_routes(
+    structs_dict: dict[str, Any],
+):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    mc_raptor = McRaptor(structs_dict, {}, 3, 0, {}, {}, ArrivalTimeLabel)
+    stop1, stop2, stop3, stop4 = [
+        id_maps.intern_stop(stop_id) for stop_id in ["stop1", "stop2", "stop3", "stop4"]
+    ]
+
+    state = BagRoundState(range(4))
+    for stop_id in [stop1, stop3, stop4]:
+        state.get_current_bag(stop_id).add(ArrivalTimeLabel(60 * stop_id, stop_id))
+        state.best[stop_id].add(ArrivalTimeLabel(60 * stop_id, stop_id))
+    state.next_round()
+
+    # route1_0_A serves stop1, stop2 and stop3, only stop2 and stop3 are
+    # scanned from position 1 on
+    previous, best = mc_raptor.chunk_round_state(
+        [(id_maps.intern_route("route1_0_A"), 1)], state
+    )
+
+    assert previous.keys() == {stop3}
+    assert best.keys() == {stop3}
+    assert previous[stop3] is state.previous[stop3]
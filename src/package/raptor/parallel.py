@@ -0,0 +1,90 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+from typing_extensions import Self
+
+I = TypeVar("I")
+R = TypeVar("R")
+
+# routes are only scanned in parallel if every worker gets at least this many,
+# as the state of the stops of its routes is pickled for every worker
+MIN_ROUTES_PER_WORKER = 32
+
+# engine of the pool a worker belongs to, set when the worker is forked
+_engine: Any = None
+
+
+def can_fork() -> bool:
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def should_scan_in_parallel(n_workers: int, n_routes: int) -> bool:
+    return n_workers > 1 and n_routes >= 2 * MIN_ROUTES_PER_WORKER and can_fork()
+
+
+class WorkerPool:
+    """
+    Worker processes that scan the routes of a round, kept for the lifetime of
+    an engine. The workers are forked once, when the pool is first used, and
+    inherit the engine (e.g. its timetable) without pickling it. The engine
+    must therefore not change after the first parallel round. Only the part
+    of the round state that a chunk reads (e.g. the labels of the previous
+    round at the stops of its routes) is pickled and sent with the chunk.
+    """
+
+    def __init__(self: Self, engine: Any, n_workers: int):
+        self.engine = engine
+        self.n_workers = n_workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def map_partitioned(
+        self: Self,
+        scan: Callable[[Any, Any, list[I]], list[R]],
+        items: list[I],
+        chunk_state: Callable[[list[I]], Any],
+    ) -> list[R]:
+        """
+        Splits the items into contiguous chunks and calls `scan(engine,
+        chunk_state(chunk), chunk)` for every chunk in the workers.
+        `chunk_state` is called in the calling process and should only return
+        the state the chunk reads, as it is pickled. Returns the concatenated
+        results in the order of the items, independent of which worker
+        finished first. `scan` has to be a module level function.
+        """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.n_workers,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_init_worker,
+                initargs=(self.engine,),
+            )
+
+        n_chunks = min(self.n_workers, max(1, len(items) // MIN_ROUTES_PER_WORKER))
+        chunk_size = -(-len(items) // n_chunks)
+        chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+        results = self.executor.map(
+            _scan_chunk,
+            [scan] * len(chunks),
+            [chunk_state(chunk) for chunk in chunks],
+            chunks,
+        )
+        return [result for chunk_results in results for result in chunk_results]
+
+    def close(self: Self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+def _init_worker(engine: Any):
+    global _engine
+
+    # the initializer arguments of a forked worker are inherited, not pickled
+    _engine = engine
+
+
+def _scan_chunk(
+    scan: Callable[[Any, Any, list[I]], list[R]], round_state: Any, chunk: list[I]
+) -> list[R]:
+    return scan(_engine, round_state, chunk)
@@ -3,9 +3,15 @@ from typing_extensions import Self
 
 import sys
 
+import numpy as np
+
 from package import strtime
 from package.logger import rlog
+from package.raptor import parallel
 from package.raptor.data import DataQuerier
+from package.raptor.state import INFINITY, RoundState, SparseTimes
+from package.raptor.timetable import Timetable
+from package.structs.footpaths import Footpaths
 from package.tracer.tracer import (
     TraceStart,
     TraceTrip,
@@ -13,65 +19,170 @@ from package.tracer.tracer import (
     TracerMap,
 )
 
-
-MarkedRouteStopTuples = dict[str, tuple[str, int]]
-TausPerIteration = dict[int, dict[str, int]]
-TausBest = dict[str, int]
+MarkedRouteStopTuples = dict[int, tuple[int, int]]
+# stop, arrival time, trip, hop on stop and hop on time of a trip arrival
+RouteCandidate = tuple[int, int, int, int, int]
 
 
 class Raptor:
     def __init__(
         self: Self,
-        structs_dict: dict,
-        footpaths: dict,
+        structs_dict: dict | Timetable,
+        footpaths: dict | Footpaths,
         max_transfers: int,
         default_transfer_time: int,
+        n_workers: int = 1,
     ):
         self.dq = DataQuerier(structs_dict, footpaths)
 
         self.max_transfers = max_transfers
         self.default_transfer_time = default_transfer_time
+        # number of processes the routes of a round are scanned with
+        self.n_workers = n_workers
+        self.worker_pool = parallel.WorkerPool(self, n_workers)
+
+        # reused by all queries, resetting it only costs the stops that changed
+        self.state = RoundState(len(self.dq.get_stop_ids()))
 
-    def run(self, start_stop_id: str, end_stop_id: Optional[str], start_time_str: str):
+    def close(self: Self):
+        """
+        Shuts down the worker processes of parallel route scans, if any were
+        started.
+        """
+        self.worker_pool.close()
+
+    def run(self, start_stop_id: int, end_stop_id: Optional[int], start_time_str: str):
         start_time = strtime.str_time_to_seconds(start_time_str)
 
-        tau_i, tau_best, marked_stops, tracers_map = self.init_vars(
-            start_stop_id, start_time
+        state = self.state
+        state.reset()
+        marked_stops, tracers_map = self.init_vars(state, start_stop_id, start_time)
+
+        k, _ = self.run_rounds(
+            state, marked_stops, end_stop_id, start_time, tracers_map
         )
 
+        rlog.info(f"RAPTOR finished after {k} iterations")
+        return seconds_dict_to_times_dict(state.best_times()), tracers_map
+
+    def run_range(
+        self: Self,
+        start_stop_id: int,
+        window_start_str: str,
+        window_end_str: str,
+    ) -> dict[int, list[tuple[str, str]]]:
+        """
+        Range RAPTOR (rRAPTOR): computes the earliest arrival times for every
+        departure from the start stop within the window [window_start,
+        window_end].
+
+        Departures are processed from latest to earliest, while the labels of
+        all rounds are kept. An arrival time reached by a later departure is
+        also reachable by an earlier one (by waiting), so every run only has to
+        explore the stops it actually improves.
+
+        Returns for every stop the Pareto profile of (departure time, arrival
+        time) tuples, sorted by departure time. A departure time is the time
+        at which the journey leaves the start stop, i.e. the departure of the
+        first trip minus the default transfer time.
+        """
+        window_start = strtime.str_time_to_seconds(window_start_str)
+        window_end = strtime.str_time_to_seconds(window_end_str)
+
+        departure_times = self.collect_departure_times(
+            start_stop_id, window_start, window_end
+        )
+
+        # the labels of all rounds are reused for the next departure
+        state = RoundState(len(self.dq.get_stop_ids()), keep_history=True)
+        tracers_map = TracerMap(self.dq.get_stop_ids())
+        profiles: dict[int, list[tuple[int, int]]] = {
+            stop_id: [] for stop_id in self.dq.get_stop_ids()
+        }
+
+        for departure_time in reversed(departure_times):
+            rlog.debug(f"departure {strtime.seconds_to_str_time(departure_time)}")
+            state.restart()
+            state.update(start_stop_id, departure_time)
+            tracers_map.add(tracer=TraceStart(start_stop_id, departure_time))
+
+            _, improved_stops = self.run_rounds(
+                state, {start_stop_id}, None, departure_time, tracers_map
+            )
+            improved_stops.add(start_stop_id)
+
+            # departures are processed in decreasing order, so an entry is only
+            # Pareto optimal if it arrives earlier than the previous one
+            for stop_id in improved_stops:
+                profile = profiles[stop_id]
+                arrival_time = state.best[stop_id]
+                if len(profile) == 0 or arrival_time < profile[-1][1]:
+                    profile.append((departure_time, arrival_time))
+
+        rlog.info(f"rRAPTOR finished after {len(departure_times)} departures")
+        return {
+            stop_id: seconds_profile_to_times_profile(profile[::-1])
+            for stop_id, profile in profiles.items()
+        }
+
+    def run_rounds(
+        self: Self,
+        state: RoundState,
+        marked_stops: set[int],
+        end_stop_id: Optional[int],
+        start_time: int,
+        tracers_map: TracerMap,
+    ) -> tuple[int, set[int]]:
+        """
+        Runs the RAPTOR rounds, updating the state in place.
+        Returns the number of rounds and the stops that were improved.
+        """
+        improved_stops: set[int] = set()
+
         k = 0
         for k in range(1, self.max_transfers + 1):
             rlog.debug(f"iteration {k}")
-            tau_i[k] = tau_i[k - 1].copy()
+            state.next_round()
 
             Q = self.collect_Q(marked_stops)
 
-            marked_stops, tau_i, tau_best, tracers_map = self.process_routes(
-                Q, k, tau_i, tau_best, end_stop_id, tracers_map
+            marked_stops, tracers_map = self.process_routes(
+                Q, state, end_stop_id, tracers_map
             )
 
-            (
-                additional_marked_stops,
-                tau_i,
-                tau_best,
-                tracers_map,
-            ) = self.process_footpaths(
-                marked_stops, k, tau_i, tau_best, end_stop_id, start_time, tracers_map
+            additional_marked_stops, tracers_map = self.process_footpaths(
+                marked_stops, state, end_stop_id, start_time, tracers_map
             )
 
             marked_stops.update(additional_marked_stops)
+            improved_stops.update(marked_stops)
 
             rlog.debug(f"marked_stops: {marked_stops}")
-            rlog.debug(f"tau_i: {tau_i[k]}")
 
             if len(marked_stops) == 0:
                 break
 
-        rlog.info(f"RAPTOR finished after {k} iterations")
-        return seconds_dict_to_times_dict(tau_best), tracers_map
+        return k, improved_stops
+
+    def collect_departure_times(
+        self: Self, stop_id: int, window_start: int, window_end: int
+    ) -> list[int]:
+        """
+        Returns the sorted, distinct times at which a trip can be caught at the
+        stop, shifted by the default transfer time, within the window.
+        """
+        departure_times = {
+            departure_time - self.default_transfer_time
+            for departure_time in self.dq.get_departure_times_at_stop(stop_id)
+        }
+        return sorted(
+            departure_time
+            for departure_time in departure_times
+            if window_start <= departure_time <= window_end
+        )
 
-    def collect_Q(self, marked_stops: set[str]) -> dict[str, tuple[str, int]]:
-        Q: dict[str, tuple[str, int]] = {}
+    def collect_Q(self, marked_stops: set[int]) -> dict[int, tuple[int, int]]:
+        Q: dict[int, tuple[int, int]] = {}
         for stop_id in marked_stops:
             for route_id in self.dq.get_routes_serving_stop(stop_id):
                 idx = self.dq.get_idx_of_stop_in_route(stop_id, route_id)
@@ -88,77 +199,187 @@ class Raptor:
     def process_routes(
         self: Self,
         Q: MarkedRouteStopTuples,
-        k: int,
-        tau_i: TausPerIteration,
-        tau_best: TausBest,
-        end_stop_id: Optional[str],
+        state: RoundState,
+        end_stop_id: Optional[int],
         tracers_map: TracerMap,
-    ) -> tuple[set[str], TausPerIteration, TausBest, TracerMap]:
+    ) -> tuple[set[int], TracerMap]:
         marked_stops = set()
 
+        if parallel.should_scan_in_parallel(self.n_workers, len(Q)):
+            candidates = self.worker_pool.map_partitioned(
+                scan_routes,
+                [(route_id, idx) for route_id, (_, idx) in Q.items()],
+                lambda routes: self.chunk_round_state(routes, state, end_stop_id),
+            )
+            self.apply_route_candidates(
+                candidates, marked_stops, state, end_stop_id, tracers_map
+            )
+            return marked_stops, tracers_map
+
         for route_id, (stop_id, idx) in Q.items():
-            trip_id: Optional[str] = None
+            trip_id: Optional[int] = None
+            trip_pointer: Optional[int] = None
 
             tracers_map.clear_last_hop()
 
             for stop_id in self.dq.iterate_stops_in_route_from_idx(route_id, idx):
-                trip_id, tau_i, tau_best, tracers_map = self.process_route(
+                trip_id, trip_pointer, tracers_map = self.process_route(
                     route_id,
                     trip_id,
+                    trip_pointer,
                     stop_id,
                     marked_stops,
-                    k,
-                    tau_i,
-                    tau_best,
+                    state,
                     end_stop_id,
                     tracers_map,
                 )
 
-        return marked_stops, tau_i, tau_best, tracers_map
+        return marked_stops, tracers_map
 
     def process_route(
         self: Self,
-        route_id: str,
-        trip_id: Optional[str],
-        stop_id: str,
-        marked_stops: set[str],
-        k: int,
-        tau_i: TausPerIteration,
-        tau_best: TausBest,
-        end_stop_id: Optional[str],
+        route_id: int,
+        trip_id: Optional[int],
+        trip_pointer: Optional[int],
+        stop_id: int,
+        marked_stops: set[int],
+        state: RoundState,
+        end_stop_id: Optional[int],
         tracers_map: TracerMap,
-    ) -> tuple[Optional[str], TausPerIteration, TausBest, TracerMap]:
-        tau_best_end_stop_id = tau_best[end_stop_id] if end_stop_id else sys.maxsize
+    ) -> tuple[Optional[int], Optional[int], TracerMap]:
+        tau_best_end_stop_id = (
+            state.best[end_stop_id] if end_stop_id is not None else sys.maxsize
+        )
 
         if trip_id is not None and self.dq.get_arrival_time(trip_id, stop_id) < min(
-            tau_best[stop_id], tau_best_end_stop_id
+            state.best[stop_id], tau_best_end_stop_id
         ):
-            self.update_tau_through_trip(
-                trip_id, stop_id, k, tau_i, tau_best, tracers_map
-            )
+            self.update_tau_through_trip(trip_id, stop_id, state, tracers_map)
             marked_stops.add(stop_id)
 
-        ready_to_depart = tau_i[k - 1][stop_id] + self.default_transfer_time
+        ready_to_depart = state.previous[stop_id] + self.default_transfer_time
         if ready_to_depart < self.dq.get_departure_time(trip_id, stop_id):
-            new_trip_id = self.find_earlier_trip(
-                route_id, stop_id, ready_to_depart, tracers_map
+            result = self.find_earlier_trip(
+                route_id, stop_id, ready_to_depart, trip_pointer, tracers_map
+            )
+            if result is not None:
+                trip_id, trip_pointer = result
+
+        return trip_id, trip_pointer, tracers_map
+
+    def scan_route(
+        self: Self,
+        route_id: int,
+        idx: int,
+        previous: list[int] | SparseTimes,
+        best: list[int] | SparseTimes,
+        end_stop_id: Optional[int],
+    ) -> list[RouteCandidate]:
+        """
+        Scans the route like `process_route`, but only reads the arrival times
+        of the previous round and the best arrival times. The arrivals that
+        improve on the best arrival times at the start of the scan are
+        returned instead of being applied.
+        """
+        candidates: list[RouteCandidate] = []
+        trip_id: Optional[int] = None
+        trip_pointer: Optional[int] = None
+        hop_on_stop_id = hop_on_time = 0
+
+        tau_best_end_stop_id = (
+            best[end_stop_id] if end_stop_id is not None else sys.maxsize
+        )
+        for stop_id in self.dq.iterate_stops_in_route_from_idx(route_id, idx):
+            if trip_id is not None:
+                arrival_time = self.dq.get_arrival_time(trip_id, stop_id)
+                if arrival_time < min(best[stop_id], tau_best_end_stop_id):
+                    candidates.append(
+                        (stop_id, arrival_time, trip_id, hop_on_stop_id, hop_on_time)
+                    )
+
+            ready_to_depart = previous[stop_id] + self.default_transfer_time
+            if ready_to_depart < self.dq.get_departure_time(trip_id, stop_id):
+                result = self.dq.earliest_trip_with_pointer(
+                    route_id,
+                    stop_id,
+                    ready_to_depart,
+                    trip_pointer + 1 if trip_pointer is not None else None,
+                )
+                if result is not None:
+                    trip_id, hop_on_time, trip_pointer = result
+                    hop_on_stop_id = stop_id
+        return candidates
+
+    def chunk_round_state(
+        self: Self,
+        routes: list[tuple[int, int]],
+        state: RoundState,
+        end_stop_id: Optional[int],
+    ) -> tuple[SparseTimes, SparseTimes, Optional[int]]:
+        """
+        Returns the part of the state that `scan_route` reads for the routes:
+        the arrival times of the previous round and the best arrival times at
+        the stops that are scanned, and at the end stop.
+        """
+        previous = SparseTimes()
+        best = SparseTimes()
+        for route_id, idx in routes:
+            for stop_id in self.dq.iterate_stops_in_route_from_idx(route_id, idx):
+                if state.previous[stop_id] != INFINITY:
+                    previous[stop_id] = state.previous[stop_id]
+                if state.best[stop_id] != INFINITY:
+                    best[stop_id] = state.best[stop_id]
+        if end_stop_id is not None and state.best[end_stop_id] != INFINITY:
+            best[end_stop_id] = state.best[end_stop_id]
+        return previous, best, end_stop_id
+
+    def apply_route_candidates(
+        self: Self,
+        candidates: list[RouteCandidate],
+        marked_stops: set[int],
+        state: RoundState,
+        end_stop_id: Optional[int],
+        tracers_map: TracerMap,
+    ):
+        """
+        Applies the candidates of parallel route scans in the order of Q.
+        Every candidate is checked again against the current best arrival
+        times, so the result is the same as scanning the routes one by one.
+        """
+        for (
+            stop_id,
+            arrival_time,
+            trip_id,
+            hop_on_stop_id,
+            hop_on_time,
+        ) in candidates:
+            tau_best_end_stop_id = (
+                state.best[end_stop_id] if end_stop_id is not None else sys.maxsize
             )
-            trip_id = new_trip_id if new_trip_id is not None else trip_id
+            if arrival_time >= min(state.best[stop_id], tau_best_end_stop_id):
+                continue
 
-        return trip_id, tau_i, tau_best, tracers_map
+            state.update(stop_id, arrival_time)
+            marked_stops.add(stop_id)
+            tracers_map.add(
+                TraceTrip(
+                    start_stop_id=hop_on_stop_id,
+                    end_stop_id=stop_id,
+                    departure_time=hop_on_time,
+                    arrival_time=arrival_time,
+                    trip_id=trip_id,
+                ),
+            )
 
     def update_tau_through_trip(
         self: Self,
-        trip_id: str,
-        stop_id: str,
-        k: int,
-        tau_i: TausPerIteration,
-        tau_best: TausBest,
+        trip_id: int,
+        stop_id: int,
+        state: RoundState,
         tracers_map: TracerMap,
     ) -> None:
         arrival_time = self.dq.get_arrival_time(trip_id, stop_id)
-        tau_i[k][stop_id] = arrival_time
-        tau_best[stop_id] = arrival_time
+        state.update(stop_id, arrival_time)
 
         hop_on_stop_id, hop_on_time = tracers_map.get_last_hop()
         if hop_on_stop_id is None or hop_on_time is None:
@@ -177,92 +398,148 @@ class Raptor:
 
     def find_earlier_trip(
         self: Self,
-        route_id: str,
-        stop_id: str,
+        route_id: int,
+        stop_id: int,
         ready_to_depart: int,
+        trip_pointer: Optional[int],
         tracers_map: TracerMap,
-    ) -> Optional[str]:
-        result = self.dq.earliest_trip(
+    ) -> Optional[tuple[int, int]]:
+        # we can catch the current trip, so the earliest trip is either the
+        # current trip or one before it
+        result = self.dq.earliest_trip_with_pointer(
             route_id,
             stop_id,
             ready_to_depart,
+            trip_pointer + 1 if trip_pointer is not None else None,
         )
         if result is None:
             # we could not find a new trip, so we return as is
             # return trip_id, tau_i, tau_best, tracers_map
             return None
-        trip_id, hop_on_time = result
+        trip_id, hop_on_time, trip_pointer = result
         hop_on_stop_id = stop_id
         tracers_map.update_last_hop(hop_on_stop_id, hop_on_time)
 
-        return trip_id
+        return trip_id, trip_pointer
 
     def process_footpaths(
         self: Self,
-        marked_stops: set[str],
-        k: int,
-        tau_i: TausPerIteration,
-        tau_best: TausBest,
-        end_stop_id: Optional[str],
+        marked_stops: set[int],
+        state: RoundState,
+        end_stop_id: Optional[int],
         start_time: int,
         tracers_map: TracerMap,
-    ) -> tuple[set[str], TausPerIteration, TausBest, TracerMap]:
-        additional_marked_stops = set()
-        for stop_id in marked_stops:
-            for nearby_stop_id, walking_time in self.dq.iterate_footpaths_from_stop(
-                stop_id
-            ):
-                nearby_stop_arrival_time = tau_i[k][stop_id] + walking_time
+    ) -> tuple[set[int], TracerMap]:
+        additional_marked_stops: set[int] = set()
+        if len(marked_stops) == 0:
+            return additional_marked_stops, tracers_map
+
+        footpaths = self.dq.footpaths
+        if footpaths is None:
+            raise Exception("footpaths have to be defined to process footpaths")
+
+        stop_ids = list(marked_stops)
+        positions, targets, walking_times = footpaths.gather(
+            np.array(stop_ids, dtype=np.int64)
+        )
+        if len(targets) == 0:
+            return additional_marked_stops, tracers_map
+
+        # footpaths are relaxed from the arrival times after the route scan,
+        # so the fastest footpath to every nearby stop can be chosen at once
+        current = state.current
+        arrival_times = (
+            np.array([current[stop_id] for stop_id in stop_ids], dtype=np.int64)[
+                positions
+            ]
+            + walking_times
+        )
 
-                tau_best_end_stop_id = (
-                    tau_best[end_stop_id] if end_stop_id else sys.maxsize
-                )
-                # we have a couple of modifications here:
-                # 1. we only mark the stop if tau is actually updated
-                # 2. we use tau_best instead of tau_k (should not make a difference)
-                # 3. we also consider tau_best[end_stop_id] just like in the stop before
-                # 4. we also update tau_best
-                if nearby_stop_arrival_time < min(
-                    tau_best[nearby_stop_id], tau_best_end_stop_id
-                ):
-                    assert type(nearby_stop_arrival_time) == int
-                    assert nearby_stop_arrival_time >= start_time
-                    tau_i[k][nearby_stop_id] = nearby_stop_arrival_time
-                    tau_best[nearby_stop_id] = nearby_stop_arrival_time
-                    additional_marked_stops.add(nearby_stop_id)
-
-                    tracers_map.add(
-                        TraceFootpath(stop_id, nearby_stop_id, walking_time),
-                    )
-        return additional_marked_stops, tau_i, tau_best, tracers_map
+        # sort by nearby stop, then by arrival time, the first footpath of
+        # every nearby stop is its fastest one
+        order = np.lexsort((arrival_times, targets))
+        sorted_targets = targets[order]
+        is_first = np.empty(len(order), dtype=bool)
+        is_first[0] = True
+        np.not_equal(sorted_targets[1:], sorted_targets[:-1], out=is_first[1:])
+        fastest = order[is_first]
+
+        tau_best_end_stop_id = (
+            state.best[end_stop_id] if end_stop_id is not None else sys.maxsize
+        )
+        # we have a couple of modifications here:
+        # 1. we only mark the stop if tau is actually updated
+        # 2. we use tau_best instead of tau_k (should not make a difference)
+        # 3. we also consider tau_best[end_stop_id] just like in the stop before
+        # 4. we also update tau_best
+        best = state.best
+        bound = np.minimum(
+            np.array(
+                [best[stop_id] for stop_id in targets[fastest].tolist()],
+                dtype=np.int64,
+            ),
+            tau_best_end_stop_id,
+        )
+        improved = fastest[arrival_times[fastest] < bound]
+
+        for position, nearby_stop_id, walking_time, nearby_stop_arrival_time in zip(
+            positions[improved].tolist(),
+            targets[improved].tolist(),
+            walking_times[improved].tolist(),
+            arrival_times[improved].tolist(),
+        ):
+            assert nearby_stop_arrival_time >= start_time
+            state.update(nearby_stop_id, nearby_stop_arrival_time)
+            additional_marked_stops.add(nearby_stop_id)
+
+            tracers_map.add(
+                TraceFootpath(stop_ids[position], nearby_stop_id, walking_time),
+            )
+        return additional_marked_stops, tracers_map
 
     def init_vars(
-        self, start_stop_id: str, start_time: int
-    ) -> tuple[dict[int, dict[str, int]], dict[str, int], set[str], TracerMap]:
-        tau_i: dict[int, dict[str, int]] = {
-            0: {},
-        }
+        self, state: RoundState, start_stop_id: int, start_time: int
+    ) -> tuple[set[int], TracerMap]:
         tracer = TracerMap(self.dq.get_stop_ids())
-        tau_best = {}
         marked_stops = set()
 
-        for stop_id in self.dq.get_stop_ids():
-            tau_i[0][stop_id] = sys.maxsize
-            tau_best[stop_id] = sys.maxsize
-
-        tau_i[0][start_stop_id] = start_time
-        tau_best[start_stop_id] = start_time
+        state.update(start_stop_id, start_time)
         tracer.add(
             tracer=TraceStart(start_stop_id, start_time),
         )
 
         marked_stops.add(start_stop_id)
 
-        return tau_i, tau_best, marked_stops, tracer
+        return marked_stops, tracer
+
 
+def scan_routes(
+    raptor: Raptor,
+    round_state: tuple[SparseTimes, SparseTimes, Optional[int]],
+    routes: list[tuple[int, int]],
+) -> list[RouteCandidate]:
+    previous, best, end_stop_id = round_state
+    return [
+        candidate
+        for route_id, idx in routes
+        for candidate in raptor.scan_route(route_id, idx, previous, best, end_stop_id)
+    ]
 
-def seconds_dict_to_times_dict(seconds_dict: dict[str, int]) -> dict[str, str]:
-    return {
-        stop_id: strtime.seconds_to_str_time(seconds)
-        for stop_id, seconds in seconds_dict.items()
-    }
+
+def seconds_dict_to_times_dict(seconds_dict: dict[int, int]) -> dict[int, str]:
+    times = strtime.seconds_to_str_times(
+        np.fromiter(seconds_dict.values(), dtype=np.int64, count=len(seconds_dict))
+    )
+    return dict(zip(seconds_dict, times.tolist()))
+
+
+def seconds_profile_to_times_profile(
+    profile: list[tuple[int, int]],
+) -> list[tuple[str, str]]:
+    return [
+        (
+            strtime.seconds_to_str_time(departure_time),
+            strtime.seconds_to_str_time(arrival_time),
+        )
+        for departure_time, arrival_time in profile
+    ]
@@ -0,0 +1,191 @@
+import os
+import time
+from typing import Any
+
+import numpy as np
+import pytest
+
+from package.raptor import parallel
+from package.raptor.raptor import Raptor
+from package.raptor.state import INFINITY, RoundState
+from package.raptor.timetable import Timetable
+from package.structs.intern import IdMaps, intern_structs
+
+
+def test_run_range(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    footpaths = id_maps.intern_footpaths(footpaths_dict)
+    start_stop = id_maps.intern_stop("stop1")
+
+    for structs in [structs_dict, Timetable.from_structs(structs_dict)]:
+        profiles = id_maps.gtfs_stop_dict(
+            Raptor(structs, footpaths, 3, 0).run_range(
+                start_stop, "00:00:00", "02:00:00"
+            )
+        )
+
+        assert profiles["stop1"] == [
+            ("00:00:00", "00:00:00"),
+            ("01:00:00", "01:00:00"),
+        ]
+        assert profiles["stop2"] == [
+            ("00:00:00", "00:10:00"),
+            ("01:00:00", "01:12:00"),
+        ]
+        assert profiles["stop3"] == [
+            ("00:00:00", "00:20:00"),
+            ("01:00:00", "01:20:00"),
+        ]
+        assert profiles["stop4"] == [
+            ("00:00:00", "00:12:00"),
+            ("01:00:00", "01:10:00"),
+        ]
+
+
+def test_run_range_matches_single_runs(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    footpaths = id_maps.intern_footpaths(footpaths_dict)
+    start_stop = id_maps.intern_stop("stop1")
+
+    profiles = Raptor(structs_dict, footpaths, 3, 60).run_range(
+        start_stop, "00:00:00", "03:00:00"
+    )
+
+    for stop_id, profile in profiles.items():
+        for departure_time, arrival_time in profile:
+            arrival_times, _ = Raptor(structs_dict, footpaths, 3, 60).run(
+                start_stop, None, departure_time
+            )
+            assert arrival_times[stop_id] == arrival_time
+
+
+def test_parallel_route_scanning(
+    monkeypatch,
+    structs_dict: dict[str, Any],
+    footpaths_dict: dict[str, dict[str, int]],
+):
+    monkeypatch.setattr(parallel, "MIN_ROUTES_PER_WORKER", 1)
+
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    footpaths = id_maps.intern_footpaths(footpaths_dict)
+
+    # the workers are forked once and reused by all queries of the engine
+    raptor = Raptor(structs_dict, footpaths, 3, 60, n_workers=2)
+    executors = []
+    for start_stop, end_stop in [("stop1", None), ("stop1", "stop3"), ("stop3", None)]:
+        args = (
+            id_maps.intern_stop(start_stop),
+            id_maps.intern_stop(end_stop) if end_stop is not None else None,
+            "00:00:00",
+        )
+        expected, expected_tracers = Raptor(structs_dict, footpaths, 3, 60).run(*args)
+        arrival_times, tracers = raptor.run(*args)
+        executors.append(raptor.worker_pool.executor)
+
+        assert arrival_times == expected
+        for stop_id, traces in expected_tracers.tracers.items():
+            assert [str(trace) for trace in tracers[stop_id]] == [
+                str(trace) for trace in traces
+            ]
+
+    assert executors[0] is not None
+    assert all(executor is executors[0] for executor in executors)
+    raptor.close()
+    assert raptor.worker_pool.executor is None
+
+
+def test_parallel_route_scanning_sends_the_state_of_the_routes(
+    structs_dict: dict[str, Any],
+):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    raptor = Raptor(structs_dict, {}, 3, 60, n_workers=2)
+    stop1, stop2, stop3, stop4 = [
+        id_maps.intern_stop(stop_id) for stop_id in ["stop1", "stop2", "stop3", "stop4"]
+    ]
+
+    state = RoundState(4)
+    for stop_id in [stop1, stop2, stop3, stop4]:
+        state.update(stop_id, 60 * stop_id)
+    state.next_round()
+
+    # route1_0_A serves stop1, stop2 and stop3, only stop2 and stop3 are
+    # scanned from position 1 on
+    previous, best, end_stop_id = raptor.chunk_round_state(
+        [(id_maps.intern_route("route1_0_A"), 1)], state, stop4
+    )
+
+    assert previous == {stop2: 60 * stop2, stop3: 60 * stop3}
+    assert best == {stop2: 60 * stop2, stop3: 60 * stop3, stop4: 60 * stop4}
+    assert previous[stop1] == INFINITY
+    assert end_stop_id == stop4
+
+
+def create_grid_timetable(n: int, n_trips: int) -> Timetable:
+    """
+    Returns a timetable of n x n stops, with a route along every row and every
+    column of the grid. The trips of all routes leave every 10 minutes and
+    take a minute from stop to stop.
+    """
+    stop_ids = np.arange(n * n, dtype=np.int32).reshape(n, n)
+    route_stops = np.concatenate([stop_ids.ravel(), stop_ids.T.ravel()])
+    stop_routes = np.stack(
+        [np.repeat(np.arange(n), n), n + np.tile(np.arange(n), n)], axis=1
+    )
+    stop_route_positions = np.stack(
+        [np.tile(np.arange(n), n), np.repeat(np.arange(n), n)], axis=1
+    )
+    times = (
+        np.arange(n_trips, dtype=np.int32)[:, None] * 600
+        + np.arange(n, dtype=np.int32)[None, :] * 60
+    ).ravel()
+    return Timetable(
+        IdMaps(
+            [f"stop{i}" for i in range(n * n)],
+            [f"route{i}" for i in range(2 * n)],
+            [f"trip{i}" for i in range(2 * n * n_trips)],
+        ),
+        route_stop_offsets=np.arange(0, 2 * n * n + 1, n, dtype=np.int64),
+        route_stops=route_stops,
+        route_trip_offsets=np.arange(0, 2 * n * n_trips + 1, n_trips, dtype=np.int64),
+        route_trips=np.arange(2 * n * n_trips, dtype=np.int32),
+        route_time_offsets=np.arange(
+            0, 2 * n * n * n_trips + 1, n * n_trips, dtype=np.int64
+        ),
+        arrival_times=np.tile(times, 2 * n),
+        departure_times=np.tile(times, 2 * n),
+        stop_route_offsets=np.arange(0, 2 * n * n + 1, 2, dtype=np.int64),
+        stop_routes=stop_routes.ravel().astype(np.int32),
+        stop_route_positions=stop_route_positions.ravel().astype(np.int32),
+    )
+
+
+@pytest.mark.skipif(
+    not parallel.can_fork() or (os.cpu_count() or 1) < 4,
+    reason="requires fork and at least 4 CPUs",
+)
+def test_parallel_route_scanning_beats_one_worker():
+    # every stop of the grid is marked after the first rounds, so all 300
+    # routes of 150 stops are scanned in the following rounds
+    timetable = create_grid_timetable(150, 18)
+    durations = {}
+    arrival_times = {}
+    for n_workers in [1, 4]:
+        raptor = Raptor(timetable, {}, 4, 0, n_workers=n_workers)
+        # the first run forks the workers
+        raptor.run(0, None, "00:00:00")
+        start = time.perf_counter()
+        arrival_times[n_workers], _ = raptor.run(0, None, "00:00:00")
+        durations[n_workers] = time.perf_counter() - start
+        raptor.close()
+
+    assert arrival_times[4] == arrival_times[1]
+    assert arrival_times[1][150 * 150 - 1] == "04:59:00"
+    assert durations[4] < durations[1]
@@ -0,0 +1,421 @@
+import json
+import multiprocessing
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+from typing_extensions import Self
+
+from package import strtime
+from package.logger import rlog
+from package.raptor import parallel
+from package.raptor.example_labels import ArrivalTimeLabel
+from package.raptor.mcraptor import McRaptor
+from package.raptor.raptor import Raptor
+from package.raptor.timetable import Timetable
+from package.structs.footpaths import Footpaths
+
+RAPTOR_ALGORITHM = "raptor"
+MCRAPTOR_ALGORITHM = "mcraptor"
+ALGORITHMS = [RAPTOR_ALGORITHM, MCRAPTOR_ALGORITHM]
+
+# algorithm, start stop, end stop (None for all stops) and start time in seconds
+QueryKey = tuple[str, int, Optional[int], int]
+
+# query server of the current process, inherited by the forked workers
+_query_server: Optional["QueryServer"] = None
+
+
+class ResultCache:
+    """
+    Least recently used cache of query results. Dicts keep their insertion
+    order, so the least recently used entry is the first one.
+    """
+
+    def __init__(self: Self, size: int):
+        self.size = size
+        self._results: dict[QueryKey, dict] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self: Self) -> int:
+        return len(self._results)
+
+    def get(self: Self, query: QueryKey) -> Optional[dict]:
+        with self._lock:
+            result = self._results.pop(query, None)
+            if result is not None:
+                self._results[query] = result
+            return result
+
+    def put(self: Self, query: QueryKey, result: dict):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._results.pop(query, None)
+            self._results[query] = result
+            while len(self._results) > self.size:
+                del self._results[next(iter(self._results))]
+
+
+class QueryBatcher:
+    """
+    Collects the single queries of concurrent requests into batches, which
+    are answered together by `answer_batch`. A batch is closed once its first
+    query waited for `window` seconds, or once it has `max_size` queries.
+    Every batch is answered in its own thread, so a slow batch does not hold
+    back the queries that arrive meanwhile.
+    """
+
+    def __init__(
+        self: Self,
+        answer_batch: Callable[[list[Any]], list[dict]],
+        window: float,
+        max_size: int = 1024,
+    ):
+        self.answer_batch = answer_batch
+        self.window = window
+        self.max_size = max_size
+        # queries with the futures of their results, None stops the collecting
+        self._queue: queue.SimpleQueue[Optional[tuple[Any, Future]]] = (
+            queue.SimpleQueue()
+        )
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def answer(self: Self, query: Any) -> dict:
+        """
+        Answers the query with the queries of the current batch, blocking
+        until the batch is answered.
+        """
+        future: Future = Future()
+        self._queue.put((query, future))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, daemon=True)
+                self._thread.start()
+        return future.result()
+
+    def close(self: Self):
+        """
+        Stops collecting queries, after the queries collected so far are sent
+        off in a last batch.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _collect(self: Self):
+        is_closed = False
+        while not is_closed:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_size:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    is_closed = True
+                    break
+                batch.append(item)
+            threading.Thread(target=self._answer, args=(batch,), daemon=True).start()
+
+    def _answer(self: Self, batch: list[tuple[Any, Future]]):
+        try:
+            results = self.answer_batch([query for query, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+class QueryServer:
+    """
+    Answers RAPTOR and McRAPTOR queries on a timetable that is loaded once.
+
+    Queries are answered in batches: identical queries of a batch are only
+    answered once, answers are cached, and the remaining queries are spread
+    over a pool of worker processes, if workers are started. Otherwise they
+    are answered in the server process, one at a time. The workers are forked
+    when they are started, so they share the timetable with the server
+    without pickling it. Single queries of concurrent requests are collected
+    into batches as well, see `QueryBatcher`.
+    """
+
+    def __init__(
+        self: Self,
+        timetable: Timetable,
+        footpaths: Footpaths,
+        max_transfers: int,
+        default_transfer_time: int,
+        n_workers: int = 1,
+        cache_size: int = 1024,
+        batch_window: float = 0.005,
+    ):
+        self.timetable = timetable
+        self.id_maps = timetable.id_maps
+        self.raptor = Raptor(timetable, footpaths, max_transfers, default_transfer_time)
+        # the lower bounds are cached per end stop, which pays off for a
+        # server that answers many queries to the same stops
+        self.mc_raptor = McRaptor(
+            timetable,
+            footpaths,
+            max_transfers,
+            default_transfer_time,
+            {},
+            {},
+            ArrivalTimeLabel,
+            lower_bound_pruning=True,
+        )
+
+        self.cache = ResultCache(cache_size)
+        self.batcher = QueryBatcher(self.answer_batch, batch_window)
+        self.n_workers = n_workers
+        self.executor: Optional[Executor] = None
+        # the engines keep state between queries, so queries answered in the
+        # server process are answered one at a time
+        self._engine_lock = threading.Lock()
+
+    def start_workers(self: Self):
+        global _query_server
+
+        if self.n_workers <= 1:
+            return
+        if not parallel.can_fork():
+            rlog.warning("Worker processes can not be forked, using one process")
+            return
+
+        _query_server = self
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            mp_context=multiprocessing.get_context("fork"),
+        )
+
+    def shutdown(self: Self):
+        global _query_server
+
+        self.batcher.close()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        _query_server = None
+
+    def answer_single(self: Self, query: Any) -> dict:
+        """
+        Answers a query in the batch of the queries of concurrent requests,
+        or on its own if queries are not batched.
+        """
+        if self.batcher.window <= 0:
+            return self.answer_batch([query])[0]
+        return self.batcher.answer(query)
+
+    def answer_batch(self: Self, queries: list[Any]) -> list[dict]:
+        """
+        Answers the queries in the format of `parse_query`. The answer of an
+        invalid query is a dict with an "error" message, which does not affect
+        the other queries of the batch.
+        """
+        keys: list[Optional[QueryKey]] = []
+        results: dict[QueryKey, dict] = {}
+        errors: dict[int, dict] = {}
+        for i, query in enumerate(queries):
+            try:
+                key = self.parse_query(query)
+            except ValueError as e:
+                keys.append(None)
+                errors[i] = {"error": str(e)}
+                continue
+            keys.append(key)
+            if key not in results:
+                result = self.cache.get(key)
+                if result is not None:
+                    results[key] = result
+
+        missing = [
+            key for key in dict.fromkeys(keys) if key is not None and key not in results
+        ]
+        rlog.debug(
+            f"Answering {len(queries)} queries, {len(missing)} not cached or duplicate"
+        )
+
+        # with workers, every query is answered in a worker, also the single
+        # queries of concurrent requests, which are then answered in parallel
+        if self.executor is not None:
+            answers = list(
+                self.executor.map(
+                    answer_query,
+                    missing,
+                    chunksize=max(1, len(missing) // (4 * self.n_workers)),
+                )
+            )
+        else:
+            with self._engine_lock:
+                answers = [self.answer(key) for key in missing]
+
+        for key, result in zip(missing, answers):
+            self.cache.put(key, result)
+            results[key] = result
+
+        return [
+            errors[i] if key is None else results[key] for i, key in enumerate(keys)
+        ]
+
+    def parse_query(self: Self, query: Any) -> QueryKey:
+        """
+        Parses a query of the form {"algorithm": "raptor" | "mcraptor",
+        "start_stop_id": str, "end_stop_id": str (optional), "start_time":
+        "HH:MM:SS"}, with GTFS stop ids.
+        """
+        if not isinstance(query, dict):
+            raise ValueError("Query must be an object")
+
+        algorithm = query.get("algorithm", RAPTOR_ALGORITHM)
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm: {algorithm}")
+
+        start_stop_id = self.parse_stop_id(query.get("start_stop_id"))
+        if start_stop_id is None:
+            raise ValueError("Start stop ID is missing")
+        end_stop_id = self.parse_stop_id(query.get("end_stop_id"))
+
+        start_time = query.get("start_time")
+        if not isinstance(start_time, str):
+            raise ValueError("Start time is missing")
+        try:
+            start_time_seconds = strtime.str_time_to_seconds(start_time)
+        except ValueError:
+            raise ValueError(f"Start time {start_time} is not in HH:MM:SS")
+
+        return algorithm, start_stop_id, end_stop_id, start_time_seconds
+
+    def parse_stop_id(self: Self, stop_id: Any) -> Optional[int]:
+        if stop_id is None:
+            return None
+        stop_id = str(stop_id)
+        if stop_id not in self.id_maps.stop_id_by_gtfs_id:
+            raise ValueError(f"Stop {stop_id} is not served by any trip.")
+        return self.id_maps.intern_stop(stop_id)
+
+    def answer(self: Self, query: QueryKey) -> dict:
+        algorithm, start_stop_id, end_stop_id, start_time = query
+        start_time_str = strtime.seconds_to_str_time(start_time)
+
+        if algorithm == MCRAPTOR_ALGORITHM:
+            bags = self.mc_raptor.run(start_stop_id, end_stop_id, start_time_str)
+            return {
+                "bags": {
+                    self.id_maps.gtfs_stop(stop_id): [
+                        {
+                            "arrival_time": label["arrival_time"],
+                            "journey": self.journey(label["traces"]),
+                        }
+                        for label in labels
+                    ]
+                    for stop_id, labels in bags.items()
+                    if len(labels) > 0
+                    and (end_stop_id is None or stop_id == end_stop_id)
+                }
+            }
+
+        arrival_times, tracer_map = self.raptor.run(
+            start_stop_id, end_stop_id, start_time_str
+        )
+        if end_stop_id is not None:
+            return {
+                "arrival_times": {
+                    self.id_maps.gtfs_stop(end_stop_id): arrival_times[end_stop_id]
+                },
+                "journey": self.journey(tracer_map[end_stop_id]),
+            }
+        return {
+            "arrival_times": {
+                self.id_maps.gtfs_stop(stop_id): arrival_time
+                for stop_id, arrival_time in arrival_times.items()
+                if arrival_time != strtime.UNREACHED_STR_TIME
+            }
+        }
+
+    def journey(self: Self, traces: list) -> list[str]:
+        return [str(self.id_maps.gtfs_trace(trace)) for trace in traces]
+
+
+def answer_query(query: QueryKey) -> dict:
+    assert _query_server is not None
+    return _query_server.answer(query)
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /query answers a query object with a result object, or a list of
+    queries with a list of results. Query objects of concurrent requests are
+    answered in one batch. GET /health reports whether the server is up.
+    """
+
+    server: "QueryHTTPServer | UnixQueryHTTPServer"
+
+    def do_GET(self: Self):
+        if self.path != "/health":
+            self.send_json(404, {"error": f"Unknown path: {self.path}"})
+            return
+        self.send_json(200, {"status": "ok"})
+
+    def do_POST(self: Self):
+        if self.path != "/query":
+            self.send_json(404, {"error": f"Unknown path: {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self.send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+
+        query_server = self.server.query_server
+        if isinstance(body, list):
+            self.send_json(200, query_server.answer_batch(body))
+            return
+
+        result = query_server.answer_single(body)
+        self.send_json(400 if "error" in result else 200, result)
+
+    def send_json(self: Self, status: int, body: Any):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def address_string(self: Self) -> str:
+        # clients of a unix socket have no address
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return str(self.server.server_address)
+
+    def log_message(self: Self, format: str, *args: Any):
+        rlog.debug(f"{self.address_string()} - {format % args}")
+
+
+class QueryHTTPServer(ThreadingHTTPServer):
+    def __init__(self: Self, address: tuple[str, int], query_server: QueryServer):
+        self.query_server = query_server
+        super().__init__(address, QueryRequestHandler)
+
+
+class UnixQueryHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self: Self, path: str, query_server: QueryServer):
+        self.query_server = query_server
+        super().__init__(path, QueryRequestHandler)
@@ -0,0 +1,216 @@
+import json
+import os
+import threading
+import time
+import urllib.request
+from typing import Any
+
+import pytest
+
+from package.raptor import parallel
+from package.raptor.data import create_footpaths
+from package.raptor.server import (
+    QueryBatcher,
+    QueryHTTPServer,
+    QueryServer,
+    ResultCache,
+)
+from package.raptor.timetable import Timetable
+
+
+@pytest.fixture
+def query_server(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+) -> QueryServer:
+    timetable = Timetable.from_structs(structs_dict)
+    footpaths = create_footpaths(
+        timetable.id_maps.intern_footpaths(footpaths_dict), timetable.n_stops
+    )
+    assert footpaths is not None
+    return QueryServer(timetable, footpaths, 3, 0)
+
+
+def test_result_cache():
+    cache = ResultCache(2)
+    cache.put(("raptor", 0, None, 0), {"a": 1})
+    cache.put(("raptor", 1, None, 0), {"b": 1})
+    # using the first entry makes the second one the least recently used
+    assert cache.get(("raptor", 0, None, 0)) == {"a": 1}
+    cache.put(("raptor", 2, None, 0), {"c": 1})
+
+    assert len(cache) == 2
+    assert cache.get(("raptor", 1, None, 0)) is None
+    assert cache.get(("raptor", 0, None, 0)) == {"a": 1}
+
+
+def test_answer_batch(query_server: QueryServer):
+    query = {"start_stop_id": "stop1", "end_stop_id": "stop3", "start_time": "00:00:00"}
+    results = query_server.answer_batch(
+        [
+            query,
+            {"algorithm": "mcraptor", **query},
+            {"start_stop_id": "stop1", "start_time": "00:00:00"},
+            {"start_stop_id": "unknown", "start_time": "00:00:00"},
+            query,
+        ]
+    )
+
+    assert results[0] == {
+        "arrival_times": {"stop3": "00:20:00"},
+        "journey": [
+            "Start at stop1 at 00:00:00",
+            "Trip trip1 from stop1@00:00:00 to stop3@00:20:00",
+        ],
+    }
+    assert results[1] == {
+        "bags": {
+            "stop3": [{"arrival_time": "00:20:00", "journey": results[0]["journey"]}]
+        }
+    }
+    assert results[2] == {
+        "arrival_times": {
+            "stop1": "00:00:00",
+            "stop2": "00:10:00",
+            "stop3": "00:20:00",
+            "stop4": "00:12:00",
+        }
+    }
+    assert results[3] == {"error": "Stop unknown is not served by any trip."}
+    assert results[4] is results[0]
+    assert len(query_server.cache) == 3
+
+
+def test_answer_batch_uses_cache(monkeypatch, query_server: QueryServer):
+    query = {"start_stop_id": "stop1", "start_time": "00:00:00"}
+    result = query_server.answer_batch([query])[0]
+
+    def fail(_):
+        raise AssertionError("cached queries must not be answered again")
+
+    monkeypatch.setattr(query_server, "answer", fail)
+    assert query_server.answer_batch([query]) == [result]
+
+
+@pytest.mark.skipif(not parallel.can_fork(), reason="requires fork")
+def test_answer_batch_in_workers(query_server: QueryServer):
+    queries = [
+        {"start_stop_id": stop, "start_time": "00:00:00"}
+        for stop in ["stop1", "stop2", "stop3", "stop4"]
+    ]
+    expected = query_server.answer_batch(queries)
+
+    query_server.cache.size = 0
+    query_server.n_workers = 2
+    query_server.start_workers()
+    try:
+        assert query_server.answer_batch(queries) == expected
+    finally:
+        query_server.shutdown()
+
+
+@pytest.mark.skipif(not parallel.can_fork(), reason="requires fork")
+def test_concurrent_single_queries_in_workers(query_server: QueryServer):
+    def answer_in_worker(query):
+        # long enough that the other requests arrive while this one is running
+        time.sleep(0.2)
+        return {"pid": os.getpid()}
+
+    # the workers are forked from the server and answer with its methods
+    query_server.answer = answer_in_worker  # type: ignore
+    query_server.n_workers = 2
+    query_server.start_workers()
+    results = []
+    requests = [
+        threading.Thread(
+            target=lambda stop: results.append(
+                query_server.answer_single(
+                    {"start_stop_id": stop, "start_time": "00:00:00"}
+                )
+            ),
+            args=(stop,),
+        )
+        for stop in ["stop1", "stop2", "stop3", "stop4"]
+    ]
+    try:
+        for request in requests:
+            request.start()
+        for request in requests:
+            request.join()
+    finally:
+        query_server.shutdown()
+
+    pids = {result["pid"] for result in results}
+    assert len(results) == 4
+    assert os.getpid() not in pids
+    assert len(pids) == 2
+
+
+def test_query_batcher():
+    batches: list[list[Any]] = []
+
+    def answer_batch(queries: list[Any]) -> list[dict]:
+        batches.append(queries)
+        return [{"query": query} for query in queries]
+
+    # long enough that all requests arrive within the window of the first one
+    batcher = QueryBatcher(answer_batch, window=0.5)
+    results: dict[int, dict] = {}
+    requests = [
+        threading.Thread(
+            target=lambda i: results.update({i: batcher.answer(i)}), args=(i,)
+        )
+        for i in range(8)
+    ]
+    try:
+        for request in requests:
+            request.start()
+        for request in requests:
+            request.join()
+    finally:
+        batcher.close()
+
+    assert results == {i: {"query": i} for i in range(8)}
+    assert sorted(query for batch in batches for query in batch) == list(range(8))
+    assert len(batches) < 8
+
+
+def test_answer_single(query_server: QueryServer):
+    query = {"start_stop_id": "stop1", "end_stop_id": "stop2", "start_time": "00:00:00"}
+    try:
+        assert query_server.answer_single(query)["arrival_times"] == {
+            "stop2": "00:10:00"
+        }
+        assert "error" in query_server.answer_single({"start_time": "00:00:00"})
+    finally:
+        query_server.shutdown()
+
+
+def test_http_server(query_server: QueryServer):
+    http_server = QueryHTTPServer(("127.0.0.1", 0), query_server)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{http_server.server_address[1]}/query"
+
+    def post(body: Any) -> Any:
+        request = urllib.request.Request(
+            url,
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    try:
+        query = {
+            "start_stop_id": "stop1",
+            "end_stop_id": "stop2",
+            "start_time": "00:00:00",
+        }
+        assert post(query)["arrival_times"] == {"stop2": "00:10:00"}
+        assert [result["arrival_times"] for result in post([query, query])] == [
+            {"stop2": "00:10:00"}
+        ] * 2
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+        query_server.shutdown()
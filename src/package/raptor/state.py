@@ -0,0 +1,164 @@
+import sys
+from typing import Iterable, Optional
+from typing_extensions import Self
+
+from package.raptor.bag import Bag
+
+INFINITY = sys.maxsize
+
+
+class SparseTimes(dict[int, int]):
+    """
+    Arrival times of some stops, indexed by stop id like the lists of
+    `RoundState`. Stops without a time are at `INFINITY`.
+    """
+
+    def __missing__(self: Self, stop_id: int) -> int:
+        return INFINITY
+
+
+class RoundState:
+    """
+    Arrival times of the RAPTOR rounds, indexed by (interned) stop id.
+
+    Only the previous and the current round are kept, in two preallocated
+    lists that are swapped when a new round starts. At the start of a round
+    both lists are equal, so after swapping only the stops that were updated
+    in the last round (the touched stops) have to be synchronized. Resetting
+    the state for a new query only costs the stops that were changed.
+
+    If `keep_history` is set, every round gets its own list instead. This is
+    needed when the labels of all rounds have to survive a query, e.g. for
+    range queries, where they are reused for the next (earlier) departure.
+    """
+
+    def __init__(self: Self, n_stops: int, keep_history: bool = False):
+        self.n_stops = n_stops
+        self.keep_history = keep_history
+        self.k = 0
+
+        self.best = [INFINITY] * n_stops
+        self.current = [INFINITY] * n_stops
+        self.previous = [INFINITY] * n_stops
+        self.history: Optional[list[list[int]]] = (
+            [self.current] if keep_history else None
+        )
+
+        # stops updated in the current round
+        self.touched: list[int] = []
+        self.is_touched = [False] * n_stops
+        # stops changed since the last reset
+        self.dirty: list[int] = []
+        self.is_dirty = [False] * n_stops
+
+    def update(self: Self, stop_id: int, time: int):
+        """
+        Sets the arrival time at the stop in the current round and, if it is
+        an improvement, the best arrival time over all rounds.
+        """
+        self.current[stop_id] = time
+        if time < self.best[stop_id]:
+            self.best[stop_id] = time
+
+        if not self.is_touched[stop_id]:
+            self.is_touched[stop_id] = True
+            self.touched.append(stop_id)
+        if not self.is_dirty[stop_id]:
+            self.is_dirty[stop_id] = True
+            self.dirty.append(stop_id)
+
+    def next_round(self: Self):
+        self.k += 1
+
+        if self.history is None:
+            self.previous, self.current = self.current, self.previous
+        else:
+            if len(self.history) <= self.k:
+                self.history.append(self.history[self.k - 1].copy())
+            self.previous = self.history[self.k - 1]
+            self.current = self.history[self.k]
+
+        # the arrival times of the previous round are upper bounds for the
+        # current round, they only differ at the stops touched last round
+        for stop_id in self.touched:
+            if self.previous[stop_id] < self.current[stop_id]:
+                self.current[stop_id] = self.previous[stop_id]
+            self.is_touched[stop_id] = False
+        self.touched = []
+
+    def restart(self: Self):
+        """
+        Starts again at round 0, keeping all labels. Only possible if the
+        history is kept.
+        """
+        if self.history is None:
+            raise Exception("Restarting requires the history to be kept")
+
+        for stop_id in self.touched:
+            self.is_touched[stop_id] = False
+        self.touched = []
+
+        self.k = 0
+        self.current = self.history[0]
+
+    def reset(self: Self):
+        """
+        Resets the state for a new query.
+        """
+        arrays = [self.best, self.current, self.previous]
+        if self.history is not None:
+            arrays.extend(self.history)
+
+        for stop_id in self.dirty:
+            for array in arrays:
+                array[stop_id] = INFINITY
+            self.is_dirty[stop_id] = False
+            self.is_touched[stop_id] = False
+        self.dirty = []
+        self.touched = []
+
+        self.k = 0
+        if self.history is not None:
+            self.current = self.history[0]
+
+    def best_times(self: Self) -> dict[int, int]:
+        return {stop_id: time for stop_id, time in enumerate(self.best)}
+
+
+class BagRoundState:
+    """
+    The multi-criteria counterpart of `RoundState`.
+
+    The bags of a round only contain the labels that were added in that
+    round, so they are stored sparsely and only the previous and the current
+    round are kept, unless `keep_history` is set. The best bags over all
+    rounds are preallocated for every stop.
+    """
+
+    def __init__(
+        self: Self,
+        stop_ids: Iterable[int],
+        keep_history: bool = False,
+        bag_class: type[Bag] = Bag,
+    ):
+        self.k = 0
+        self.bag_class = bag_class
+        self.best: dict[int, Bag] = {stop_id: bag_class() for stop_id in stop_ids}
+        self.previous: dict[int, Bag] = {}
+        self.current: dict[int, Bag] = {}
+        self.history: Optional[list[dict[int, Bag]]] = (
+            [self.current] if keep_history else None
+        )
+
+    def get_current_bag(self: Self, stop_id: int) -> Bag:
+        bag = self.current.get(stop_id)
+        if bag is None:
+            bag = self.current[stop_id] = self.bag_class()
+        return bag
+
+    def next_round(self: Self):
+        self.k += 1
+        self.previous = self.current
+        self.current = {}
+        if self.history is not None:
+            self.history.append(self.current)
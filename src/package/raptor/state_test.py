@@ -0,0 +1,48 @@
+from package.raptor.state import INFINITY, RoundState
+
+
+def test_round_state_rolls_rounds():
+    state = RoundState(4)
+    state.update(0, 100)
+
+    state.next_round()
+    assert state.previous[0] == 100
+    assert state.current[0] == 100
+
+    state.update(1, 200)
+    state.update(1, 150)
+    assert state.touched == [1]
+    assert state.best[1] == 150
+
+    state.next_round()
+    assert state.previous == [100, 150, INFINITY, INFINITY]
+    assert state.current == [100, 150, INFINITY, INFINITY]
+    assert state.touched == []
+
+
+def test_round_state_reset_only_clears_dirty_stops():
+    state = RoundState(3)
+    state.update(2, 100)
+    state.next_round()
+    state.update(1, 200)
+
+    state.reset()
+
+    assert state.dirty == []
+    assert state.best == [INFINITY] * 3
+    assert state.current == [INFINITY] * 3
+    assert state.previous == [INFINITY] * 3
+
+
+def test_round_state_keeps_history():
+    state = RoundState(2, keep_history=True)
+    state.update(0, 100)
+    state.next_round()
+    state.update(1, 200)
+
+    state.restart()
+    state.update(0, 50)
+    state.next_round()
+
+    assert state.history == [[50, INFINITY], [50, 200]]
+    assert state.best == [50, 200]
@@ -0,0 +1,553 @@
+import json
+import os
+import sys
+from collections.abc import Callable, Sequence
+from functools import cached_property
+from typing import Optional
+from typing_extensions import Self
+
+import numpy as np
+
+from package import key
+from package.logger import rlog
+from package.structs import build, intern
+from package.structs.intern import IdMaps
+
+# marks stops of a route that are not served by a trip
+NO_TIME = np.iinfo(np.int32).max
+
+# version of the directory format written by `Timetable.save`
+FORMAT_VERSION = 2
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+class Timetable:
+    """
+    Compiled, array-backed representation of the structures created by
+    `build_structures`.
+
+    The timetable works on the dense integer ids of the interned structs (see
+    `package.structs.intern`), which are used directly as indices into the
+    arrays. Trips of a route are stored contiguously and in departure order,
+    so that the arrival and departure times of a route form a trips x stops
+    matrix. The routes serving a stop are stored in CSR format (offsets +
+    values).
+
+    A `Timetable` answers the same queries as `DataQuerier` and can therefore
+    be passed to `DataQuerier` (and all RAPTOR engines) instead of the structs
+    dict.
+    """
+
+    # arrays passed to the constructor, in order
+    ARRAY_ATTRIBUTES = [
+        "route_stop_offsets",
+        "route_stops",
+        "route_trip_offsets",
+        "route_trips",
+        "route_time_offsets",
+        "arrival_times",
+        "departure_times",
+        "stop_route_offsets",
+        "stop_routes",
+        "stop_route_positions",
+    ]
+
+    # arrays that are derived from the arrays passed to the constructor, and
+    # stored next to them so that opening a timetable does not compute them
+    LOOKUP_ARRAY_ATTRIBUTES = [
+        "trip_route",
+        "trip_pos",
+        "sorted_departures",
+    ]
+
+    # attributes that are derived from the arrays on first use and therefore
+    # not pickled
+    DERIVED_ATTRIBUTES = [
+        "arrival_times_by_route",
+        "departure_times_by_route",
+        "sorted_departures_by_route",
+        "stop_id_set",
+    ]
+
+    def __init__(
+        self: Self,
+        id_maps: IdMaps,
+        route_stop_offsets: np.ndarray,
+        route_stops: np.ndarray,
+        route_trip_offsets: np.ndarray,
+        route_trips: np.ndarray,
+        route_time_offsets: np.ndarray,
+        arrival_times: np.ndarray,
+        departure_times: np.ndarray,
+        stop_route_offsets: np.ndarray,
+        stop_routes: np.ndarray,
+        stop_route_positions: np.ndarray,
+        trip_route: Optional[np.ndarray] = None,
+        trip_pos: Optional[np.ndarray] = None,
+        sorted_departures: Optional[np.ndarray] = None,
+    ):
+        self.id_maps = id_maps
+        self.n_stops = len(id_maps.stop_ids)
+        self.n_routes = len(id_maps.route_ids)
+        self.n_trips = len(id_maps.trip_ids)
+
+        self.route_stop_offsets = route_stop_offsets
+        self.route_stops = route_stops
+        self.route_trip_offsets = route_trip_offsets
+        self.route_trips = route_trips
+        self.route_time_offsets = route_time_offsets
+        self.arrival_times = arrival_times
+        self.departure_times = departure_times
+        self.stop_route_offsets = stop_route_offsets
+        self.stop_routes = stop_routes
+        self.stop_route_positions = stop_route_positions
+
+        if trip_route is None or trip_pos is None:
+            trip_route, trip_pos = self.create_trip_lookups()
+        self.trip_route = trip_route
+        self.trip_pos = trip_pos
+        if sorted_departures is None:
+            sorted_departures = self.create_sorted_departures()
+        self.sorted_departures = sorted_departures
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.DERIVED_ATTRIBUTES:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def create_trip_lookups(self: Self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the route and the position within the route of every trip.
+        """
+        n_trips_per_route = np.diff(self.route_trip_offsets)
+        trip_route = np.zeros(self.n_trips, dtype=np.int32)
+        trip_route[self.route_trips] = np.repeat(
+            np.arange(self.n_routes, dtype=np.int32), n_trips_per_route
+        )
+        trip_pos = np.zeros(self.n_trips, dtype=np.int32)
+        trip_pos[self.route_trips] = np.arange(
+            len(self.route_trips), dtype=np.int32
+        ) - np.repeat(self.route_trip_offsets[:-1], n_trips_per_route)
+        return trip_route, trip_pos
+
+    def create_sorted_departures(self: Self) -> np.ndarray:
+        """
+        Returns the flags of all routes, concatenated like the stops of the
+        routes, telling whether the departures at a stop of a route are sorted
+        in trip order, i.e. whether the column can be binary searched.
+        """
+        return concatenate_bool(
+            [
+                np.all(
+                    np.diff(self.departure_times_by_route[route_id], axis=0) >= 0,
+                    axis=0,
+                )
+                for route_id in range(self.n_routes)
+            ]
+        )
+
+    # per-route (trips x stops) views into the flat time arrays, created when
+    # a route is first accessed
+
+    @cached_property
+    def arrival_times_by_route(self: Self) -> "RouteViews":
+        return RouteViews(self.n_routes, self.route_matrix_view(self.arrival_times))
+
+    @cached_property
+    def departure_times_by_route(self: Self) -> "RouteViews":
+        return RouteViews(self.n_routes, self.route_matrix_view(self.departure_times))
+
+    @cached_property
+    def sorted_departures_by_route(self: Self) -> "RouteViews":
+        def view(route_id: int) -> np.ndarray:
+            return self.sorted_departures[
+                self.route_stop_offsets[route_id] : self.route_stop_offsets[
+                    route_id + 1
+                ]
+            ]
+
+        return RouteViews(self.n_routes, view)
+
+    def route_matrix_view(self: Self, times: np.ndarray):
+        def view(route_id: int) -> np.ndarray:
+            shape = (
+                self.route_trip_offsets[route_id + 1]
+                - self.route_trip_offsets[route_id],
+                self.route_stop_offsets[route_id + 1]
+                - self.route_stop_offsets[route_id],
+            )
+            start = self.route_time_offsets[route_id]
+            end = self.route_time_offsets[route_id + 1]
+            return times[start:end].reshape(shape)
+
+        return view
+
+    @cached_property
+    def stop_id_set(self: Self) -> set[int]:
+        return set(range(self.n_stops))
+
+    @staticmethod
+    def from_structs(structs_dict: dict) -> "Timetable":
+        structs_dict = intern.ensure_interned(structs_dict)
+        id_maps = IdMaps.from_structs(structs_dict)
+        (
+            trip_ids_by_route,
+            stops_by_route,
+            _,
+            routes_by_stop,
+            times_by_stop_by_trip,
+            _,
+        ) = build.unpack_structs(structs_dict)
+
+        route_trips: list[int] = []
+        route_stops: list[int] = []
+        route_stop_offsets = [0]
+        route_trip_offsets = [0]
+        route_time_offsets = [0]
+        arrival_times: list[np.ndarray] = []
+        departure_times: list[np.ndarray] = []
+
+        for route_id in range(len(id_maps.route_ids)):
+            stops = stops_by_route[route_id]
+            trips = trip_ids_by_route[route_id]
+
+            arrivals = np.full((len(trips), len(stops)), NO_TIME, dtype=np.int32)
+            departures = np.full((len(trips), len(stops)), NO_TIME, dtype=np.int32)
+            for trip_pos, trip_id in enumerate(trips):
+                times_by_stop = times_by_stop_by_trip[trip_id]
+                for stop_pos, stop_id in enumerate(stops):
+                    if stop_id in times_by_stop:
+                        (
+                            arrivals[trip_pos, stop_pos],
+                            departures[trip_pos, stop_pos],
+                        ) = times_by_stop[stop_id]
+
+            route_trips.extend(trips)
+            route_stops.extend(stops)
+            route_stop_offsets.append(len(route_stops))
+            route_trip_offsets.append(len(route_trips))
+            route_time_offsets.append(route_time_offsets[-1] + arrivals.size)
+            arrival_times.append(arrivals.ravel())
+            departure_times.append(departures.ravel())
+
+        stop_routes: list[int] = []
+        stop_route_positions: list[int] = []
+        stop_route_offsets = [0]
+        for stop_id in range(len(id_maps.stop_ids)):
+            # sorted, so that the position of a stop in a route can be found by
+            # binary search
+            for route_id in sorted(routes_by_stop.get(stop_id, ())):
+                stop_routes.append(route_id)
+                stop_route_positions.append(stops_by_route[route_id].index(stop_id))
+            stop_route_offsets.append(len(stop_routes))
+
+        return Timetable(
+            id_maps=id_maps,
+            route_stop_offsets=np.array(route_stop_offsets, dtype=np.int64),
+            route_stops=np.array(route_stops, dtype=np.int32),
+            route_trip_offsets=np.array(route_trip_offsets, dtype=np.int64),
+            route_trips=np.array(route_trips, dtype=np.int32),
+            route_time_offsets=np.array(route_time_offsets, dtype=np.int64),
+            arrival_times=concatenate_int32(arrival_times),
+            departure_times=concatenate_int32(departure_times),
+            stop_route_offsets=np.array(stop_route_offsets, dtype=np.int64),
+            stop_routes=np.array(stop_routes, dtype=np.int32),
+            stop_route_positions=np.array(stop_route_positions, dtype=np.int32),
+        )
+
+    def save(self: Self, path: str, structs_path: Optional[str] = None):
+        """
+        Writes the timetable to the directory `path`, with one `.npy` file per
+        array, including the lookups and the id maps, and a JSON manifest. The
+        manifest is written last, so a directory without one is incomplete.
+
+        If the timetable was compiled from a structs file, the fingerprint of
+        the file is stored in the manifest, see `open_timetable_for_structs`.
+        """
+        os.makedirs(path, exist_ok=True)
+
+        arrays = {
+            name: getattr(self, name)
+            for name in self.ARRAY_ATTRIBUTES + self.LOOKUP_ARRAY_ATTRIBUTES
+        }
+        arrays.update(self.id_maps.to_arrays())
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(array))
+
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "arrays": {
+                name: {"dtype": str(array.dtype), "shape": list(array.shape)}
+                for name, array in arrays.items()
+            },
+            "structs": (
+                structs_fingerprint(structs_path) if structs_path is not None else None
+            ),
+        }
+        with open(os.path.join(path, MANIFEST_FILE_NAME), "w") as f:
+            json.dump(manifest, f)
+
+    @staticmethod
+    def open(path: str, mmap: bool = True) -> "Timetable":
+        """
+        Opens a timetable written by `save`. All arrays, including the lookups
+        of the trips and the id maps, are memory-mapped read-only, and the
+        per-route views are only created when a route is accessed. Opening
+        therefore does not depend on the size of the timetable, and all
+        processes that open the same files share one copy in the page cache.
+        """
+        manifest = read_manifest(path)
+        if manifest["format_version"] != FORMAT_VERSION:
+            raise Exception(
+                f"Timetable {path} has format version {manifest['format_version']}, "
+                + f"expected {FORMAT_VERSION}"
+            )
+
+        arrays = {
+            name: np.load(
+                os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None
+            )
+            for name in manifest["arrays"]
+        }
+        for name, spec in manifest["arrays"].items():
+            if str(arrays[name].dtype) != spec["dtype"] or list(
+                arrays[name].shape
+            ) != list(spec["shape"]):
+                raise Exception(f"Array {name} of timetable {path} does not match")
+
+        return Timetable(
+            IdMaps.from_arrays(arrays),
+            **{
+                name: arrays[name]
+                for name in Timetable.ARRAY_ATTRIBUTES
+                + Timetable.LOOKUP_ARRAY_ATTRIBUTES
+            },
+        )
+
+    def nbytes(self: Self) -> int:
+        """
+        Returns the number of bytes used by the arrays of the timetable.
+        """
+        return sum(getattr(self, name).nbytes for name in self.ARRAY_ATTRIBUTES)
+
+    # -- querier interface (see `DataQuerier`) --
+
+    def get_stop_ids(self: Self) -> set[int]:
+        return self.stop_id_set
+
+    def get_routes_serving_stop(self: Self, stop_id: int) -> list[int]:
+        start = self.stop_route_offsets[stop_id]
+        end = self.stop_route_offsets[stop_id + 1]
+        return self.stop_routes[start:end].tolist()
+
+    get_routes_by_stop = get_routes_serving_stop
+
+    def get_idx_of_stop_in_route(self: Self, stop_id: int, route_id: int) -> int:
+        return self.stop_position_in_route(stop_id, route_id)
+
+    def stop_position_in_route(self: Self, stop_id: int, route_id: int) -> int:
+        start = self.stop_route_offsets[stop_id]
+        end = self.stop_route_offsets[stop_id + 1]
+        i = start + np.searchsorted(self.stop_routes[start:end], route_id)
+        if i == end or self.stop_routes[i] != route_id:
+            raise KeyError(f"Stop {stop_id} is not part of route {route_id}")
+        return int(self.stop_route_positions[i])
+
+    def get_arrival_time(self: Self, trip_id: int, stop_id: int) -> int:
+        assert trip_id is not None
+        assert stop_id is not None
+
+        route_id, trip_pos, stop_pos = self.locate(trip_id, stop_id)
+        return int(self.arrival_times_by_route[route_id][trip_pos, stop_pos])
+
+    def get_departure_time(self: Self, trip_id: Optional[int], stop_id: int) -> int:
+        assert stop_id is not None
+
+        if trip_id is None:
+            return sys.maxsize
+
+        route_id, trip_pos, stop_pos = self.locate(trip_id, stop_id)
+        return int(self.departure_times_by_route[route_id][trip_pos, stop_pos])
+
+    def get_departure_times_at_stop(self: Self, stop_id: int) -> list[int]:
+        start = self.stop_route_offsets[stop_id]
+        end = self.stop_route_offsets[stop_id + 1]
+        departure_times: list[int] = []
+        for route_id, stop_pos in zip(
+            self.stop_routes[start:end], self.stop_route_positions[start:end]
+        ):
+            departures = self.departure_times_by_route[route_id][:, stop_pos]
+            departure_times.extend(departures[departures != NO_TIME].tolist())
+        return departure_times
+
+    def locate(self: Self, trip_id: int, stop_id: int) -> tuple[int, int, int]:
+        """
+        Returns the route of the trip, the position of the trip within the
+        route and the position of the stop within the route.
+        """
+        route_id = int(self.trip_route[trip_id])
+        trip_pos = int(self.trip_pos[trip_id])
+        stop_pos = self.stop_position_in_route(stop_id, route_id)
+        return route_id, trip_pos, stop_pos
+
+    def earliest_trip(
+        self: Self,
+        route_id: int,
+        stop_id: int,
+        arrival_time: int,
+        trip_pointer: Optional[int] = None,
+    ) -> Optional[tuple[int, int]]:
+        result = self.earliest_trip_with_pointer(
+            route_id, stop_id, arrival_time, trip_pointer
+        )
+        if result is None:
+            return None
+        trip_id, departure_time, _ = result
+        return trip_id, departure_time
+
+    def earliest_trip_with_pointer(
+        self: Self,
+        route_id: int,
+        stop_id: int,
+        arrival_time: int,
+        trip_pointer: Optional[int] = None,
+    ) -> Optional[tuple[int, int, int]]:
+        stop_pos = self.stop_position_in_route(stop_id, route_id)
+
+        trip_pos = self.earliest_trip_pos(
+            route_id, stop_pos, arrival_time, trip_pointer
+        )
+        if trip_pos is None:
+            return None
+
+        trip_id = int(self.route_trips[self.route_trip_offsets[route_id] + trip_pos])
+        departure_time = int(
+            self.departure_times_by_route[route_id][trip_pos, stop_pos]
+        )
+        return trip_id, departure_time, trip_pos
+
+    def earliest_trip_pos(
+        self: Self,
+        route_id: int,
+        stop_pos: int,
+        arrival_time: int,
+        trip_pointer: Optional[int] = None,
+    ) -> Optional[int]:
+        """
+        Returns the position of the first trip of the route that departs at
+        the stop no earlier than `arrival_time`. Only trips before
+        `trip_pointer` are considered, if given.
+        """
+        departures = self.departure_times_by_route[route_id][:trip_pointer, stop_pos]
+
+        if self.sorted_departures_by_route[route_id][stop_pos]:
+            trip_pos = int(np.searchsorted(departures, arrival_time, side="left"))
+            if trip_pos == len(departures) or departures[trip_pos] == NO_TIME:
+                return None
+            return trip_pos
+
+        # trips overtake each other at this stop, fall back to a linear scan
+        catchable = (departures >= arrival_time) & (departures != NO_TIME)
+        trip_pos = int(catchable.argmax()) if len(catchable) > 0 else 0
+        if trip_pos == len(catchable) or not catchable[trip_pos]:
+            return None
+        return trip_pos
+
+    def iterate_stops_in_route_from_idx(
+        self: Self, route_id: int, idx: int
+    ) -> list[int]:
+        start = self.route_stop_offsets[route_id] + idx
+        end = self.route_stop_offsets[route_id + 1]
+        return self.route_stops[start:end].tolist()
+
+
+class RouteViews(Sequence[np.ndarray]):
+    """
+    Sequence of the views of all routes into a flat array, which creates the
+    view of a route on its first access.
+    """
+
+    def __init__(self: Self, n_routes: int, view: Callable[[int], np.ndarray]):
+        self.n_routes = n_routes
+        self.view = view
+        self.views: dict[int, np.ndarray] = {}
+
+    def __len__(self: Self) -> int:
+        return self.n_routes
+
+    def __getitem__(self: Self, route_id):
+        if not 0 <= route_id < self.n_routes:
+            raise IndexError(f"Route {route_id} out of range")
+        view = self.views.get(route_id)
+        if view is None:
+            view = self.views[route_id] = self.view(route_id)
+        return view
+
+
+def timetable_path_for_structs(structs_path: str) -> str:
+    """
+    Returns the path of the timetable that `build-structures` writes next to
+    the structs file. It is named after the structs file, so that every
+    structs file of a directory has its own timetable.
+    """
+    return os.path.splitext(structs_path)[0] + key.TIMETABLE_DIR_SUFFIX
+
+
+def open_timetable_for_structs(structs_path: str) -> Optional[Timetable]:
+    """
+    Opens the timetable that `build-structures` wrote for the structs file.
+    Returns None if there is none, if it was written in another format, or if
+    it was compiled from another version of the file, e.g. because the structs were rebuilt without a timetable
+    or replaced since. The structs have to be compiled then, as queries on
+    the outdated timetable would be answered wrongly.
+    """
+    path = timetable_path_for_structs(structs_path)
+    if not os.path.exists(path):
+        return None
+    manifest = read_manifest(path)
+    if manifest["format_version"] != FORMAT_VERSION:
+        rlog.warning(
+            f"Timetable {path} was written in an older format, ignoring it. "
+            + "Run build-structures again to update it."
+        )
+        return None
+    if manifest.get("structs") != structs_fingerprint(structs_path):
+        rlog.warning(
+            f"Timetable {path} was not compiled from the current {structs_path}, "
+            + "ignoring it. Run build-structures again to update it."
+        )
+        return None
+    return Timetable.open(path)
+
+
+def structs_fingerprint(structs_path: str) -> dict[str, int]:
+    """
+    Returns the size and modification time of the structs file, which change
+    whenever the file is written again.
+    """
+    stat = os.stat(structs_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def read_manifest(path: str) -> dict:
+    manifest_path = os.path.join(path, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        raise Exception(f"Timetable {path} has no {MANIFEST_FILE_NAME}")
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def concatenate_int32(arrays: list[np.ndarray]) -> np.ndarray:
+    if len(arrays) == 0:
+        return np.empty(0, dtype=np.int32)
+    return np.concatenate(arrays)
+
+
+def concatenate_bool(arrays: list[np.ndarray]) -> np.ndarray:
+    if len(arrays) == 0:
+        return np.empty(0, dtype=bool)
+    return np.concatenate(arrays)
@@ -0,0 +1,228 @@
+import os
+import pickle
+from typing import Any
+
+import numpy as np
+import pytest
+
+from package import key, storage
+from package.raptor.data import DataQuerier
+from package.tracer.tracer import TraceFootpath, TraceStart, TraceTrip
+from package.raptor.raptor import Raptor
+from package.raptor.timetable import (
+    Timetable,
+    open_timetable_for_structs,
+    timetable_path_for_structs,
+)
+from package.structs.intern import GtfsIds, IdMaps, intern_structs
+
+
+def test_timetable_layout(structs_dict: dict[str, Any]):
+    timetable = Timetable.from_structs(structs_dict)
+
+    assert timetable.id_maps.stop_ids == ["stop1", "stop2", "stop3", "stop4"]
+    assert timetable.id_maps.route_ids == ["route1_0_A", "route1_0_B", "route1_1_A"]
+    assert timetable.id_maps.trip_ids == ["trip1", "trip2", "trip3"]
+
+    np.testing.assert_array_equal(timetable.route_stop_offsets, [0, 3, 6, 9])
+    np.testing.assert_array_equal(timetable.route_stops, [0, 1, 2, 0, 3, 2, 2, 1, 0])
+    np.testing.assert_array_equal(timetable.route_trips, [0, 1, 2])
+    np.testing.assert_array_equal(timetable.stop_route_offsets, [0, 3, 5, 8, 9])
+    np.testing.assert_array_equal(timetable.stop_routes, [0, 1, 2, 0, 2, 0, 1, 2, 1])
+    np.testing.assert_array_equal(
+        timetable.stop_route_positions, [0, 0, 2, 1, 1, 2, 2, 0, 1]
+    )
+    assert timetable.arrival_times.dtype == np.int32
+    np.testing.assert_array_equal(
+        timetable.arrival_times_by_route[1], [[3600, 4200, 4800]]
+    )
+
+
+def test_timetable_answers_like_structs(structs_dict: dict[str, Any]):
+    dict_querier = DataQuerier(structs_dict, None)
+    timetable_querier = DataQuerier(Timetable.from_structs(structs_dict), None)
+
+    assert dict_querier.get_stop_ids() == timetable_querier.get_stop_ids()
+
+    for stop_id in dict_querier.get_stop_ids():
+        assert set(dict_querier.get_routes_serving_stop(stop_id)) == set(
+            timetable_querier.get_routes_serving_stop(stop_id)
+        )
+
+    for route_id, trip_ids in dict_querier.trip_ids_by_route.items():
+        for idx, stop_id in enumerate(dict_querier.stops_by_route[route_id]):
+            assert timetable_querier.get_idx_of_stop_in_route(stop_id, route_id) == idx
+            assert dict_querier.iterate_stops_in_route_from_idx(
+                route_id, idx
+            ) == timetable_querier.iterate_stops_in_route_from_idx(route_id, idx)
+
+            for trip_id in trip_ids:
+                assert dict_querier.get_arrival_time(
+                    trip_id, stop_id
+                ) == timetable_querier.get_arrival_time(trip_id, stop_id)
+                assert dict_querier.get_departure_time(
+                    trip_id, stop_id
+                ) == timetable_querier.get_departure_time(trip_id, stop_id)
+
+            for arrival_time in [0, 600, 601, 3600, 7200, 9000]:
+                assert dict_querier.earliest_trip(
+                    route_id, stop_id, arrival_time
+                ) == timetable_querier.earliest_trip(route_id, stop_id, arrival_time)
+
+
+def test_timetable_survives_pickling(structs_dict: dict[str, Any]):
+    timetable = Timetable.from_structs(structs_dict)
+    unpickled = pickle.loads(pickle.dumps(timetable))
+    id_maps = unpickled.id_maps
+
+    stop2, stop4 = id_maps.intern_stop("stop2"), id_maps.intern_stop("stop4")
+    trip2, trip3 = id_maps.intern_trip("trip2"), id_maps.intern_trip("trip3")
+    route = id_maps.intern_route("route1_1_A")
+    assert unpickled.get_arrival_time(trip2, stop4) == 4200
+    assert unpickled.earliest_trip(route, stop2, 0) == (trip3, 7800)
+
+
+def test_timetable_save_and_open(tmp_path, structs_dict: dict[str, Any]):
+    timetable = Timetable.from_structs(structs_dict)
+    path = os.path.join(tmp_path, "timetable")
+    timetable.save(path)
+
+    opened = Timetable.open(path)
+    assert opened.id_maps.to_dict() == timetable.id_maps.to_dict()
+    assert isinstance(opened.id_maps.trip_ids, GtfsIds)
+    assert isinstance(opened.id_maps.trip_ids.ids, np.memmap)
+    # the per-route views are only created for the routes that are accessed
+    for name in Timetable.DERIVED_ATTRIBUTES:
+        assert name not in opened.__dict__
+    for name in Timetable.ARRAY_ATTRIBUTES + Timetable.LOOKUP_ARRAY_ATTRIBUTES:
+        array = getattr(opened, name)
+        assert isinstance(array, np.memmap)
+        assert not array.flags.writeable
+        np.testing.assert_array_equal(array, getattr(timetable, name))
+        assert array.dtype == getattr(timetable, name).dtype
+    for flags, expected in zip(
+        opened.sorted_departures_by_route, timetable.sorted_departures_by_route
+    ):
+        np.testing.assert_array_equal(flags, expected)
+
+    dq = DataQuerier(path, None)
+    stop2, stop4 = dq.id_maps.intern_stop("stop2"), dq.id_maps.intern_stop("stop4")
+    trip2, trip3 = dq.id_maps.intern_trip("trip2"), dq.id_maps.intern_trip("trip3")
+    route = dq.id_maps.intern_route("route1_1_A")
+    assert dq.get_arrival_time(trip2, stop4) == 4200
+    assert dq.earliest_trip(route, stop2, 0) == (trip3, 7800)
+    assert set(dq.timetable.arrival_times_by_route.views) == {
+        dq.id_maps.intern_route("route1_0_B")
+    }
+    assert set(dq.timetable.departure_times_by_route.views) == {route}
+
+    # opened timetables are read-only and still survive pickling
+    with pytest.raises(ValueError):
+        opened.arrival_times[0] = 0
+    assert pickle.loads(pickle.dumps(opened)).get_arrival_time(trip2, stop4) == 4200
+
+
+def test_timetable_open_rejects_incomplete_directory(tmp_path):
+    with pytest.raises(Exception, match="manifest"):
+        Timetable.open(str(tmp_path))
+
+
+def test_open_timetable_for_structs(tmp_path, structs_dict: dict[str, Any]):
+    structs_path = os.path.join(tmp_path, "structs.pkl")
+    other_structs_path = os.path.join(tmp_path, "structs_2024-05-01.pkl")
+    assert timetable_path_for_structs(structs_path) != timetable_path_for_structs(
+        other_structs_path
+    )
+
+    storage.write_any_dict(structs_dict, structs_path)
+    assert open_timetable_for_structs(structs_path) is None
+
+    timetable = Timetable.from_structs(structs_dict)
+    timetable.save(timetable_path_for_structs(structs_path), structs_path)
+    opened = open_timetable_for_structs(structs_path)
+    assert opened is not None
+    assert opened.id_maps.to_dict() == timetable.id_maps.to_dict()
+    # the timetable of another structs file in the same directory is not used
+    storage.write_any_dict(structs_dict, other_structs_path)
+    assert open_timetable_for_structs(other_structs_path) is None
+
+    # the structs are rebuilt without a timetable
+    storage.write_any_dict({**structs_dict, "rebuilt": True}, structs_path)
+    assert open_timetable_for_structs(structs_path) is None
+
+    # timetables that do not know their structs file are never used
+    timetable.save(timetable_path_for_structs(structs_path))
+    assert open_timetable_for_structs(structs_path) is None
+
+
+def test_raptor_on_timetable(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    footpaths = id_maps.intern_footpaths(footpaths_dict)
+    start_stop = id_maps.intern_stop("stop1")
+
+    expected, _ = Raptor(structs_dict, footpaths, 3, 0).run(
+        start_stop, None, "00:00:00"
+    )
+    arrival_times, tracer_map = Raptor(
+        Timetable.from_structs(structs_dict), footpaths, 3, 0
+    ).run(start_stop, None, "00:00:00")
+
+    assert arrival_times == expected
+    assert id_maps.gtfs_stop_dict(arrival_times)["stop4"] == "00:12:00"
+
+    traces = id_maps.gtfs_tracer_map(tracer_map)["stop4"]
+    assert [type(trace) for trace in traces] == [TraceStart, TraceTrip, TraceFootpath]
+    assert traces[1].trip_id == "trip1"
+
+
+def overtaking_structs_dict() -> dict[str, Any]:
+    # trip "b" departs after "a" at stop "x" but overtakes it before stop "y"
+    times_by_stop_by_trip = {
+        "a": {"x": (100, 100), "y": (500, 500)},
+        "b": {"x": (200, 200), "y": (300, 300)},
+        "c": {"x": (600, 600), "y": (700, 700)},
+    }
+    return {
+        key.STOP_TIMES_BY_TRIP_KEY: {},
+        key.TRIP_IDS_BY_ROUTE_KEY: {"r": ["a", "b", "c"]},
+        key.STOPS_BY_ROUTE_KEY: {"r": ["x", "y"]},
+        key.ROUTES_BY_STOP_KEY: {"x": {"r"}, "y": {"r"}},
+        key.IDX_BY_STOP_BY_ROUTE_KEY: {"r": {"x": 0, "y": 1}},
+        key.TIMES_BY_STOP_BY_TRIP_KEY: times_by_stop_by_trip,
+        key.STOP_ID_SET_KEY: {"x", "y"},
+        key.ROUTE_ID_SET_KEY: {"r"},
+        key.TRIP_ID_SET_KEY: {"a", "b", "c"},
+    }
+
+
+def save_and_open(timetable: Timetable, tmp_path) -> Timetable:
+    path = os.path.join(tmp_path, "timetable")
+    timetable.save(path)
+    return Timetable.open(path)
+
+
+def test_earliest_trip_with_pointer(tmp_path):
+    structs = intern_structs(overtaking_structs_dict())
+    id_maps = IdMaps.from_structs(structs)
+    r = id_maps.intern_route("r")
+    x, y = id_maps.intern_stop("x"), id_maps.intern_stop("y")
+    a, b, c = [id_maps.intern_trip(trip_id) for trip_id in ["a", "b", "c"]]
+    for dq in [
+        DataQuerier(structs, None),
+        DataQuerier(Timetable.from_structs(structs), None),
+        DataQuerier(save_and_open(Timetable.from_structs(structs), tmp_path), None),
+    ]:
+        # sorted column, binary search
+        assert dq.earliest_trip_with_pointer(r, x, 150) == (b, 200, 1)
+        assert dq.earliest_trip_with_pointer(r, x, 150, 1) is None
+        assert dq.earliest_trip_with_pointer(r, x, 50, 1) == (a, 100, 0)
+        assert dq.earliest_trip_with_pointer(r, x, 601) is None
+
+        # unsorted column, linear scan in trip order
+        assert dq.earliest_trip_with_pointer(r, y, 250) == (a, 500, 0)
+        assert dq.earliest_trip_with_pointer(r, y, 600) == (c, 700, 2)
+        assert dq.earliest_trip_with_pointer(r, y, 600, 2) is None
+        assert dq.earliest_trip(r, y, 400) == (a, 500)
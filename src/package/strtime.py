@@ -1,4 +1,16 @@
 import sys
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+# str of times that are never reached, i.e. sys.maxsize seconds
+UNREACHED_STR_TIME = "--:--:--"
+
+_COLON = ord(":")
+_ZERO = ord("0")
+# times with fewer than three hour digits have the fixed width HH:MM:SS
+_MAX_FIXED_WIDTH_SECONDS = 100 * 3600
 
 
 def str_time_to_seconds(str_time: str) -> int:
@@ -15,14 +27,116 @@ def str_time_to_seconds(str_time: str) -> int:
     return total_seconds
 
 
+def str_times_to_seconds(
+    str_times: pd.Series | np.ndarray | Iterable[str],
+) -> np.ndarray:
+    """
+    Converts strs of format HH:MM:SS to seconds since midnight, like
+    `str_time_to_seconds`, but for all values at once. Can handle times that
+    go past midnight, and converts "--:--:--" to sys.maxsize, the inverse of
+    `seconds_to_str_times`.
+    """
+    str_times = np.asarray(
+        str_times.to_numpy() if isinstance(str_times, pd.Series) else list(str_times),
+        dtype=str,
+    )
+    seconds = np.empty(len(str_times), dtype=np.int64)
+    if len(str_times) == 0:
+        return seconds
+
+    is_unreached = str_times == UNREACHED_STR_TIME
+    seconds[is_unreached] = sys.maxsize
+    seconds[~is_unreached] = _parse_str_times(str_times[~is_unreached])
+    return seconds
+
+
+def _parse_str_times(str_times: np.ndarray) -> np.ndarray:
+    hours, minutes, seconds = _split_fixed_width(str_times)
+    if hours is None or minutes is None or seconds is None:
+        # e.g. H:MM:SS, which is allowed in GTFS
+        parts = pd.Series(str_times).str.split(":", expand=True)
+        if parts.shape[1] != 3 or parts.isna().to_numpy().any():
+            raise ValueError("Invalid time format")
+        hours, minutes, seconds = [
+            parts[i].astype(np.int64).to_numpy() for i in range(3)
+        ]
+
+    if (minutes >= 60).any() or (seconds >= 60).any():
+        raise ValueError("Invalid time format")
+
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def _split_fixed_width(
+    str_times: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray] | tuple[None, None, None]:
+    """
+    Reads hours, minutes and seconds from the code points of the strs, if
+    all of them have the format HH:MM:SS. Returns Nones otherwise.
+    """
+    if str_times.dtype.itemsize != 8 * 4:
+        return None, None, None
+
+    codes = str_times.view(np.uint32).reshape(-1, 8).astype(np.int64)
+    digits = codes[:, [0, 1, 3, 4, 6, 7]] - _ZERO
+    if (
+        (codes[:, 2] != _COLON).any()
+        or (codes[:, 5] != _COLON).any()
+        or (digits < 0).any()
+        or (digits > 9).any()
+    ):
+        return None, None, None
+
+    return (
+        digits[:, 0] * 10 + digits[:, 1],
+        digits[:, 2] * 10 + digits[:, 3],
+        digits[:, 4] * 10 + digits[:, 5],
+    )
+
+
 def seconds_to_str_time(seconds: int) -> str:
     """
     Converts seconds since midnight to a str of format HH:MM:SS.
     Can handle times that go past midnight.
     """
     if seconds == sys.maxsize:
-        return "--:--:--"
+        return UNREACHED_STR_TIME
     hours = seconds // 3600
     minutes = (seconds - hours * 3600) // 60
     seconds = seconds - hours * 3600 - minutes * 60
     return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
+def seconds_to_str_times(seconds: np.ndarray | Iterable[int]) -> np.ndarray:
+    """
+    Converts seconds since midnight to strs of format HH:MM:SS, like
+    `seconds_to_str_time`, but for all values at once. The strs are written
+    as code points, so there is no formatting per value, except for times
+    of 100 hours or more, for which the result has dtype object.
+    """
+    seconds = np.asarray(
+        seconds if isinstance(seconds, np.ndarray) else list(seconds), dtype=np.int64
+    )
+    is_unreached = seconds == sys.maxsize
+    is_fixed_width = (seconds >= 0) & (seconds < _MAX_FIXED_WIDTH_SECONDS)
+
+    fixed_width_seconds = np.where(is_fixed_width, seconds, 0)
+    hours = fixed_width_seconds // 3600
+    minutes = fixed_width_seconds % 3600 // 60
+    secs = fixed_width_seconds % 60
+
+    codes = np.empty((len(seconds), 8), dtype=np.uint32)
+    codes[:, [2, 5]] = _COLON
+    for column, values in [(0, hours), (3, minutes), (6, secs)]:
+        codes[:, column] = _ZERO + values // 10
+        codes[:, column + 1] = _ZERO + values % 10
+    codes[is_unreached] = [ord(char) for char in UNREACHED_STR_TIME]
+
+    str_times = codes.view("U8").reshape(-1)
+    is_other = ~(is_fixed_width | is_unreached)
+    if is_other.any():
+        str_times = str_times.astype(object)
+        str_times[is_other] = [
+            seconds_to_str_time(value) for value in seconds[is_other].tolist()
+        ]
+    return str_times
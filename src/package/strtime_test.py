@@ -1,7 +1,15 @@
 import pytest
 import sys
 
-from package.strtime import str_time_to_seconds, seconds_to_str_time
+import numpy as np
+import pandas as pd
+
+from package.strtime import (
+    str_time_to_seconds,
+    str_times_to_seconds,
+    seconds_to_str_time,
+    seconds_to_str_times,
+)
 
 
 def test_str_time_to_seconds():
@@ -50,3 +58,42 @@ def test_invalid_time_format():
         str_time_to_seconds("12:00:60")  # Invalid seconds
     with pytest.raises(ValueError):
         str_time_to_seconds("12:00:00:00")  # Extra field
+
+
+def test_str_times_to_seconds():
+    str_times = pd.Series(["00:00:00", "01:30:45", "25:30:45", "--:--:--"])
+    assert str_times_to_seconds(str_times).tolist() == [0, 5445, 91845, sys.maxsize]
+    # hours without leading zero and with three digits are not fixed width
+    assert str_times_to_seconds(["7:05:00", "10:00:00", "100:00:01"]).tolist() == [
+        25500,
+        36000,
+        360001,
+    ]
+    assert str_times_to_seconds(pd.Series([], dtype=str)).tolist() == []
+
+    with pytest.raises(ValueError):
+        str_times_to_seconds(pd.Series(["12:00:00", "12:00:60"]))
+    with pytest.raises(ValueError):
+        str_times_to_seconds(pd.Series(["12:00:00", "12:00"]))
+    with pytest.raises(ValueError):
+        str_times_to_seconds(["12:0a:00"])
+
+
+def test_seconds_to_str_times():
+    seconds = np.array([0, 5445, 91845, sys.maxsize, 360001])
+    assert seconds_to_str_times(seconds).tolist() == [
+        "00:00:00",
+        "01:30:45",
+        "25:30:45",
+        "--:--:--",
+        "100:00:01",
+    ]
+    assert seconds_to_str_times([]).tolist() == []
+
+
+def test_vectorized_conversions_match_scalar_conversions():
+    seconds = np.arange(0, 48 * 3600, 17)
+    str_times = seconds_to_str_times(seconds)
+
+    assert str_times.tolist() == [seconds_to_str_time(s) for s in seconds.tolist()]
+    assert str_times_to_seconds(str_times).tolist() == seconds.tolist()
@@ -1,8 +1,10 @@
-from typing import Any
+import hashlib
+from typing import Any, Optional
+import numpy as np
 import pandas as pd
-from package.logger import Timed
+from package.logger import Timed, rlog
 
-from package.strtime import str_time_to_seconds
+from package.strtime import str_times_to_seconds
 from package.key import (
     STOP_TIMES_BY_TRIP_KEY,
     TRIP_IDS_BY_ROUTE_KEY,
@@ -13,6 +15,7 @@ from package.key import (
     STOP_ID_SET_KEY,
     ROUTE_ID_SET_KEY,
     TRIP_ID_SET_KEY,
+    ROUTE_HASHES_KEY,
 )
 
 STRUCTS_KEYS = [
@@ -29,22 +32,56 @@ STRUCTS_KEYS = [
 
 
 def build_structures(
-    trips_df: pd.DataFrame, stop_times_df: pd.DataFrame
+    trips_df: pd.DataFrame,
+    stop_times_df: pd.DataFrame,
+    previous: Optional[dict[str, Any]] = None,
 ) -> dict[str, Any]:
-    with Timed.info("Creating `stop_times_by_trip`"):
-        stop_times_by_trip = create_stop_times_by_trip(stop_times_df)
-    with Timed.info("Creating `trip_ids_by_route`"):
-        trip_ids_by_route = create_trip_ids_by_route_sorted_by_departure(trips_df)
-    with Timed.info("Creating `stops_by_route`"):
-        stops_by_route = create_stops_by_route_ordered(
-            trip_ids_by_route, stop_times_by_trip
+    """
+    Builds the structs from the cleaned trips and stop times. The stop times
+    are sorted once and the structs are derived column-wise from the sorted
+    frame, which gives the same structs as the per-trip `create_*` functions.
+
+    The structs contain a content hash per route. If the (not interned)
+    structs of a previous build are given, only the routes whose hash changed
+    are built again, the blocks of all other routes and their trips are taken
+    from `previous`.
+    """
+    with Timed.info("Hashing routes"):
+        route_hashes = create_route_hashes(trips_df, stop_times_df)
+
+    if previous is None or ROUTE_HASHES_KEY not in previous:
+        route_blocks = build_route_blocks(trips_df, stop_times_df)
+    else:
+        changed_route_ids = {
+            route_id
+            for route_id, route_hash in route_hashes.items()
+            if previous[ROUTE_HASHES_KEY].get(route_id) != route_hash
+        }
+        rlog.info(
+            f"{len(changed_route_ids)} of {len(route_hashes)} routes changed, rebuilding them"
+        )
+        changed_trips_df = trips_df[trips_df["route_id"].isin(changed_route_ids)]
+        # stop times without a trip are not part of any route and therefore
+        # always built again
+        changed_stop_times_df = stop_times_df[
+            stop_times_df["trip_id"].isin(changed_trips_df["trip_id"])
+            | ~stop_times_df["trip_id"].isin(trips_df["trip_id"])
+        ]
+        route_blocks = merge_route_blocks(
+            previous,
+            build_route_blocks(changed_trips_df, changed_stop_times_df),
+            set(route_hashes) - changed_route_ids,
         )
+
+    (
+        stop_times_by_trip,
+        trip_ids_by_route,
+        stops_by_route,
+        idx_by_stop_by_route,
+        times_by_stop_by_trip,
+    ) = route_blocks
     with Timed.info("Creating `routes_by_stop`"):
         routes_by_stop = create_routes_by_stop(stops_by_route)
-    with Timed.info("Creating `idx_by_stop_by_route`"):
-        idx_by_stop_by_route = create_idx_by_stop_by_route(stops_by_route)
-    with Timed.info("Creating `times_by_stop_by_trip`"):
-        times_by_stop_by_trip = create_times_by_stop_by_trip(stop_times_by_trip)
 
     with Timed.info("Creating id sets"):
         stop_id_set, route_id_set, trip_id_set = create_id_sets(
@@ -61,28 +98,203 @@ def build_structures(
         STOP_ID_SET_KEY: stop_id_set,
         ROUTE_ID_SET_KEY: route_id_set,
         TRIP_ID_SET_KEY: trip_id_set,
+        ROUTE_HASHES_KEY: route_hashes,
     }
     return data
 
 
+RouteBlocks = tuple[
+    "StopTimesByTrip",
+    "TripIdsByRouteSortedByDeparture",
+    "StopsByRouteOrdered",
+    "IdxByStopByRoute",
+    "TimesByStopByTrip",
+]
+
+
+def build_route_blocks(
+    trips_df: pd.DataFrame, stop_times_df: pd.DataFrame
+) -> RouteBlocks:
+    """
+    Builds the structs that are keyed by route or trip, i.e. all structs that
+    only depend on the trips of a route and their stop times.
+    """
+    with Timed.info("Sorting stop times"):
+        stop_times_df = sort_stop_times(stop_times_df)
+    with Timed.info("Creating `stop_times_by_trip`"):
+        stop_times_by_trip = create_stop_times_by_trip_from_df(stop_times_df)
+    with Timed.info("Creating `trip_ids_by_route`"):
+        trip_ids_by_route = create_trip_ids_by_route_sorted_by_departure(trips_df)
+    with Timed.info("Creating `stops_by_route`"):
+        stops_by_route = create_stops_by_route_ordered_from_df(
+            trip_ids_by_route, stop_times_df
+        )
+    with Timed.info("Creating `idx_by_stop_by_route`"):
+        idx_by_stop_by_route = create_idx_by_stop_by_route(stops_by_route)
+    with Timed.info("Creating `times_by_stop_by_trip`"):
+        times_by_stop_by_trip = create_times_by_stop_by_trip_from_df(stop_times_df)
+
+    return (
+        stop_times_by_trip,
+        trip_ids_by_route,
+        stops_by_route,
+        idx_by_stop_by_route,
+        times_by_stop_by_trip,
+    )
+
+
+def merge_route_blocks(
+    previous: dict[str, Any],
+    rebuilt: RouteBlocks,
+    unchanged_route_ids: set[str],
+) -> RouteBlocks:
+    """
+    Merges the blocks of the unchanged routes of `previous` with the rebuilt
+    blocks. Keys are ordered as in a full build, so the merged structs are
+    interned to the same ids.
+    """
+    (
+        stop_times_by_trip,
+        trip_ids_by_route,
+        stops_by_route,
+        idx_by_stop_by_route,
+        times_by_stop_by_trip,
+    ) = rebuilt
+
+    for route_id in unchanged_route_ids:
+        trip_ids_by_route[route_id] = previous[TRIP_IDS_BY_ROUTE_KEY][route_id]
+        stops_by_route[route_id] = previous[STOPS_BY_ROUTE_KEY][route_id]
+        idx_by_stop_by_route[route_id] = previous[IDX_BY_STOP_BY_ROUTE_KEY][route_id]
+        for trip_id in trip_ids_by_route[route_id]:
+            if trip_id in previous[STOP_TIMES_BY_TRIP_KEY]:
+                stop_times_by_trip[trip_id] = previous[STOP_TIMES_BY_TRIP_KEY][trip_id]
+                times_by_stop_by_trip[trip_id] = previous[TIMES_BY_STOP_BY_TRIP_KEY][
+                    trip_id
+                ]
+
+    return (
+        sort_by_key(stop_times_by_trip),
+        sort_by_key(trip_ids_by_route),
+        sort_by_key(stops_by_route),
+        sort_by_key(idx_by_stop_by_route),
+        sort_by_key(times_by_stop_by_trip),
+    )
+
+
+def sort_by_key(d: dict) -> dict:
+    return {k: d[k] for k in sorted(d)}
+
+
+RouteHashes = dict[str, str]
+
+TRIP_HASH_COLUMNS = ["route_id", "trip_id", "trip_departure_time"]
+
+
+def create_route_hashes(
+    trips_df: pd.DataFrame, stop_times_df: pd.DataFrame
+) -> RouteHashes:
+    """
+    Returns a content hash per route, over the trips of the route and their
+    stop times. The hash only covers the columns the structs are built from
+    and does not depend on the order of the rows, so it changes exactly when
+    the structs of the route change.
+    """
+    trips_df = trips_df[TRIP_HASH_COLUMNS]
+    stop_times_df = stop_times_df[["trip_id", *STOP_TIME_COLUMNS]].merge(
+        trips_df[["trip_id", "route_id"]], on="trip_id"
+    )
+    row_hashes_df = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "route_id": trips_df["route_id"].to_numpy(),
+                    "hash": pd.util.hash_pandas_object(
+                        trips_df, index=False
+                    ).to_numpy(),
+                }
+            ),
+            pd.DataFrame(
+                {
+                    "route_id": stop_times_df["route_id"].to_numpy(),
+                    "hash": pd.util.hash_pandas_object(
+                        stop_times_df[["trip_id", *STOP_TIME_COLUMNS]], index=False
+                    ).to_numpy(),
+                }
+            ),
+        ],
+        ignore_index=True,
+    ).sort_values(["route_id", "hash"])
+
+    route_ids = row_hashes_df["route_id"].to_numpy()
+    row_hashes = row_hashes_df["hash"].to_numpy(dtype=np.uint64)
+    if len(route_ids) == 0:
+        return {}
+    starts = np.flatnonzero(route_ids[1:] != route_ids[:-1]) + 1
+    offsets = np.concatenate([[0], starts, [len(route_ids)]])
+    return {
+        route_ids[offsets[i]]: hashlib.blake2b(
+            row_hashes[offsets[i] : offsets[i + 1]].tobytes(), digest_size=16
+        ).hexdigest()
+        for i in range(len(offsets) - 1)
+    }
+
+
 StopTimesByTrip = dict[str, list[dict[str, str]]]
 
 
+STOP_TIME_COLUMNS = ["arrival_time", "departure_time", "stop_id", "stop_sequence"]
+
+
+def sort_stop_times(stop_times_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sorts the stop times by trip and stop sequence, so that the stop times of
+    a trip are contiguous and in order. Sorting an already sorted frame does
+    not change it.
+    """
+    stop_times_df = stop_times_df[stop_times_df["trip_id"].notna()]
+    return stop_times_df.sort_values(["trip_id", "stop_sequence"]).reset_index(
+        drop=True
+    )
+
+
+def create_trip_offsets(sorted_stop_times_df: pd.DataFrame) -> tuple[list, list[int]]:
+    """
+    Returns the trip ids of the sorted stop times and the offsets of their
+    stop times, i.e. the stop times of the i-th trip are the rows
+    `offsets[i]:offsets[i + 1]`.
+    """
+    trip_ids = sorted_stop_times_df["trip_id"].to_numpy()
+    if len(trip_ids) == 0:
+        return [], [0]
+    starts = np.flatnonzero(trip_ids[1:] != trip_ids[:-1]) + 1
+    offsets = np.concatenate([[0], starts, [len(trip_ids)]]).astype(np.int64)
+    return trip_ids[offsets[:-1]].tolist(), offsets.tolist()
+
+
 def create_stop_times_by_trip(stop_times_df: pd.DataFrame) -> dict:
     with Timed.debug("grouping by trip and sorting by stop sequence"):
-        stop_times_df = stop_times_df.sort_values(["trip_id", "stop_sequence"])
-        grouped = stop_times_df.groupby("trip_id")
+        stop_times_df = sort_stop_times(stop_times_df)
+
+    return create_stop_times_by_trip_from_df(stop_times_df)
+
 
-    stop_times_by_trip = {}
+def create_stop_times_by_trip_from_df(
+    sorted_stop_times_df: pd.DataFrame,
+) -> StopTimesByTrip:
+    trip_ids, offsets = create_trip_offsets(sorted_stop_times_df)
 
     with Timed.debug("creating stop_times_by_trip dictionary from dataframe"):
-        for trip_id, group in grouped:
-            stop_times = stop_times_by_trip.get(trip_id, [])
-            records = group[
-                ["arrival_time", "departure_time", "stop_id", "stop_sequence"]
-            ].to_dict("records")
-            stop_times.extend(records)
-            stop_times_by_trip[trip_id] = stop_times
+        # one record per stop time, with the keys in the order of the columns
+        records = [
+            dict(zip(STOP_TIME_COLUMNS, values))
+            for values in zip(
+                *[sorted_stop_times_df[column].tolist() for column in STOP_TIME_COLUMNS]
+            )
+        ]
+        stop_times_by_trip = {
+            trip_id: records[offsets[i] : offsets[i + 1]]
+            for i, trip_id in enumerate(trip_ids)
+        }
 
     return stop_times_by_trip
 
@@ -94,7 +306,9 @@ def create_trip_ids_by_route_sorted_by_departure(
     trips_df: pd.DataFrame,
 ) -> TripIdsByRouteSortedByDeparture:
     return (
-        trips_df.sort_values("trip_departure_time")
+        # stable, so that trips departing at the same time are ordered the
+        # same when only some of the routes are built
+        trips_df.sort_values("trip_departure_time", kind="stable")
         .groupby("route_id")["trip_id"]
         .apply(lambda x: x.tolist())
         .to_dict()
@@ -127,6 +341,40 @@ def create_stops_by_route_ordered(
     return stops_by_route
 
 
+def create_stops_by_route_ordered_from_df(
+    trip_ids_by_route: TripIdsByRouteSortedByDeparture,
+    sorted_stop_times_df: pd.DataFrame,
+) -> StopsByRouteOrdered:
+    """
+    Same as `create_stops_by_route_ordered`, but on the sorted stop times:
+    the stops of a route are its first visits to every stop, ordered by the
+    departure of the trip and the stop sequence.
+    """
+    route_trips_df = pd.DataFrame(
+        [
+            (route_pos, trip_pos, trip_id)
+            for route_pos, trip_ids in enumerate(trip_ids_by_route.values())
+            for trip_pos, trip_id in enumerate(trip_ids)
+        ],
+        columns=["route_pos", "trip_pos", "trip_id"],
+    )
+    stops_df = (
+        sorted_stop_times_df[["trip_id", "stop_id"]]
+        .reset_index(names="row")
+        .merge(route_trips_df, on="trip_id")
+        .sort_values(["route_pos", "trip_pos", "row"])
+        .drop_duplicates(["route_pos", "stop_id"])
+    )
+
+    route_pos = stops_df["route_pos"].to_numpy()
+    stops = stops_df["stop_id"].tolist()
+    offsets = np.searchsorted(route_pos, np.arange(len(trip_ids_by_route) + 1))
+    return {
+        route_id: stops[offsets[i] : offsets[i + 1]]
+        for i, route_id in enumerate(trip_ids_by_route)
+    }
+
+
 RoutesByStop = dict[str, set[str]]
 
 
@@ -175,18 +423,46 @@ TimesByStopByTrip = dict[str, dict[str, tuple[int, int]]]
 def create_times_by_stop_by_trip(
     stop_times_by_trip: StopTimesByTrip,
 ) -> TimesByStopByTrip:
+    stop_times = [stop for stops in stop_times_by_trip.values() for stop in stops]
+    times = iter(
+        zip(
+            str_times_to_seconds(
+                [stop["arrival_time"] for stop in stop_times]
+            ).tolist(),
+            str_times_to_seconds(
+                [stop["departure_time"] for stop in stop_times]
+            ).tolist(),
+        )
+    )
     return {
-        trip_id: {
-            stop["stop_id"]: (
-                str_time_to_seconds(stop["arrival_time"]),
-                str_time_to_seconds(stop["departure_time"]),
-            )
-            for stop in stops
-        }
+        trip_id: {stop["stop_id"]: next(times) for stop in stops}
         for (trip_id, stops) in stop_times_by_trip.items()
     }
 
 
+def create_times_by_stop_by_trip_from_df(
+    sorted_stop_times_df: pd.DataFrame,
+) -> TimesByStopByTrip:
+    """
+    Same as `create_times_by_stop_by_trip`, but on the sorted stop times, with
+    the times parsed column-wise.
+    """
+    trip_ids, offsets = create_trip_offsets(sorted_stop_times_df)
+    stops = sorted_stop_times_df["stop_id"].tolist()
+    times = list(
+        zip(
+            str_times_to_seconds(sorted_stop_times_df["arrival_time"]).tolist(),
+            str_times_to_seconds(sorted_stop_times_df["departure_time"]).tolist(),
+        )
+    )
+    return {
+        trip_id: dict(
+            zip(stops[offsets[i] : offsets[i + 1]], times[offsets[i] : offsets[i + 1]])
+        )
+        for i, trip_id in enumerate(trip_ids)
+    }
+
+
 def validate_structs_dict(structs: dict):
     for key in STRUCTS_KEYS:
         if not key in structs:
@@ -1,15 +1,19 @@
 import pandas as pd
 
+from package.structs import build
 from package.structs.build import (
+    build_structures,
     create_id_sets,
+    create_route_hashes,
     create_idx_by_stop_by_route,
     create_routes_by_stop,
     create_stop_times_by_trip,
     create_times_by_stop_by_trip,
     create_trip_ids_by_route_sorted_by_departure,
 )
-from package import strtime
+from package import key, strtime
 from package.structs.build import create_stops_by_route_ordered
+from package.structs.intern import intern_structs, unintern_structs
 
 
 def test_create_stop_times_by_trip(stop_times_df: pd.DataFrame):
@@ -216,3 +220,80 @@ def test_create_times_by_stop_by_trip(
     assert times_by_stop_by_trip == expected_times_by_stop_by_trip
 
 
+
+
+def test_build_structures_matches_per_trip_functions(
+    cleaned_trips_df: pd.DataFrame, stop_times_df: pd.DataFrame
+):
+    # the column-wise build must give the same structs as the per-trip functions
+    shuffled_stop_times_df = stop_times_df.sample(frac=1, random_state=0)
+    structs = build_structures(cleaned_trips_df, shuffled_stop_times_df)
+
+    stop_times_by_trip = create_stop_times_by_trip(stop_times_df)
+    trip_ids_by_route = create_trip_ids_by_route_sorted_by_departure(cleaned_trips_df)
+    stops_by_route = create_stops_by_route_ordered(
+        trip_ids_by_route, stop_times_by_trip
+    )
+    times_by_stop_by_trip = create_times_by_stop_by_trip(stop_times_by_trip)
+
+    assert structs[key.STOP_TIMES_BY_TRIP_KEY] == stop_times_by_trip
+    assert structs[key.STOPS_BY_ROUTE_KEY] == stops_by_route
+    assert structs[key.TIMES_BY_STOP_BY_TRIP_KEY] == times_by_stop_by_trip
+    assert list(structs[key.TIMES_BY_STOP_BY_TRIP_KEY]["trip2"]) == [
+        "stop1",
+        "stop4",
+        "stop3",
+    ]
+    assert structs[key.ROUTES_BY_STOP_KEY] == create_routes_by_stop(stops_by_route)
+
+
+def test_build_structures_rebuilds_changed_routes(
+    monkeypatch, cleaned_trips_df: pd.DataFrame, stop_times_df: pd.DataFrame
+):
+    previous = unintern_structs(
+        intern_structs(build_structures(cleaned_trips_df, stop_times_df))
+    )
+
+    # trip3 leaves stop2 five minutes later, only its route changes
+    changed_stop_times_df = stop_times_df.copy()
+    changed = (changed_stop_times_df["trip_id"] == "trip3") & (
+        changed_stop_times_df["stop_id"] == "stop2"
+    )
+    changed_stop_times_df.loc[changed, "departure_time"] = "02:15:00"
+    expected = build_structures(cleaned_trips_df, changed_stop_times_df)
+
+    changed_hashes = {
+        route_id
+        for route_id, route_hash in expected[key.ROUTE_HASHES_KEY].items()
+        if previous[key.ROUTE_HASHES_KEY][route_id] != route_hash
+    }
+    assert changed_hashes == {"route1_1_A"}
+
+    built_trips: list[str] = []
+    create_stop_times_by_trip_from_df = build.create_stop_times_by_trip_from_df
+
+    def record_built_trips(sorted_stop_times_df: pd.DataFrame):
+        built_trips.extend(sorted_stop_times_df["trip_id"].unique())
+        return create_stop_times_by_trip_from_df(sorted_stop_times_df)
+
+    monkeypatch.setattr(build, "create_stop_times_by_trip_from_df", record_built_trips)
+    structs = build_structures(cleaned_trips_df, changed_stop_times_df, previous)
+
+    assert built_trips == ["trip3"]
+    assert structs == expected
+    assert list(structs[key.TRIP_IDS_BY_ROUTE_KEY]) == list(
+        expected[key.TRIP_IDS_BY_ROUTE_KEY]
+    )
+    assert structs[key.TIMES_BY_STOP_BY_TRIP_KEY]["trip3"]["stop2"] == (7800, 8100)
+
+
+def test_route_hashes_ignore_row_order(
+    cleaned_trips_df: pd.DataFrame, stop_times_df: pd.DataFrame
+):
+    route_hashes = create_route_hashes(cleaned_trips_df, stop_times_df)
+
+    assert list(route_hashes) == ["route1_0_A", "route1_0_B", "route1_1_A"]
+    assert route_hashes == create_route_hashes(
+        cleaned_trips_df.sample(frac=1, random_state=0),
+        stop_times_df.sample(frac=1, random_state=0),
+    )
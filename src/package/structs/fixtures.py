@@ -1,7 +1,10 @@
+from typing import Any
+
 import pytest
 import pandas as pd
 
 from package.structs.build import (
+    build_structures,
     create_id_sets,
     create_idx_by_stop_by_route,
     create_routes_by_stop,
@@ -56,3 +59,20 @@ def test_create_id_sets(
     trips_df: pd.DataFrame, routes_by_stop: dict[str, set[str]]
 ) -> tuple[set[str], set[str], set[str]]:
     return create_id_sets(trips_df, routes_by_stop)
+
+
+@pytest.fixture
+def structs_dict(
+    cleaned_trips_df: pd.DataFrame, stop_times_df: pd.DataFrame
+) -> dict[str, Any]:
+    return build_structures(cleaned_trips_df, stop_times_df)
+
+
+@pytest.fixture
+def footpaths_dict() -> dict[str, dict[str, int]]:
+    return {
+        "stop1": {},
+        "stop2": {"stop4": 120},
+        "stop3": {},
+        "stop4": {"stop2": 120},
+    }
@@ -0,0 +1,182 @@
+from typing import Any, Iterable
+from typing_extensions import Self
+
+import numpy as np
+
+CSR_STOP_IDS_KEY = "stop_ids"
+CSR_OFFSETS_KEY = "offsets"
+CSR_NEIGHBORS_KEY = "neighbors"
+CSR_WALKING_TIMES_KEY = "walking_times"
+
+
+class Footpaths:
+    """
+    Footpaths between (interned) stops in compressed sparse row format.
+
+    The footpaths of stop `i` lead to `neighbors[offsets[i]:offsets[i + 1]]`
+    and take the respective `walking_times` in seconds. Compared to a dict of
+    dicts this needs three flat arrays instead of a dict per stop, and the
+    footpaths of many stops can be gathered with a few NumPy operations.
+    """
+
+    def __init__(
+        self: Self,
+        offsets: np.ndarray,
+        neighbors: np.ndarray,
+        walking_times: np.ndarray,
+    ):
+        if len(offsets) == 0 or offsets[-1] != len(neighbors):
+            raise ValueError("offsets do not match the number of footpaths")
+        if len(neighbors) != len(walking_times):
+            raise ValueError("neighbors and walking_times must have equal length")
+
+        self.offsets = offsets.astype(np.int64, copy=False)
+        self.neighbors = neighbors.astype(np.int64, copy=False)
+        self.walking_times = walking_times.astype(np.int64, copy=False)
+
+        # plain lists for the scalar lookups of the Python engines
+        self.neighbor_list: list[int] = self.neighbors.tolist()
+        self.walking_time_list: list[int] = self.walking_times.tolist()
+        self.offset_list: list[int] = self.offsets.tolist()
+
+    @property
+    def n_stops(self: Self) -> int:
+        return len(self.offsets) - 1
+
+    @staticmethod
+    def from_dict(footpaths: dict[int, dict[int, int]], n_stops: int) -> "Footpaths":
+        counts = np.zeros(n_stops, dtype=np.int64)
+        for stop_id, nearby_stops in footpaths.items():
+            counts[stop_id] = len(nearby_stops)
+        offsets = np.zeros(n_stops + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        neighbors = np.empty(offsets[-1], dtype=np.int64)
+        walking_times = np.empty(offsets[-1], dtype=np.int64)
+        for stop_id, nearby_stops in footpaths.items():
+            start = offsets[stop_id]
+            end = start + len(nearby_stops)
+            neighbors[start:end] = list(nearby_stops.keys())
+            walking_times[start:end] = list(nearby_stops.values())
+
+        return Footpaths(offsets, neighbors, walking_times)
+
+    @staticmethod
+    def from_edges(
+        sources: np.ndarray,
+        targets: np.ndarray,
+        walking_times: np.ndarray,
+        n_stops: int,
+    ) -> "Footpaths":
+        order = np.argsort(sources, kind="stable")
+        counts = np.bincount(sources, minlength=n_stops)
+        offsets = np.zeros(n_stops + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return Footpaths(offsets, targets[order], walking_times[order])
+
+    def to_dict(self: Self) -> dict[int, dict[int, int]]:
+        return {stop_id: dict(self.items(stop_id)) for stop_id in range(self.n_stops)}
+
+    def items(self: Self, stop_id: int) -> Iterable[tuple[int, int]]:
+        """
+        Returns the (nearby stop, walking time) tuples of the stop, like
+        `footpaths[stop_id].items()` of the dict format.
+        """
+        start = self.offset_list[stop_id]
+        end = self.offset_list[stop_id + 1]
+        return zip(
+            self.neighbor_list[start:end],
+            self.walking_time_list[start:end],
+        )
+
+    def sources(self: Self) -> np.ndarray:
+        """
+        Returns the start stop of every footpath.
+        """
+        return np.repeat(np.arange(self.n_stops), np.diff(self.offsets))
+
+    def gather(
+        self: Self, stop_ids: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns all footpaths starting at the given stops as three arrays: the
+        position of the start stop in `stop_ids`, the nearby stop and the
+        walking time.
+        """
+        starts = self.offsets[stop_ids]
+        counts = self.offsets[stop_ids + 1] - starts
+        total = int(counts.sum())
+
+        # positions of the footpaths in the flat arrays: for every stop a run
+        # from its start offset, built without a Python loop
+        run_starts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        edges = run_starts + np.arange(total)
+
+        return (
+            np.repeat(np.arange(len(stop_ids)), counts),
+            self.neighbors[edges],
+            self.walking_times[edges],
+        )
+
+
+def create_csr_dict(footpaths: dict[str, dict[str, int]]) -> dict[str, Any]:
+    """
+    Stores footpaths keyed by GTFS stop ids in the CSR format: the stops are
+    listed once in `stop_ids`, and footpaths refer to them by index.
+    """
+    stop_ids = sorted(
+        set(footpaths.keys())
+        | {stop_id for nearby_stops in footpaths.values() for stop_id in nearby_stops}
+    )
+    idx_by_stop_id = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+    offsets = [0]
+    neighbors: list[int] = []
+    walking_times: list[int] = []
+    for stop_id in stop_ids:
+        for nearby_stop_id, walking_time in footpaths.get(stop_id, {}).items():
+            neighbors.append(idx_by_stop_id[nearby_stop_id])
+            walking_times.append(walking_time)
+        offsets.append(len(neighbors))
+
+    return {
+        CSR_STOP_IDS_KEY: stop_ids,
+        CSR_OFFSETS_KEY: np.array(offsets, dtype=np.int64),
+        CSR_NEIGHBORS_KEY: np.array(neighbors, dtype=np.int64),
+        CSR_WALKING_TIMES_KEY: np.array(walking_times, dtype=np.int32),
+    }
+
+
+def create_csr_dict_from_edges(
+    sources: np.ndarray, targets: np.ndarray, walking_times: np.ndarray
+) -> dict[str, Any]:
+    """
+    Like `create_csr_dict`, but for footpaths given as edges between GTFS
+    stop ids, so that no dict has to be built per stop. Duplicate edges are
+    kept once.
+    """
+    stop_ids, stop_idx = np.unique(
+        np.concatenate([sources, targets]).astype(str), return_inverse=True
+    )
+    source_idx, target_idx = stop_idx[: len(sources)], stop_idx[len(sources) :]
+    _, first_idx = np.unique(
+        np.stack([source_idx, target_idx]), axis=1, return_index=True
+    )
+    first_idx.sort()
+
+    footpaths = Footpaths.from_edges(
+        source_idx[first_idx],
+        target_idx[first_idx],
+        walking_times[first_idx],
+        len(stop_ids),
+    )
+    return {
+        CSR_STOP_IDS_KEY: stop_ids.tolist(),
+        CSR_OFFSETS_KEY: footpaths.offsets,
+        CSR_NEIGHBORS_KEY: footpaths.neighbors,
+        CSR_WALKING_TIMES_KEY: footpaths.walking_times.astype(np.int32),
+    }
+
+
+def is_csr_dict(footpaths: dict) -> bool:
+    return CSR_OFFSETS_KEY in footpaths and CSR_STOP_IDS_KEY in footpaths
@@ -0,0 +1,55 @@
+import numpy as np
+
+from package.structs.footpaths import (
+    Footpaths,
+    create_csr_dict,
+    create_csr_dict_from_edges,
+)
+
+FOOTPATHS = {0: {2: 60, 3: 120}, 1: {}, 2: {0: 60}, 3: {0: 120, 2: 30}}
+
+
+def test_footpaths_from_dict():
+    footpaths = Footpaths.from_dict(FOOTPATHS, 4)
+
+    assert footpaths.offsets.tolist() == [0, 2, 2, 3, 5]
+    assert list(footpaths.items(0)) == [(2, 60), (3, 120)]
+    assert list(footpaths.items(1)) == []
+    assert footpaths.to_dict() == FOOTPATHS
+
+
+def test_footpaths_gather():
+    footpaths = Footpaths.from_dict(FOOTPATHS, 4)
+
+    positions, targets, walking_times = footpaths.gather(np.array([3, 1, 0]))
+
+    assert positions.tolist() == [0, 0, 2, 2]
+    assert targets.tolist() == [0, 2, 2, 3]
+    assert walking_times.tolist() == [120, 30, 60, 120]
+
+
+def test_footpaths_from_edges():
+    footpaths = Footpaths.from_edges(
+        np.array([3, 0, 2, 3, 0]),
+        np.array([0, 2, 0, 2, 3]),
+        np.array([120, 60, 60, 30, 120]),
+        4,
+    )
+
+    assert footpaths.to_dict() == FOOTPATHS
+
+
+def test_create_csr_dict_from_edges():
+    footpaths_dict = {"a": {"b": 60, "c": 120}, "b": {"a": 60}, "d": {"a": 30}}
+
+    csr_dict = create_csr_dict_from_edges(
+        np.array(["d", "a", "b", "a", "a"]),
+        np.array(["a", "b", "a", "c", "b"]),
+        np.array([30, 60, 60, 120, 60]),
+    )
+
+    expected = create_csr_dict(footpaths_dict)
+    assert csr_dict["stop_ids"] == expected["stop_ids"]
+    for key in ["offsets", "neighbors", "walking_times"]:
+        assert csr_dict[key].tolist() == expected[key].tolist()
+        assert csr_dict[key].dtype == expected[key].dtype
@@ -0,0 +1,337 @@
+from collections import deque
+from typing import Any, Optional
+
+import pandas as pd
+
+from package.key import (
+    ID_MAPS_KEY,
+    STOP_TIMES_BY_TRIP_KEY,
+    TRIP_IDS_BY_ROUTE_KEY,
+    STOPS_BY_ROUTE_KEY,
+    ROUTES_BY_STOP_KEY,
+    IDX_BY_STOP_BY_ROUTE_KEY,
+    TIMES_BY_STOP_BY_TRIP_KEY,
+    STOP_ID_SET_KEY,
+    ROUTE_ID_SET_KEY,
+    TRIP_ID_SET_KEY,
+    ROUTE_HASHES_KEY,
+)
+from package.logger import Timed, rlog
+from package.structs import build, intern
+from package.structs.intern import IdMaps
+
+
+def build_structures_interned(
+    trips_df: pd.DataFrame,
+    stop_times_df: pd.DataFrame,
+    previous: Optional[dict[str, Any]] = None,
+) -> dict[str, Any]:
+    """
+    Builds the interned structs from the cleaned trips and stop times.
+
+    If the interned structs of a previous build are given, only the routes
+    whose content hash changed are built and interned. The blocks of all other
+    routes are reused as they are, and so are their integer ids: the ids of
+    the previous build are kept, new stops, routes and trips take the ids that
+    were freed, and the remaining gaps are closed by moving the highest ids
+    into them. Unlike a full build, the ids are therefore not in sorted order.
+    """
+    if previous is None or not intern.is_interned(previous):
+        return intern.intern_structs(
+            build.build_structures(trips_df, stop_times_df, previous)
+        )
+    if ROUTE_HASHES_KEY not in previous:
+        return intern.intern_structs(build.build_structures(trips_df, stop_times_df))
+
+    with Timed.info("Hashing routes"):
+        route_hashes = build.create_route_hashes(trips_df, stop_times_df)
+    previous_hashes: dict[str, str] = previous[ROUTE_HASHES_KEY]
+    changed_route_ids = {
+        route_id
+        for route_id, route_hash in route_hashes.items()
+        if previous_hashes.get(route_id) != route_hash
+    }
+    removed_route_ids = set(previous_hashes) - set(route_hashes)
+    rlog.info(
+        f"{len(changed_route_ids)} of {len(route_hashes)} routes changed and "
+        + f"{len(removed_route_ids)} were removed, rebuilding them"
+    )
+
+    changed_trips_df = trips_df[trips_df["route_id"].isin(changed_route_ids)]
+    changed_stop_times_df = stop_times_df[
+        stop_times_df["trip_id"].isin(changed_trips_df["trip_id"])
+    ]
+    (
+        stop_times_by_trip,
+        trip_ids_by_route,
+        stops_by_route,
+        idx_by_stop_by_route,
+        times_by_stop_by_trip,
+    ) = build.build_route_blocks(changed_trips_df, changed_stop_times_df)
+
+    with Timed.info("Interning rebuilt routes"):
+        structs = InternedStructs(previous)
+        structs.remove_routes(changed_route_ids | removed_route_ids)
+        structs.allocate_ids(
+            stops={stop_id for stops in stops_by_route.values() for stop_id in stops},
+            routes=trip_ids_by_route.keys(),
+            trips={
+                trip_id for trips in trip_ids_by_route.values() for trip_id in trips
+            },
+        )
+        structs.add_routes(
+            stop_times_by_trip,
+            trip_ids_by_route,
+            stops_by_route,
+            idx_by_stop_by_route,
+            times_by_stop_by_trip,
+        )
+
+    return structs.to_dict(route_hashes)
+
+
+class InternedStructs:
+    """
+    Mutable copy of interned structs, in which routes can be removed and
+    added while the blocks of all other routes are shared with the original.
+    """
+
+    def __init__(self, structs_dict: dict[str, Any]):
+        self.id_maps = IdMaps.from_structs(structs_dict)
+        self.stop_ids = list(self.id_maps.stop_ids)
+        self.route_ids = list(self.id_maps.route_ids)
+        self.trip_ids = list(self.id_maps.trip_ids)
+
+        # shallow copies, the blocks of a route are only replaced, never
+        # changed in place
+        self.stop_times_by_trip = dict(structs_dict[STOP_TIMES_BY_TRIP_KEY])
+        self.trip_ids_by_route = dict(structs_dict[TRIP_IDS_BY_ROUTE_KEY])
+        self.stops_by_route = dict(structs_dict[STOPS_BY_ROUTE_KEY])
+        self.routes_by_stop = dict(structs_dict[ROUTES_BY_STOP_KEY])
+        self.idx_by_stop_by_route = dict(structs_dict[IDX_BY_STOP_BY_ROUTE_KEY])
+        self.times_by_stop_by_trip = dict(structs_dict[TIMES_BY_STOP_BY_TRIP_KEY])
+
+        self.removed_stops: set[int] = set()
+        self.removed_routes: set[int] = set()
+        self.removed_trips: set[int] = set()
+        self.trips_of_removed_routes: set[int] = set()
+
+    def remove_routes(self, route_ids: set[str]):
+        """
+        Removes the routes with the given GTFS ids and their trips, routes that
+        do not exist are skipped. Stops that are no longer served by any route
+        are marked as removed.
+        """
+        for gtfs_route_id in route_ids:
+            if gtfs_route_id not in self.id_maps.route_id_by_gtfs_id:
+                continue
+            route_id = self.id_maps.intern_route(gtfs_route_id)
+            for stop_id in self.stops_by_route.pop(route_id):
+                self.routes_by_stop[stop_id] = self.routes_by_stop[stop_id] - {route_id}
+                if len(self.routes_by_stop[stop_id]) == 0:
+                    del self.routes_by_stop[stop_id]
+                    self.removed_stops.add(stop_id)
+            for trip_id in self.trip_ids_by_route.pop(route_id):
+                self.stop_times_by_trip.pop(trip_id, None)
+                self.times_by_stop_by_trip.pop(trip_id, None)
+                self.removed_trips.add(trip_id)
+                self.trips_of_removed_routes.add(trip_id)
+            del self.idx_by_stop_by_route[route_id]
+            self.removed_routes.add(route_id)
+
+    def allocate_ids(self, stops: set[str], routes, trips: set[str]):
+        """
+        Assigns ids to the GTFS ids of the routes that are added. Stops,
+        routes and trips that existed before keep their id.
+        """
+        stop_moves = self.allocate(
+            self.stop_ids,
+            self.id_maps.stop_id_by_gtfs_id,
+            self.removed_stops,
+            stops,
+        )
+        route_moves = self.allocate(
+            self.route_ids,
+            self.id_maps.route_id_by_gtfs_id,
+            self.removed_routes,
+            routes,
+        )
+        trip_moves = self.allocate(
+            self.trip_ids,
+            self.id_maps.trip_id_by_gtfs_id,
+            self.removed_trips,
+            trips,
+        )
+        self.move_stops(stop_moves)
+        self.move_routes(route_moves)
+        self.move_trips(trip_moves)
+        self.id_maps = IdMaps(self.stop_ids, self.route_ids, self.trip_ids)
+
+    @staticmethod
+    def allocate(
+        ids: list[str],
+        id_by_gtfs_id: dict[str, int],
+        removed: set[int],
+        gtfs_ids,
+    ) -> dict[int, int]:
+        """
+        Allocates ids in `ids` for the GTFS ids, reusing ids that are still
+        known. Removed ids are given to new GTFS ids first; the remaining ones
+        are filled by moving the highest ids into them. Returns the moves.
+        """
+        for gtfs_id in gtfs_ids:
+            if gtfs_id in id_by_gtfs_id:
+                removed.discard(id_by_gtfs_id[gtfs_id])
+        new_gtfs_ids = sorted(
+            gtfs_id for gtfs_id in gtfs_ids if gtfs_id not in id_by_gtfs_id
+        )
+
+        free = deque(sorted(removed))
+        for gtfs_id in new_gtfs_ids:
+            if len(free) > 0:
+                ids[free.popleft()] = gtfs_id
+            else:
+                ids.append(gtfs_id)
+
+        moves: dict[int, int] = {}
+        while len(free) > 0:
+            if free[-1] == len(ids) - 1:
+                free.pop()
+                ids.pop()
+            else:
+                slot = free.popleft()
+                moves[len(ids) - 1] = slot
+                ids[slot] = ids.pop()
+        return moves
+
+    def move_stops(self, moves: dict[int, int]):
+        moved_routes: set[int] = set()
+        for old, new in moves.items():
+            if old not in self.routes_by_stop:
+                # only served by changed routes, it is added with its new id
+                continue
+            self.routes_by_stop[new] = self.routes_by_stop.pop(old)
+            moved_routes |= self.routes_by_stop[new]
+
+        for route_id in moved_routes:
+            self.stops_by_route[route_id] = [
+                moves.get(stop_id, stop_id) for stop_id in self.stops_by_route[route_id]
+            ]
+            self.idx_by_stop_by_route[route_id] = {
+                moves.get(stop_id, stop_id): idx
+                for stop_id, idx in self.idx_by_stop_by_route[route_id].items()
+            }
+            for trip_id in self.trip_ids_by_route[route_id]:
+                if trip_id not in self.stop_times_by_trip:
+                    continue
+                self.stop_times_by_trip[trip_id] = [
+                    {
+                        **stop_time,
+                        "stop_id": moves.get(
+                            stop_time["stop_id"], stop_time["stop_id"]
+                        ),
+                    }
+                    for stop_time in self.stop_times_by_trip[trip_id]
+                ]
+                self.times_by_stop_by_trip[trip_id] = {
+                    moves.get(stop_id, stop_id): times
+                    for stop_id, times in self.times_by_stop_by_trip[trip_id].items()
+                }
+
+    def move_routes(self, moves: dict[int, int]):
+        for old, new in moves.items():
+            if old not in self.stops_by_route:
+                # a changed route, it is added with its new id
+                continue
+            self.trip_ids_by_route[new] = self.trip_ids_by_route.pop(old)
+            self.stops_by_route[new] = self.stops_by_route.pop(old)
+            self.idx_by_stop_by_route[new] = self.idx_by_stop_by_route.pop(old)
+            for stop_id in self.stops_by_route[new]:
+                self.routes_by_stop[stop_id] = (
+                    self.routes_by_stop[stop_id] - {old}
+                ) | {new}
+
+    def move_trips(self, moves: dict[int, int]):
+        for old, new in moves.items():
+            if old in self.trips_of_removed_routes:
+                # a trip of a changed route, it is added with its new id
+                continue
+            route_id = self.find_route_of_trip(old)
+            self.trip_ids_by_route[route_id] = [
+                new if trip_id == old else trip_id
+                for trip_id in self.trip_ids_by_route[route_id]
+            ]
+            if old in self.stop_times_by_trip:
+                self.stop_times_by_trip[new] = self.stop_times_by_trip.pop(old)
+            if old in self.times_by_stop_by_trip:
+                self.times_by_stop_by_trip[new] = self.times_by_stop_by_trip.pop(old)
+
+    def find_route_of_trip(self, trip_id: int) -> int:
+        stop_times = self.stop_times_by_trip.get(trip_id, [])
+        # the trip is one of the trips of the routes serving its first stop,
+        # only trips without stop times require a scan of all routes
+        route_ids = (
+            self.routes_by_stop[stop_times[0]["stop_id"]]
+            if len(stop_times) > 0
+            else self.trip_ids_by_route.keys()
+        )
+        for route_id in route_ids:
+            if trip_id in self.trip_ids_by_route[route_id]:
+                return route_id
+        raise Exception(f"Trip {trip_id} is not part of any route")
+
+    def add_routes(
+        self,
+        stop_times_by_trip: build.StopTimesByTrip,
+        trip_ids_by_route: build.TripIdsByRouteSortedByDeparture,
+        stops_by_route: build.StopsByRouteOrdered,
+        idx_by_stop_by_route: build.IdxByStopByRoute,
+        times_by_stop_by_trip: build.TimesByStopByTrip,
+    ):
+        """
+        Interns and adds the blocks of routes built by `build_route_blocks`,
+        after their ids were allocated.
+        """
+        stop = self.id_maps.stop_id_by_gtfs_id
+        route = self.id_maps.route_id_by_gtfs_id
+        trip = self.id_maps.trip_id_by_gtfs_id
+
+        for gtfs_route_id, trips in trip_ids_by_route.items():
+            route_id = route[gtfs_route_id]
+            self.trip_ids_by_route[route_id] = [trip[trip_id] for trip_id in trips]
+            self.stops_by_route[route_id] = [
+                stop[stop_id] for stop_id in stops_by_route[gtfs_route_id]
+            ]
+            self.idx_by_stop_by_route[route_id] = {
+                stop[stop_id]: idx
+                for stop_id, idx in idx_by_stop_by_route[gtfs_route_id].items()
+            }
+            for stop_id in self.stops_by_route[route_id]:
+                self.routes_by_stop[stop_id] = self.routes_by_stop.get(
+                    stop_id, set()
+                ) | {route_id}
+
+        for gtfs_trip_id, stop_times in stop_times_by_trip.items():
+            self.stop_times_by_trip[trip[gtfs_trip_id]] = [
+                {**stop_time, "stop_id": stop[stop_time["stop_id"]]}
+                for stop_time in stop_times
+            ]
+        for gtfs_trip_id, times_by_stop in times_by_stop_by_trip.items():
+            self.times_by_stop_by_trip[trip[gtfs_trip_id]] = {
+                stop[stop_id]: times for stop_id, times in times_by_stop.items()
+            }
+
+    def to_dict(self, route_hashes: build.RouteHashes) -> dict[str, Any]:
+        return {
+            STOP_TIMES_BY_TRIP_KEY: self.stop_times_by_trip,
+            TRIP_IDS_BY_ROUTE_KEY: self.trip_ids_by_route,
+            STOPS_BY_ROUTE_KEY: self.stops_by_route,
+            ROUTES_BY_STOP_KEY: self.routes_by_stop,
+            IDX_BY_STOP_BY_ROUTE_KEY: self.idx_by_stop_by_route,
+            TIMES_BY_STOP_BY_TRIP_KEY: self.times_by_stop_by_trip,
+            STOP_ID_SET_KEY: set(range(len(self.stop_ids))),
+            ROUTE_ID_SET_KEY: set(range(len(self.route_ids))),
+            TRIP_ID_SET_KEY: set(range(len(self.trip_ids))),
+            ID_MAPS_KEY: self.id_maps.to_dict(),
+            ROUTE_HASHES_KEY: route_hashes,
+        }
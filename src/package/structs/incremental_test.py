@@ -0,0 +1,86 @@
+import pandas as pd
+
+from package import key
+from package.raptor.timetable import Timetable
+from package.structs import build
+from package.structs.build import build_structures
+from package.structs.incremental import build_structures_interned
+from package.structs.intern import IdMaps, intern_structs, unintern_structs
+
+
+def test_build_structures_interned_reuses_unchanged_routes(
+    monkeypatch, cleaned_trips_df: pd.DataFrame, stop_times_df: pd.DataFrame
+):
+    previous = build_structures_interned(cleaned_trips_df, stop_times_df)
+    assert previous == intern_structs(build_structures(cleaned_trips_df, stop_times_df))
+
+    # trip3 leaves stop2 five minutes later, only its route changes
+    changed_stop_times_df = stop_times_df.copy()
+    changed = (changed_stop_times_df["trip_id"] == "trip3") & (
+        changed_stop_times_df["stop_id"] == "stop2"
+    )
+    changed_stop_times_df.loc[changed, "departure_time"] = "02:15:00"
+
+    built_trips: list[str] = []
+    create_stop_times_by_trip_from_df = build.create_stop_times_by_trip_from_df
+
+    def record_built_trips(sorted_stop_times_df: pd.DataFrame):
+        built_trips.extend(sorted_stop_times_df["trip_id"].unique())
+        return create_stop_times_by_trip_from_df(sorted_stop_times_df)
+
+    monkeypatch.setattr(build, "create_stop_times_by_trip_from_df", record_built_trips)
+    structs = build_structures_interned(
+        cleaned_trips_df, changed_stop_times_df, previous
+    )
+
+    assert built_trips == ["trip3"]
+    assert structs[key.ID_MAPS_KEY] == previous[key.ID_MAPS_KEY]
+    id_maps = IdMaps.from_structs(structs)
+    route = id_maps.intern_route("route1_0_A")
+    trip = id_maps.intern_trip("trip1")
+    for struct_key in [
+        key.TRIP_IDS_BY_ROUTE_KEY,
+        key.STOPS_BY_ROUTE_KEY,
+        key.IDX_BY_STOP_BY_ROUTE_KEY,
+    ]:
+        assert structs[struct_key][route] is previous[struct_key][route]
+    for struct_key in [key.STOP_TIMES_BY_TRIP_KEY, key.TIMES_BY_STOP_BY_TRIP_KEY]:
+        assert structs[struct_key][trip] is previous[struct_key][trip]
+
+    assert unintern_structs(structs) == build_structures(
+        cleaned_trips_df, changed_stop_times_df
+    )
+    assert structs[key.TIMES_BY_STOP_BY_TRIP_KEY][id_maps.intern_trip("trip3")][
+        id_maps.intern_stop("stop2")
+    ] == (7800, 8100)
+
+
+def test_build_structures_interned_closes_gaps_of_removed_routes(
+    cleaned_trips_df: pd.DataFrame, stop_times_df: pd.DataFrame
+):
+    previous = build_structures_interned(cleaned_trips_df, stop_times_df)
+
+    # trip2 is the only trip of route1_0_B and the only one serving stop4
+    trips_df = cleaned_trips_df[cleaned_trips_df["trip_id"] != "trip2"]
+    trip_stop_times_df = stop_times_df[stop_times_df["trip_id"] != "trip2"]
+    structs = build_structures_interned(trips_df, trip_stop_times_df, previous)
+
+    id_maps = IdMaps.from_structs(structs)
+    assert id_maps.stop_ids == ["stop1", "stop2", "stop3"]
+    assert id_maps.route_ids == ["route1_0_A", "route1_1_A"]
+    assert id_maps.trip_ids == ["trip1", "trip3"]
+    assert unintern_structs(structs) == build_structures(trips_df, trip_stop_times_df)
+
+    # and the gaps are taken by the routes that are added again
+    structs = build_structures_interned(cleaned_trips_df, stop_times_df, structs)
+
+    id_maps = IdMaps.from_structs(structs)
+    assert id_maps.stop_ids == ["stop1", "stop2", "stop3", "stop4"]
+    assert id_maps.route_ids == ["route1_0_A", "route1_1_A", "route1_0_B"]
+    assert id_maps.trip_ids == ["trip1", "trip3", "trip2"]
+    assert unintern_structs(structs) == build_structures(
+        cleaned_trips_df, stop_times_df
+    )
+    assert Timetable.from_structs(structs).get_routes_serving_stop(
+        id_maps.intern_stop("stop3")
+    ) == [0, 1, 2]
@@ -0,0 +1,450 @@
+from collections.abc import Iterator, Mapping, Sequence
+from functools import cached_property
+from typing import Any, Optional
+from typing_extensions import Self
+
+import numpy as np
+
+from package.key import (
+    ID_MAPS_KEY,
+    STOP_TIMES_BY_TRIP_KEY,
+    TRIP_IDS_BY_ROUTE_KEY,
+    STOPS_BY_ROUTE_KEY,
+    ROUTES_BY_STOP_KEY,
+    IDX_BY_STOP_BY_ROUTE_KEY,
+    TIMES_BY_STOP_BY_TRIP_KEY,
+    STOP_ID_SET_KEY,
+    ROUTE_ID_SET_KEY,
+    TRIP_ID_SET_KEY,
+    ROUTE_HASHES_KEY,
+)
+from package.structs import build
+from package.structs.footpaths import (
+    CSR_NEIGHBORS_KEY,
+    CSR_OFFSETS_KEY,
+    CSR_STOP_IDS_KEY,
+    CSR_WALKING_TIMES_KEY,
+    Footpaths,
+    is_csr_dict,
+)
+from package.tracer.tracer import (
+    Trace,
+    TraceFootpath,
+    TraceStart,
+    TraceTrip,
+    TracerMap,
+)
+
+STOP_IDS_KEY = "stop_ids"
+ROUTE_IDS_KEY = "route_ids"
+TRIP_IDS_KEY = "trip_ids"
+
+
+class GtfsIds(Sequence[str]):
+    """
+    GTFS ids indexed by their integer id, backed by arrays that can be
+    memory-mapped: the UTF-8 encoded ids, and the encoded ids in sorted order
+    together with their integer ids, so that an id is looked up by binary
+    search instead of through a dict that has to be built first.
+    """
+
+    def __init__(
+        self: Self,
+        ids: np.ndarray,
+        sorted_ids: np.ndarray,
+        id_by_sorted_idx: np.ndarray,
+    ):
+        self.ids = ids
+        self.sorted_ids = sorted_ids
+        self.id_by_sorted_idx = id_by_sorted_idx
+
+    @staticmethod
+    def from_list(ids: Sequence[str]) -> "GtfsIds":
+        encoded = np.char.encode(np.array(list(ids), dtype=str), "utf-8")
+        order = np.argsort(encoded, kind="stable")
+        return GtfsIds(encoded, encoded[order], order.astype(np.int64))
+
+    def __len__(self: Self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self: Self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        return self.ids[idx].decode("utf-8")
+
+    def __iter__(self: Self) -> Iterator[str]:
+        return iter(np.char.decode(self.ids, "utf-8").tolist())
+
+    def lookup(self: Self, gtfs_id: str) -> Optional[int]:
+        encoded = gtfs_id.encode("utf-8")
+        i = int(np.searchsorted(self.sorted_ids, encoded))
+        if i == len(self.sorted_ids) or self.sorted_ids[i] != encoded:
+            return None
+        return int(self.id_by_sorted_idx[i])
+
+
+class GtfsIdLookup(Mapping[str, int]):
+    """
+    Read-only mapping from GTFS ids to integer ids on top of `GtfsIds`.
+    """
+
+    def __init__(self: Self, gtfs_ids: GtfsIds):
+        self.gtfs_ids = gtfs_ids
+
+    def __getitem__(self: Self, gtfs_id: str) -> int:
+        idx = self.gtfs_ids.lookup(gtfs_id) if isinstance(gtfs_id, str) else None
+        if idx is None:
+            raise KeyError(gtfs_id)
+        return idx
+
+    def __contains__(self: Self, gtfs_id: object) -> bool:
+        return isinstance(gtfs_id, str) and self.gtfs_ids.lookup(gtfs_id) is not None
+
+    def __len__(self: Self) -> int:
+        return len(self.gtfs_ids)
+
+    def __iter__(self: Self) -> Iterator[str]:
+        return iter(self.gtfs_ids)
+
+
+def create_id_lookup(ids: Sequence[str]) -> Mapping[str, int]:
+    if isinstance(ids, GtfsIds):
+        return GtfsIdLookup(ids)
+    return {gtfs_id: i for i, gtfs_id in enumerate(ids)}
+
+
+class IdMaps:
+    """
+    Maps between GTFS ids and the dense integer ids used by the routing
+    engines.
+
+    The integer id of a stop, route or trip is its index in `stop_ids`,
+    `route_ids` or `trip_ids` respectively, so translating back to GTFS ids
+    is a list lookup. The ids are either lists, or `GtfsIds` when the id maps
+    were opened from the arrays written by `to_arrays`. The lookups by GTFS
+    id are only created on first use.
+    """
+
+    def __init__(
+        self: Self,
+        stop_ids: Sequence[str],
+        route_ids: Sequence[str],
+        trip_ids: Sequence[str],
+    ):
+        self.stop_ids = stop_ids
+        self.route_ids = route_ids
+        self.trip_ids = trip_ids
+
+    @cached_property
+    def stop_id_by_gtfs_id(self: Self) -> Mapping[str, int]:
+        return create_id_lookup(self.stop_ids)
+
+    @cached_property
+    def route_id_by_gtfs_id(self: Self) -> Mapping[str, int]:
+        return create_id_lookup(self.route_ids)
+
+    @cached_property
+    def trip_id_by_gtfs_id(self: Self) -> Mapping[str, int]:
+        return create_id_lookup(self.trip_ids)
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(
+            state[STOP_IDS_KEY],
+            state[ROUTE_IDS_KEY],
+            state[TRIP_IDS_KEY],
+        )
+
+    @staticmethod
+    def from_dict(id_maps: dict[str, list[str]]) -> "IdMaps":
+        return IdMaps(
+            id_maps[STOP_IDS_KEY],
+            id_maps[ROUTE_IDS_KEY],
+            id_maps[TRIP_IDS_KEY],
+        )
+
+    @staticmethod
+    def from_structs(structs_dict: dict) -> "IdMaps":
+        if ID_MAPS_KEY not in structs_dict:
+            raise Exception(
+                "Structs dict is not interned, use `intern_structs` to intern it"
+            )
+        return IdMaps.from_dict(structs_dict[ID_MAPS_KEY])
+
+    def to_dict(self: Self) -> dict[str, list[str]]:
+        return {
+            STOP_IDS_KEY: list(self.stop_ids),
+            ROUTE_IDS_KEY: list(self.route_ids),
+            TRIP_IDS_KEY: list(self.trip_ids),
+        }
+
+    def to_arrays(self: Self) -> dict[str, np.ndarray]:
+        """
+        Returns the arrays of the `GtfsIds` of the stops, routes and trips,
+        which are read by `from_arrays`.
+        """
+        arrays: dict[str, np.ndarray] = {}
+        for name, ids in [
+            (STOP_IDS_KEY, self.stop_ids),
+            (ROUTE_IDS_KEY, self.route_ids),
+            (TRIP_IDS_KEY, self.trip_ids),
+        ]:
+            gtfs_ids = ids if isinstance(ids, GtfsIds) else GtfsIds.from_list(ids)
+            arrays[name] = gtfs_ids.ids
+            arrays[f"sorted_{name}"] = gtfs_ids.sorted_ids
+            arrays[f"{name}_by_sorted_idx"] = gtfs_ids.id_by_sorted_idx
+        return arrays
+
+    @staticmethod
+    def from_arrays(arrays: Mapping[str, np.ndarray]) -> "IdMaps":
+        return IdMaps(
+            *[
+                GtfsIds(
+                    arrays[name],
+                    arrays[f"sorted_{name}"],
+                    arrays[f"{name}_by_sorted_idx"],
+                )
+                for name in [STOP_IDS_KEY, ROUTE_IDS_KEY, TRIP_IDS_KEY]
+            ]
+        )
+
+    def intern_stop(self: Self, stop_id: str) -> int:
+        return self.stop_id_by_gtfs_id[stop_id]
+
+    def intern_route(self: Self, route_id: str) -> int:
+        return self.route_id_by_gtfs_id[route_id]
+
+    def intern_trip(self: Self, trip_id: str) -> int:
+        return self.trip_id_by_gtfs_id[trip_id]
+
+    def gtfs_stop(self: Self, stop_id: int) -> str:
+        return self.stop_ids[stop_id]
+
+    def gtfs_route(self: Self, route_id: int) -> str:
+        return self.route_ids[route_id]
+
+    def gtfs_trip(self: Self, trip_id: int) -> str:
+        return self.trip_ids[trip_id]
+
+    def intern_footpaths(
+        self: Self, footpaths: dict
+    ) -> dict[int, dict[int, int]] | Footpaths:
+        """
+        Translates footpaths, as generated by the footpaths command, to
+        integer stop ids. Stops that are not served by any trip are dropped.
+
+        Footpaths in the CSR format are returned as `Footpaths`, footpaths
+        keyed by GTFS stop ids (the format of older footpath files) as a dict.
+        """
+        if is_csr_dict(footpaths):
+            return self.intern_csr_footpaths(footpaths)
+
+        interned: dict[int, dict[int, int]] = {
+            stop_id: {} for stop_id in range(len(self.stop_ids))
+        }
+        for stop_id, nearby_stops in footpaths.items():
+            if stop_id not in self.stop_id_by_gtfs_id:
+                continue
+            interned[self.stop_id_by_gtfs_id[stop_id]] = {
+                self.stop_id_by_gtfs_id[nearby_stop_id]: walking_time
+                for nearby_stop_id, walking_time in nearby_stops.items()
+                if nearby_stop_id in self.stop_id_by_gtfs_id
+            }
+        return interned
+
+    def intern_csr_footpaths(self: Self, footpaths: dict) -> Footpaths:
+        stop_id_by_idx = np.array(
+            [
+                self.stop_id_by_gtfs_id.get(stop_id, -1)
+                for stop_id in footpaths[CSR_STOP_IDS_KEY]
+            ],
+            dtype=np.int64,
+        )
+        offsets = np.asarray(footpaths[CSR_OFFSETS_KEY])
+        sources = stop_id_by_idx[
+            np.repeat(np.arange(len(stop_id_by_idx)), np.diff(offsets))
+        ]
+        targets = stop_id_by_idx[np.asarray(footpaths[CSR_NEIGHBORS_KEY])]
+        walking_times = np.asarray(footpaths[CSR_WALKING_TIMES_KEY])
+
+        served = (sources >= 0) & (targets >= 0)
+        return Footpaths.from_edges(
+            sources[served],
+            targets[served],
+            walking_times[served],
+            len(self.stop_ids),
+        )
+
+    def gtfs_stop_dict(self: Self, values_by_stop: dict[int, Any]) -> dict[str, Any]:
+        return {
+            self.stop_ids[stop_id]: value for stop_id, value in values_by_stop.items()
+        }
+
+    def gtfs_trace(self: Self, trace: Trace) -> Trace:
+        if isinstance(trace, TraceStart):
+            return TraceStart(self.stop_ids[trace.start_stop_id], trace.start_time)
+        if isinstance(trace, TraceTrip):
+            return TraceTrip(
+                self.stop_ids[trace.start_stop_id],
+                trace.departure_time,
+                self.stop_ids[trace.end_stop_id],
+                trace.arrival_time,
+                self.trip_ids[trace.trip_id],
+            )
+        if isinstance(trace, TraceFootpath):
+            return TraceFootpath(
+                self.stop_ids[trace.start_stop_id],
+                self.stop_ids[trace.end_stop_id],
+                trace.walking_time,
+            )
+        raise ValueError(f"Unknown tracer type: {type(trace)}")
+
+    def gtfs_tracer_map(self: Self, tracer_map: TracerMap) -> TracerMap:
+        gtfs_tracer_map = TracerMap(set())
+        gtfs_tracer_map.tracers = {
+            self.stop_ids[stop_id]: [self.gtfs_trace(trace) for trace in traces]
+            for stop_id, traces in tracer_map.tracers.items()
+        }
+        return gtfs_tracer_map
+
+
+def is_interned(structs_dict: dict) -> bool:
+    return ID_MAPS_KEY in structs_dict
+
+
+def ensure_interned(structs_dict: dict) -> dict[str, Any]:
+    """
+    Returns the structs dict with integer ids, interning it if it was created
+    before interning was done by the build-structures command.
+    """
+    if is_interned(structs_dict):
+        return structs_dict
+    return intern_structs(structs_dict)
+
+
+def intern_structs(structs_dict: dict) -> dict[str, Any]:
+    """
+    Translates all stop, route and trip ids of the structs dict to dense
+    integers. The reverse maps are stored under `ID_MAPS_KEY`.
+
+    Stops are numbered in sorted order, routes in the order of
+    `trip_ids_by_route` and trips route by route in departure order, so the
+    trips of a route have consecutive ids.
+    """
+    (
+        trip_ids_by_route,
+        stops_by_route,
+        idx_by_stop_by_route,
+        routes_by_stop,
+        times_by_stop_by_trip,
+        stop_id_set,
+    ) = build.unpack_structs(structs_dict)
+
+    stop_ids = sorted(stop_id_set)
+    route_ids = list(trip_ids_by_route.keys())
+    trip_ids = [trip_id for trips in trip_ids_by_route.values() for trip_id in trips]
+    trip_ids.extend(sorted(set(structs_dict[TRIP_ID_SET_KEY]) - set(trip_ids)))
+    id_maps = IdMaps(stop_ids, route_ids, trip_ids)
+
+    stop = id_maps.stop_id_by_gtfs_id
+    route = id_maps.route_id_by_gtfs_id
+    trip = id_maps.trip_id_by_gtfs_id
+
+    return {
+        STOP_TIMES_BY_TRIP_KEY: {
+            trip[trip_id]: [
+                {**stop_time, "stop_id": stop[stop_time["stop_id"]]}
+                for stop_time in stop_times
+            ]
+            for trip_id, stop_times in structs_dict[STOP_TIMES_BY_TRIP_KEY].items()
+        },
+        TRIP_IDS_BY_ROUTE_KEY: {
+            route[route_id]: [trip[trip_id] for trip_id in trips]
+            for route_id, trips in trip_ids_by_route.items()
+        },
+        STOPS_BY_ROUTE_KEY: {
+            route[route_id]: [stop[stop_id] for stop_id in stops]
+            for route_id, stops in stops_by_route.items()
+        },
+        ROUTES_BY_STOP_KEY: {
+            stop[stop_id]: {route[route_id] for route_id in routes}
+            for stop_id, routes in routes_by_stop.items()
+        },
+        IDX_BY_STOP_BY_ROUTE_KEY: {
+            route[route_id]: {stop[stop_id]: idx for stop_id, idx in idxs.items()}
+            for route_id, idxs in idx_by_stop_by_route.items()
+        },
+        TIMES_BY_STOP_BY_TRIP_KEY: {
+            trip[trip_id]: {
+                stop[stop_id]: times for stop_id, times in times_by_stop.items()
+            }
+            for trip_id, times_by_stop in times_by_stop_by_trip.items()
+        },
+        STOP_ID_SET_KEY: set(range(len(stop_ids))),
+        ROUTE_ID_SET_KEY: set(range(len(route_ids))),
+        TRIP_ID_SET_KEY: set(range(len(trip_ids))),
+        ID_MAPS_KEY: id_maps.to_dict(),
+        # keyed by GTFS route id, as the integer ids change between builds
+        **optional_route_hashes(structs_dict),
+    }
+
+
+def unintern_structs(structs_dict: dict) -> dict[str, Any]:
+    """
+    Translates the integer ids of interned structs back to GTFS ids, the
+    inverse of `intern_structs`. Structs that are not interned are returned
+    as they are.
+    """
+    if not is_interned(structs_dict):
+        return structs_dict
+
+    id_maps = IdMaps.from_structs(structs_dict)
+    stop = id_maps.stop_ids
+    route = id_maps.route_ids
+    trip = id_maps.trip_ids
+
+    return {
+        STOP_TIMES_BY_TRIP_KEY: {
+            trip[trip_id]: [
+                {**stop_time, "stop_id": stop[stop_time["stop_id"]]}
+                for stop_time in stop_times
+            ]
+            for trip_id, stop_times in structs_dict[STOP_TIMES_BY_TRIP_KEY].items()
+        },
+        TRIP_IDS_BY_ROUTE_KEY: {
+            route[route_id]: [trip[trip_id] for trip_id in trips]
+            for route_id, trips in structs_dict[TRIP_IDS_BY_ROUTE_KEY].items()
+        },
+        STOPS_BY_ROUTE_KEY: {
+            route[route_id]: [stop[stop_id] for stop_id in stops]
+            for route_id, stops in structs_dict[STOPS_BY_ROUTE_KEY].items()
+        },
+        ROUTES_BY_STOP_KEY: {
+            stop[stop_id]: {route[route_id] for route_id in routes}
+            for stop_id, routes in structs_dict[ROUTES_BY_STOP_KEY].items()
+        },
+        IDX_BY_STOP_BY_ROUTE_KEY: {
+            route[route_id]: {stop[stop_id]: idx for stop_id, idx in idxs.items()}
+            for route_id, idxs in structs_dict[IDX_BY_STOP_BY_ROUTE_KEY].items()
+        },
+        TIMES_BY_STOP_BY_TRIP_KEY: {
+            trip[trip_id]: {
+                stop[stop_id]: times for stop_id, times in times_by_stop.items()
+            }
+            for trip_id, times_by_stop in structs_dict[
+                TIMES_BY_STOP_BY_TRIP_KEY
+            ].items()
+        },
+        STOP_ID_SET_KEY: set(stop),
+        ROUTE_ID_SET_KEY: set(route),
+        TRIP_ID_SET_KEY: set(trip),
+        **optional_route_hashes(structs_dict),
+    }
+
+
+def optional_route_hashes(structs_dict: dict) -> dict[str, Any]:
+    if ROUTE_HASHES_KEY not in structs_dict:
+        return {}
+    return {ROUTE_HASHES_KEY: structs_dict[ROUTE_HASHES_KEY]}
@@ -0,0 +1,99 @@
+from typing import Any
+
+import pytest
+
+from package import key
+from package.structs.footpaths import Footpaths, create_csr_dict
+from package.structs.intern import (
+    GtfsIds,
+    IdMaps,
+    ensure_interned,
+    intern_structs,
+    unintern_structs,
+)
+
+
+def test_intern_structs(structs_dict: dict[str, Any]):
+    interned = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(interned)
+
+    assert id_maps.stop_ids == ["stop1", "stop2", "stop3", "stop4"]
+    assert id_maps.route_ids == ["route1_0_A", "route1_0_B", "route1_1_A"]
+    assert id_maps.trip_ids == ["trip1", "trip2", "trip3"]
+
+    assert interned[key.TRIP_IDS_BY_ROUTE_KEY] == {0: [0], 1: [1], 2: [2]}
+    assert interned[key.STOPS_BY_ROUTE_KEY] == {
+        0: [0, 1, 2],
+        1: [0, 3, 2],
+        2: [2, 1, 0],
+    }
+    assert interned[key.ROUTES_BY_STOP_KEY][id_maps.intern_stop("stop3")] == {
+        0,
+        1,
+        2,
+    }
+    assert interned[key.TIMES_BY_STOP_BY_TRIP_KEY][id_maps.intern_trip("trip2")] == {
+        0: (3600, 3600),
+        3: (4200, 4200),
+        2: (4800, 4800),
+    }
+    assert interned[key.STOP_ID_SET_KEY] == {0, 1, 2, 3}
+
+    assert ensure_interned(interned) is interned
+
+
+def test_unintern_structs(structs_dict: dict[str, Any]):
+    interned = intern_structs(structs_dict)
+
+    assert interned[key.ROUTE_HASHES_KEY] == structs_dict[key.ROUTE_HASHES_KEY]
+    assert unintern_structs(interned) == structs_dict
+    assert unintern_structs(structs_dict) is structs_dict
+
+
+def test_intern_footpaths(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    id_maps = IdMaps.from_structs(intern_structs(structs_dict))
+
+    footpaths = id_maps.intern_footpaths(footpaths_dict)
+
+    assert footpaths == {0: {}, 1: {3: 120}, 2: {}, 3: {1: 120}}
+    assert id_maps.gtfs_stop_dict({3: "00:12:00"}) == {"stop4": "00:12:00"}
+
+
+def test_intern_csr_footpaths(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    id_maps = IdMaps.from_structs(intern_structs(structs_dict))
+
+    # footpaths to stops without trips are dropped
+    csr_dict = create_csr_dict({**footpaths_dict, "stop5": {"stop1": 60}})
+    footpaths = id_maps.intern_footpaths(csr_dict)
+
+    assert isinstance(footpaths, Footpaths)
+    assert footpaths.to_dict() == id_maps.intern_footpaths(footpaths_dict)
+
+
+def test_id_maps_from_arrays(structs_dict: dict[str, Any]):
+    id_maps = IdMaps(["stop2", "stöp1", "stop3"], ["route1"], [])
+
+    opened = IdMaps.from_arrays(id_maps.to_arrays())
+
+    assert isinstance(opened.stop_ids, GtfsIds)
+    assert opened.to_dict() == id_maps.to_dict()
+    assert opened.gtfs_stop(1) == "stöp1"
+    assert opened.stop_ids[1:] == ["stöp1", "stop3"]
+    for stop_id in ["stop2", "stöp1", "stop3"]:
+        assert opened.intern_stop(stop_id) == id_maps.intern_stop(stop_id)
+    assert "stop4" not in opened.stop_id_by_gtfs_id
+    assert opened.stop_id_by_gtfs_id.get("stop0", -1) == -1
+    with pytest.raises(KeyError):
+        opened.intern_trip("trip1")
+
+    # footpaths are interned the same through the arrays
+    interned = IdMaps.from_structs(intern_structs(structs_dict))
+    csr_dict = create_csr_dict({"stop1": {"stop2": 60, "stop5": 30}})
+    assert (
+        IdMaps.from_arrays(interned.to_arrays()).intern_footpaths(csr_dict).to_dict()
+        == interned.intern_footpaths(csr_dict).to_dict()
+    )
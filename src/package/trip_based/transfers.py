@@ -0,0 +1,307 @@
+from typing import Optional
+from typing_extensions import Self
+
+import numpy as np
+
+from package.logger import rlog
+from package.raptor.timetable import NO_TIME, Timetable, structs_fingerprint
+from package.structs.footpaths import Footpaths
+
+INFINITY = np.iinfo(np.int64).max
+
+
+class Transfers:
+    """
+    Trip-to-trip transfers of the Trip-Based routing algorithm.
+
+    A stop event, i.e. a trip at a stop, is identified by its index into the
+    flat time arrays of the `Timetable` (see `stop_event`). The transfers of
+    stop event `e` lead to the trips `trips[offsets[e]:offsets[e + 1]]`, which
+    are boarded at the respective stop positions in `positions`.
+
+    Transfers depend on the transfer time they were computed with, which is
+    stored alongside, so that they are not used with a different one. If they
+    were computed from files, the fingerprints of the structs and footpaths
+    files are stored as well (see `source_fingerprint`), so that they are not
+    used after the files were built again.
+    """
+
+    def __init__(
+        self: Self,
+        offsets: np.ndarray,
+        trips: np.ndarray,
+        positions: np.ndarray,
+        default_transfer_time: int,
+        source_fingerprint: Optional[dict] = None,
+    ):
+        self.offsets = offsets
+        self.trips = trips
+        self.positions = positions
+        self.default_transfer_time = default_transfer_time
+        self.source_fingerprint = source_fingerprint
+
+    def __len__(self: Self) -> int:
+        return len(self.trips)
+
+    def get(self: Self, stop_event: int) -> tuple[np.ndarray, np.ndarray]:
+        start = self.offsets[stop_event]
+        end = self.offsets[stop_event + 1]
+        return self.trips[start:end], self.positions[start:end]
+
+    def validate(self: Self, timetable: Timetable, default_transfer_time: int):
+        if len(self.offsets) != len(timetable.arrival_times) + 1:
+            raise Exception("Transfers were computed for a different timetable")
+        if self.default_transfer_time != default_transfer_time:
+            raise Exception(
+                f"Transfers were computed with a transfer time of "
+                f"{self.default_transfer_time}s, not {default_transfer_time}s"
+            )
+
+    def validate_source(self: Self, structs_path: str, footpaths_path: str):
+        # transfers pickled before the fingerprint was stored have none
+        if getattr(self, "source_fingerprint", None) != source_fingerprint(
+            structs_path, footpaths_path
+        ):
+            raise Exception(
+                f"Transfers were not computed from {structs_path} and "
+                f"{footpaths_path} as they are now, compute them again"
+            )
+
+
+def source_fingerprint(structs_path: str, footpaths_path: str) -> dict:
+    """
+    Returns the fingerprints of the structs and footpaths files, which change
+    whenever one of the files is written again.
+    """
+    return {
+        "structs": structs_fingerprint(structs_path),
+        "footpaths": structs_fingerprint(footpaths_path),
+    }
+
+
+def stop_event(timetable: Timetable, route_id: int, trip_pos: int, stop_pos: int):
+    n_route_stops = (
+        timetable.route_stop_offsets[route_id + 1]
+        - timetable.route_stop_offsets[route_id]
+    )
+    return int(
+        timetable.route_time_offsets[route_id] + trip_pos * n_route_stops + stop_pos
+    )
+
+
+def compute_transfers(
+    timetable: Timetable, footpaths: Footpaths, default_transfer_time: int
+) -> Transfers:
+    """
+    Computes the transfers between all trips, as described by Witt, "Trip-Based
+    Public Transit Routing" (2015):
+
+    1. From every stop event, transfer to the earliest trip of every route
+       that can be caught at the stop (after the transfer time) or at a
+       nearby stop (after walking and the transfer time).
+    2. Drop U-turn transfers, which go back to the previous stop of the trip.
+    3. Reduction: drop transfers that do not improve the arrival time at any
+       stop compared to staying in the trip or to transfers at later stops.
+
+    Trips of a route are assumed not to overtake each other.
+    """
+    targets_by_event: dict[int, list[tuple[int, int]]] = {}
+    for route_id in range(timetable.n_routes):
+        for trip_pos in range(len(timetable.arrival_times_by_route[route_id])):
+            for stop_pos, transfers in compute_initial_transfers(
+                timetable, footpaths, default_transfer_time, route_id, trip_pos
+            ).items():
+                event = stop_event(timetable, route_id, trip_pos, stop_pos)
+                targets_by_event[event] = transfers
+
+    n_initial = sum(len(transfers) for transfers in targets_by_event.values())
+
+    for route_id in range(timetable.n_routes):
+        for trip_pos in range(len(timetable.arrival_times_by_route[route_id])):
+            reduce_transfers(timetable, targets_by_event, route_id, trip_pos)
+
+    n_events = len(timetable.arrival_times)
+    counts = np.zeros(n_events, dtype=np.int64)
+    for event, transfers in targets_by_event.items():
+        counts[event] = len(transfers)
+    offsets = np.zeros(n_events + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    trips = np.empty(offsets[-1], dtype=np.int32)
+    positions = np.empty(offsets[-1], dtype=np.int32)
+    for event, transfers in targets_by_event.items():
+        start = offsets[event]
+        for i, (trip_id, stop_pos) in enumerate(transfers):
+            trips[start + i] = trip_id
+            positions[start + i] = stop_pos
+
+    rlog.info(f"Kept {len(trips)} of {n_initial} transfers after reduction")
+    return Transfers(offsets, trips, positions, default_transfer_time)
+
+
+def compute_initial_transfers(
+    timetable: Timetable,
+    footpaths: Footpaths,
+    default_transfer_time: int,
+    route_id: int,
+    trip_pos: int,
+) -> dict[int, list[tuple[int, int]]]:
+    """
+    Returns the transfers of the trip (steps 1 and 2), keyed by the stop
+    position the trip is left at.
+    """
+    stops = timetable.iterate_stops_in_route_from_idx(route_id, 0)
+    arrivals = timetable.arrival_times_by_route[route_id][trip_pos].tolist()
+
+    transfers_by_stop_pos: dict[int, list[tuple[int, int]]] = {}
+    for stop_pos in range(1, len(stops)):
+        arrival_time = arrivals[stop_pos]
+        if arrival_time == NO_TIME:
+            continue
+
+        transfers: list[tuple[int, int]] = []
+        nearby_stops = [(stops[stop_pos], 0), *footpaths.items(stops[stop_pos])]
+        for nearby_stop_id, walking_time in nearby_stops:
+            ready_to_depart = arrival_time + walking_time + default_transfer_time
+            start = timetable.stop_route_offsets[nearby_stop_id]
+            end = timetable.stop_route_offsets[nearby_stop_id + 1]
+            for other_route_id, other_stop_pos in zip(
+                timetable.stop_routes[start:end].tolist(),
+                timetable.stop_route_positions[start:end].tolist(),
+            ):
+                other_stops = timetable.iterate_stops_in_route_from_idx(
+                    other_route_id, 0
+                )
+                # the trip can not be left again after boarding at the last stop
+                if other_stop_pos == len(other_stops) - 1:
+                    continue
+
+                other_trip_pos = timetable.earliest_trip_pos(
+                    other_route_id, other_stop_pos, ready_to_depart
+                )
+                if other_trip_pos is None:
+                    continue
+                # staying in the trip is at least as good
+                if (
+                    other_route_id == route_id
+                    and other_trip_pos >= trip_pos
+                    and other_stop_pos >= stop_pos
+                ):
+                    continue
+                if is_u_turn(
+                    timetable,
+                    default_transfer_time,
+                    route_id,
+                    trip_pos,
+                    stop_pos,
+                    other_route_id,
+                    other_trip_pos,
+                    other_stop_pos,
+                ):
+                    continue
+
+                other_trip_id = int(
+                    timetable.route_trips[
+                        timetable.route_trip_offsets[other_route_id] + other_trip_pos
+                    ]
+                )
+                transfers.append((other_trip_id, other_stop_pos))
+
+        if len(transfers) > 0:
+            transfers_by_stop_pos[stop_pos] = transfers
+    return transfers_by_stop_pos
+
+
+def is_u_turn(
+    timetable: Timetable,
+    default_transfer_time: int,
+    route_id: int,
+    trip_pos: int,
+    stop_pos: int,
+    other_route_id: int,
+    other_trip_pos: int,
+    other_stop_pos: int,
+) -> bool:
+    """
+    A transfer is a U-turn if the other trip next goes to the previous stop
+    of the trip, and could also have been caught there.
+    """
+    stops = timetable.iterate_stops_in_route_from_idx(route_id, stop_pos - 1)
+    other_stops = timetable.iterate_stops_in_route_from_idx(
+        other_route_id, other_stop_pos
+    )
+    if len(other_stops) < 2 or stops[0] != other_stops[1]:
+        return False
+
+    previous_arrival = timetable.arrival_times_by_route[route_id][
+        trip_pos, stop_pos - 1
+    ]
+    next_departure = timetable.departure_times_by_route[other_route_id][
+        other_trip_pos, other_stop_pos + 1
+    ]
+    if previous_arrival == NO_TIME or next_departure == NO_TIME:
+        return False
+    return previous_arrival + default_transfer_time <= next_departure
+
+
+def reduce_transfers(
+    timetable: Timetable,
+    targets_by_event: dict[int, list[tuple[int, int]]],
+    route_id: int,
+    trip_pos: int,
+):
+    """
+    Removes the transfers of the trip that do not improve the arrival time at
+    any stop (step 3). The stops of the trip are processed from last to
+    first, so the arrival times that can be reached by staying in the trip
+    longer are known when the transfers of a stop are checked.
+    """
+    stops = timetable.iterate_stops_in_route_from_idx(route_id, 0)
+    arrivals = timetable.arrival_times_by_route[route_id][trip_pos].tolist()
+
+    # footpaths can not be chained, so arriving by trip is only dominated by
+    # an earlier arrival by trip, as only that allows to walk on. Walking on
+    # from an arrival that is not improved does not improve the nearby stops
+    # either, so only the arrivals by trip have to be tracked
+    earliest_trip_arrival: dict[int, int] = {}
+
+    def improve(stop_id: int, arrival_time: int) -> bool:
+        if arrival_time >= earliest_trip_arrival.get(stop_id, INFINITY):
+            return False
+        earliest_trip_arrival[stop_id] = arrival_time
+        return True
+
+    for stop_pos in range(len(stops) - 1, 0, -1):
+        if arrivals[stop_pos] == NO_TIME:
+            continue
+        improve(stops[stop_pos], arrivals[stop_pos])
+
+        event = stop_event(timetable, route_id, trip_pos, stop_pos)
+        transfers = targets_by_event.get(event)
+        if transfers is None:
+            continue
+
+        kept: list[tuple[int, int]] = []
+        for other_trip_id, other_stop_pos in transfers:
+            other_route_id = int(timetable.trip_route[other_trip_id])
+            other_stops = timetable.iterate_stops_in_route_from_idx(
+                other_route_id, other_stop_pos + 1
+            )
+            other_arrivals = timetable.arrival_times_by_route[other_route_id][
+                timetable.trip_pos[other_trip_id], other_stop_pos + 1 :
+            ].tolist()
+
+            is_kept = False
+            for other_stop_id, arrival_time in zip(other_stops, other_arrivals):
+                if arrival_time == NO_TIME:
+                    continue
+                # every stop has to be checked, as the arrivals of all stops
+                # reached earlier have to be recorded
+                is_kept = improve(other_stop_id, arrival_time) or is_kept
+            if is_kept:
+                kept.append((other_trip_id, other_stop_pos))
+
+        if len(kept) > 0:
+            targets_by_event[event] = kept
+        else:
+            del targets_by_event[event]
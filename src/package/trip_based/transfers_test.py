@@ -0,0 +1,80 @@
+import os
+from typing import Any
+
+import pytest
+
+from package import storage
+from package.raptor.data import create_footpaths
+from package.raptor.timetable import Timetable
+from package.structs.intern import IdMaps, intern_structs
+from package.trip_based.transfers import (
+    compute_transfers,
+    source_fingerprint,
+    stop_event,
+)
+
+
+def test_compute_transfers(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    timetable = Timetable.from_structs(structs_dict)
+    footpaths = create_footpaths(
+        id_maps.intern_footpaths(footpaths_dict), timetable.n_stops
+    )
+    assert footpaths is not None
+
+    transfers = compute_transfers(timetable, footpaths, 60)
+
+    def get_transfers(trip_id: str, stop_id: str) -> list[tuple[str, int]]:
+        trip = id_maps.intern_trip(trip_id)
+        route_id, trip_pos, stop_pos = timetable.locate(
+            trip, id_maps.intern_stop(stop_id)
+        )
+        trips, positions = transfers.get(
+            stop_event(timetable, route_id, trip_pos, stop_pos)
+        )
+        return [
+            (id_maps.gtfs_trip(other_trip), position)
+            for other_trip, position in zip(trips.tolist(), positions.tolist())
+        ]
+
+    assert get_transfers("trip2", "stop3") == [("trip3", 0)]
+    # going back to stop2 with trip3 is a U-turn, as trip1 can be left at
+    # stop2 directly
+    assert get_transfers("trip1", "stop3") == []
+    # walking from stop4 to trip3 at stop2 is removed by the reduction, as
+    # transferring at stop3 reaches the same stops at the same times
+    assert get_transfers("trip2", "stop4") == []
+    assert len(transfers) == 1
+    assert transfers.default_transfer_time == 60
+
+
+def test_validate_source(
+    tmp_path,
+    structs_dict: dict[str, Any],
+    footpaths_dict: dict[str, dict[str, int]],
+):
+    structs_path = os.path.join(tmp_path, "structs.pkl")
+    footpaths_path = os.path.join(tmp_path, "footpaths.pkl")
+    structs_dict = intern_structs(structs_dict)
+    storage.write_any_dict(structs_dict, structs_path)
+    storage.write_any_dict(footpaths_dict, footpaths_path)
+    timetable = Timetable.from_structs(structs_dict)
+    footpaths = create_footpaths(
+        timetable.id_maps.intern_footpaths(footpaths_dict), timetable.n_stops
+    )
+    assert footpaths is not None
+
+    transfers = compute_transfers(timetable, footpaths, 60)
+    with pytest.raises(Exception):
+        transfers.validate_source(structs_path, footpaths_path)
+
+    transfers.source_fingerprint = source_fingerprint(structs_path, footpaths_path)
+    transfers.validate_source(structs_path, footpaths_path)
+
+    # the footpaths are built again, with the same number of stop events
+    storage.write_any_dict({**footpaths_dict, "stop9": {}}, footpaths_path)
+    with pytest.raises(Exception, match="compute them again"):
+        transfers.validate_source(structs_path, footpaths_path)
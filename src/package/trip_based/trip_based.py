@@ -0,0 +1,293 @@
+import sys
+from typing import Optional
+from typing_extensions import Self
+
+from package import strtime
+from package.logger import rlog
+from package.raptor.data import create_footpaths
+from package.raptor.raptor import seconds_dict_to_times_dict
+from package.raptor.timetable import Timetable
+from package.structs.footpaths import Footpaths
+from package.tracer.tracer import (
+    Trace,
+    TraceFootpath,
+    TraceStart,
+    TraceTrip,
+    TracerMap,
+)
+from package.trip_based.transfers import Transfers, compute_transfers, stop_event
+
+INFINITY = sys.maxsize
+
+# trip, boarding stop position, end stop position (exclusive), parent segment
+# and the stop position the parent segment was left at
+Segment = tuple[int, int, int, Optional[int], int]
+# segment, stop position the segment is left at and the walking time of a
+# footpath afterwards (None if the stop is reached by the trip)
+Arrival = tuple[int, int, Optional[int]]
+
+
+class TripBased:
+    """
+    Trip-Based public transit routing (Witt, 2015).
+
+    Instead of scanning routes, queries follow precomputed trip-to-trip
+    transfers (see `package.trip_based.transfers`) in a breadth first search
+    over trip segments, the n-th level containing the segments that are
+    reached with n transfers. Computing the transfers is expensive, but only
+    has to be done once per timetable, queries then touch far less data than
+    RAPTOR.
+
+    Answers the same queries as `Raptor.run` with the same results, plus the
+    Pareto set of (number of trips, arrival time) per stop.
+    """
+
+    def __init__(
+        self: Self,
+        structs_dict: dict | Timetable,
+        footpaths: dict | Footpaths,
+        max_transfers: int,
+        default_transfer_time: int,
+        transfers: Optional[Transfers] = None,
+    ):
+        if not isinstance(structs_dict, Timetable):
+            structs_dict = Timetable.from_structs(structs_dict)
+        self.timetable = structs_dict
+
+        footpaths = create_footpaths(footpaths, self.timetable.n_stops)
+        assert footpaths is not None
+        self.footpaths = footpaths
+
+        self.max_transfers = max_transfers
+        self.default_transfer_time = default_transfer_time
+
+        if transfers is None:
+            transfers = compute_transfers(
+                self.timetable, self.footpaths, default_transfer_time
+            )
+        transfers.validate(self.timetable, default_transfer_time)
+        self.transfers = transfers
+
+        # plain lists for the hot loops
+        self.trip_route: list[int] = self.timetable.trip_route.tolist()
+        self.trip_pos: list[int] = self.timetable.trip_pos.tolist()
+        self.route_stops: list[list[int]] = [
+            self.timetable.iterate_stops_in_route_from_idx(route_id, 0)
+            for route_id in range(self.timetable.n_routes)
+        ]
+        self.route_trips: list[list[int]] = [
+            self.timetable.route_trips[
+                self.timetable.route_trip_offsets[
+                    route_id
+                ] : self.timetable.route_trip_offsets[route_id + 1]
+            ].tolist()
+            for route_id in range(self.timetable.n_routes)
+        ]
+        self.transfer_offsets: list[int] = transfers.offsets.tolist()
+        self.transfer_trips: list[int] = transfers.trips.tolist()
+        self.transfer_positions: list[int] = transfers.positions.tolist()
+
+    def run(
+        self: Self, start_stop_id: int, end_stop_id: Optional[int], start_time_str: str
+    ) -> tuple[dict[int, str], TracerMap]:
+        """
+        Returns the earliest arrival times at all stops and the journeys
+        leading to them, like `Raptor.run`.
+        """
+        start_time = strtime.str_time_to_seconds(start_time_str)
+        segments, arrivals, _ = self.search(start_stop_id, end_stop_id, start_time)
+
+        best_times = {stop_id: INFINITY for stop_id in range(self.timetable.n_stops)}
+        tracers_map = TracerMap(self.timetable.stop_id_set)
+        for stop_id, (arrival_time, arrival) in arrivals.items():
+            best_times[stop_id] = arrival_time
+            tracers_map.tracers[stop_id] = self.trace(
+                segments, arrival, stop_id, start_stop_id, start_time
+            )
+
+        return seconds_dict_to_times_dict(best_times), tracers_map
+
+    def run_pareto(
+        self: Self, start_stop_id: int, start_time_str: str
+    ) -> dict[int, list[tuple[int, str]]]:
+        """
+        Returns for every stop the Pareto set of (number of trips, arrival
+        time) tuples, sorted by the number of trips.
+        """
+        start_time = strtime.str_time_to_seconds(start_time_str)
+        _, _, profiles = self.search(start_stop_id, None, start_time)
+
+        return {
+            stop_id: [
+                (n_trips, strtime.seconds_to_str_time(arrival_time))
+                for n_trips, arrival_time in profiles.get(stop_id, [])
+            ]
+            for stop_id in range(self.timetable.n_stops)
+        }
+
+    def search(
+        self: Self, start_stop_id: int, end_stop_id: Optional[int], start_time: int
+    ) -> tuple[
+        list[Segment],
+        dict[int, tuple[int, Optional[Arrival]]],
+        dict[int, list[tuple[int, int]]],
+    ]:
+        """
+        Runs the breadth first search over trip segments. Returns the
+        segments, the earliest arrival at every reached stop (with how it was
+        reached, None for the start stop) and the (number of trips, arrival
+        time) Pareto sets.
+        """
+        timetable = self.timetable
+        arrival_times_by_route = timetable.arrival_times_by_route
+
+        segments: list[Segment] = []
+        # first stop position at which a trip is boarded
+        reached: dict[int, int] = {}
+        arrivals: dict[int, tuple[int, Optional[Arrival]]] = {
+            start_stop_id: (start_time, None)
+        }
+        profiles: dict[int, list[tuple[int, int]]] = {start_stop_id: [(0, start_time)]}
+
+        def enqueue(trip_id: int, stop_pos: int, parent: Optional[int], k: int):
+            route_id = self.trip_route[trip_id]
+            n_route_stops = len(self.route_stops[route_id])
+            if stop_pos >= reached.get(trip_id, n_route_stops):
+                return
+            segments.append(
+                (trip_id, stop_pos, reached.get(trip_id, n_route_stops), parent, k)
+            )
+            # trips do not overtake each other, so all later trips of the route
+            # are reached at this stop as well
+            for later_trip_id in self.route_trips[route_id][self.trip_pos[trip_id] :]:
+                if reached.get(later_trip_id, n_route_stops) <= stop_pos:
+                    break
+                reached[later_trip_id] = stop_pos
+
+        def update(stop_id: int, arrival_time: int, n_trips: int, arrival: Arrival):
+            if arrival_time >= arrivals.get(stop_id, (INFINITY,))[0]:
+                return
+            arrivals[stop_id] = (arrival_time, arrival)
+            profile = profiles.setdefault(stop_id, [])
+            if len(profile) > 0 and profile[-1][0] == n_trips:
+                profile[-1] = (n_trips, arrival_time)
+            else:
+                profile.append((n_trips, arrival_time))
+
+        # the first trips are boarded at the start stop
+        ready_to_depart = start_time + self.default_transfer_time
+        start = timetable.stop_route_offsets[start_stop_id]
+        end = timetable.stop_route_offsets[start_stop_id + 1]
+        for route_id, stop_pos in zip(
+            timetable.stop_routes[start:end].tolist(),
+            timetable.stop_route_positions[start:end].tolist(),
+        ):
+            trip_pos = timetable.earliest_trip_pos(route_id, stop_pos, ready_to_depart)
+            if trip_pos is not None:
+                enqueue(self.route_trips[route_id][trip_pos], stop_pos, None, 0)
+
+        level_start = 0
+        n_trips = 0
+        while level_start < len(segments) and n_trips < self.max_transfers:
+            n_trips += 1
+            level_end = len(segments)
+            rlog.debug(f"level {n_trips}: {level_end - level_start} segments")
+
+            for segment_idx in range(level_start, level_end):
+                trip_id, board_pos, end_pos, _, _ = segments[segment_idx]
+                route_id = self.trip_route[trip_id]
+                stops = self.route_stops[route_id]
+                arrival_times = arrival_times_by_route[route_id][
+                    self.trip_pos[trip_id], :end_pos
+                ].tolist()
+
+                for k in range(board_pos + 1, end_pos):
+                    arrival_time = arrival_times[k]
+                    # arrival times only increase along the trip
+                    if (
+                        end_stop_id is not None
+                        and arrival_time >= arrivals.get(end_stop_id, (INFINITY,))[0]
+                    ):
+                        break
+
+                    update(stops[k], arrival_time, n_trips, (segment_idx, k, None))
+                    for nearby_stop_id, walking_time in self.footpaths.items(stops[k]):
+                        update(
+                            nearby_stop_id,
+                            arrival_time + walking_time,
+                            n_trips,
+                            (segment_idx, k, walking_time),
+                        )
+
+                    if n_trips < self.max_transfers:
+                        event = stop_event(
+                            timetable, route_id, self.trip_pos[trip_id], k
+                        )
+                        for i in range(
+                            self.transfer_offsets[event],
+                            self.transfer_offsets[event + 1],
+                        ):
+                            enqueue(
+                                self.transfer_trips[i],
+                                self.transfer_positions[i],
+                                segment_idx,
+                                k,
+                            )
+
+            level_start = level_end
+
+        rlog.info(f"Trip-Based search finished after {n_trips} levels")
+        return segments, arrivals, profiles
+
+    def trace(
+        self: Self,
+        segments: list[Segment],
+        arrival: Optional[Arrival],
+        stop_id: int,
+        start_stop_id: int,
+        start_time: int,
+    ) -> list[Trace]:
+        """
+        Reconstructs the journey to the stop from the parent segments.
+        """
+        traces: list[Trace] = []
+        if arrival is None:
+            return [TraceStart(start_stop_id, start_time)]
+
+        segment_idx: Optional[int]
+        segment_idx, k, walking_time = arrival
+
+        previous_stop_id = stop_id
+        while segment_idx is not None:
+            trip_id, board_pos, _, parent, parent_k = segments[segment_idx]
+            route_id = self.trip_route[trip_id]
+            trip_pos = self.trip_pos[trip_id]
+            stops = self.route_stops[route_id]
+
+            if stops[k] != previous_stop_id:
+                if walking_time is None:
+                    walking_time = dict(self.footpaths.items(stops[k]))[
+                        previous_stop_id
+                    ]
+                traces.append(TraceFootpath(stops[k], previous_stop_id, walking_time))
+            traces.append(
+                TraceTrip(
+                    start_stop_id=stops[board_pos],
+                    departure_time=int(
+                        self.timetable.departure_times_by_route[route_id][
+                            trip_pos, board_pos
+                        ]
+                    ),
+                    end_stop_id=stops[k],
+                    arrival_time=int(
+                        self.timetable.arrival_times_by_route[route_id][trip_pos, k]
+                    ),
+                    trip_id=trip_id,
+                )
+            )
+
+            previous_stop_id = stops[board_pos]
+            segment_idx, k, walking_time = parent, parent_k, None
+
+        traces.append(TraceStart(start_stop_id, start_time))
+        return traces[::-1]
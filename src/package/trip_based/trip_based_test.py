@@ -0,0 +1,49 @@
+from typing import Any
+
+from package.raptor.raptor import Raptor
+from package.raptor.timetable import Timetable
+from package.structs.intern import IdMaps, intern_structs
+from package.trip_based.trip_based import TripBased
+
+
+def test_trip_based_matches_raptor(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    footpaths = id_maps.intern_footpaths(footpaths_dict)
+    timetable = Timetable.from_structs(structs_dict)
+
+    for transfer_time in [0, 60]:
+        trip_based = TripBased(timetable, footpaths, 3, transfer_time)
+        raptor = Raptor(timetable, footpaths, 3, transfer_time)
+
+        for start_stop_id in id_maps.stop_ids:
+            for start_time in ["00:00:00", "00:30:00", "01:00:00", "02:00:00"]:
+                args = (id_maps.intern_stop(start_stop_id), None, start_time)
+                expected, expected_tracers = raptor.run(*args)
+                arrival_times, tracers = trip_based.run(*args)
+
+                assert arrival_times == expected
+                for stop_id, traces in expected_tracers.tracers.items():
+                    assert [str(trace) for trace in tracers[stop_id]] == [
+                        str(trace) for trace in traces
+                    ]
+
+
+def test_trip_based_pareto(
+    structs_dict: dict[str, Any], footpaths_dict: dict[str, dict[str, int]]
+):
+    structs_dict = intern_structs(structs_dict)
+    id_maps = IdMaps.from_structs(structs_dict)
+    trip_based = TripBased(structs_dict, id_maps.intern_footpaths(footpaths_dict), 3, 0)
+
+    profiles = id_maps.gtfs_stop_dict(
+        trip_based.run_pareto(id_maps.intern_stop("stop1"), "00:30:00")
+    )
+
+    assert profiles["stop1"] == [(0, "00:30:00")]
+    assert profiles["stop4"] == [(1, "01:10:00")]
+    assert profiles["stop3"] == [(1, "01:20:00")]
+    # stop2 is reached earlier by walking from stop4 than by transferring
+    assert profiles["stop2"] == [(1, "01:12:00")]
@@ -0,0 +1,611 @@
+use std::collections::HashMap;
+use std::sync::Arc;
+
+use log::info;
+use pyo3::buffer::{Element, PyBuffer};
+use pyo3::exceptions::PyValueError;
+use pyo3::prelude::*;
+
+// marks stops of a route that are not served by a trip, see `NO_TIME` in
+// package/raptor/timetable.py
+const NO_TIME: u64 = i32::MAX as u64;
+
+// ticket costs, see package/mcr/label.py
+const COST_SHORT_DISTANCE_TICKET_INCR: i64 = 220;
+const COST_LONG_DISTANCE_TICKET_INCR: i64 = 320;
+const LENGTH_SHORT_DISTANCE_TICKET: u64 = 4;
+
+const STOP_MARKER: &str = "STOP";
+const TRIP_MARKER: &str = "TRIP";
+
+/// The arrays of the compiled python `Timetable`, indexed by interned ids.
+pub struct Timetable {
+    route_stop_offsets: Vec<usize>,
+    route_stops: Vec<usize>,
+    route_trip_offsets: Vec<usize>,
+    route_trips: Vec<usize>,
+    route_time_offsets: Vec<usize>,
+    // kept as the int32 of the python arrays, the times are the largest arrays
+    arrival_times: Vec<i32>,
+    departure_times: Vec<i32>,
+    stop_route_offsets: Vec<usize>,
+    stop_routes: Vec<usize>,
+    stop_route_positions: Vec<usize>,
+    // whether the departures of a route at a stop are sorted in trip order,
+    // indexed like `route_stops`
+    sorted_departures: Vec<bool>,
+}
+
+impl Timetable {
+    fn new(
+        route_stop_offsets: Vec<usize>,
+        route_stops: Vec<usize>,
+        route_trip_offsets: Vec<usize>,
+        route_trips: Vec<usize>,
+        route_time_offsets: Vec<usize>,
+        arrival_times: Vec<i32>,
+        departure_times: Vec<i32>,
+        stop_route_offsets: Vec<usize>,
+        stop_routes: Vec<usize>,
+        stop_route_positions: Vec<usize>,
+    ) -> Self {
+        let sorted_departures = sorted_departures(
+            &route_stop_offsets,
+            &route_trip_offsets,
+            &route_time_offsets,
+            &departure_times,
+        );
+        Timetable {
+            route_stop_offsets,
+            route_stops,
+            route_trip_offsets,
+            route_trips,
+            route_time_offsets,
+            arrival_times,
+            departure_times,
+            stop_route_offsets,
+            stop_routes,
+            stop_route_positions,
+            sorted_departures,
+        }
+    }
+
+    fn n_stops_of_route(&self, route_id: usize) -> usize {
+        self.route_stop_offsets[route_id + 1] - self.route_stop_offsets[route_id]
+    }
+
+    fn n_trips_of_route(&self, route_id: usize) -> usize {
+        self.route_trip_offsets[route_id + 1] - self.route_trip_offsets[route_id]
+    }
+
+    fn time_idx(&self, route_id: usize, trip_pos: usize, stop_pos: usize) -> usize {
+        self.route_time_offsets[route_id] + trip_pos * self.n_stops_of_route(route_id) + stop_pos
+    }
+
+    /// Returns `NO_TIME` if the trip does not serve the stop.
+    fn arrival_time(&self, route_id: usize, trip_pos: usize, stop_pos: usize) -> u64 {
+        self.arrival_times[self.time_idx(route_id, trip_pos, stop_pos)] as u64
+    }
+
+    /// Returns `NO_TIME` if the trip does not serve the stop.
+    fn departure_time(&self, route_id: usize, trip_pos: usize, stop_pos: usize) -> u64 {
+        self.departure_times[self.time_idx(route_id, trip_pos, stop_pos)] as u64
+    }
+
+    fn trip_id(&self, route_id: usize, trip_pos: usize) -> usize {
+        self.route_trips[self.route_trip_offsets[route_id] + trip_pos]
+    }
+
+    fn stop_id(&self, route_id: usize, stop_pos: usize) -> usize {
+        self.route_stops[self.route_stop_offsets[route_id] + stop_pos]
+    }
+
+    /// Returns (route, position of the stop in the route) for all routes
+    /// serving the stop.
+    fn routes_serving_stop(&self, stop_id: usize) -> impl Iterator<Item = (usize, usize)> + '_ {
+        let start = self.stop_route_offsets[stop_id];
+        let end = self.stop_route_offsets[stop_id + 1];
+        (start..end).map(|i| (self.stop_routes[i], self.stop_route_positions[i]))
+    }
+
+    /// Returns the position of the first trip before `trip_pointer` that can
+    /// be boarded at the stop at `ready_to_depart`.
+    fn earliest_trip_pos(
+        &self,
+        route_id: usize,
+        stop_pos: usize,
+        ready_to_depart: u64,
+        trip_pointer: usize,
+    ) -> Option<usize> {
+        if ready_to_depart >= NO_TIME {
+            return None;
+        }
+        if self.sorted_departures[self.route_stop_offsets[route_id] + stop_pos] {
+            let (mut low, mut high) = (0, trip_pointer);
+            while low < high {
+                let mid = (low + high) / 2;
+                if self.departure_time(route_id, mid, stop_pos) < ready_to_depart {
+                    low = mid + 1;
+                } else {
+                    high = mid;
+                }
+            }
+            if low == trip_pointer || self.departure_time(route_id, low, stop_pos) == NO_TIME {
+                return None;
+            }
+            return Some(low);
+        }
+
+        (0..trip_pointer).find(|&trip_pos| {
+            let departure_time = self.departure_time(route_id, trip_pos, stop_pos);
+            departure_time != NO_TIME && departure_time >= ready_to_depart
+        })
+    }
+}
+
+fn sorted_departures(
+    route_stop_offsets: &[usize],
+    route_trip_offsets: &[usize],
+    route_time_offsets: &[usize],
+    departure_times: &[i32],
+) -> Vec<bool> {
+    let n_routes = route_stop_offsets.len() - 1;
+    let mut sorted = vec![true; route_stop_offsets[n_routes]];
+    for route_id in 0..n_routes {
+        let n_stops = route_stop_offsets[route_id + 1] - route_stop_offsets[route_id];
+        let n_trips = route_trip_offsets[route_id + 1] - route_trip_offsets[route_id];
+        let offset = route_time_offsets[route_id];
+        for stop_pos in 0..n_stops {
+            sorted[route_stop_offsets[route_id] + stop_pos] = (1..n_trips).all(|trip_pos| {
+                departure_times[offset + (trip_pos - 1) * n_stops + stop_pos]
+                    <= departure_times[offset + trip_pos * n_stops + stop_pos]
+            });
+        }
+    }
+    sorted
+}
+
+fn to_index_vec<T>(py: Python, array: &PyAny) -> PyResult<Vec<usize>>
+where
+    T: Element + Copy + TryInto<usize>,
+{
+    PyBuffer::<T>::get(array)?
+        .to_vec(py)?
+        .into_iter()
+        .map(|value| {
+            value
+                .try_into()
+                .map_err(|_| PyValueError::new_err("Timetable index out of range"))
+        })
+        .collect()
+}
+
+#[pyclass]
+pub struct TimetableCache {
+    pub timetable: Option<Arc<Timetable>>,
+}
+
+#[pymethods]
+impl TimetableCache {
+    #[new]
+    fn new() -> Self {
+        TimetableCache { timetable: None }
+    }
+
+    /// Takes the arrays of a compiled `Timetable` as numpy arrays, which
+    /// are copied through the buffer protocol without creating python ints.
+    fn set_timetable(
+        &mut self,
+        py: Python,
+        route_stop_offsets: &PyAny,
+        route_stops: &PyAny,
+        route_trip_offsets: &PyAny,
+        route_trips: &PyAny,
+        route_time_offsets: &PyAny,
+        arrival_times: &PyAny,
+        departure_times: &PyAny,
+        stop_route_offsets: &PyAny,
+        stop_routes: &PyAny,
+        stop_route_positions: &PyAny,
+    ) -> PyResult<()> {
+        self.timetable = Some(Arc::new(Timetable::new(
+            to_index_vec::<i64>(py, route_stop_offsets)?,
+            to_index_vec::<i32>(py, route_stops)?,
+            to_index_vec::<i64>(py, route_trip_offsets)?,
+            to_index_vec::<i32>(py, route_trips)?,
+            to_index_vec::<i64>(py, route_time_offsets)?,
+            PyBuffer::<i32>::get(arrival_times)?.to_vec(py)?,
+            PyBuffer::<i32>::get(departure_times)?.to_vec(py)?,
+            to_index_vec::<i64>(py, stop_route_offsets)?,
+            to_index_vec::<i32>(py, stop_routes)?,
+            to_index_vec::<i32>(py, stop_route_positions)?,
+        )));
+        Ok(())
+    }
+
+    fn summary(&self) -> PyResult<()> {
+        if let Some(timetable) = &self.timetable {
+            info!("Stops: {}", timetable.stop_route_offsets.len() - 1);
+            info!("Routes: {}", timetable.route_stop_offsets.len() - 1);
+            info!("Trips: {}", timetable.route_trips.len());
+            Ok(())
+        } else {
+            Err(PyValueError::new_err("Timetable not set"))
+        }
+    }
+}
+
+#[derive(Clone, Debug, PartialEq)]
+enum PathElement {
+    Stop(usize),
+    Trip(usize),
+}
+
+/// Mirrors `McRAPTORLabel` and `McRAPTORLabelWithPath`. The path only holds
+/// the stops and trips of this step, the path of previous steps is kept on
+/// the python side and referenced by `origin`.
+#[derive(Clone, Debug)]
+struct McRaptorLabel {
+    arrival_time: u64,
+    cost: i64,
+    n_stops: u64,
+    origin: (usize, usize),
+    path: Vec<PathElement>,
+}
+
+impl McRaptorLabel {
+    fn strictly_dominates(&self, other: &McRaptorLabel) -> bool {
+        self.arrival_time <= other.arrival_time && self.cost <= other.cost
+    }
+
+    fn update_along_trip(&mut self, arrival_time: u64, trip_id: usize, track_path: bool) {
+        self.arrival_time = arrival_time;
+        if self.n_stops == 0 {
+            self.cost += COST_SHORT_DISTANCE_TICKET_INCR;
+        }
+        if self.n_stops == LENGTH_SHORT_DISTANCE_TICKET {
+            self.cost -= COST_SHORT_DISTANCE_TICKET_INCR;
+            self.cost += COST_LONG_DISTANCE_TICKET_INCR;
+        }
+        self.n_stops += 1;
+
+        if track_path && self.path.last() != Some(&PathElement::Trip(trip_id)) {
+            self.path.push(PathElement::Trip(trip_id));
+        }
+    }
+
+    fn update_before_route_bag_merge(
+        &mut self,
+        departure_time: u64,
+        stop_id: usize,
+        track_path: bool,
+    ) {
+        self.arrival_time = departure_time;
+        if track_path {
+            self.path.push(PathElement::Stop(stop_id));
+        }
+    }
+
+    fn update_before_stop_bag_merge(&mut self, stop_id: usize, track_path: bool) {
+        if track_path {
+            self.path.push(PathElement::Stop(stop_id));
+        }
+    }
+}
+
+fn add_if_necessary<T>(bag: &mut Vec<T>, label: T, get_label: fn(&T) -> &McRaptorLabel) -> bool {
+    if bag
+        .iter()
+        .any(|other| get_label(other).strictly_dominates(get_label(&label)))
+    {
+        return false;
+    }
+    bag.retain(|other| !get_label(&label).strictly_dominates(get_label(other)));
+    bag.push(label);
+    true
+}
+
+type McRaptorBags = HashMap<usize, Vec<McRaptorLabel>>;
+
+/// Single round McRAPTOR as implemented by `McRaptorSingle`.
+fn run(
+    timetable: &Timetable,
+    bags: &McRaptorBags,
+    default_transfer_time: u64,
+    track_path: bool,
+) -> McRaptorBags {
+    let mut output_bags = bags.clone();
+
+    // first position of a marked stop for every route serving one
+    let mut q: HashMap<usize, usize> = HashMap::new();
+    for stop_id in bags.keys() {
+        for (route_id, stop_pos) in timetable.routes_serving_stop(*stop_id) {
+            let first_pos = q.entry(route_id).or_insert(stop_pos);
+            if stop_pos < *first_pos {
+                *first_pos = stop_pos;
+            }
+        }
+    }
+    let mut q: Vec<(usize, usize)> = q.into_iter().collect();
+    q.sort();
+
+    for (route_id, first_pos) in q {
+        let n_trips = timetable.n_trips_of_route(route_id);
+        let mut route_bag: Vec<(McRaptorLabel, usize)> = Vec::new();
+
+        for stop_pos in first_pos..timetable.n_stops_of_route(route_id) {
+            let stop_id = timetable.stop_id(route_id, stop_pos);
+
+            // first step - update arrival times in route bag
+            for (label, trip_pos) in route_bag.iter_mut() {
+                label.update_along_trip(
+                    timetable.arrival_time(route_id, *trip_pos, stop_pos),
+                    timetable.trip_id(route_id, *trip_pos),
+                    track_path,
+                );
+            }
+
+            // second step - merge route bag into stop bag, labels on trips
+            // that do not serve the stop are not merged
+            if route_bag
+                .iter()
+                .any(|(label, _)| label.arrival_time < NO_TIME)
+            {
+                let output_bag = output_bags.entry(stop_id).or_default();
+                for (label, _) in route_bag.iter() {
+                    if label.arrival_time >= NO_TIME {
+                        continue;
+                    }
+                    let mut label = label.clone();
+                    label.update_before_stop_bag_merge(stop_id, track_path);
+                    add_if_necessary(output_bag, label, |label| label);
+                }
+            }
+
+            // third step - merge stop bag into route bag, from latest to
+            // earliest arrival so that the trip pointer only moves backwards
+            let Some(bag) = bags.get(&stop_id) else {
+                continue;
+            };
+            let mut labels: Vec<&McRaptorLabel> = bag.iter().collect();
+            labels.sort_by(|a, b| b.arrival_time.cmp(&a.arrival_time));
+
+            let mut trip_pointer = n_trips;
+            for label in labels {
+                let Some(trip_pos) = timetable.earliest_trip_pos(
+                    route_id,
+                    stop_pos,
+                    label.arrival_time.saturating_add(default_transfer_time),
+                    trip_pointer,
+                ) else {
+                    continue;
+                };
+                trip_pointer = trip_pos + 1;
+
+                let mut label = label.clone();
+                label.update_before_route_bag_merge(
+                    timetable.departure_time(route_id, trip_pos, stop_pos),
+                    stop_id,
+                    track_path,
+                );
+                add_if_necessary(&mut route_bag, (label, trip_pos), |(label, _)| label);
+            }
+        }
+    }
+
+    output_bags
+}
+
+#[pyclass]
+pub struct PyMcRaptorLabel {
+    #[pyo3(get)]
+    pub arrival_time: u64,
+    #[pyo3(get)]
+    pub cost: i64,
+    #[pyo3(get)]
+    pub n_stops: u64,
+    /// (stop id, index) of the input label this label was created from
+    #[pyo3(get)]
+    pub origin: (usize, usize),
+    /// ("STOP" | "TRIP", id) tuples, like in `McRAPTORLabelWithPath`
+    #[pyo3(get)]
+    pub path: Vec<(&'static str, usize)>,
+}
+
+pub struct PyMcRaptorBags(McRaptorBags);
+
+impl IntoPy<PyObject> for PyMcRaptorBags {
+    fn into_py(self, py: Python) -> PyObject {
+        let mut py_bags: HashMap<usize, Vec<PyObject>> = HashMap::new();
+        for (stop_id, labels) in self.0 {
+            let py_labels = labels
+                .into_iter()
+                .map(|label| {
+                    PyMcRaptorLabel {
+                        arrival_time: label.arrival_time,
+                        cost: label.cost,
+                        n_stops: label.n_stops,
+                        origin: label.origin,
+                        path: label
+                            .path
+                            .iter()
+                            .map(|element| match element {
+                                PathElement::Stop(stop_id) => (STOP_MARKER, *stop_id),
+                                PathElement::Trip(trip_id) => (TRIP_MARKER, *trip_id),
+                            })
+                            .collect(),
+                    }
+                    .into_py(py)
+                })
+                .collect();
+            py_bags.insert(stop_id, py_labels);
+        }
+        py_bags.into_py(py)
+    }
+}
+
+/// Runs McRAPTOR on the timetable of the cache, starting from the given
+/// bags of (arrival time, cost, number of stops) labels by interned stop id.
+/// The GIL is released while running.
+#[pyfunction]
+pub fn run_mcraptor_with_bags(
+    py: Python,
+    timetable_cache: &TimetableCache,
+    bags: HashMap<usize, Vec<(u64, i64, u64)>>,
+    default_transfer_time: u64,
+    disable_paths: Option<bool>,
+) -> PyResult<PyMcRaptorBags> {
+    let timetable = timetable_cache
+        .timetable
+        .as_ref()
+        .map(Arc::clone)
+        .ok_or_else(|| PyValueError::new_err("Timetable not set"))?;
+    let track_path = !disable_paths.unwrap_or(false);
+
+    let bags: McRaptorBags = bags
+        .into_iter()
+        .map(|(stop_id, labels)| {
+            let labels = labels
+                .into_iter()
+                .enumerate()
+                .map(|(idx, (arrival_time, cost, n_stops))| McRaptorLabel {
+                    arrival_time,
+                    cost,
+                    n_stops,
+                    origin: (stop_id, idx),
+                    path: Vec::new(),
+                })
+                .collect();
+            (stop_id, labels)
+        })
+        .collect();
+
+    let output_bags =
+        py.allow_threads(|| run(&timetable, &bags, default_transfer_time, track_path));
+
+    Ok(PyMcRaptorBags(output_bags))
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    const NO: i32 = i32::MAX;
+
+    /// Route 0 serves stops 0 to 5 with trips 0 and 1, trip 1 does not serve
+    /// stop 3. Route 1 serves stops 5 and 6 with trip 2.
+    fn timetable() -> Timetable {
+        Timetable::new(
+            vec![0, 6, 8],
+            vec![0, 1, 2, 3, 4, 5, 5, 6],
+            vec![0, 2, 3],
+            vec![0, 1, 2],
+            vec![0, 12, 14],
+            vec![
+                100, 200, 300, 400, 500, 600, //
+                1000, 1100, 1200, NO, 1400, 1500, //
+                700, 800,
+            ],
+            vec![
+                100, 200, 300, 400, 500, 600, //
+                1000, 1100, 1200, NO, 1400, 1500, //
+                700, 800,
+            ],
+            vec![0, 1, 2, 3, 4, 5, 7, 8],
+            vec![0, 0, 0, 0, 0, 0, 1, 1],
+            vec![0, 1, 2, 3, 4, 5, 0, 1],
+        )
+    }
+
+    fn bags(labels: Vec<(usize, Vec<(u64, i64)>)>) -> McRaptorBags {
+        labels
+            .into_iter()
+            .map(|(stop_id, labels)| {
+                let labels = labels
+                    .into_iter()
+                    .enumerate()
+                    .map(|(idx, (arrival_time, cost))| McRaptorLabel {
+                        arrival_time,
+                        cost,
+                        n_stops: 0,
+                        origin: (stop_id, idx),
+                        path: Vec::new(),
+                    })
+                    .collect();
+                (stop_id, labels)
+            })
+            .collect()
+    }
+
+    fn times_and_costs(bags: &McRaptorBags, stop_id: usize) -> Vec<(u64, i64, u64)> {
+        bags[&stop_id]
+            .iter()
+            .map(|label| (label.arrival_time, label.cost, label.n_stops))
+            .collect()
+    }
+
+    #[test]
+    fn ticket_costs_follow_mc_raptor_label() {
+        let output_bags = run(&timetable(), &bags(vec![(0, vec![(0, 0)])]), 0, false);
+
+        assert_eq!(times_and_costs(&output_bags, 0), vec![(0, 0, 0)]);
+        assert_eq!(times_and_costs(&output_bags, 1), vec![(200, 220, 1)]);
+        assert_eq!(times_and_costs(&output_bags, 4), vec![(500, 220, 4)]);
+        // the fifth stop switches to the long distance ticket
+        assert_eq!(times_and_costs(&output_bags, 5), vec![(600, 320, 5)]);
+        // only routes serving the input stops are scanned
+        assert!(!output_bags.contains_key(&6));
+    }
+
+    #[test]
+    fn labels_reference_their_input_label() {
+        let input_bags = bags(vec![(0, vec![(50, 0), (0, 10)]), (5, vec![(650, 0)])]);
+
+        let output_bags = run(&timetable(), &input_bags, 0, true);
+
+        let labels = &output_bags[&2];
+        assert_eq!(labels.len(), 1);
+        assert_eq!(labels[0].origin, (0, 0));
+        assert_eq!(
+            labels[0].path,
+            vec![
+                PathElement::Stop(0),
+                PathElement::Trip(0),
+                PathElement::Stop(2)
+            ]
+        );
+        assert_eq!(output_bags[&6][0].origin, (5, 0));
+        assert_eq!(
+            output_bags[&6][0].path,
+            vec![
+                PathElement::Stop(5),
+                PathElement::Trip(2),
+                PathElement::Stop(6)
+            ]
+        );
+    }
+
+    #[test]
+    fn transfer_time_delays_boarding() {
+        let output_bags = run(&timetable(), &bags(vec![(0, vec![(50, 0)])]), 60, false);
+
+        assert_eq!(times_and_costs(&output_bags, 1), vec![(1100, 220, 1)]);
+    }
+
+    #[test]
+    fn unserved_stops_are_skipped() {
+        let output_bags = run(&timetable(), &bags(vec![(0, vec![(500, 0)])]), 0, false);
+
+        assert!(!output_bags.contains_key(&3));
+        assert_eq!(times_and_costs(&output_bags, 4), vec![(1400, 220, 4)]);
+    }
+
+    #[test]
+    fn unreached_input_labels_do_not_board() {
+        let input_bags = bags(vec![(0, vec![(NO_TIME, 0)]), (1, vec![(u64::MAX, 0)])]);
+
+        let output_bags = run(&timetable(), &input_bags, 60, false);
+
+        assert_eq!(output_bags.len(), 2);
+    }
+}
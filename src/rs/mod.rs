@@ -1,3 +1,4 @@
 pub mod graph_cache;
 pub mod label;
+pub mod mcraptor;
 pub mod mlc_adapter;